@@ -0,0 +1,27 @@
+"""Shared bootstrap for the standalone benchmark scripts (python benchmarks/<script>.py)."""
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django  # noqa: E402
+
+django.setup()
+
+
+def timed(label, fn, repeat=5):
+    """Run fn `repeat` times and print the best wall-clock time."""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"{label:<48} {best * 1000:10.2f} ms")
+    return result
@@ -0,0 +1,85 @@
+"""
+Backtest engine benchmarks: 10 coins, five years of daily prices.
+
+    python benchmarks/bench_backtest.py
+
+Every strategy must run well under a second on cached price arrays. The DB
+section times writing a weekly DCA run as a simulation (bulk insert plus lot
+replay) against the test database.
+"""
+from datetime import date
+from unittest.mock import patch
+
+import numpy as np
+from _setup import timed
+
+from django.conf import settings
+from django.db import connection, transaction as dbtx
+from django.test.utils import get_runner, setup_test_environment
+
+from web_app.utils.backtest import parse_spec, run_backtest
+
+COINS = [f"coin-{i}" for i in range(10)]
+START, END = date(2019, 1, 1), date(2023, 12, 31)
+SPECS = {
+    "DCA weekly": {"strategy": "DCA", "amount": 500, "every_days": 7},
+    "DCA daily": {"strategy": "DCA", "amount": 50, "every_days": 1},
+    "REBALANCE monthly": {"strategy": "REBALANCE", "initial_cash": 100_000, "every_days": 30},
+    "REBALANCE daily": {"strategy": "REBALANCE", "initial_cash": 100_000, "every_days": 1},
+    "THRESHOLD 10% / 30d": {"strategy": "THRESHOLD", "amount": 200, "buy_below": 0.1, "sell_above": 0.1},
+}
+
+
+def _prices(days):
+    rng = np.random.default_rng(3)
+    return 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.04, (len(COINS), days)), axis=1))
+
+
+def _spec(options):
+    return parse_spec({"coins": COINS, "start_date": START.isoformat(), "end_date": END.isoformat(), **options},
+                      today=END)
+
+
+def bench_engine(prices):
+    print(f"Engine, {len(COINS)} coins x {prices.shape[1]} days")
+    for label, options in SPECS.items():
+        spec = _spec(options)
+        result = timed(label, lambda: run_backtest(prices, spec))
+        print(f"{'  trades':<48} {len(result['day']):>10}")
+
+
+def bench_db(prices):
+    from web_app.models import User
+    from web_app.utils.backtest import backtest, save_backtest
+
+    user = User.objects.create_user(email="bench@example.com", username="bench@example.com", password="x")
+    spec = _spec(SPECS["DCA weekly"])
+    with patch("web_app.utils.backtest.historical_prices", return_value=prices):
+        run = backtest(spec, "USD")
+    print(f"Saving {run['stats']['trades']} trades")
+
+    def save():
+        # Roll back so the on-commit snapshot refresh (which fetches live charts) never runs.
+        with dbtx.atomic():
+            save_backtest(user, spec, run, "USD", "bench")
+            dbtx.set_rollback(True)
+
+    timed("save_backtest (bulk insert + lot replay)", save, repeat=3)
+
+
+def main():
+    prices = _prices((END - START).days + 1)
+    bench_engine(prices)
+
+    setup_test_environment()
+    runner = get_runner(settings)(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        bench_db(prices)
+    finally:
+        runner.teardown_databases(old_config)
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
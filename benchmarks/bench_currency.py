@@ -0,0 +1,69 @@
+"""
+Batch currency conversion benchmarks: 10k-row portfolios and transaction lists.
+
+    python benchmarks/bench_currency.py
+"""
+import random
+import time
+from decimal import Decimal
+
+from _setup import timed
+
+from django.core.cache import cache
+
+from web_app.utils import currency
+
+ROWS = 10_000
+
+
+def _seed_rates():
+    now = time.time()
+    cache.set(
+        currency.FX_TABLE_CACHE_KEY,
+        {"EUR": (Decimal("0.91"), now), "AUD": (Decimal("1.53"), now)},
+        currency.FX_TABLE_TIMEOUT,
+    )
+
+
+def main():
+    _seed_rates()
+    rng = random.Random(42)
+    prices = [f"{rng.uniform(0.01, 70000):.10f}" for _ in range(ROWS)]
+    holdings = [
+        {"coin_id": f"coin-{i}", "quantity": rng.uniform(0, 10), "avg_price": p, "avg_price_currency": "USD"}
+        for i, p in enumerate(prices)
+    ]
+    transactions = [
+        {
+            "price": p,
+            "cost_basis": f"{float(p) * 2:.10f}",
+            "realised_profit": f"{rng.uniform(-500, 500):.10f}",
+            "price_currency": rng.choice(["USD", "EUR", "AUD"]),
+        }
+        for p in prices
+    ]
+
+    print(f"{ROWS} rows, USD -> AUD")
+    timed("convert_amount per value", lambda: [currency.convert_amount(p, "USD", "AUD") for p in prices])
+    timed("convert_amounts (float ndarray)", lambda: currency.convert_amounts(prices, "USD", "AUD"))
+    timed("convert_amounts (exact Decimal)", lambda: currency.convert_amounts(prices, "USD", "AUD", exact=True))
+    timed(
+        "convert_rows portfolio (1 field)",
+        lambda: currency.convert_rows(holdings, ["avg_price"], "AUD", currency_field="avg_price_currency"),
+    )
+    timed(
+        "convert_rows transactions (3 fields, mixed src)",
+        lambda: currency.convert_rows(
+            transactions, ["price", "cost_basis", "realised_profit"], "AUD", currency_field="price_currency"
+        ),
+    )
+    timed(
+        "convert_rows transactions exact",
+        lambda: currency.convert_rows(
+            transactions, ["price", "cost_basis", "realised_profit"], "AUD", currency_field="price_currency", exact=True
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
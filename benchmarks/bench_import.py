@@ -0,0 +1,57 @@
+"""
+CSV import throughput on a 50k-row trade history (prices present, USD).
+
+    python benchmarks/bench_import.py
+"""
+import io
+import random
+from datetime import datetime, timedelta, timezone
+
+from _setup import timed
+
+from django.conf import settings
+from django.db import connection, transaction as dbtx
+from django.test.utils import get_runner, setup_test_environment
+
+ROWS = 50_000
+COINS = ["bitcoin", "ethereum", "solana", "cardano", "dogecoin"]
+
+
+def _csv(rng):
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    out = io.StringIO()
+    out.write("coin,side,qty,price,currency,time\n")
+    for i in range(ROWS):
+        side = "SELL" if i % 3 == 2 else "BUY"
+        out.write(f"{rng.choice(COINS)},{side},{rng.uniform(0.01, 1):.8f},{rng.uniform(1, 60000):.2f},USD,"
+                  f"{(start + timedelta(minutes=i)).isoformat()}\n")
+    return out.getvalue()
+
+
+def main():
+    from web_app.models import User
+    from web_app.utils.imports import import_transactions
+
+    payload = _csv(random.Random(3))
+    setup_test_environment()
+    runner = get_runner(settings)(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        user = User.objects.create_user(email="bench@example.com", username="bench@example.com", password="x")
+
+        def run():
+            # Roll back each run; this also skips the on-commit snapshot refresh, which needs the network
+            with dbtx.atomic():
+                report = import_transactions(user, io.StringIO(payload))
+                dbtx.set_rollback(True)
+            return report
+
+        report = timed(f"import {ROWS} rows", run, repeat=2)
+        print(f"{'throughput':<48} {report['rows_per_second']:>10} rows/s")
+    finally:
+        runner.teardown_databases(old_config)
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Tax-lot engine benchmarks on a 100k-transaction single-coin ledger.
+
+    python benchmarks/bench_lots.py
+
+The in-memory replay must stay sub-second for every method. The DB section
+measures a full rebuild and a one-row append against the test database.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from _setup import timed
+
+from django.db import connection, transaction as dbtx
+from django.test.utils import setup_test_environment, get_runner
+from django.conf import settings
+from django.utils import timezone
+
+from web_app.utils.lots import METHODS, LotBook, rebuild_lots, replay
+
+ROWS = 100_000
+
+
+def _ledger(rng):
+    types, quantities, prices = [], [], []
+    held = 0.0
+    for _ in range(ROWS):
+        price = rng.uniform(100, 70000)
+        if held > 0 and rng.random() < 0.4:
+            q = rng.uniform(0, held)
+            types.append("SELL")
+            held -= q
+        else:
+            q = rng.uniform(0.001, 2)
+            types.append("BUY")
+            held += q
+        quantities.append(q)
+        prices.append(price)
+    return types, quantities, prices
+
+
+def bench_memory(types, quantities, prices):
+    print(f"In-memory replay, {ROWS} rows")
+    for method in METHODS:
+        timed(f"replay {method}", lambda: replay(LotBook(method), types, quantities, prices))
+    book = LotBook("FIFO")
+    replay(book, types, quantities, prices)
+    blob = book.pack()
+    print(f"{'open FIFO lots / packed bytes':<48} {len(book.lots()):>10} / {len(blob)}")
+    timed("unpack FIFO state", lambda: LotBook.unpack("FIFO", blob))
+
+
+def bench_db(types, quantities, prices):
+    from web_app.models import Coin, Transaction, User
+
+    user = User.objects.create_user(email="bench@example.com", username="bench@example.com", password="x")
+    coin = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    start = timezone.now() - timedelta(days=400)
+    Transaction.objects.bulk_create(
+        [
+            Transaction(user=user, coin=coin, type=t, quantity=Decimal(f"{q:.10f}"), price=Decimal(f"{p:.4f}"),
+                        price_currency="USD")
+            for t, q, p in zip(types, quantities, prices)
+        ],
+        batch_size=5000,
+    )
+    # time is auto_now_add; spread rows out so ordering is deterministic
+    ids = list(Transaction.objects.filter(user=user).order_by("id").values_list("id", flat=True))
+    Transaction.objects.bulk_update(
+        [Transaction(id=i, time=start + timedelta(seconds=n * 60)) for n, i in enumerate(ids)], ["time"],
+        batch_size=5000,
+    )
+
+    print(f"DB-backed rebuild, {ROWS} rows")
+    with dbtx.atomic():
+        timed("first full rebuild_lots (FIFO, writes every sell)",
+              lambda: rebuild_lots(user.id, None, coin.id, method="FIFO"), repeat=1)
+        timed("full rebuild_lots (FIFO, nothing changed)",
+              lambda: rebuild_lots(user.id, None, coin.id, method="FIFO"), repeat=3)
+    # bulk_create skips the snapshot signal, which would otherwise fetch prices
+    tx = Transaction.objects.bulk_create([
+        Transaction(user=user, coin=coin, type="BUY", quantity=1, price=1, price_currency="USD")
+    ])[0]
+    with dbtx.atomic():
+        timed("append one row", lambda: rebuild_lots(user.id, None, coin.id, from_time=tx.time, method="FIFO"),
+              repeat=3)
+    middle = start + timedelta(seconds=ROWS // 2 * 60)
+    with dbtx.atomic():
+        timed("replay suffix from the middle", lambda: rebuild_lots(user.id, None, coin.id, from_time=middle,
+                                                                     method="FIFO"), repeat=1)
+
+
+def main():
+    rng = random.Random(7)
+    types, quantities, prices = _ledger(rng)
+    bench_memory(types, quantities, prices)
+
+    setup_test_environment()
+    runner = get_runner(settings)(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        bench_db(types, quantities, prices)
+    finally:
+        runner.teardown_databases(old_config)
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Monte Carlo projection benchmarks: 10k paths x 365 days x 20 coins.
+
+    python benchmarks/bench_projection.py
+
+The return model is built once per coin set and window and cached; these
+timings are the per-request work on top of it (random draws, compounding
+and percentile bands), which must stay interactive.
+"""
+import numpy as np
+from _setup import timed
+
+from web_app.utils.projection import simulate_paths
+
+PATHS, DAYS, COINS = 10_000, 365, 20
+
+
+def _model():
+    rng = np.random.default_rng(3)
+    returns = rng.normal(0.0005, 0.04, (365, COINS)) + rng.normal(0, 0.03, (365, 1))
+    return {"growth": np.exp(returns), "mean": returns.mean(axis=0),
+            "chol": np.linalg.cholesky(np.cov(returns, rowvar=False))}
+
+
+def main():
+    model = _model()
+    start = np.full(COINS, 1000.0)
+    print(f"Projection, {PATHS} paths x {DAYS} days x {COINS} coins")
+    for method in ("bootstrap", "normal"):
+        values = timed(f"simulate_paths ({method})", lambda: simulate_paths(model, start, DAYS, PATHS, method, 1),
+                       repeat=3)
+        timed("  percentile bands", lambda: np.percentile(values, [5, 25, 50, 75, 95], axis=1), repeat=3)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Parameter sweep benchmarks: a 1000-run DCA grid over 10 coins and five
+years of daily prices, inline versus across a process pool.
+
+    python benchmarks/bench_sweep.py [workers]
+
+Runs read the price matrix through a shared memory map, so the pool speedup
+should track the number of cores available.
+"""
+import os
+import sys
+from datetime import date
+from unittest.mock import patch
+
+import numpy as np
+from _setup import timed
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import get_runner, setup_test_environment
+
+COINS = [f"coin-{i}" for i in range(10)]
+START, END = date(2019, 1, 1), date(2023, 12, 31)
+BASE = {"strategy": "DCA", "coins": COINS, "start_date": START.isoformat(), "end_date": END.isoformat()}
+GRID = {
+    "amount": [50, 100, 200, 500, 1000],
+    "every_days": [1, 2, 3, 5, 7, 10, 14, 21, 30, 60],
+    "fee_bps": [0, 5, 10, 25, 50],
+    "slippage_bps": [0, 5, 10, 50],
+}
+
+
+def _prices(coin_ids, currency, start, end):
+    rng = np.random.default_rng(3)
+    days = (end - start).days + 1
+    return 100 * np.exp(np.cumsum(rng.normal(0.0005, 0.04, (len(coin_ids), days)), axis=1))
+
+
+def bench(workers):
+    from web_app.models import BacktestSweepResult, User
+    from web_app.utils.sweeps import create_sweep, run_sweep
+
+    user = User.objects.create_user(email="bench@example.com", username="bench@example.com", password="x")
+    sweep = create_sweep(user, "bench", BASE, GRID)
+    print(f"Sweep of {sweep.total} backtests, {len(COINS)} coins x {(END - START).days + 1} days")
+
+    def run(n):
+        BacktestSweepResult.objects.filter(sweep=sweep).delete()
+        run_sweep(sweep, workers=n)
+
+    with patch("web_app.utils.sweeps.historical_prices", side_effect=_prices):
+        timed("run_sweep, 1 worker", lambda: run(1), repeat=1)
+        timed(f"run_sweep, {workers} workers", lambda: run(workers), repeat=1)
+
+
+def main():
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else max(2, os.cpu_count() or 1)
+    setup_test_environment()
+    runner = get_runner(settings)(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        bench(workers)
+    finally:
+        runner.teardown_databases(old_config)
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -30,6 +30,7 @@ try:
     print("Running Django migrations...")
     subprocess.run([sys.executable, "manage.py", "makemigrations"], check=True)
     subprocess.run([sys.executable, "manage.py", "migrate"], check=True)
+    subprocess.run([sys.executable, "manage.py", "createcachetable"], check=True)  # shared cache (settings.CACHES)
 
     # --- Frontend setup ---
     node_modules_path = os.path.join(frontend_path, "node_modules")
@@ -0,0 +1,7 @@
+from django.conf import settings
+
+
+def pytest_configure(config):
+    # Tests run in one process, so the shared cache from settings is not needed; LocMem keeps cache-only
+    # tests off the database.
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
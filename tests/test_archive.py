@@ -0,0 +1,157 @@
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from web_app.models import (Coin, FxRate, Holding, LotState, Simulation, SimulationArchive, SyncTombstone,
+                            Transaction, User, WatchListItem)
+from web_app.utils import archive
+from web_app.utils.lots import rebuild_lots
+from web_app.utils.series import MS_PER_DAY
+from web_app.utils.simulations import simulation_summaries
+from web_app.utils.sync import current_state, deleted_since
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="cold@example.com", username="cold@example.com", password="pass")
+
+
+def _chart(coin_id, vs_currency="usd", days=7, interval=None):
+    """bitcoin closes at 100 + day index for the last 60 days; other coins have no data."""
+    if coin_id != "bitcoin":
+        return None
+    today = timezone.now().date()
+    first = datetime.combine(today - timedelta(days=60), dt_time(12), tzinfo=dt_timezone.utc)
+    return {"prices": [[int(first.timestamp() * 1000) + i * MS_PER_DAY, 100.0 + i] for i in range(61)]}
+
+
+def _archived(user, coin):
+    today = timezone.now().date()
+    sim = Simulation.objects.create(user=user, name="Old run", start_date=today - timedelta(days=30),
+                                    end_date=today - timedelta(days=10), status="ARCHIVED")
+    for days_ago, kind, quantity in ((25, "BUY", 2), (20, "BUY", 1), (15, "SELL", 1)):
+        Transaction.objects.create(user=user, simulation=sim, coin=coin, type=kind, quantity=quantity, price=100,
+                                   time=timezone.now() - timedelta(days=days_ago, microseconds=123))
+    rebuild_lots(user.id, sim.id, coin.id)
+    WatchListItem.objects.create(user=user, coin=coin, simulation=sim)
+    return sim
+
+
+def _snapshot(sim):
+    return {
+        model: sorted(model.objects.filter(simulation=sim).values(), key=lambda r: str(r["id"]))
+        for model in archive.ARCHIVED_MODELS
+    }
+
+
+def _unversioned(rows):
+    return [{k: v for k, v in row.items() if k != "version"} for row in rows]
+
+
+def test_rows_round_trip_through_the_payload():
+    rows = [("transaction", {"id": "a", "time": datetime(2024, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc)})]
+    assert list(archive.decode_rows(archive.encode_rows(rows))) == \
+        [("transaction", {"id": "a", "time": "2024-01-01T12:00:00.123456+00:00"})]
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.prices.get_markets", return_value=[])
+@patch("web_app.utils.series.get_coin_market_chart", side_effect=_chart)
+@patch("web_app.utils.backtest.get_coin_market_chart", side_effect=_chart)
+def test_archive_and_restore_round_trip(mock_hist, _series, _markets, user, django_capture_on_commit_callbacks):
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    sim = _archived(user, btc)
+    hot = _snapshot(sim)
+    assert LotState.objects.filter(simulation=sim).exists()
+
+    with CaptureQueriesContext(connection) as ctx:
+        stored = archive.archive_simulation(sim, batch_size=2)
+    assert stored.counts == {"transaction": 3, "holding": 1, "watchlistitem": 1}
+    deletes = [q for q in ctx.captured_queries if q["sql"].startswith("DELETE") and "IN (" in q["sql"]]
+    assert len([q for q in deletes if "web_app_transaction" in q["sql"]]) == 2  # 3 rows in batches of 2
+    assert not Transaction.objects.filter(simulation=sim).exists()
+    assert not Holding.objects.filter(simulation=sim).exists()
+    assert not WatchListItem.objects.filter(simulation=sim).exists()
+    assert not LotState.objects.filter(simulation=sim).exists()
+    # Delta clients drop the archived holding and watchlist item.
+    since = max(hot[Holding][0]["version"], hot[WatchListItem][0]["version"])
+    assert deleted_since(user.id, "holding", since) == [str(hot[Holding][0]["id"])]
+    assert deleted_since(user.id, "watchlist", since) == [str(hot[WatchListItem][0]["id"])]
+    archived_at = current_state(user.id)[0]
+
+    # The frozen valuation stays valid while the ledger is cold: no re-freeze, no price lookups.
+    calls = mock_hist.call_count
+    summary = simulation_summaries([sim])[sim.id]
+    assert summary["current_value"] == 300.0 and summary["valued_at"] == sim.end_date.isoformat()
+    assert mock_hist.call_count == calls
+    assert archive.archive_simulation(sim) == stored  # already cold
+
+    sim.status = "ENDED"
+    with django_capture_on_commit_callbacks(execute=True):
+        sim.save()
+    assert not SimulationArchive.objects.exists()
+    restored = _snapshot(sim)
+    assert restored[Transaction] == hot[Transaction]
+    assert _unversioned(restored[WatchListItem]) == _unversioned(hot[WatchListItem])
+    assert [h["id"] for h in restored[Holding]] == [h["id"] for h in hot[Holding]]
+    assert restored[Holding][0]["quantity"] == hot[Holding][0]["quantity"]
+    # ...and pick them up again: newer versions, no tombstones left to contradict them.
+    assert restored[Holding][0]["version"] > archived_at and restored[WatchListItem][0]["version"] > archived_at
+    assert not SyncTombstone.objects.exists()
+    assert LotState.objects.filter(simulation=sim).exists()
+    assert simulation_summaries([sim])[sim.id]["current_value"] == 300.0
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.prices.get_markets", return_value=[])
+@patch("web_app.utils.series.get_coin_market_chart", side_effect=_chart)
+@patch("web_app.utils.backtest.get_coin_market_chart", side_effect=_chart)
+def test_cold_valuation_is_converted_to_a_new_currency(_hist, _series, _markets, user):
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    sim = _archived(user, btc)
+    archive.archive_simulation(sim)
+    FxRate.objects.create(currency="EUR", rate=0.5, fetched_at=timezone.now())  # 1 EUR = 2 USD
+    user.preferred_currency = "EUR"
+    user.save()
+
+    summary = simulation_summaries([sim])[sim.id]
+    assert summary["current_value"] == 150.0 and summary["invested"] == 100.0
+    assert summary["valued_at"] == sim.end_date.isoformat() and summary["metrics"]["currency"] == "EUR"
+
+
+@pytest.mark.django_db
+def test_only_status_changes_touch_the_archive(user):
+    with CaptureQueriesContext(connection) as ctx:
+        sim = Simulation.objects.create(user=user, name="Fresh", start_date=timezone.now().date())
+        sim.name = "Renamed"
+        sim.save()
+    assert not [q for q in ctx.captured_queries if "simulationarchive" in q["sql"] or "simulationvaluation" in q["sql"]]
+
+@pytest.mark.django_db
+@patch("web_app.utils.prices.get_markets", return_value=[])
+@patch("web_app.utils.series.get_coin_market_chart", side_effect=_chart)
+@patch("web_app.utils.backtest.get_coin_market_chart", side_effect=_chart)
+def test_archive_job_skips_simulations_it_cannot_freeze(_hist, _series, _markets, user):
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    odd = Coin.objects.create(id="oddcoin", symbol="ODD", name="Odd", current_price=7)
+    _archived(user, btc)
+    unpriced = _archived(user, odd)
+    Simulation.objects.create(user=user, name="Running", start_date=timezone.now().date())
+
+    call_command("archive_simulations", "--batch-size", "2")
+    assert SimulationArchive.objects.count() == 1
+    assert Transaction.objects.filter(simulation=unpriced).count() == 3
+    assert archive.archive_pending() == {"archived": 0, "skipped": 1, "rows": 0}
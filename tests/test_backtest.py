@@ -0,0 +1,104 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from web_app.models import Holding, Simulation, Transaction, User
+from web_app.utils.backtest import BacktestSpecError, backtest_stats, parse_spec, run_backtest
+
+TODAY = date(2024, 1, 1)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def _spec(**overrides):
+    data = {"strategy": "DCA", "coins": ["a", "b"], "start_date": "2023-01-01", "end_date": "2023-01-10",
+            "amount": 100, "every_days": 2, "fee_bps": 0, "slippage_bps": 0, **overrides}
+    return parse_spec(data, today=TODAY)
+
+
+def test_parse_spec_validation():
+    with pytest.raises(BacktestSpecError):
+        _spec(strategy="MOON")
+    with pytest.raises(BacktestSpecError):
+        _spec(end_date="2024-06-01")
+    with pytest.raises(BacktestSpecError):
+        _spec(amount=0)
+    assert _spec(weights={"a": 3, "b": 1})["weights"] == [0.75, 0.25]
+
+
+def test_dca_buys_on_schedule_with_fees_and_slippage():
+    prices = np.array([[10.0] * 5, [np.nan, np.nan, 20.0, 20.0, 20.0]])
+    result = run_backtest(prices, _spec(fee_bps=100, slippage_bps=100, every_days=2))
+    # Day 0 only buys coin a (b has no price yet); days 2 and 4 buy both.
+    assert result["day"].tolist() == [0, 2, 2, 4, 4]
+    assert result["price"][0] == pytest.approx(10.1)
+    assert result["quantity"][0] == pytest.approx(50 / 1.01 / 10.1)
+    assert result["fee"][0] == pytest.approx(50 / 1.01 * 0.01)
+    assert result["contributed"][-1] == pytest.approx(250)
+
+
+def test_rebalance_restores_target_weights():
+    prices = np.array([[10.0, 20.0, 20.0], [10.0, 10.0, 10.0]])
+    result = run_backtest(prices, _spec(strategy="REBALANCE", initial_cash=1000, every_days=2))
+    assert result["day"].tolist() == [0, 0, 2, 2]
+    assert result["is_buy"].tolist() == [True, True, False, True]  # sells first on a rebalance day
+    # Day 2: a is worth 1000, b 500 -> move 250 from a to b.
+    assert result["quantity"][2] == pytest.approx(12.5)
+    assert result["value"][-1] == pytest.approx(1500)
+    assert backtest_stats(result)["return_pct"] == pytest.approx(50)
+
+
+def test_threshold_buys_dips_and_sells_rallies():
+    prices = np.array([[10.0, 10.0, 8.0, 8.0, 12.0, 12.0]])
+    spec = _spec(strategy="THRESHOLD", coins=["a"], lookback_days=2, buy_below=0.1, sell_above=0.1,
+                 sell_fraction=0.5, amount=80)
+    result = run_backtest(prices, spec)
+    assert result["day"].tolist() == [2, 4]
+    assert result["is_buy"].tolist() == [True, False]
+    assert result["quantity"].tolist() == pytest.approx([10, 5])
+
+
+@pytest.mark.django_db
+def test_backtest_endpoint_writes_one_simulation():
+    user = User.objects.create_user(email="bt@example.com", username="bt@example.com", password="pass")
+    client = APIClient()
+    client.force_authenticate(user=user)
+    start = date.today() - timedelta(days=20)
+    start_ms = int(np.datetime64(start, "ms").astype(np.int64))
+    chart = {"prices": [[start_ms + i * 86_400_000, 100 + i] for i in range(30)]}
+    body = {"name": "DCA test", "strategy": "DCA", "coins": ["bitcoin"], "amount": 50, "every_days": 7,
+            "start_date": start.isoformat(), "end_date": (start + timedelta(days=14)).isoformat()}
+
+    with patch("web_app.utils.backtest.get_coin_market_chart", return_value=chart) as mock, \
+            patch("web_app.utils.series.get_coin_market_chart", return_value=chart), \
+            patch("web_app.utils.prices.get_markets", return_value=[]):
+        dry = client.post(reverse("simulation-backtest"), {**body, "dry_run": True}, format="json")
+        assert mock.call_count == 1
+        resp = client.post(reverse("simulation-backtest"), body, format="json")
+    assert dry.status_code == 200
+    assert not Simulation.objects.filter(name="DCA test").exclude(id=resp.data["simulation"]["id"]).exists()
+    # The second run reads the cached price matrix; freezing is left to the freeze job.
+    assert mock.call_count == 1
+    assert resp.data["simulation"]["valued_at"] is None
+    assert resp.status_code == 201
+    assert resp.data["stats"]["trades"] == 3
+    assert resp.data["stats"] == dry.data["stats"]
+
+    sim = Simulation.objects.get(id=resp.data["simulation"]["id"])
+    assert sim.status == "ENDED"
+    assert Transaction.objects.filter(simulation=sim).count() == 3
+    holding = Holding.objects.get(simulation=sim, coin_id="bitcoin")
+    assert float(holding.quantity) == pytest.approx(sum(50 / 1.001 / (p * 1.0005) for p in (100, 107, 114)), rel=1e-6)
+
+    dup = client.post(reverse("simulation-backtest"), body, format="json")
+    assert dup.status_code == 400
@@ -0,0 +1,114 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from web_app.models import Simulation, User
+from web_app.utils import benchmarks
+from web_app.utils.series import MS_PER_DAY
+
+MARKETS = [
+    {"id": "bitcoin", "market_cap": 300},
+    {"id": "ethereum", "market_cap": 100},
+    {"id": "newcoin", "market_cap": 0},
+]
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="bench@example.com", username="bench@example.com", password="pass")
+
+
+def _prices(coin_ids, currency, start, end):
+    """bitcoin 100 then 200 from yesterday on; ethereum flat at 10; anything else has no data."""
+    days = (end - start).days + 1
+    switch = (timezone.now().date() - timedelta(days=1) - start).days
+    rows = {"bitcoin": np.where(np.arange(days) >= switch, 200.0, 100.0), "ethereum": np.full(days, 10.0)}
+    return np.vstack([rows.get(c, np.full(days, np.nan)) for c in coin_ids])
+
+
+def test_parse_benchmarks():
+    assert benchmarks.parse_benchmarks(None) == ["coin:bitcoin"]
+    assert benchmarks.parse_benchmarks("TOP10, mcap,top10") == ["top10", "mcap"]
+    for bad in ("sp500", "coin:", "coin:a,coin:b,coin:c,coin:d"):
+        with pytest.raises(benchmarks.BenchmarkSpecError):
+            benchmarks.parse_benchmarks(bad)
+
+
+def test_bucket_range_shares_starts_within_a_window():
+    first, _ = benchmarks.bucket_range(date(2024, 3, 2), date(2024, 6, 1))
+    assert first <= date(2024, 3, 2) and (date(2024, 3, 2) - first).days < benchmarks.BENCHMARK_BUCKET_DAYS
+    assert benchmarks.bucket_range(first + timedelta(days=benchmarks.BENCHMARK_BUCKET_DAYS - 1), date(2024, 6, 1))[0] == first
+
+
+@patch("web_app.utils.benchmarks.get_markets", return_value=MARKETS)
+@patch("web_app.utils.benchmarks.historical_prices", side_effect=_prices)
+def test_basket_series_weights_and_cache(mock_prices, _markets):
+    today = timezone.now().date()
+    start = today - timedelta(days=3)
+    equal = benchmarks.benchmark_series("top10", "USD", start, today)
+    # newcoin has no prices and drops out; the rest are bought equally and held.
+    assert equal["coins"] == ["bitcoin", "ethereum"] and equal["missing"] == ["newcoin"]
+    assert equal["weights"] == [0.5, 0.5]
+    assert equal["index"].tolist() == [1.0, 1.0, 1.5, 1.5]
+
+    cap = benchmarks.benchmark_series("mcap", "USD", start, today)
+    assert cap["weights"] == [0.75, 0.25]
+    assert cap["index"][-1] == pytest.approx(1.75)
+
+    assert benchmarks.benchmark_series("top10", "usd", start, today)["weights"] == equal["weights"]
+    assert mock_prices.call_count == 2
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.benchmarks.historical_prices", side_effect=_prices)
+def test_compare_buys_the_benchmark_with_the_same_cash_flows(_prices_mock, user):
+    today = timezone.now().date()
+    sim = Simulation.objects.create(user=user, name="B", start_date=today - timedelta(days=2))
+    day0 = (today - timedelta(days=2)).toordinal() - date(1970, 1, 1).toordinal()
+    fake = {"t": [(day0 + i) * MS_PER_DAY + 1 for i in range(3)], "value": [100.0, 150.0, 300.0],
+            "invested": [100.0, 100.0, 200.0], "missing": []}
+    client = APIClient()
+    client.force_authenticate(user=user)
+    with patch("web_app.utils.benchmarks.simulation_series", return_value=fake):
+        resp = client.get(reverse("simulation-benchmarks", kwargs={"sim_id": sim.id}), {"benchmark": "coin:bitcoin,coin:nope"})
+    assert resp.status_code == 200
+    assert resp.data["unavailable"] == ["coin:nope"]
+    [btc] = resp.data["benchmarks"]
+    # 100 buys 100 units at level 1; the later 100 buys 50 units at level 2.
+    assert btc["value"] == [100.0, 200.0, 300.0]
+    assert btc["excess"] == [0.0, -50.0, 0.0]
+    assert btc["beat"] is False
+
+    bad = client.get(reverse("simulation-benchmarks", kwargs={"sim_id": sim.id}), {"benchmark": "sp500"})
+    assert bad.status_code == 400 and bad.data["code"] == 1000
+    other = User.objects.create_user(email="other-b@example.com", username="other-b", password="pass")
+    theirs = Simulation.objects.create(user=other, name="T", start_date=today)
+    assert client.get(reverse("simulation-benchmarks", kwargs={"sim_id": theirs.id})).status_code == 404
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.benchmarks.get_markets", return_value=MARKETS)
+@patch("web_app.utils.benchmarks.historical_prices", side_effect=_prices)
+def test_precompute_builds_one_series_per_range(mock_prices, _markets, user):
+    today = timezone.now().date()
+    for name in ("a", "b"):  # same bucket, shared series
+        Simulation.objects.create(user=user, name=name, start_date=today - timedelta(days=1))
+    call_command("precompute_benchmarks", "--benchmarks", "coin:bitcoin,top10")
+    assert mock_prices.call_count == 2
+    start, end = benchmarks.bucket_range(today - timedelta(days=1), today)
+    assert benchmarks.benchmark_series("coin:bitcoin", "USD", start, end) is not None
+    assert mock_prices.call_count == 2
@@ -1,7 +1,13 @@
 import decimal
+import io
+from datetime import date, datetime, timezone as dt_timezone
 from unittest.mock import patch
 
+import numpy as np
 import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
 
 from web_app.utils import currency
 
@@ -12,26 +18,76 @@ def test_normalise_standardises_input():
     assert currency.normalise(None) == currency.DEFAULT_CURRENCY
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.mark.django_db
 @patch("web_app.utils.currency.get_current_prices")
 def test_usd_coin_rate_uses_cache(mock_prices):
     mock_prices.return_value = {
-        currency.STABLE_COIN_ID: {"eur": "0.91"},
+        currency.STABLE_COIN_ID: {"eur": "0.91", "aud": "1.52"},
     }
 
-    currency._usd_coin_rate.cache_clear()
-
-    # First call should fetch from API through the patched function.
+    # First call should fetch every supported currency in one upstream call.
     rate = currency._usd_coin_rate("eur")
     assert rate == decimal.Decimal("0.91")
     mock_prices.assert_called_once()
+    assert mock_prices.call_args[0][1] == "aud,eur"
 
-    # Second call should use cached value and not call the API again.
-    again = currency._usd_coin_rate("eur")
-    assert again == rate
+    # Subsequent calls read the shared table and do not call the API again.
+    assert currency._usd_coin_rate("eur") == rate
+    assert currency._usd_coin_rate("aud") == decimal.Decimal("1.52")
     mock_prices.assert_called_once()
 
-    # Clear the cache for other tests.
-    currency._usd_coin_rate.cache_clear()
+
+@pytest.mark.django_db
+@patch("web_app.utils.currency.get_current_prices")
+def test_usd_coin_rate_failure_is_not_memoized(mock_prices):
+    mock_prices.return_value = None
+    assert currency._usd_coin_rate("eur") is None
+
+    # Within the backoff window the upstream is not asked again...
+    mock_prices.return_value = {currency.STABLE_COIN_ID: {"eur": "0.91"}}
+    assert currency._usd_coin_rate("eur") is None
+    assert mock_prices.call_count == 1
+
+    # ...but the failure itself is not cached: once the marker expires the next read refreshes.
+    cache.delete(currency.FX_REFRESH_BACKOFF_KEY)
+    assert currency._usd_coin_rate("eur") == decimal.Decimal("0.91")
+    assert mock_prices.call_count == 2
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.currency.get_current_prices", side_effect=TypeError("upstream down"))
+def test_usd_coin_rate_backs_off_after_an_upstream_error(mock_prices):
+    assert currency._usd_coin_rate("eur") is None
+    assert currency.convert_amount(10, "EUR", "USD") == decimal.Decimal("10")
+    assert mock_prices.call_count == 1
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.currency.get_current_prices")
+def test_usd_coin_rate_refreshes_after_ttl(mock_prices, monkeypatch):
+    mock_prices.return_value = {currency.STABLE_COIN_ID: {"eur": "0.91"}}
+    now = [1000.0]
+    monkeypatch.setattr(currency.time, "time", lambda: now[0])
+    assert currency._usd_coin_rate("eur") == decimal.Decimal("0.91")
+
+    now[0] += currency.FX_RATE_TTL + 1
+    mock_prices.return_value = {currency.STABLE_COIN_ID: {"eur": "0.93"}}
+    assert currency._usd_coin_rate("eur") == decimal.Decimal("0.93")
+
+    # A failed refresh falls back to the last known rate.
+    now[0] += currency.FX_RATE_TTL + 1
+    mock_prices.return_value = None
+    assert currency._usd_coin_rate("eur") == decimal.Decimal("0.93")
+    assert mock_prices.call_count == 3
+    assert currency._usd_coin_rate("eur") == decimal.Decimal("0.93")
+    assert mock_prices.call_count == 3  # backing off: the stale rate is served without going upstream
 
 
 @patch("web_app.utils.currency._usd_coin_rate")
@@ -54,3 +110,118 @@ def test_convert_amount_falls_back_when_rate_missing(mock_rate):
 def test_convert_amount_invalid_input_raises():
     with pytest.raises(ValueError):
         currency.convert_amount(object(), "USD", "EUR")
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.currency.get_current_prices")
+def test_refresh_fx_rates_command(mock_prices):
+    mock_prices.return_value = {currency.STABLE_COIN_ID: {"eur": "0.91", "aud": "1.52"}}
+    out = io.StringIO()
+    call_command("refresh_fx_rates", stdout=out)
+    assert "Refreshed 2 FX rates" in out.getvalue()
+
+    # Rates reach other processes through the FxRate table, not this process's cache.
+    cache.clear()
+    assert currency._usd_coin_rate("aud") == decimal.Decimal("1.52")
+    mock_prices.assert_called_once()
+
+    mock_prices.return_value = None
+    with pytest.raises(CommandError):
+        call_command("refresh_fx_rates", "eur", stdout=io.StringIO())
+
+
+@patch("web_app.utils.currency._usd_coin_rate")
+def test_convert_amounts_resolves_rates_once(mock_rate):
+    mock_rate.side_effect = [decimal.Decimal("2"), decimal.Decimal("4")]
+    result = currency.convert_amounts([1, "2.5", decimal.Decimal("3")], "CAD", "AUD")
+    assert result.tolist() == [2.0, 5.0, 6.0]
+    assert mock_rate.call_count == 2
+
+
+@patch("web_app.utils.currency._usd_coin_rate")
+def test_convert_amounts_exact_matches_convert_amount(mock_rate):
+    mock_rate.side_effect = lambda code: {"EUR": decimal.Decimal("0.91"), "AUD": decimal.Decimal("1.53")}[code]
+    values = ["10", "0.3333333", "12345.6789"]
+    exact = currency.convert_amounts(values, "EUR", "AUD", exact=True)
+    assert exact == [currency.convert_amount(v, "EUR", "AUD") for v in values]
+
+
+def test_convert_amounts_numpy_array_same_currency():
+    arr = np.array([1.5, 2.5])
+    result = currency.convert_amounts(arr, "usd", "USD")
+    assert result.tolist() == [1.5, 2.5]
+    assert result is not arr
+
+
+@patch("web_app.utils.currency._usd_coin_rate", return_value=None)
+def test_convert_amounts_missing_rate_returns_values(mock_rate):
+    assert currency.convert_amounts(["15"], "CAD", "JPY", exact=True) == [decimal.Decimal("15")]
+
+
+def test_convert_amounts_invalid_input_raises():
+    with pytest.raises(ValueError):
+        currency.convert_amounts([object()], "USD", "EUR")
+
+
+@patch("web_app.utils.currency._usd_coin_rate")
+def test_convert_rows_groups_by_row_currency(mock_rate):
+    mock_rate.side_effect = lambda code: {
+        "USD": decimal.Decimal("1"),
+        "EUR": decimal.Decimal("0.5"),
+        "AUD": decimal.Decimal("2"),
+    }[code]
+    rows = [
+        {"price": "10", "cost": None, "price_currency": "EUR"},
+        {"price": "10", "cost": "4", "price_currency": "USD"},
+        {"price": "10", "cost": "2", "price_currency": "EUR"},
+    ]
+    out = currency.convert_rows(rows, ["price", "cost"], "AUD", currency_field="price_currency")
+    assert [r["price"] for r in out] == [40.0, 20.0, 40.0]
+    assert [r["cost"] for r in out] == [None, 8.0, 8.0]
+    assert all(r["price_currency"] == "AUD" for r in out)
+    assert rows[0]["price_currency"] == "EUR"
+
+
+@patch("web_app.utils.currency._usd_coin_rate")
+def test_convert_rows_keeps_the_label_of_unconverted_rows(mock_rate):
+    mock_rate.side_effect = lambda code: {"USD": decimal.Decimal("1"), "AUD": decimal.Decimal("2")}.get(code)
+    rows = [{"price": "10", "price_currency": "CAD"}, {"price": "10", "price_currency": "USD"}]
+    out = currency.convert_rows(rows, ["price"], "AUD", currency_field="price_currency")
+    assert out == [{"price": "10", "price_currency": "CAD"}, {"price": 20.0, "price_currency": "AUD"}]
+
+
+def _chart(points):
+    return {"prices": [[day * currency.MS_PER_DAY + offset, rate] for day, offset, rate in points]}
+
+
+@patch("web_app.utils.currency.get_coin_market_chart")
+def test_historical_rates_as_of_lookup(mock_chart):
+    # Two samples on day 10 (the later one wins), then day 12.
+    mock_chart.return_value = _chart([(10, 0, 0.90), (10, 3600_000, 0.92), (12, 0, 0.95)])
+    dates = np.array(["1970-01-05", "1970-01-12", "1970-01-13", "1970-02-01"], dtype="datetime64[D]")
+    rates = currency.historical_rates("eur", dates)
+    assert rates.tolist() == [0.92, 0.92, 0.95, 0.95]
+
+    # The table is shared through the cache; a second lookup makes no upstream call.
+    currency.historical_rates("EUR", [datetime(1970, 1, 13, tzinfo=dt_timezone.utc)])
+    mock_chart.assert_called_once()
+
+
+@patch("web_app.utils.currency.get_coin_market_chart", return_value=None)
+@patch("web_app.utils.currency._usd_coin_rate", return_value=None)
+def test_historical_rates_unavailable_is_not_cached(mock_rate, mock_chart):
+    assert np.isnan(currency.historical_rates("eur", [date(2024, 1, 1)])).all()
+    # Missing rates convert as identity.
+    assert currency.convert_at_dates([5], [date(2024, 1, 1)], "USD", "EUR").tolist() == [5.0]
+    assert cache.get(currency.FX_HISTORY_CACHE_KEY.format(currency="EUR")) is None
+
+
+@patch("web_app.utils.currency.get_coin_market_chart")
+def test_convert_at_dates_mixed_currencies(mock_chart):
+    mock_chart.side_effect = lambda coin, vs, days: {
+        "eur": _chart([(0, 0, 0.5), (1, 0, 0.25)]),
+        "aud": _chart([(0, 0, 2.0), (1, 0, 4.0)]),
+    }[vs]
+    dates = [date(1970, 1, 1), date(1970, 1, 2), date(1970, 1, 2)]
+    out = currency.convert_at_dates([1, 1, 10], dates, ["EUR", "EUR", "USD"], "AUD")
+    assert out.tolist() == [4.0, 16.0, 40.0]
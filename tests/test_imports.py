@@ -0,0 +1,145 @@
+import io
+import uuid
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from web_app.models import Holding, PortfolioSummary, Transaction, User
+from web_app.utils.imports import ImportFormatError, import_transactions
+
+CSV = """coin,side,qty,price,currency,time
+bitcoin,BUY,2,100,USD,2024-01-01T00:00:00Z
+ethereum,buy,1,,USD,2024-01-02
+bitcoin,SELL,1,150,USD,2024-01-03T00:00:00Z
+bitcoin,HOLD,1,150,USD,2024-01-03
+dogecoin,BUY,abc,1,USD,2024-01-03
+"""
+
+CHART = {"prices": [[1704067200000, 40.0], [1704153600000, 50.0]]}  # 2024-01-01, 2024-01-02
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="imp@example.com", username="imp@example.com", password="pass")
+
+
+@pytest.mark.django_db
+def test_import_streams_rows_and_reports_errors(user):
+    with patch("web_app.utils.imports.get_coin_market_chart", return_value=CHART) as mock_chart:
+        report = import_transactions(user, io.StringIO(CSV), chunk_size=2)
+
+    assert report["rows"] == 5
+    assert report["imported"] == 3
+    assert report["failed"] == 2
+    assert [e["line"] for e in report["errors"]] == [5, 6]
+    assert report["rows_per_second"] > 0
+    mock_chart.assert_called_once()
+
+    eth = Transaction.objects.get(user=user, coin_id="ethereum")
+    assert eth.price == Decimal("50")
+    assert eth.time.date().isoformat() == "2024-01-02"
+
+    sell = Transaction.objects.get(user=user, coin_id="bitcoin", type="SELL")
+    assert sell.realised_profit == Decimal("50")
+    assert Holding.objects.get(user=user, coin_id="bitcoin").quantity == Decimal("1")
+    assert Holding.objects.get(user=user, coin_id="ethereum").avg_price == Decimal("50")
+    assert not PortfolioSummary.objects.filter(user=user).exists()  # rebuilt from the ledger on next read
+
+
+@pytest.mark.django_db
+def test_import_rejects_sells_beyond_the_running_position(user):
+    csv_text = """coin,side,qty,price,time
+bitcoin,BUY,1,100,2024-01-01
+bitcoin,SELL,2,150,2024-01-02
+bitcoin,SELL,1,150,2024-01-03
+"""
+    with patch("web_app.utils.imports.get_coin_market_chart") as mock_chart:
+        report = import_transactions(user, io.StringIO(csv_text))
+    mock_chart.assert_not_called()
+    assert report["imported"] == 2
+    assert report["errors"] == [{"line": 3, "detail": "sell exceeds the quantity held"}]
+    assert list(Transaction.objects.filter(user=user).order_by("time").values_list("type", "quantity")) == \
+        [("BUY", Decimal("1")), ("SELL", Decimal("1"))]
+    assert not Holding.objects.filter(user=user).exists()
+
+
+@pytest.mark.django_db
+def test_import_keeps_existing_later_sells_covered(user):
+    existing = """coin,side,qty,price,time
+bitcoin,BUY,2,100,2024-01-01
+bitcoin,SELL,2,150,2024-01-10
+"""
+    import_transactions(user, io.StringIO(existing))
+    backdated = """coin,side,qty,price,time
+bitcoin,SELL,1,120,2024-01-05
+bitcoin,BUY,1,130,2024-01-20
+bitcoin,SELL,1,140,2024-01-25
+"""
+    report = import_transactions(user, io.StringIO(backdated))
+    assert report["errors"] == [{"line": 2, "detail": "sell would leave a later sell short"}]
+    assert report["imported"] == 2
+    assert not Transaction.objects.filter(user=user, time__date="2024-01-05").exists()
+    sells = Transaction.objects.filter(user=user, type="SELL").order_by("time")
+    assert [s.cost_basis for s in sells] == [Decimal("200"), Decimal("130")]
+    assert not Holding.objects.filter(user=user).exists()
+
+
+@pytest.mark.django_db
+def test_import_rolls_back_when_the_lot_engine_reports_oversold_rows(user):
+    csv_text = """coin,side,qty,price,time
+bitcoin,BUY,1,100,2024-01-01
+"""
+    with patch("web_app.utils.imports.rebuild_lots", return_value={"oversold": [uuid.uuid4().hex]}):
+        report = import_transactions(user, io.StringIO(csv_text))
+    assert report["imported"] == 0
+    assert report["errors"] == [{"line": 0, "detail": "sell exceeds the quantity held"}]
+    assert not Transaction.objects.filter(user=user).exists()
+
+
+@pytest.mark.django_db
+def test_import_prices_rows_before_opening_a_transaction(user):
+    from django.db import connection
+
+    depth = []
+    chart = lambda *args, **kwargs: depth.append(len(connection.savepoint_ids)) or CHART
+    with patch("web_app.utils.imports.get_coin_market_chart", side_effect=chart):
+        import_transactions(user, io.StringIO(CSV))
+    baseline = len(connection.savepoint_ids)
+    assert depth == [baseline]
+
+
+@pytest.mark.django_db
+def test_import_rejects_missing_columns(user):
+    with pytest.raises(ImportFormatError):
+        import_transactions(user, io.StringIO("coin,qty\nbitcoin,1\n"))
+
+
+@pytest.mark.django_db
+def test_import_endpoint(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    upload = SimpleUploadedFile("trades.csv", CSV.encode(), content_type="text/csv")
+    with patch("web_app.utils.imports.get_coin_market_chart", return_value=CHART):
+        resp = client.post(reverse("transactions-import"), {"file": upload}, format="multipart")
+    assert resp.status_code == 201
+    assert resp.data["imported"] == 3
+
+    bad = SimpleUploadedFile("trades.csv", b"foo,bar\n1,2\n", content_type="text/csv")
+    resp = client.post(reverse("transactions-import"), {"file": bad}, format="multipart")
+    assert resp.status_code == 400
+    assert resp.data["code"] == 1000
+
+
+@pytest.mark.django_db
+def test_import_command(user, tmp_path):
+    path = tmp_path / "trades.csv"
+    path.write_text("coin,side,qty,price,time\nbitcoin,BUY,1,10,2024-01-01\n")
+    out = io.StringIO()
+    call_command("import_transactions", str(path), "--user", user.email, stdout=out)
+    assert "Imported 1 of 1 rows" in out.getvalue()
+    assert Holding.objects.get(user=user, coin_id="bitcoin").quantity == Decimal("1")
@@ -0,0 +1,87 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from web_app.models import Coin, LeaderboardEntry, Simulation, Transaction, User
+from web_app.utils import leaderboard
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def _prices(coin_ids, currency, start, end):
+    """31 daily closes: bitcoin 100 -> 150 over the last week, ethereum 50 throughout, anything else unpriced."""
+    days = (end - start).days + 1
+    rows = {"bitcoin": np.where(np.arange(days) >= days - 7, 150.0, 100.0), "ethereum": np.full(days, 50.0)}
+    return np.vstack([rows.get(c, np.full(days, np.nan)) for c in coin_ids])
+
+
+def test_window_returns_value_holdings_against_one_matrix():
+    prices = np.array([[80.0] + [100.0] * 23 + [120.0] * 7, [np.nan] * 30 + [10.0]])
+    quantity = np.array([[1.0, 0.0], [1.0, 1.0], [0.0, 0.0]])
+    result = leaderboard.window_returns(quantity, prices, np.array([100.0, 90.0, 0.0]), np.array([0.0, 0.0, 0.0]))
+    assert result["value"].tolist() == [120.0, 130.0, 0.0]
+    assert result["7d"][0] == pytest.approx(20.0) and result["30d"][0] == pytest.approx(50.0)
+    assert result["all"][0] == pytest.approx(20.0)
+    # The second simulation holds a coin without an old price, so only "all" ranks it.
+    assert np.isnan(result["7d"][1]) and result["all"][1] == pytest.approx(130 / 90 * 100 - 100)
+    assert np.isnan(result["all"][2])
+
+
+def test_top_k_keeps_the_best_finite_scores_in_order():
+    assert leaderboard.top_k(np.array([5.0, np.nan, 9.0, 5.0, -1.0]), 3) == [2, 0, 3]
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.leaderboard.historical_prices", side_effect=_prices)
+def test_build_leaderboard_and_endpoint(mock_prices):
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    eth = Coin.objects.create(id="ethereum", symbol="ETH", name="Ethereum")
+    users = [User.objects.create_user(email=f"lb{i}@example.com", username=f"lb{i}", password="pass") for i in range(3)]
+    today = timezone.now().date()
+
+    def sim(user, name, coin, price, status="ACTIVE"):
+        s = Simulation.objects.create(user=user, name=name, start_date=today, status=status)
+        Transaction.objects.create(user=user, simulation=s, coin=coin, type="BUY", quantity=1, price=price)
+        return s
+
+    winner = sim(users[0], "All in BTC", btc, 100)
+    flat = sim(users[1], "ETH", eth, 50)
+    cheap = sim(users[2], "Cheap BTC", btc, 50)
+    sim(users[2], "Ended", btc, 10, status="ENDED")
+
+    with CaptureQueriesContext(connection) as ctx:
+        written = leaderboard.build_leaderboard()
+    assert written == {"7d": 3, "30d": 3, "all": 3}
+    selects = [q for q in ctx.captured_queries if q["sql"].startswith("SELECT")]
+    assert len(selects) == 1  # one GROUP BY for every simulation
+    assert mock_prices.call_count == 1
+
+    rows = list(LeaderboardEntry.objects.filter(window="all").values_list("simulation_id", "return_pct"))
+    assert rows == [(cheap.id, 200.0), (winner.id, 50.0), (flat.id, 0.0)]
+
+    client = APIClient()
+    client.force_authenticate(user=users[1])
+    resp = client.get(reverse("simulation-leaderboard"), {"window": "7d", "limit": 2})
+    assert resp.status_code == 200
+    assert [r["return_pct"] for r in resp.data["rows"]] == [50.0, 50.0]
+    assert {r["name"] for r in resp.data["rows"]} == {"All in BTC", "Cheap BTC"}
+    assert not any(r["mine"] for r in resp.data["rows"])
+    assert {r["user"] for r in resp.data["rows"]} == {f"Trader #{u.id.hex[:8]}" for u in (users[0], users[2])}
+    assert client.get(reverse("simulation-leaderboard"), {"window": "1y"}).status_code == 400
+
+    # Rebuilding replaces the table rather than appending to it.
+    call_command("build_leaderboard", "--size", "1")
+    assert LeaderboardEntry.objects.count() == 3
@@ -0,0 +1,182 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from web_app.models import Coin, Holding, LotState, Transaction, User
+from web_app.utils import lots
+from web_app.utils.lots import LotBook, rebuild_lots, replay
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="lots@example.com", username="lots@example.com", password="pass")
+
+
+@pytest.fixture
+def client(user):
+    c = APIClient()
+    c.force_authenticate(user=user)
+    return c
+
+
+@pytest.fixture
+def coin(db):
+    return Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+
+
+def _tx(user, coin, kind, quantity, price, minutes):
+    tx = Transaction.objects.create(user=user, coin=coin, type=kind, quantity=quantity, price=price)
+    tx.time = timezone.now() - timedelta(days=1) + timedelta(minutes=minutes)
+    Transaction.objects.filter(pk=tx.pk).update(time=tx.time)
+    return tx
+
+
+@pytest.mark.parametrize("method, cost, remaining_avg", [
+    ("FIFO", 100.0, 200.0),
+    ("LIFO", 200.0, 100.0),
+    ("AVERAGE", 150.0, 150.0),
+])
+def test_lot_book_methods(method, cost, remaining_avg):
+    book = LotBook(method)
+    book.buy(1, 100)
+    book.buy(1, 200)
+    closed, realised = book.sell(1, 250)
+    assert closed == pytest.approx(cost)
+    assert realised == pytest.approx(250 - cost)
+    assert book.quantity == pytest.approx(1)
+    assert book.cost / book.quantity == pytest.approx(remaining_avg)
+
+
+def test_lot_book_sell_is_capped_and_pack_round_trips():
+    book = LotBook("FIFO")
+    costs, realised = replay(book, ["BUY", "BUY", "SELL", "SELL"], [2, 1, 1.5, 5], [10, 20, 30, 40])
+    assert costs == pytest.approx([20, 20, 15, 25])
+    assert realised == pytest.approx([0, 0, 30, 35])
+    assert book.quantity == 0
+    assert book.shortfall == pytest.approx(3.5)
+
+    book = LotBook("FIFO")
+    replay(book, ["BUY", "BUY", "SELL"], [2, 1, 1.5], [10, 20, 30])
+    restored = LotBook.unpack("FIFO", book.pack(), book.realised)
+    assert restored.lots() == pytest.approx(book.lots())
+    assert restored.quantity == pytest.approx(1.5)
+    assert restored.realised == pytest.approx(book.realised)
+
+
+def test_unknown_method_rejected():
+    with pytest.raises(ValueError):
+        LotBook("HIFO")
+
+
+@pytest.mark.django_db
+def test_delete_replays_later_sells_and_fixes_holding(client, user, coin):
+    user.cost_basis_method = "FIFO"
+    user.save()
+    first = _tx(user, coin, "BUY", 1, 100, 0)
+    _tx(user, coin, "BUY", 1, 200, 1)
+    sell = _tx(user, coin, "SELL", 1, 300, 2)
+    rebuild_lots(user.id, None, coin.id)
+    sell.refresh_from_db()
+    assert sell.realised_profit == Decimal("200")
+
+    resp = client.delete(reverse("transaction-delete", kwargs={"tx_id": first.id}))
+    assert resp.status_code == 204
+    sell.refresh_from_db()
+    assert sell.cost_basis == Decimal("200")
+    assert sell.realised_profit == Decimal("100")
+    assert not Holding.objects.filter(user=user, coin=coin).exists()
+
+
+def test_replay_reports_oversold_rows():
+    book, oversold = LotBook("AVERAGE"), []
+    replay(book, ["BUY", "SELL", "BUY", "SELL", "SELL"], [0.1 + 0.2, 0.3, 1, 0.5, 0.7], [10, 20, 30, 40, 50], oversold)
+    assert oversold == [4]  # float drift on row 1 is not an oversell
+    assert book.shortfall == pytest.approx(0.2)
+
+
+@pytest.mark.django_db
+def test_delete_rejected_when_later_sells_would_be_oversold(client, user, coin):
+    first = _tx(user, coin, "BUY", 1, 100, 0)
+    sell = _tx(user, coin, "SELL", 1, 300, 1)
+    rebuild_lots(user.id, None, coin.id)
+
+    resp = client.delete(reverse("transaction-delete", kwargs={"tx_id": first.id}))
+    assert resp.status_code == 400
+    assert resp.json()["code"] == 1001
+    assert Transaction.objects.filter(pk=first.pk).exists()
+    sell.refresh_from_db()
+    assert sell.realised_profit == Decimal("200")
+
+
+@pytest.mark.django_db
+def test_full_rebuild_of_100k_row_ledger_is_sub_second(user, coin):
+    rng, held, rows = random.Random(7), 0.0, []
+    for _ in range(100_000):
+        sell = held > 0 and rng.random() < 0.4
+        q = rng.uniform(0, held) if sell else rng.uniform(0.001, 2)
+        held += -q if sell else q
+        rows.append(Transaction(user=user, coin=coin, type="SELL" if sell else "BUY",
+                                quantity=Decimal(f"{q:.10f}"), price=Decimal(f"{rng.uniform(100, 70000):.4f}")))
+    Transaction.objects.bulk_create(rows, batch_size=5000)
+    assert rebuild_lots(user.id, None, coin.id)["oversold"] == []
+
+    started = time.perf_counter()
+    result = rebuild_lots(user.id, None, coin.id)
+    assert time.perf_counter() - started < 1.0
+    assert result["replayed"] == 100_000 and result["changed"] == []
+
+
+@pytest.mark.django_db
+def test_replay_starts_from_latest_checkpoint(user, coin):
+    with patch.object(lots, "CHECKPOINT_INTERVAL", 2):
+        txs = [_tx(user, coin, "BUY", 1, 10 * (i + 1), i) for i in range(5)]
+        result = rebuild_lots(user.id, None, coin.id)
+        assert result["replayed"] == 5
+        assert sorted(LotState.objects.values_list("position", flat=True)) == [2, 4, 5]
+
+        # A change at the 4th row restarts from the checkpoint after row 2
+        Transaction.objects.filter(pk=txs[3].pk).delete()
+        result = rebuild_lots(user.id, None, coin.id, from_time=txs[3].time)
+        assert result["replayed"] == 2
+        assert sorted(LotState.objects.values_list("position", flat=True)) == [2, 4]
+
+        # An append replays one row and replaces nothing but the head
+        new = _tx(user, coin, "BUY", 1, 60, 10)
+        assert lots.apply_transaction(new)["replayed"] == 1
+        assert sorted(LotState.objects.values_list("position", flat=True)) == [2, 4, 5]
+
+    holding = Holding.objects.get(user=user, coin=coin)
+    assert holding.quantity == Decimal("5")
+    assert holding.avg_price == Decimal("34")
+
+
+@pytest.mark.django_db
+def test_portfolio_sell_uses_cost_basis_method(client, user):
+    user.cost_basis_method = "LIFO"
+    user.save()
+    client.post(reverse("portfolio"), {"coin_id": "bitcoin", "quantity": "1", "price": "100"})
+    client.post(reverse("portfolio"), {"coin_id": "bitcoin", "quantity": "1", "price": "200"})
+    resp = client.post(reverse("portfolio-sell"), {"coin_id": "bitcoin", "quantity": "1", "price": "250"})
+    assert resp.data["realised_total"] == 50.0
+    holding = Holding.objects.get(user=user, simulation=None)
+    assert holding.avg_price == Decimal("100")
+
+
+@pytest.mark.django_db
+def test_method_change_replays_ledger(client, user):
+    client.post(reverse("portfolio"), {"coin_id": "bitcoin", "quantity": "1", "price": "100"})
+    client.post(reverse("portfolio"), {"coin_id": "bitcoin", "quantity": "1", "price": "200"})
+    client.post(reverse("portfolio-sell"), {"coin_id": "bitcoin", "quantity": "1", "price": "250"})
+    assert client.get(reverse("portfolio")).data["realised_total"] == 100.0
+
+    resp = client.put(reverse("profile"), {"cost_basis_method": "FIFO"})
+    assert resp.status_code == 200
+    assert client.get(reverse("portfolio")).data["realised_total"] == 150.0
+    assert Holding.objects.get(user=user, simulation=None).avg_price == Decimal("200")
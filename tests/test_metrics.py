@@ -0,0 +1,134 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from web_app.models import Coin, PortfolioSnapshot, Simulation, Transaction, User
+from web_app.utils import metrics
+from web_app.utils.series import MS_PER_DAY
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="metrics@example.com", username="metrics@example.com", password="pass")
+
+
+@pytest.fixture
+def client(user):
+    c = APIClient()
+    c.force_authenticate(user=user)
+    return c
+
+
+def _days(n):
+    return np.arange(n) * MS_PER_DAY
+
+
+def test_risk_metrics_on_a_known_series():
+    result = metrics.risk_metrics(_days(4), [100, 110, 99, 120], [100] * 4)
+    returns = np.array([0.1, -0.1, 120 / 99 - 1])
+    assert result["periods"] == 3
+    assert result["periods_per_year"] == 365
+    assert result["total_return_pct"] == pytest.approx(20.0)
+    assert result["max_drawdown_pct"] == pytest.approx(-10.0)
+    assert result["max_drawdown_days"] == 1.0  # peak on day 1, recovered by day 3
+    assert result["volatility_pct"] == pytest.approx(returns.std(ddof=1) * np.sqrt(365) * 100, rel=1e-6)
+    assert result["sharpe"] == pytest.approx(returns.mean() * 365 / (returns.std(ddof=1) * np.sqrt(365)), rel=1e-4)
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2)) * np.sqrt(365)
+    assert result["sortino"] == pytest.approx(returns.mean() * 365 / downside, rel=1e-4)
+
+
+def test_risk_metrics_strip_cash_flows_and_empty_periods():
+    # Money added on day 2 is not a return; days before the first buy are skipped.
+    result = metrics.risk_metrics(_days(5), [0, 100, 200, 200, 220], [0, 100, 200, 200, 200])
+    assert result["periods"] == 3
+    assert result["total_return_pct"] == pytest.approx(10.0)
+    assert result["max_drawdown_pct"] == 0.0
+    assert result["max_drawdown_days"] == 0.0
+
+    flat = metrics.risk_metrics(_days(3), [100, 100, 100], [100] * 3)
+    assert flat["volatility_pct"] == 0.0 and flat["sharpe"] is None and flat["sortino"] is None
+    assert metrics.risk_metrics([], [], [])["total_return_pct"] is None
+
+
+def test_underwater_duration_counts_an_unrecovered_drawdown():
+    result = metrics.risk_metrics(_days(5), [100, 80, 90, 95, 99], [100] * 5)
+    assert result["max_drawdown_pct"] == pytest.approx(-20.0)
+    assert result["max_drawdown_days"] == 4.0
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.prices.get_markets", return_value=[])
+@patch("web_app.utils.series.get_coin_market_chart")
+def test_simulation_metrics_are_cached_and_listed(mock_chart, _markets, client, user):
+    now = timezone.now()
+    start_ms = int((now - timedelta(days=3)).timestamp() * 1000)
+    mock_chart.return_value = {"prices": [[start_ms, 100], [start_ms + 2 * MS_PER_DAY, 150]]}
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    sim = Simulation.objects.create(user=user, name="M", start_date=(now - timedelta(days=3)).date())
+    Transaction.objects.create(user=user, simulation=sim, coin=btc, type="BUY", quantity=1, price=100,
+                               price_currency="USD", time=now - timedelta(days=3))
+
+    listed = client.get(reverse("simulations")).data
+    rows = listed if isinstance(listed, list) else listed["results"]
+    assert rows[0]["metrics"] is None  # listing never computes
+
+    resp = client.get(reverse("simulation-metrics", kwargs={"sim_id": sim.id}))
+    assert resp.status_code == 200
+    assert resp.data["total_return_pct"] == pytest.approx(50.0, abs=0.01)
+    assert resp.data["max_drawdown_pct"] == 0.0
+    client.get(reverse("simulation-metrics", kwargs={"sim_id": sim.id}))
+    assert mock_chart.call_count == 1
+
+    listed = client.get(reverse("simulations")).data
+    rows = listed if isinstance(listed, list) else listed["results"]
+    assert rows[0]["metrics"]["total_return_pct"] == resp.data["total_return_pct"]
+
+    # A new trade changes the transaction fingerprint, so the cached metrics no longer apply.
+    Transaction.objects.create(user=user, simulation=sim, coin=btc, type="BUY", quantity=1, price=150,
+                               price_currency="USD", time=now - timedelta(hours=1))
+    assert metrics.cached_simulation_metrics([sim])[sim.id] is None
+
+    other = User.objects.create_user(email="other-m@example.com", username="other-m", password="pass")
+    theirs = Simulation.objects.create(user=other, name="T", start_date=now.date())
+    assert client.get(reverse("simulation-metrics", kwargs={"sim_id": theirs.id})).status_code == 404
+
+
+def test_price_watermark_freezes_for_ended_simulations():
+    now = timezone.now()
+    ended = Simulation(name="E", start_date=date(2024, 1, 1), end_date=date(2024, 2, 1))
+    running = Simulation(name="R", start_date=date(2024, 1, 1))
+    later = now + timedelta(seconds=metrics.CACHE_TIMEOUT)
+    assert metrics.price_watermark(ended, now) == metrics.price_watermark(ended, later) == "ended:2024-02-01"
+    assert metrics.price_watermark(running, now) != metrics.price_watermark(running, later)
+
+
+@pytest.mark.django_db
+def test_portfolio_metrics_from_snapshots(client, user):
+    today = timezone.now().date()
+    rows = [(100, 100, 0), (120, 100, 0), (90, 100, 0), (190, 200, 0)]  # 100 more cash in on the last day
+    for i, (value, cost, realised) in enumerate(rows):
+        PortfolioSnapshot.objects.create(user=user, currency="USD", date=today - timedelta(days=len(rows) - 1 - i),
+                                         value=value, cost_basis=cost, realised_profit=realised)
+    resp = client.get(reverse("portfolio-metrics"), {"currency": "USD"})
+    assert resp.status_code == 200
+    assert resp.data["periods"] == 3
+    assert resp.data["total_return_pct"] == pytest.approx(-10.0)
+    assert resp.data["max_drawdown_pct"] == pytest.approx(-25.0)
+    assert resp.data["start"] == (today - timedelta(days=3)).isoformat()
+
+    # A rewritten snapshot moves the watermark, so the next read recomputes.
+    PortfolioSnapshot.objects.filter(user=user, date=today).update(value=220, updated_at=timezone.now())
+    assert client.get(reverse("portfolio-metrics"), {"currency": "USD"}).data["total_return_pct"] == pytest.approx(20.0)
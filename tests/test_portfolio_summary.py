@@ -0,0 +1,81 @@
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from web_app.models import Coin, PortfolioSummary, Simulation, Transaction, User
+from web_app.utils import portfolio
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="sum@example.com", username="sum@example.com", password="pass")
+
+
+@pytest.fixture
+def client(user):
+    c = APIClient()
+    c.force_authenticate(user=user)
+    return c
+
+
+@pytest.mark.django_db
+def test_buy_and_sell_update_summary_incrementally(client, user):
+    client.post(reverse("portfolio"), {"coin_id": "bitcoin", "quantity": "2", "price": "100"})
+    client.post(reverse("portfolio"), {"coin_id": "ethereum", "quantity": "1", "price": "50"})
+    resp = client.post(reverse("portfolio-sell"), {"coin_id": "bitcoin", "quantity": "1", "price": "130"})
+
+    summary = PortfolioSummary.objects.get(user=user, simulation=None)
+    assert summary.trade_count == 3
+    assert summary.realised_total == Decimal("30")
+    assert summary.total_cost_basis == Decimal("150")
+    assert summary.local_currency == "USD"
+    assert resp.data["realised_total"] == 30.0
+    assert resp.data["realised_total_local"] == 30.0
+    assert resp.data["total_cost_basis"] == 150.0
+
+
+@pytest.mark.django_db
+def test_portfolio_read_does_not_scan_ledger(client, user):
+    coin = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    Transaction.objects.bulk_create([
+        Transaction(user=user, coin=coin, type="SELL", quantity=1, price=1, realised_profit=Decimal("1"))
+        for _ in range(50)
+    ])
+    client.get(reverse("portfolio"))  # first read builds the summary from the ledger
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.get(reverse("portfolio"))
+    assert resp.data["realised_total"] == 50.0
+    assert not any("SUM(" in q["sql"].upper() for q in ctx.captured_queries)
+
+
+@pytest.mark.django_db
+def test_delete_invalidates_and_rebuild_command_repairs(client, user):
+    client.post(reverse("portfolio"), {"coin_id": "bitcoin", "quantity": "2", "price": "100"})
+    tx = Transaction.objects.get(user=user)
+    client.delete(reverse("transaction-delete", kwargs={"tx_id": str(tx.id)}))
+    assert not PortfolioSummary.objects.filter(user=user).exists()
+
+    sim = Simulation.objects.create(user=user, name="S", start_date=timezone.localdate())
+    coin = Coin.objects.get(id="bitcoin")
+    Transaction.objects.create(user=user, coin=coin, simulation=sim, type="BUY", quantity=2, price=Decimal("10"))
+    PortfolioSummary.objects.create(user=user, simulation=None, trade_count=99)
+
+    call_command("rebuild_portfolio_summaries")
+    assert not PortfolioSummary.objects.filter(user=user, simulation=None).exists()
+    sim_summary = PortfolioSummary.objects.get(user=user, simulation=sim)
+    assert sim_summary.trade_count == 1
+    assert sim_summary.total_cost_basis == Decimal("20")
+
+
+@pytest.mark.django_db
+def test_realised_local_recomputed_when_currency_changes(user):
+    summary = portfolio.get_summary(user)
+    assert portfolio.realised_local(summary, "USD") == 0.0
+    summary.refresh_from_db()
+    assert summary.local_currency == "USD"
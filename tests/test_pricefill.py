@@ -0,0 +1,103 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from web_app.models import Holding, Simulation, Transaction, User
+from web_app.utils.pricefill import fill_pending_prices, retry_delay
+
+CHARTS = {
+    "bitcoin": {"prices": [[1704067200000, 40.0], [1704153600000, 50.0]]},  # 2024-01-01, 2024-01-02
+    "ethereum": {"prices": [[1704067200000, 2.0]]},
+}
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="fill@example.com", username="fill@example.com", password="pass")
+
+
+@pytest.fixture
+def client(user):
+    c = APIClient()
+    c.force_authenticate(user=user)
+    return c
+
+
+@pytest.mark.django_db
+def test_async_trade_is_inserted_pending_without_upstream_calls(client, user):
+    sim = Simulation.objects.create(user=user, name="async", start_date="2024-01-01")
+    url = reverse("simulation-transaction", kwargs={"sim_id": sim.id})
+    with patch("web_app.utils.coingecko.get_price_at_timestamp") as hist, \
+         patch("web_app.utils.coingecko.get_current_prices") as current, \
+         patch("web_app.utils.coingecko.get_coin_details") as details:
+        resp = client.post(url, {"coin_id": "bitcoin", "quantity": "2", "time": "2024-01-02T12:00:00Z",
+                                 "async_price": True}, format="json")
+    assert resp.status_code == 201
+    assert resp.data["price_status"] == "PENDING"
+    hist.assert_not_called()
+    current.assert_not_called()
+    details.assert_not_called()
+
+    tx = Transaction.objects.get(simulation=sim)
+    assert tx.time == datetime(2024, 1, 2, 12, tzinfo=dt_timezone.utc)
+    assert Holding.objects.get(simulation=sim).quantity == Decimal("2")  # quantity counts immediately
+
+
+@pytest.mark.django_db
+def test_fill_pending_prices_groups_by_coin_and_replays_ledgers(client, user):
+    sim = Simulation.objects.create(user=user, name="async", start_date="2024-01-01")
+    url = reverse("simulation-transaction", kwargs={"sim_id": sim.id})
+    trades = [("bitcoin", "BUY", "2", "2024-01-01T12:00:00Z"), ("bitcoin", "SELL", "1", "2024-01-02T12:00:00Z"),
+              ("ethereum", "BUY", "5", "2024-01-01T12:00:00Z"), ("dogecoin", "BUY", "5", "2024-01-01T12:00:00Z")]
+    for coin_id, side, qty, when in trades:
+        client.post(url, {"coin_id": coin_id, "type": side, "quantity": qty, "time": when, "async_price": "1"},
+                    format="json")
+    assert Transaction.objects.filter(price_status="PENDING").count() == 4
+
+    with patch("web_app.utils.imports.get_coin_market_chart",
+               side_effect=lambda coin_id, currency, days: CHARTS.get(coin_id, {})) as chart:
+        report = fill_pending_prices()
+    assert chart.call_count == 3  # one request per coin
+    assert report == {"pending": 4, "filled": 3, "unresolved": 1}
+
+    sell = Transaction.objects.get(simulation=sim, type="SELL")
+    assert sell.price == Decimal("50") and sell.price_status == "FILLED"
+    assert sell.realised_profit == Decimal("10")  # replayed against the filled buy at 40
+    holding = Holding.objects.get(simulation=sim, coin_id="bitcoin")
+    assert holding.avg_price == Decimal("40")
+    assert Transaction.objects.get(coin_id="dogecoin").price_status == "PENDING"
+
+    with patch("web_app.utils.imports.get_coin_market_chart", return_value={}):
+        call_command("fill_pending_prices")
+    assert Transaction.objects.filter(price_status="PENDING").count() == 1
+
+
+@pytest.mark.django_db
+def test_unresolved_rows_back_off(client, user):
+    sim = Simulation.objects.create(user=user, name="async", start_date="2024-01-01")
+    url = reverse("simulation-transaction", kwargs={"sim_id": sim.id})
+    for coin_id in ("dogecoin", "bitcoin"):
+        client.post(url, {"coin_id": coin_id, "quantity": "1", "time": "2024-01-02T12:00:00Z", "async_price": "1"},
+                    format="json")
+    chart = lambda coin_id, currency, days: CHARTS.get(coin_id, {})
+
+    with patch("web_app.utils.imports.get_coin_market_chart", side_effect=chart):
+        assert fill_pending_prices(limit=1) == {"pending": 1, "filled": 1, "unresolved": 0}  # bitcoin sorts first
+        assert fill_pending_prices(limit=1) == {"pending": 1, "filled": 0, "unresolved": 1}
+        # dogecoin is left out until its retry time instead of blocking every batch
+        assert fill_pending_prices(limit=1) == {"pending": 0, "filled": 0, "unresolved": 0}
+    doge = Transaction.objects.get(coin_id="dogecoin")
+    assert doge.price_attempts == 1 and doge.price_status == "PENDING"
+
+    Transaction.objects.filter(pk=doge.pk).update(price_retry_at=timezone.now())
+    with patch("web_app.utils.imports.get_coin_market_chart", side_effect=chart):
+        fill_pending_prices()
+    doge.refresh_from_db()
+    assert doge.price_attempts == 2
+    assert doge.price_retry_at - timezone.now() > retry_delay(1)
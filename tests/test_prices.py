@@ -0,0 +1,126 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from web_app.models import Coin, CurrentPrice, Holding, User
+from web_app.utils import prices
+from web_app.utils.portfolio import value_holdings
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="live@example.com", username="live@example.com", password="pass")
+
+
+def _market(coin_id, price, pct):
+    return {"id": coin_id, "current_price": price, "price_change_percentage_24h": pct}
+
+
+@pytest.mark.django_db
+def test_live_quotes_fetches_all_missing_coins_in_one_call():
+    with patch("web_app.utils.prices.get_markets",
+               return_value=[_market("bitcoin", 100, 10), _market("ethereum", 20, -5)]) as mock:
+        quotes = prices.live_quotes(["ethereum", "bitcoin", "bitcoin"], "usd")
+    assert mock.call_count == 1
+    assert mock.call_args[0][0]["ids"] == "bitcoin,ethereum"
+    assert quotes["bitcoin"] == {"price": 100.0, "change_24h_pct": 10.0, "source": "market"}
+
+    with patch("web_app.utils.prices.get_markets") as mock:
+        again = prices.live_quotes(["bitcoin", "ethereum"], "USD")
+    mock.assert_not_called()
+    assert again == quotes
+
+
+@pytest.mark.django_db
+def test_live_quotes_prefers_fresh_db_price():
+    coin = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin", price_change_24h=2)
+    CurrentPrice.objects.create(coin=coin, price=Decimal("123"), currency="USD")
+    with patch("web_app.utils.prices.get_markets", return_value=[_market("ethereum", 20, 1)]) as mock:
+        quotes = prices.live_quotes(["bitcoin", "ethereum"], "USD")
+    assert mock.call_args[0][0]["ids"] == "ethereum"
+    assert quotes["bitcoin"]["price"] == 123.0
+    assert quotes["bitcoin"]["source"] == "db"
+
+
+@pytest.mark.django_db
+def test_live_quotes_falls_back_to_stale_db_price():
+    coin = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    CurrentPrice.objects.create(coin=coin, price=Decimal("90"), currency="USD")
+    CurrentPrice.objects.filter(coin=coin).update(last_updated="2020-01-01T00:00:00Z")
+    with patch("web_app.utils.prices.get_markets", return_value=None):
+        quotes = prices.live_quotes(["bitcoin", "solana"], "USD")
+    assert quotes == {"bitcoin": {"price": 90.0, "change_24h_pct": 0.0, "source": "db"}}
+
+
+@pytest.mark.django_db
+def test_value_holdings_totals(user):
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    eth = Coin.objects.create(id="ethereum", symbol="ETH", name="Ethereum")
+    sol = Coin.objects.create(id="solana", symbol="SOL", name="Solana")
+    holdings = [
+        Holding.objects.create(user=user, coin=btc, quantity=2, avg_price=50, avg_price_currency="USD"),
+        Holding.objects.create(user=user, coin=eth, quantity=1, avg_price=30, avg_price_currency="USD"),
+        Holding.objects.create(user=user, coin=sol, quantity=1, avg_price=10, avg_price_currency="USD"),
+    ]
+    with patch("web_app.utils.prices.get_markets",
+               return_value=[_market("bitcoin", 110, 10), _market("ethereum", 20, None)]):
+        per_holding, totals = value_holdings(holdings, "USD")
+
+    btc_row = per_holding[str(holdings[0].id)]
+    assert btc_row["market_value"] == 220.0
+    assert btc_row["unrealised_pnl"] == 120.0
+    assert btc_row["change_24h_value"] == 20.0
+    assert per_holding[str(holdings[1].id)]["change_24h_value"] is None
+    assert per_holding[str(holdings[2].id)]["market_value"] is None
+
+    assert totals["market_value"] == 240.0
+    assert totals["cost_basis"] == 140.0
+    assert totals["unrealised_pnl"] == 110.0
+    assert totals["change_24h_value"] == 20.0
+    assert totals["unpriced"] == ["solana"]
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.currency._usd_coin_rate", side_effect=lambda code: Decimal("1") if code == "USD" else None)
+def test_value_holdings_leaves_out_cost_without_fx_rate(_rate, user):
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    eth = Coin.objects.create(id="ethereum", symbol="ETH", name="Ethereum")
+    holdings = [
+        Holding.objects.create(user=user, coin=btc, quantity=1, avg_price=50, avg_price_currency="USD"),
+        Holding.objects.create(user=user, coin=eth, quantity=1, avg_price=30, avg_price_currency="CAD"),
+    ]
+    with patch("web_app.utils.prices.get_markets",
+               return_value=[_market("bitcoin", 60, 0), _market("ethereum", 40, 0)]):
+        per_holding, totals = value_holdings(holdings, "USD")
+
+    assert per_holding[str(holdings[1].id)]["cost_basis"] is None
+    assert per_holding[str(holdings[1].id)]["market_value"] == 40.0
+    assert totals["market_value"] == 100.0 and totals["cost_basis"] == 50.0
+    assert totals["unrealised_pnl"] == 10.0 and totals["unconverted"] == ["ethereum"]
+
+
+@pytest.mark.django_db
+def test_portfolio_response_includes_live_valuation(user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    with patch("web_app.utils.prices.get_markets", return_value=[_market("bitcoin", 60, 20)]) as mock:
+        client.post(reverse("portfolio"), {"coin_id": "bitcoin", "quantity": "2", "price": "50"})
+        resp = client.get(reverse("portfolio"))
+    assert mock.call_count == 1  # the GET reuses the quote cached by the POST
+    holding = resp.data["holdings"][0]
+    assert holding["market_value"] == 120.0
+    assert holding["unrealised_pnl"] == 20.0
+    assert holding["coin_data"]["current_price"] == 60.0
+    assert resp.data["totals"]["market_value"] == 120.0
+    assert resp.data["totals"]["change_24h_value"] == 20.0
@@ -0,0 +1,105 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from web_app.models import Coin, Holding, Simulation, Transaction, User
+from web_app.utils import projection
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="proj@example.com", username="proj@example.com", password="pass")
+
+
+def _prices(coin_ids, currency, start, end):
+    rng = np.random.default_rng(7)
+    days = (end - start).days + 1
+    common = rng.normal(0.001, 0.03, days)
+    rows = {"bitcoin": common, "ethereum": common + rng.normal(0, 0.005, days)}
+    return np.vstack([100 * np.exp(np.cumsum(rows[c])) if c in rows else np.full(days, np.nan) for c in coin_ids])
+
+
+def _model(returns):
+    returns = np.asarray(returns, dtype=float)
+    return {"growth": np.exp(returns), "mean": returns.mean(axis=0),
+            "chol": np.linalg.cholesky(np.cov(returns, rowvar=False) + np.eye(returns.shape[1]) * 1e-12)}
+
+
+def test_parse_projection_defaults_and_errors():
+    spec = projection.parse_projection({})
+    assert spec["method"] == "bootstrap" and spec["paths"] == 5000 and spec["seed"] is None
+    assert projection.parse_projection({"percentiles": "90,10"})["percentiles"] == [10.0, 90.0]
+    for bad in ({"paths": "20000"}, {"method": "garch"}, {"horizon_days": "x"}, {"percentiles": "101"}):
+        with pytest.raises(projection.ProjectionSpecError):
+            projection.parse_projection(bad)
+
+
+@pytest.mark.parametrize("method", projection.METHODS)
+def test_simulate_paths_is_seeded_and_compounds(method):
+    rng = np.random.default_rng(0)
+    model = _model(rng.normal(0, 0.02, (200, 3)))
+    a = projection.simulate_paths(model, np.array([100.0, 50.0, 0.0]), 30, 500, method, seed=42)
+    b = projection.simulate_paths(model, np.array([100.0, 50.0, 0.0]), 30, 500, method, seed=42)
+    assert a.shape == (31, 500)
+    assert np.array_equal(a, b)
+    assert np.allclose(a[0], 150.0)
+
+    flat = _model(np.zeros((50, 2)))
+    assert np.allclose(projection.simulate_paths(flat, np.array([10.0, 5.0]), 10, 100, method, seed=1), 15.0, rtol=1e-4)
+
+
+def test_bootstrap_keeps_cross_coin_correlation():
+    rng = np.random.default_rng(1)
+    x = rng.normal(0, 0.03, 500)
+    model = _model(np.column_stack([x, -x]))  # perfectly hedged pair
+    values = projection.simulate_paths(model, np.array([100.0, 100.0]), 60, 1000, "bootstrap", seed=3)
+    assert np.ptp(values[-1]) < 0.25 * np.ptp(
+        projection.simulate_paths(_model(np.column_stack([x, x])), np.array([100.0, 100.0]), 60, 1000,
+                                  "bootstrap", seed=3)[-1]
+    )
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.projection.live_quotes", return_value={"bitcoin": {"price": 200.0}})
+@patch("web_app.utils.projection.historical_prices", side_effect=_prices)
+def test_projection_endpoint(mock_prices, mock_quotes, user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    eth = Coin.objects.create(id="ethereum", symbol="ETH", name="Ethereum")
+    Holding.objects.create(user=user, coin=btc, quantity=2, avg_price=100)
+
+    url = reverse("portfolio-projection")
+    resp = client.get(url, {"paths": 200, "horizon_days": 30, "seed": 5})
+    assert resp.status_code == 200
+    assert resp.data["start_value"] == 400.0
+    assert resp.data["seed"] == 5 and resp.data["coins"] == ["bitcoin"]
+    bands = resp.data["bands"]
+    assert list(bands) == ["p5", "p25", "p50", "p75", "p95"]
+    assert len(bands["p50"]) == 31
+    assert all(lo <= hi for lo, hi in zip(bands["p5"], bands["p95"]))
+    assert client.get(url, {"paths": 200, "horizon_days": 30, "seed": 5}).data["bands"] == bands
+
+    # The return matrix is cached per coin set and window.
+    client.get(url, {"paths": 200, "horizon_days": 30, "seed": 6})
+    assert mock_prices.call_count == 1
+
+    sim = Simulation.objects.create(user=user, name="s", start_date="2024-01-01")
+    assert client.get(url, {"simulation_id": sim.id}).status_code == 400  # nothing held
+    Transaction.objects.create(user=user, simulation=sim, coin=eth, type="BUY", quantity=3, price=10)
+    resp = client.get(url, {"simulation_id": sim.id, "paths": 200, "horizon_days": 10, "method": "normal"})
+    assert resp.status_code == 200 and resp.data["coins"] == ["ethereum"]
+
+    assert client.get(url, {"simulation_id": "not-a-uuid"}).status_code == 404
+    assert client.get(url, {"paths": "0"}).status_code == 400
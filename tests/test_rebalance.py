@@ -0,0 +1,124 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from web_app.models import Coin, Holding, Simulation, Transaction, User
+from web_app.utils import rebalance
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="rebal@example.com", username="rebal@example.com", password="pass")
+
+
+def _spec(**overrides):
+    return {**rebalance.parse_rebalance({"targets": {"a": 1, "b": 1}, "fee_bps": 0}), **overrides}
+
+
+def _prices(coin_ids, currency, start, end):
+    rng = np.random.default_rng(3)
+    days = (end - start).days + 1
+    rows = {"bitcoin": 100 * np.exp(np.cumsum(rng.normal(0, 0.04, days))), "tether": np.full(days, 1.0)}
+    return np.vstack([rows.get(c, np.full(days, np.nan)) for c in coin_ids])
+
+
+def test_parse_rebalance():
+    spec = rebalance.parse_rebalance({"targets": {"bitcoin": 3, "ethereum": 1}, "keep": "solana, bitcoin"})
+    assert spec["objective"] == "targets"
+    assert spec["targets"] == {"bitcoin": 0.75, "ethereum": 0.25}
+    assert spec["keep"] == ["bitcoin", "solana"] and spec["fee_bps"] == 10.0
+    assert rebalance.parse_rebalance({"objective": "MIN_RISK"})["objective"] == "min_risk"
+    for bad in ({}, {"targets": {"a": -1}}, {"targets": [1]}, {"objective": "min_risk", "fee_bps": 5000},
+                {"objective": "min_risk", "max_weight": "x"}):
+        with pytest.raises(rebalance.RebalanceSpecError):
+            rebalance.parse_rebalance(bad)
+
+
+def test_targets_trade_only_the_gap():
+    solved = rebalance.solve_rebalance(np.array([300.0, 100.0]), _spec(), ["a", "b"])
+    assert solved["sell"] == pytest.approx([100, 0]) and solved["buy"] == pytest.approx([0, 100])
+    assert solved["fees"] == 0 and solved["cash_left"] == pytest.approx(0)
+
+    # Fees are paid out of the sells, so the buy is smaller than the sell.
+    solved = rebalance.solve_rebalance(np.array([300.0, 100.0]), _spec(fee_bps=100), ["a", "b"])
+    assert solved["buy"][1] < solved["sell"][0]
+    assert solved["fees"] == pytest.approx(0.01 * (solved["buy"][1] + solved["sell"][0]))
+    assert solved["cash_left"] == pytest.approx(0, abs=1e-6)
+
+
+def test_min_trade_and_keep_suppress_trades():
+    # Moving 20 would help, but the smallest allowed trade (50) overshoots by more than it fixes.
+    solved = rebalance.solve_rebalance(np.array([270.0, 230.0]), _spec(min_trade=50), ["a", "b"])
+    assert solved["buy"].sum() == solved["sell"].sum() == 0
+    # a cannot be sold and there is no cash, so nothing can move.
+    solved = rebalance.solve_rebalance(np.array([300.0, 100.0]), _spec(keep=["a"]), ["a", "b"])
+    assert solved["buy"].sum() == solved["sell"].sum() == 0
+
+
+def test_min_risk_moves_into_the_steady_coin_up_to_max_weight():
+    returns = np.column_stack([np.random.default_rng(1).normal(0, 0.05, 200), np.zeros(200)])
+    spec = rebalance.parse_rebalance({"objective": "min_risk", "fee_bps": 0, "max_weight": 0.8})
+    solved = rebalance.solve_rebalance(np.array([100.0, 0.0]), spec, ["volatile", "steady"], returns)
+    assert solved["buy"][1] == pytest.approx(80)
+    assert solved["sell"][0] == pytest.approx(80)
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.prices.get_markets", return_value=[])
+@patch("web_app.utils.rebalance.live_quotes", return_value={"bitcoin": {"price": 200.0}, "tether": {"price": 1.0}})
+@patch("web_app.utils.projection.historical_prices", side_effect=_prices)
+def test_rebalance_endpoint_returns_a_batch_payload(mock_prices, _quotes, _markets, user):
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    Holding.objects.create(user=user, coin=btc, quantity=2, avg_price=100)
+    client = APIClient()
+    client.force_authenticate(user=user)
+
+    body = {"targets": {"bitcoin": 0.5, "tether": 0.5}, "fee_bps": 0}
+    resp = client.post(reverse("portfolio-rebalance"), body, format="json")
+    assert resp.status_code == 200
+    assert resp.data["before"]["weights"] == {"bitcoin": 1.0, "tether": 0.0}
+    assert resp.data["after"]["weights"] == {"bitcoin": 0.5, "tether": 0.5}
+    assert resp.data["before"]["volatility_pct"] > resp.data["after"]["volatility_pct"]
+    assert [(t["coin_id"], t["type"], t["quantity"]) for t in resp.data["batch"]["trades"]] == [
+        ("bitcoin", "SELL", 1.0), ("tether", "BUY", 200.0)
+    ]
+
+
+    # With fees, each trade carries its own and the batch records it.
+    costly = client.post(reverse("portfolio-rebalance"), {**body, "fee_bps": 10, "fee_fixed": 0.5}, format="json").data
+    assert [t["fee"] for t in costly["batch"]["trades"]] == \
+        [pytest.approx(t["value"] * 0.001 + 0.5, abs=0.01) for t in costly["trades"]]
+    applied = client.post(reverse("portfolio-batch"), costly["batch"], format="json")
+    assert applied.status_code == 201
+    tether = next(t for t in costly["batch"]["trades"] if t["coin_id"] == "tether")
+    assert Holding.objects.get(user=user, coin_id="tether").quantity == Decimal(str(tether["quantity"]))
+    fees = Transaction.objects.filter(user=user).values_list("fee", flat=True)
+    assert float(sum(fees)) == pytest.approx(sum(t["fee"] for t in costly["batch"]["trades"]))
+
+    # Return statistics are cached per coin set and window; the second solve reuses them.
+    client.post(reverse("portfolio-rebalance"), body, format="json")
+    assert mock_prices.call_count == 1
+
+    assert client.post(reverse("portfolio-rebalance"), {"objective": "nope"}, format="json").status_code == 400
+    other = User.objects.create_user(email="other-r@example.com", username="other-r", password="pass")
+    theirs = Simulation.objects.create(user=other, name="T", start_date="2024-01-01")
+    missing = client.post(reverse("portfolio-rebalance"), {**body, "simulation_id": str(theirs.id)}, format="json")
+    assert missing.status_code == 404 and missing.data["code"] == 1002
+
+    mine = Simulation.objects.create(user=user, name="Mine", start_date="2024-01-01")
+    Transaction.objects.create(user=user, coin=btc, simulation=mine, type="BUY", quantity=2, price=100)
+    simulated = client.post(reverse("portfolio-rebalance"), {**body, "simulation_id": str(mine.id)}, format="json")
+    # portfolio/batch/ would move the live portfolio, so no batch payload for a simulation
+    assert simulated.data["trades"] and simulated.data["batch"] is None
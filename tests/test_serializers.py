@@ -287,10 +287,10 @@ def test_simulation_summary_serializer_fallback_price(monkeypatch):
     coin = Coin.objects.create(id="bnb", symbol="BNB", name="Binance", current_price=Decimal("320"))
     Transaction.objects.create(simulation=sim, coin=coin, type="BUY", quantity=Decimal("2"), price=Decimal("300"), user=user)
 
-    def fake_prices(ids, currency):
-        return {}
+    def fake_markets(params):
+        return []
 
-    monkeypatch.setattr("web_app.utils.coingecko.get_current_prices", fake_prices)
+    monkeypatch.setattr("web_app.utils.prices.get_markets", fake_markets)
     serializer = SimulationSummarySerializer(sim)
     value = serializer.get_current_value(sim)
     assert value == round(float(2 * coin.current_price), 2)
@@ -0,0 +1,112 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+
+from web_app.utils import series
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def test_chart_arrays_sorts_and_drops_bad_points():
+    ts, prices = series.chart_arrays({"prices": [[3, 30], [1, "10"], [2, None], "bad", [4]]})
+    assert ts.tolist() == [1, 3]
+    assert prices.tolist() == [10.0, 30.0]
+    assert series.chart_arrays(None)[0].size == 0
+
+
+def test_align_to_grid_uses_latest_sample_at_or_before():
+    a = (np.array([10, 20, 30]), np.array([1.0, 2.0, 3.0]))
+    b = (np.array([25]), np.array([9.0]))
+    empty = (np.empty(0, dtype=np.int64), np.empty(0))
+    matrix = series.align_to_grid([a, b, empty], np.array([5, 20, 29, 40]))
+    assert matrix[0].tolist() == [1.0, 2.0, 2.0, 3.0]
+    assert matrix[1].tolist() == [9.0, 9.0, 9.0, 9.0]
+    assert np.isnan(matrix[2]).all()
+
+
+def test_daily_grid_ends_at_now():
+    grid = series.daily_grid(3, now_ms=10 * series.MS_PER_DAY)
+    assert grid.tolist() == [8 * series.MS_PER_DAY, 9 * series.MS_PER_DAY, 10 * series.MS_PER_DAY]
+
+
+@patch("web_app.utils.series.daily_grid", return_value=np.array([100, 200]))
+@patch("web_app.utils.series.get_coin_market_chart")
+def test_portfolio_performance_columnar_and_cached(mock_chart, mock_grid):
+    mock_chart.side_effect = lambda coin, vs, days: {
+        "bitcoin": {"prices": [[100, 10], [200, 20]]},
+        "ethereum": None,
+    }[coin]
+    holdings = [
+        {"coin_id": "bitcoin", "quantity": Decimal("2"), "avg_price": Decimal("5"), "avg_price_currency": "USD"},
+        {"coin_id": "ethereum", "quantity": Decimal("1"), "avg_price": Decimal("7"), "avg_price_currency": "USD"},
+    ]
+    result = series.portfolio_performance(holdings, "usd", 2)
+    assert result["t"] == [100, 200]
+    assert result["value"] == [27.0, 47.0]
+    assert result["unrealised"] == [10.0, 30.0]
+    assert result["cost_basis"] == 17.0
+    assert result["missing"] == ["ethereum"]
+
+    assert series.portfolio_performance(list(reversed(holdings)), "USD", 2) == result
+    assert mock_chart.call_count == 2
+
+
+def test_portfolio_performance_empty_holdings():
+    result = series.portfolio_performance([], "USD", 3)
+    assert len(result["t"]) == 3
+    assert result["value"] == [0.0, 0.0, 0.0]
+
+
+def test_cumulative_matrix_applies_each_delta_from_its_time():
+    grid = np.array([10, 20, 30, 40])
+    held = series.cumulative_matrix(
+        np.array([0, 1, 0, 0]), np.array([5, 20, 21, 99]), np.array([2.0, 1.0, -1.0, 5.0]), 2, grid
+    )
+    assert held.tolist() == [[2.0, 2.0, 1.0, 1.0], [0.0, 1.0, 1.0, 1.0]]
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.series.get_coin_market_chart")
+def test_simulation_series_uses_quantity_held_at_each_point(mock_chart):
+    from datetime import timedelta
+
+    from django.utils import timezone
+
+    from web_app.models import Coin, Simulation, Transaction, User
+
+    user = User.objects.create_user(email="series@example.com", username="series@example.com", password="pass")
+    now = timezone.now()
+    sim = Simulation.objects.create(user=user, name="S", start_date=(now - timedelta(days=2)).date())
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    start_ms = int((now - timedelta(days=3)).timestamp() * 1000)
+    # Charts with different sample times: alignment is by time, not index.
+    mock_chart.side_effect = lambda coin, vs, days: {"prices": [[start_ms, 100], [start_ms + 2 * series.MS_PER_DAY, 200]]}
+
+    buy = Transaction.objects.create(user=user, simulation=sim, coin=btc, type="BUY", quantity=1, price=100,
+                                     price_currency="USD", time=now - timedelta(days=1, hours=12))
+    Transaction.objects.create(user=user, simulation=sim, coin=btc, type="BUY", quantity=1, price=200,
+                               price_currency="USD", time=now - timedelta(hours=12))
+    result = series.simulation_series(sim, "USD")
+    assert result["coins"] == ["bitcoin"]
+    assert result["t"][-1] >= int(now.timestamp() * 1000)
+    assert result["value"][0] == 0.0
+    assert result["value"][-1] == 400.0
+    assert result["invested"][-1] == 300.0
+    # One unit is held between the two buys, priced at whatever the chart said then.
+    middle = result["t"].index(next(t for t in result["t"] if t >= int(buy.time.timestamp() * 1000)))
+    assert result["value"][middle] == 100.0
+
+    assert series.simulation_series(sim, "USD") is not None
+    assert mock_chart.call_count == 1  # cached
+
+    buy.delete()
+    assert series.simulation_series(sim, "USD")["invested"][-1] == 200.0
+    assert mock_chart.call_count == 2
@@ -0,0 +1,151 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from web_app.models import Coin, PendingSnapshotUpdate, PortfolioSnapshot, Simulation, Transaction, User
+from web_app.utils import snapshots
+from web_app.utils.currency import day_numbers
+
+
+def _row(coin, side, qty, price, when, currency="USD", cost=0, realised=0):
+    return (None, None, coin, side, Decimal(str(qty)), Decimal(str(price)), currency, when,
+            Decimal(str(cost)), Decimal(str(realised)), "USD")
+
+
+def test_daily_valuation_follows_the_lot_engine_and_opening_state():
+    d0 = datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+    rows = [
+        _row("btc", "BUY", 2, 100, d0 - timedelta(days=5)),  # before the window: opening state
+        _row("btc", "BUY", 2, 200, d0),
+        # FIFO, as written by rebuild_lots: the sell closes a 100 lot (average cost would say 150).
+        _row("btc", "SELL", 1, 300, d0 + timedelta(days=1), cost=100, realised=200),
+        _row("eth", "BUY", 1, 10, d0 + timedelta(days=1)),
+    ]
+    start = int(day_numbers([d0])[0])
+    prices = np.array([[150.0, 250.0, 300.0], [np.nan, np.nan, 20.0]])
+    result = snapshots.daily_valuation(rows, "USD", start, start + 2, ["btc", "eth"], prices)
+
+    assert result["cost_basis"].tolist() == [600.0, 510.0, 510.0]
+    assert result["realised"].tolist() == [0.0, 200.0, 200.0]
+    # eth has no price on day 1, so it is valued at cost.
+    assert result["value"].tolist() == [600.0, 760.0, 920.0]
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="snap@example.com", username="snap@example.com", password="pass")
+
+
+@pytest.fixture
+def coin(db):
+    return Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+
+
+def _chart(coin_id, vs, days):
+    return {"prices": [[0, 100.0]]}
+
+
+@pytest.mark.django_db
+def test_update_snapshots_from_writes_one_row_per_day(user, coin):
+    tx = Transaction.objects.create(user=user, coin=coin, type="BUY", quantity=Decimal("2"), price=Decimal("50"))
+    Transaction.objects.filter(id=tx.id).update(time=timezone.now() - timedelta(days=2))
+
+    with patch("web_app.utils.snapshots.get_coin_market_chart", side_effect=_chart):
+        written = snapshots.update_snapshots_from(user.id, None, timezone.now() - timedelta(days=10))
+    assert written == 3
+    rows = list(PortfolioSnapshot.objects.filter(user=user).order_by("date"))
+    assert [r.value for r in rows] == [Decimal("200")] * 3
+    assert rows[0].cost_basis == Decimal("100")
+
+    # Deleting the ledger clears snapshots from the requested date.
+    Transaction.objects.all().delete()
+    snapshots.update_snapshots_from(user.id, None, timezone.now() - timedelta(days=1))
+    assert PortfolioSnapshot.objects.filter(user=user).count() == 1
+
+
+@pytest.mark.django_db
+def test_transaction_signal_marks_portfolio_for_the_snapshot_job(user, coin, django_capture_on_commit_callbacks):
+    with patch("web_app.utils.snapshots.get_coin_market_chart", side_effect=_chart) as mock_chart:
+        with django_capture_on_commit_callbacks(execute=True):
+            Transaction.objects.create(user=user, coin=coin, type="BUY", quantity=Decimal("1"), price=Decimal("80"))
+            Transaction.objects.create(user=user, coin=coin, type="BUY", quantity=Decimal("1"), price=Decimal("80"),
+                                       time=timezone.now() - timedelta(days=2))
+    # The write path only marks the portfolio; no chart reads happen in the request.
+    mock_chart.assert_not_called()
+    mark = PendingSnapshotUpdate.objects.get(user_id=user.id, simulation_id=None)
+    assert mark.from_date == (timezone.now() - timedelta(days=2)).astimezone(dt_timezone.utc).date()
+
+    with patch("web_app.utils.snapshots.get_coin_market_chart", side_effect=_chart):
+        call_command("update_portfolio_snapshots")
+    assert not PendingSnapshotUpdate.objects.exists()
+    snap = PortfolioSnapshot.objects.get(user=user, date=timezone.now().astimezone(dt_timezone.utc).date())
+    assert snap.value == Decimal("200")
+    assert snap.cost_basis == Decimal("160")
+    assert PortfolioSnapshot.objects.filter(user=user).count() == 3
+
+
+@pytest.mark.django_db
+def test_failed_snapshot_updates_stay_pending(user, coin):
+    Transaction.objects.create(user=user, coin=coin, type="BUY", quantity=Decimal("1"), price=Decimal("80"))
+    with patch("web_app.utils.snapshots.update_snapshots_from", side_effect=RuntimeError("upstream down")):
+        assert snapshots.process_pending_updates() == {"updated": 0, "failed": 1, "snapshots": 0}
+    assert PendingSnapshotUpdate.objects.count() == 1
+
+    # Deleting the user leaves a mark behind for a ledger that no longer exists; the job just clears it.
+    user.delete()
+    assert snapshots.process_pending_updates()["updated"] == 1
+    assert not PendingSnapshotUpdate.objects.exists()
+
+
+@pytest.mark.django_db
+def test_marks_renewed_while_the_job_runs_are_kept(user, coin):
+    Transaction.objects.create(user=user, coin=coin, type="BUY", quantity=Decimal("1"), price=Decimal("80"))
+    earlier = timezone.now().date() - timedelta(days=3)
+
+    def trade_commits_meanwhile(user_id, simulation_id, start):
+        snapshots.schedule_snapshot_update_from(user_id, simulation_id, earlier)
+        return 1
+
+    with patch("web_app.utils.snapshots.update_snapshots_from", side_effect=trade_commits_meanwhile):
+        assert snapshots.process_pending_updates()["updated"] == 1
+    assert PendingSnapshotUpdate.objects.get().from_date == earlier
+
+    with patch("web_app.utils.snapshots.update_snapshots_from", return_value=1):
+        snapshots.process_pending_updates()
+    assert not PendingSnapshotUpdate.objects.exists()
+
+
+@pytest.mark.django_db
+def test_rebuild_all_snapshots_command(user, coin):
+    sim = Simulation.objects.create(user=user, name="S", start_date=date.today())
+    Transaction.objects.create(user=user, coin=coin, type="BUY", quantity=Decimal("1"), price=Decimal("80"))
+    Transaction.objects.create(user=user, coin=coin, simulation=sim, type="BUY", quantity=Decimal("3"), price=Decimal("90"))
+    with patch("web_app.utils.snapshots.get_coin_market_chart", side_effect=_chart) as mock_chart:
+        call_command("build_portfolio_snapshots", "--days", "1")
+    # One shared price matrix for all portfolios in the same currency.
+    mock_chart.assert_called_once()
+    assert PortfolioSnapshot.objects.get(user=user, simulation=None).value == Decimal("100")
+    assert PortfolioSnapshot.objects.get(user=user, simulation=sim).value == Decimal("300")
+
+
+@pytest.mark.django_db
+def test_portfolio_history_endpoint(user):
+    today = date.today()
+    for offset in range(3):
+        PortfolioSnapshot.objects.create(
+            user=user, currency="USD", date=today - timedelta(days=offset), value=Decimal(offset + 1)
+        )
+    client = APIClient()
+    client.force_authenticate(user=user)
+    resp = client.get(reverse("portfolio-history") + f"?from={today - timedelta(days=1)}")
+    assert resp.status_code == 200
+    assert resp.data["dates"] == [(today - timedelta(days=1)).isoformat(), today.isoformat()]
+    assert resp.data["value"] == [2.0, 1.0]
+    assert client.get(reverse("portfolio-history") + "?from=bad").status_code == 400
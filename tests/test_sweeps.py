@@ -0,0 +1,82 @@
+from datetime import date, timedelta
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from web_app.models import BacktestSweep, BacktestSweepResult, User
+from web_app.utils import sweeps
+
+START = date.today() - timedelta(days=60)
+BASE = {"strategy": "DCA", "start_date": START.isoformat(), "end_date": (START + timedelta(days=40)).isoformat(),
+        "fee_bps": 0, "slippage_bps": 0}
+GRID = {"amount": [50, 100], "every_days": [1, 7], "coins": [["bitcoin"], ["bitcoin", "ethereum"]]}
+
+
+def _prices(coin_ids, currency, start, end):
+    days = (end - start).days + 1
+    trend = {"bitcoin": np.linspace(100, 200, days), "ethereum": np.linspace(100, 50, days)}
+    return np.vstack([trend[c] for c in coin_ids])
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="sweep@example.com", username="sweep@example.com", password="pass")
+
+
+def test_expand_grid_and_validation():
+    assert sweeps.expand_grid({"b": [1, 2], "a": ["x"]}) == [{"a": "x", "b": 1}, {"a": "x", "b": 2}]
+    with pytest.raises(sweeps.SweepSpecError):
+        sweeps.sweep_runs(BASE, {"start_date": ["2020-01-01"]})
+    with pytest.raises(sweeps.SweepSpecError):
+        sweeps.sweep_runs(BASE, {"amount": [50, -1]})
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("workers", [1, 2])
+@patch("web_app.utils.sweeps.historical_prices", side_effect=_prices)
+def test_run_sweep_ranks_and_resumes(mock_prices, user, workers):
+    sweep = sweeps.create_sweep(user, "grid", BASE, GRID)
+    assert sweep.total == 8
+
+    # Pretend an earlier run stored the first result before dying.
+    BacktestSweepResult.objects.create(sweep=sweep, index=0, params={}, stats={"return_pct": -99}, score=-99)
+    sweep = sweeps.run_sweep(sweep, workers=workers, chunk_size=2)
+    assert sweep.status == "DONE"
+    assert sweep.completed == 8
+    assert BacktestSweepResult.objects.get(sweep=sweep, index=0).score == -99  # not recomputed
+
+    ranked = sweeps.ranked_results(sweep, limit=3)
+    assert [r["rank"] for r in ranked] == [1, 2, 3]
+    assert ranked[0]["params"]["coins"] == ["bitcoin"]  # bitcoin-only beats the mix with a falling coin
+    assert ranked[0]["score"] >= ranked[1]["score"] >= ranked[2]["score"]
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.sweeps.historical_prices", side_effect=_prices)
+def test_sweep_endpoints(mock_prices, user):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    resp = client.post(reverse("backtest-sweeps"), {"name": "dca", "base": BASE, "grid": GRID}, format="json")
+    assert resp.status_code == 201
+    assert resp.data["status"] == "DONE"
+    assert len(resp.data["results"]) == 8
+
+    detail = client.get(reverse("backtest-sweep-detail", kwargs={"sweep_id": resp.data["id"]}), {"limit": 2})
+    assert [r["rank"] for r in detail.data["results"]] == [1, 2]
+    listing = client.get(reverse("backtest-sweeps"))
+    assert listing.data["sweeps"][0]["completed"] == 8
+
+    bad = client.post(reverse("backtest-sweeps"), {"name": "x", "base": BASE, "grid": {"amount": []}}, format="json")
+    assert bad.status_code == 400
+
+    with patch.object(sweeps, "MAX_INLINE_SWEEP_RUNS", 4), patch("web_app.views.MAX_INLINE_SWEEP_RUNS", 4):
+        queued = client.post(reverse("backtest-sweeps"), {"name": "big", "base": BASE, "grid": GRID}, format="json")
+    assert queued.status_code == 202
+    assert BacktestSweep.objects.get(id=queued.data["id"]).status == "PENDING"
+
+    other = User.objects.create_user(email="other@example.com", username="other@example.com", password="pass")
+    client.force_authenticate(user=other)
+    assert client.get(reverse("backtest-sweep-detail", kwargs={"sweep_id": resp.data["id"]})).status_code == 404
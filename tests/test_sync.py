@@ -0,0 +1,113 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from web_app.models import Holding, SyncState, SyncTombstone, User, WatchListItem
+from web_app.utils.sync import bump_version, prune_tombstones
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="sync@example.com", username="sync@example.com", password="pass")
+
+
+@pytest.fixture
+def client(user):
+    c = APIClient()
+    c.force_authenticate(user=user)
+    return c
+
+
+@pytest.fixture(autouse=True)
+def no_market():
+    with patch("web_app.utils.prices.get_markets", return_value=[]):
+        yield
+
+
+def _buy(client, coin_id, quantity="1"):
+    return client.post(reverse("portfolio"), {"coin_id": coin_id, "quantity": quantity, "price": "10"})
+
+
+@pytest.mark.django_db
+def test_bump_version_is_monotonic_per_user(user):
+    other = User.objects.create_user(email="o@example.com", username="o@example.com", password="pass")
+    assert [bump_version(user.id) for _ in range(3)] == [1, 2, 3]
+    assert bump_version(other.id) == 1
+
+
+@pytest.mark.django_db
+def test_portfolio_delta_returns_changes_and_deletions(client, user):
+    _buy(client, "bitcoin")
+    version = client.get(reverse("portfolio")).data["version"]
+
+    quote = {"bitcoin": {"price": 12.0, "change_24h_pct": 1.5, "market_cap": 1}}
+    with CaptureQueriesContext(connection) as ctx, patch("web_app.views.live_quotes", return_value=quote):
+        idle = client.get(reverse("portfolio"), {"since": version})
+    assert idle.data == {"code": 0, "version": version, "since": version, "full": False, "holdings": [], "deleted": [],
+                         "quotes": {"bitcoin": {"price": 12.0, "change_24h_pct": 1.5}}, "currency": "USD"}
+    assert len([q for q in ctx.captured_queries if "web_app_syncstate" in q["sql"]]) == 1
+    assert len(ctx.captured_queries) <= 3  # counter, held coin ids (+ the auth user when not forced)
+
+    _buy(client, "ethereum")
+    btc = Holding.objects.get(user=user, coin_id="bitcoin")
+    client.delete(reverse("transaction-delete", kwargs={"tx_id": user.transactions.get(coin_id="bitcoin").id}))
+    delta = client.get(reverse("portfolio"), {"since": version}).data
+    assert delta["full"] is False
+    assert delta["version"] > version
+    assert [h["coin_id"] for h in delta["holdings"]] == ["ethereum"]
+    assert delta["deleted"] == [str(btc.id)]
+
+
+@pytest.mark.django_db
+def test_portfolio_since_validation_and_stale_tokens(client, user):
+    assert client.get(reverse("portfolio"), {"since": "abc"}).status_code == 400
+    _buy(client, "bitcoin")
+    ahead = client.get(reverse("portfolio"), {"since": 999}).data
+    assert ahead["full"] is True
+    assert [h["coin_id"] for h in ahead["holdings"]] == ["bitcoin"]
+
+    SyncState.objects.filter(user=user).update(pruned_version=5)
+    assert client.get(reverse("portfolio"), {"since": 1}).data["full"] is True
+
+
+@pytest.mark.django_db
+def test_watchlist_delta(client, user):
+    first = client.get(reverse("watchlist"))
+    assert first["X-Sync-Version"] == "0"
+    client.post(reverse("watchlist"), {"coin_id": "bitcoin"})
+    version = int(client.get(reverse("watchlist"))["X-Sync-Version"])
+
+    client.post(reverse("watchlist"), {"coin_id": "ethereum"})
+    btc = WatchListItem.objects.get(user=user, coin_id="bitcoin")
+    client.delete(reverse("watchlist-remove", kwargs={"watchlist_id": btc.id}))
+    delta = client.get(reverse("watchlist"), {"since": version}).data
+    assert delta["full"] is False
+    assert [item["coin"]["id"] for item in delta["items"]] == ["ethereum"]
+    assert delta["deleted"] == [str(btc.id)]
+
+
+@pytest.mark.django_db
+def test_watchlist_since_zero_includes_rows_from_before_versioning(client, user):
+    client.post(reverse("watchlist"), {"coin_id": "bitcoin"})
+    WatchListItem.objects.filter(user=user).update(version=0)  # as stamped by the versioning migration
+    client.post(reverse("watchlist"), {"coin_id": "ethereum"})
+
+    first = client.get(reverse("watchlist"), {"since": 0}).data
+    assert first["full"] is True
+    assert sorted(item["coin"]["id"] for item in first["items"]) == ["bitcoin", "ethereum"]
+
+
+@pytest.mark.django_db
+def test_prune_tombstones_forces_full_resync(user):
+    bump_version(user.id)
+    SyncTombstone.objects.create(user=user, kind="holding", object_id="00000000-0000-0000-0000-000000000001",
+                                 version=bump_version(user.id))
+    SyncTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=60))
+    assert prune_tombstones(30) == 1
+    assert SyncState.objects.get(user=user).pruned_version == 2
@@ -0,0 +1,153 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from web_app.models import Coin, Simulation, Transaction, User
+from web_app.utils import timeline
+
+T0 = datetime(2024, 3, 1, 12, tzinfo=dt_timezone.utc)
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="tt@example.com", username="tt@example.com", password="pass")
+
+
+@pytest.fixture
+def sim(user):
+    Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    Coin.objects.create(id="ethereum", symbol="ETH", name="Ethereum")
+    return Simulation.objects.create(user=user, name="tt", start_date=date(2024, 3, 1))
+
+
+def _tx(user, sim, coin, kind, qty, price, days):
+    return Transaction.objects.create(user=user, simulation=sim, coin_id=coin, type=kind, quantity=qty, price=price,
+                                      price_currency="USD", time=T0 + timedelta(days=days))
+
+
+def _state(index, when):
+    n = int(np.searchsorted(index["t"], int(when.timestamp() * 1000), side="right"))
+    return {cid: (round(index["qty"][n - 1][c], 9), round(index["cost"][n - 1][c], 6))
+            for c, cid in enumerate(index["coins"])} if n else {}
+
+
+def _same(index, rebuilt):
+    for day in range(-1, 12):
+        when = T0 + timedelta(days=day, hours=1)
+        assert {k: v for k, v in _state(index, when).items() if v != (0, 0)} == \
+               {k: v for k, v in _state(rebuilt, when).items() if v != (0, 0)}
+
+
+@pytest.mark.django_db
+@patch("web_app.signals.schedule_snapshot_update")
+def test_incremental_updates_match_a_rebuild(mock_snapshots, user, sim, django_capture_on_commit_callbacks):
+    _tx(user, sim, "bitcoin", "BUY", 2, 100, 0)
+    _tx(user, sim, "bitcoin", "SELL", 1, 150, 5)
+    index = timeline.simulation_index(sim.id, "USD")
+    assert _state(index, T0 + timedelta(days=6)) == {"bitcoin": (1.0, 50.0)}
+
+    with django_capture_on_commit_callbacks(execute=True):
+        backdated = _tx(user, sim, "ethereum", "BUY", 3, 10, 2)  # inserted mid-ledger, new coin column
+        appended = _tx(user, sim, "bitcoin", "BUY", 1, 200, 9)
+    with django_capture_on_commit_callbacks(execute=True):
+        backdated.quantity = 4
+        backdated.save()
+        appended.delete()
+
+    with patch.object(timeline, "build_index", wraps=timeline.build_index) as build:
+        index = timeline.simulation_index(sim.id, "USD")
+        assert build.call_count == 0  # patched in place, not rebuilt
+    assert len(index["ids"]) == 3
+    assert _state(index, T0 + timedelta(days=3)) == {"bitcoin": (2.0, 200.0), "ethereum": (4.0, 40.0)}
+    _same(index, timeline.build_index(sim.id, "USD"))
+
+
+@pytest.mark.django_db
+def test_missed_update_triggers_rebuild(user, sim):
+    _tx(user, sim, "bitcoin", "BUY", 2, 100, 0)
+    timeline.simulation_index(sim.id, "USD")
+    _tx(user, sim, "bitcoin", "BUY", 1, 100, 1)  # on_commit never runs inside the test transaction
+    assert len(timeline.simulation_index(sim.id, "USD")["ids"]) == 2
+
+
+def test_parse_as_of():
+    assert timeline.parse_as_of("2024-03-05").isoformat() == "2024-03-05T23:59:59.999999+00:00"
+    assert timeline.parse_as_of("2024-03-05T10:00:00Z").hour == 10
+    for bad in ("yesterday", "2024-13-01", (date.today() + timedelta(days=2)).isoformat()):
+        with pytest.raises(ValueError):
+            timeline.parse_as_of(bad)
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.timeline.historical_prices", return_value=np.array([[300.0]]))
+def test_detail_as_of(mock_prices, user, sim):
+    client = APIClient()
+    client.force_authenticate(user=user)
+    _tx(user, sim, "bitcoin", "BUY", 2, 100, 0)
+    _tx(user, sim, "bitcoin", "SELL", 1, 150, 5)
+    _tx(user, sim, "ethereum", "BUY", 1, 10, 7)
+
+    url = reverse("simulation-detail", kwargs={"sim_id": sim.id})
+    resp = client.get(url, {"as_of": "2024-03-04"})
+    assert resp.status_code == 200
+    state = resp.data["as_of"]
+    assert state["transactions"] == 1
+    assert state["holdings"] == [{"coin_id": "bitcoin", "quantity": 2.0, "invested": 200.0, "price": 300.0,
+                                  "value": 600.0}]
+    assert (state["invested"], state["value"], state["pnl"]) == (200.0, 600.0, 400.0)
+    assert mock_prices.call_args[0][0] == ["bitcoin"]
+
+    assert client.get(url, {"as_of": "2024-02-01"}).data["as_of"]["holdings"] == []
+    assert client.get(url, {"as_of": "nope"}).status_code == 400
+    assert "as_of" not in client.get(url).data
+
+
+@pytest.mark.django_db
+def test_concurrent_patches_fall_back_to_a_rebuild(user, sim):
+    buy = _tx(user, sim, "bitcoin", "BUY", 2, 100, 0)
+    key = timeline._key(sim.id, "USD")
+    first = timeline.simulation_index(sim.id, "USD")
+
+    # Writer A reads the index and takes its generation; writer B changes the same ledger and finishes first.
+    stale = cache.get(key)
+    generation = timeline._bump_generation(sim.id)
+    Transaction.objects.filter(pk=buy.pk).update(quantity=5)
+    timeline.update_simulation_index(sim.id, buy.id, (buy.id, "bitcoin", "BUY", 5, 100, "USD", buy.time))
+    assert cache.get(key) is None  # B found the index mid-change and dropped it
+    stale["generation"] = generation
+    cache.set(key, stale)  # A's late write, missing B's change (the row count still matches)
+
+    with patch.object(timeline, "build_index", wraps=timeline.build_index) as build:
+        index = timeline.simulation_index(sim.id, "USD")
+    assert build.call_count == 1
+    assert index["generation"] > first["generation"]
+    assert _state(index, T0 + timedelta(days=1)) == {"bitcoin": (5.0, 500.0)}
+
+
+@pytest.mark.django_db
+def test_bulk_edits_that_keep_the_row_count_retire_other_copies(user, sim, django_capture_on_commit_callbacks):
+    buy = _tx(user, sim, "bitcoin", "BUY", 2, 100, 0)
+    key = timeline._key(sim.id, "USD")
+    timeline.simulation_index(sim.id, "USD")
+    elsewhere = cache.get(key)  # a copy cached by another worker before the edit
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Transaction.objects.filter(pk=buy.pk).update(quantity=5)
+        timeline.drop_simulation_index(sim.id)
+    cache.set(key, elsewhere)
+
+    index = timeline.simulation_index(sim.id, "USD")
+    assert index["generation"] == Simulation.objects.get(pk=sim.pk).ledger_generation
+    assert _state(index, T0 + timedelta(days=1)) == {"bitcoin": (5.0, 500.0)}
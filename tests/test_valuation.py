@@ -0,0 +1,144 @@
+from datetime import datetime, time as dt_time, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from web_app.models import Coin, Simulation, SimulationValuation, Transaction, User
+from web_app.utils import valuation
+from web_app.utils.series import MS_PER_DAY
+from web_app.utils.simulations import freeze_pending, simulation_summaries
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(email="frozen@example.com", username="frozen@example.com", password="pass")
+
+
+def _chart(coin_id, vs_currency="usd", days=7, interval=None):
+    """bitcoin closes at 100 + day index for the last 60 days; other coins have no data."""
+    if coin_id != "bitcoin":
+        return None
+    today = timezone.now().date()
+    first = datetime.combine(today - timedelta(days=60), dt_time(12), tzinfo=dt_timezone.utc)
+    return {"prices": [[int(first.timestamp() * 1000) + i * MS_PER_DAY, 100.0 + i] for i in range(61)]}
+
+
+def _ended(user, coin, days_ago=10, status="ENDED"):
+    today = timezone.now().date()
+    sim = Simulation.objects.create(user=user, name=f"Ended {days_ago}", start_date=today - timedelta(days=30),
+                                    end_date=today - timedelta(days=days_ago), status=status)
+    Transaction.objects.create(user=user, simulation=sim, coin=coin, type="BUY", quantity=2, price=100,
+                               time=timezone.now() - timedelta(days=20))
+    return sim
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.prices.get_markets", return_value=[])
+@patch("web_app.utils.series.get_coin_market_chart", side_effect=_chart)
+@patch("web_app.utils.backtest.get_coin_market_chart", side_effect=_chart)
+def test_finished_simulations_are_valued_once_at_their_end_date(mock_hist, _series, _markets, user):
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin", current_price=1)
+    sim = _ended(user, btc)
+
+    # Summaries never freeze: until the job has run the simulation is valued live.
+    assert "valued_at" not in simulation_summaries([sim])[sim.id]
+    assert not SimulationValuation.objects.exists() and mock_hist.call_count == 0
+
+    assert freeze_pending() == {"checked": 1, "frozen": 1, "deferred": 0}
+    summary = simulation_summaries([sim])[sim.id]
+    # Close on end_date (10 days ago) is 100 + 50.
+    assert summary["current_value"] == 300.0 and summary["invested"] == 200.0
+    assert summary["valued_at"] == sim.end_date.isoformat()
+    assert summary["metrics"]["total_return_pct"] is not None
+    frozen = SimulationValuation.objects.get(simulation=sim)
+    assert frozen.holdings == [{"coin_id": "bitcoin", "quantity": 2.0, "price": 150.0, "value": 300.0}]
+
+    cache.clear()
+    calls = mock_hist.call_count
+    with patch("web_app.utils.simulations.live_quotes") as quotes:
+        again = simulation_summaries([sim])[sim.id]
+    assert again == summary
+    quotes.assert_not_called()
+    assert mock_hist.call_count == calls  # no price lookups once frozen, even with a cold cache
+    freeze_pending()
+    assert mock_hist.call_count == calls and SimulationValuation.objects.get().id == frozen.id
+
+    # A trade added after freezing makes the stored valuation stale: reads fall back to live prices and
+    # leave the row alone; the next job run replaces it.
+    Transaction.objects.create(user=user, simulation=sim, coin=btc, type="BUY", quantity=1, price=100,
+                               time=timezone.now() - timedelta(days=15))
+    assert "valued_at" not in simulation_summaries([sim])[sim.id]
+    assert SimulationValuation.objects.get(simulation=sim).id == frozen.id
+    call_command("freeze_simulations")
+    assert simulation_summaries([sim])[sim.id]["current_value"] == 450.0
+    assert SimulationValuation.objects.get(simulation=sim).id != frozen.id
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.prices.get_markets", return_value=[])
+@patch("web_app.utils.series.get_coin_market_chart", side_effect=_chart)
+@patch("web_app.utils.backtest.get_coin_market_chart", side_effect=_chart)
+def test_unpriced_coins_are_not_frozen_and_back_off(_hist, _series, _markets, user):
+    odd = Coin.objects.create(id="oddcoin", symbol="ODD", name="Odd", current_price=7)
+    sim = _ended(user, odd)
+    assert freeze_pending() == {"checked": 1, "frozen": 0, "deferred": 1}
+    sim.refresh_from_db()
+    assert sim.freeze_attempts == 1 and sim.freeze_retry_at > timezone.now()
+    assert freeze_pending()["checked"] == 0  # backing off
+
+    summary = simulation_summaries([sim])[sim.id]
+    assert "valued_at" not in summary and summary["current_value"] == 14.0  # live fallback
+    assert not SimulationValuation.objects.exists()
+
+
+@pytest.mark.django_db
+@patch("web_app.utils.prices.get_markets", return_value=[])
+@patch("web_app.utils.series.get_coin_market_chart", side_effect=_chart)
+@patch("web_app.utils.backtest.get_coin_market_chart", side_effect=_chart)
+def test_ending_queues_a_freeze_and_reopening_discards(mock_hist, _series, _markets, user,
+                                                       django_capture_on_commit_callbacks):
+    btc = Coin.objects.create(id="bitcoin", symbol="BTC", name="Bitcoin")
+    sim = _ended(user, btc, status="ACTIVE")
+
+    sim.status = "ENDED"
+    with django_capture_on_commit_callbacks(execute=True):
+        sim.save()
+    assert not SimulationValuation.objects.exists() and mock_hist.call_count == 0
+    freeze_pending()
+    assert SimulationValuation.objects.filter(simulation=sim, valued_at=sim.end_date).exists()
+
+    client = APIClient()
+    client.force_authenticate(user=user)
+    frozen = SimulationValuation.objects.get(simulation=sim).metrics
+    assert client.get(reverse("simulation-metrics", kwargs={"sim_id": sim.id})).data["total_return_pct"] == \
+        frozen["total_return_pct"]
+    listed = client.get(reverse("simulations")).data
+    rows = listed if isinstance(listed, list) else listed["results"]
+    assert rows[0]["valued_at"] == sim.end_date.isoformat() and rows[0]["metrics"] == frozen
+
+    Simulation.objects.filter(pk=sim.pk).update(freeze_attempts=3, freeze_retry_at=timezone.now())
+    sim.refresh_from_db()
+    sim.status = "ACTIVE"
+    sim.save()
+    sim.refresh_from_db()
+    assert not SimulationValuation.objects.exists()
+    assert sim.freeze_attempts == 0 and sim.freeze_retry_at is None
+
+
+def test_valuation_date_caps_at_today():
+    today = timezone.now().date()
+    assert valuation.valuation_date(Simulation(end_date=today + timedelta(days=5))) == today
+    assert valuation.valuation_date(Simulation(end_date=None)) == today
+    assert valuation.valuation_date(Simulation(end_date=today - timedelta(days=3))) == today - timedelta(days=3)
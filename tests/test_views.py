@@ -9,8 +9,10 @@ from datetime import timedelta
 from types import SimpleNamespace
 from unittest.mock import patch
 
-from web_app.models import User, PasswordResetToken, Coin, WatchListItem, Holding, Transaction, Simulation
+from web_app.models import (User, PasswordResetToken, Coin, FxRate, WatchListItem, Holding, Transaction, Simulation,
+                            PortfolioSummary)
 from web_app.serializers import TransactionSerializer
+from web_app.utils.portfolio import get_summary
 
 @pytest.fixture
 def api_client():
@@ -666,6 +668,16 @@ class TestAdminTransactionsAPI:
         response = api_client.delete(url)
         assert response.status_code == 204
 
+    def test_delete_transaction_locks_the_owners_holding(self, api_client, user, staff_user, coin, sim):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        tx = Transaction.objects.create(user=user, coin=coin, simulation=sim, quantity=1, type="BUY", price=50000)
+        with CaptureQueriesContext(connection) as ctx:
+            api_client.delete(reverse("admin-transaction-detail", args=[tx.id]))
+        lock = next(q["sql"] for q in ctx.captured_queries if q["sql"].startswith('SELECT "web_app_holding"'))
+        assert user.id.hex in lock and staff_user.id.hex not in lock
+
     def test_create_transaction(self, api_client, user, coin, sim):
         payload = {
             "user_id": str(user.id),
@@ -1038,6 +1050,25 @@ def test_create_transaction_view(api_client, user):
     assert resp.data["coin"]["id"] == coin.id
 
 
+@pytest.mark.django_db
+def test_create_transaction_keeps_summary_in_step_with_ledger(api_client, user):
+    api_client.force_authenticate(user=user)
+    coin = Coin.objects.create(id="uni", symbol="UNI", name="Uniswap", current_price=Decimal("5"))
+    get_summary(user)  # an existing running summary must be updated, not left behind
+    api_client.post(reverse("transaction-create"), {"type": "BUY", "coin_id": coin.id, "quantity": "2", "price": "5"})
+    resp = api_client.post(reverse("transaction-create"),
+                           {"type": "SELL", "coin_id": coin.id, "quantity": "1", "price": "8"})
+    assert resp.status_code == 201
+    summary = PortfolioSummary.objects.get(user=user, simulation=None)
+    assert (summary.trade_count, summary.total_cost_basis, summary.realised_total) == (2, Decimal("5"), Decimal("3"))
+    assert Holding.objects.get(user=user, coin=coin).quantity == Decimal("1")
+
+    oversell = api_client.post(reverse("transaction-create"),
+                               {"type": "SELL", "coin_id": coin.id, "quantity": "5", "price": "8"})
+    assert oversell.status_code == 400 and oversell.data["code"] == 1001
+    assert Transaction.objects.filter(user=user).count() == 2
+
+
 @pytest.mark.django_db
 def test_list_transactions_view(api_client, user):
     api_client.force_authenticate(user=user)
@@ -1243,6 +1274,100 @@ def test_simulation_transaction_invalid_data_returns_400(api_client, user):
     assert resp.data["code"] == 1000
 
 
+@pytest.mark.django_db
+def test_simulation_trades_maintain_holdings_and_positions(api_client, user):
+    api_client.force_authenticate(user=user)
+    sim = Simulation.objects.create(user=user, name="Held", start_date=timezone.localdate())
+    url = reverse("simulation-transaction", kwargs={"sim_id": str(sim.id)})
+    with patch("web_app.utils.coingecko.get_price_at_timestamp", return_value=None), \
+         patch("web_app.utils.coingecko.get_current_prices", return_value={}):
+        api_client.post(url, {"coin_id": "ethereum", "quantity": "2", "price": "100", "type": "BUY"})
+        sell = api_client.post(url, {"coin_id": "ethereum", "quantity": "0.5", "price": "300", "type": "SELL"})
+        over = api_client.post(url, {"coin_id": "ethereum", "quantity": "5", "price": "300", "type": "SELL"})
+    assert sell.status_code == 201
+    assert over.status_code == 400 and over.data["code"] == 1001
+    holding = Holding.objects.get(user=user, simulation=sim)
+    assert holding.quantity == Decimal("1.5")
+    assert Holding.objects.filter(user=user, simulation=None).count() == 0
+
+    positions_url = reverse("simulation-positions", kwargs={"sim_id": str(sim.id)})
+    with patch("web_app.utils.portfolio.live_quotes", return_value={"ethereum": {"price": 200.0, "change_24h_pct": 1.0}}):
+        resp = api_client.get(positions_url)
+    assert resp.status_code == 200
+    assert [h["coin_id"] for h in resp.data["holdings"]] == ["ethereum"]
+    assert resp.data["holdings"][0]["market_value"] == 300.0
+    assert resp.data["totals"]["market_value"] == 300.0
+
+    buy_tx = Transaction.objects.get(simulation=sim, type="BUY")
+    sell_tx = Transaction.objects.get(simulation=sim, type="SELL")
+    # The sell still needs the buy's quantity
+    assert api_client.delete(reverse("transaction-delete", kwargs={"tx_id": buy_tx.id})).data["code"] == 1001
+    api_client.delete(reverse("transaction-delete", kwargs={"tx_id": sell_tx.id}))
+    api_client.delete(reverse("transaction-delete", kwargs={"tx_id": buy_tx.id}))
+    assert not Holding.objects.filter(user=user, simulation=sim).exists()
+
+    other = User.objects.create_user(username="pos_other", email="pos_other@example.com", password="x")
+    api_client.force_authenticate(user=other)
+    assert api_client.get(positions_url).status_code == 404
+
+
+@pytest.mark.django_db
+def test_simulation_buy_records_cost_in_usd(api_client, user):
+    user.preferred_currency = "EUR"
+    user.save()
+    api_client.force_authenticate(user=user)
+    sim = Simulation.objects.create(user=user, name="Euro", start_date=timezone.localdate())
+    FxRate.objects.create(currency="EUR", rate=Decimal("0.5"), fetched_at=timezone.now())  # 1 EUR = 2 USD
+    with patch("web_app.utils.coingecko.get_price_at_timestamp", return_value=None), \
+         patch("web_app.utils.coingecko.get_current_prices", return_value={}), \
+         patch("web_app.utils.currency.get_coin_market_chart", return_value=None), \
+         patch("web_app.views.record_trade") as record:
+        resp = api_client.post(reverse("simulation-transaction", kwargs={"sim_id": str(sim.id)}),
+                               {"coin_id": "ethereum", "quantity": "2", "price": "100", "type": "BUY"})
+    assert resp.status_code == 201 and resp.data["price_currency"] == "EUR"
+    assert record.call_args.kwargs["cost_delta"] == Decimal("400")
+
+
+def _sim_trade(api_client, sim, side, quantity, price, when):
+    with patch("web_app.utils.coingecko.get_price_at_timestamp", return_value=None), \
+         patch("web_app.utils.coingecko.get_current_prices", return_value={}):
+        return api_client.post(reverse("simulation-transaction", kwargs={"sim_id": str(sim.id)}),
+                               {"coin_id": "bitcoin", "quantity": quantity, "price": price, "type": side,
+                                "time": when.isoformat()})
+
+
+@pytest.mark.django_db
+def test_simulation_backdated_sell_before_the_buy_is_rejected(api_client, user):
+    api_client.force_authenticate(user=user)
+    sim = Simulation.objects.create(user=user, name="Early", start_date=timezone.localdate() - timedelta(days=30))
+    now = timezone.now()
+    assert _sim_trade(api_client, sim, "BUY", "1", "100", now - timedelta(days=1)).status_code == 201
+
+    resp = _sim_trade(api_client, sim, "SELL", "1", "150", now - timedelta(days=10))
+    assert resp.status_code == 400 and resp.data["code"] == 1001
+    assert not Transaction.objects.filter(simulation=sim, type="SELL").exists()
+    assert Holding.objects.get(user=user, simulation=sim).quantity == Decimal("1")
+
+
+@pytest.mark.django_db
+def test_simulation_backdated_sell_rebuilds_the_summary(api_client, user):
+    user.cost_basis_method = "FIFO"
+    user.save()
+    api_client.force_authenticate(user=user)
+    sim = Simulation.objects.create(user=user, name="Backdated", start_date=timezone.localdate() - timedelta(days=30))
+    now = timezone.now()
+    _sim_trade(api_client, sim, "BUY", "1", "100", now - timedelta(days=5))
+    _sim_trade(api_client, sim, "BUY", "1", "200", now - timedelta(days=3))
+    _sim_trade(api_client, sim, "SELL", "1", "300", now - timedelta(days=1))
+    assert get_summary(user, sim).realised_total == Decimal("200")
+
+    # The backdated sell takes the first lot, so the later sell now closes the 200 lot
+    assert _sim_trade(api_client, sim, "SELL", "1", "250", now - timedelta(days=4)).status_code == 201
+    summary = get_summary(user, sim)
+    assert summary.realised_total == Decimal("250")
+    assert summary.total_cost_basis == Decimal("0")
+
+
 # ----------------------
 # Transaction Tests
 # ----------------------
@@ -1475,4 +1600,138 @@ def test_admin_transaction_detail_forbidden_for_non_staff(api_client, user):
     url = reverse("admin-transaction-detail", kwargs={"tx_id": str(tx.id)})
     resp = api_client.delete(url)
     assert resp.status_code == 403
-    assert resp.data["code"] == 1001
\ No newline at end of file
+    assert resp.data["code"] == 1001
+
+@pytest.mark.django_db
+def test_portfolio_reports_realised_total_local(api_client, user):
+    api_client.force_authenticate(user=user)
+    api_client.post(reverse("portfolio"), {"coin_id": "bitcoin", "quantity": "1.0", "price": "50000"})
+    resp = api_client.post(reverse("portfolio-sell"), {"coin_id": "bitcoin", "quantity": "0.5", "price": "60000"})
+    assert resp.data["realised_total"] == 5000.0
+    assert resp.data["realised_total_local"] == 5000.0
+    assert resp.data["currency"] == "USD"
+
+
+@pytest.mark.django_db
+def test_portfolio_performance_endpoint(api_client, user):
+    api_client.force_authenticate(user=user)
+    api_client.post(reverse("portfolio"), {"coin_id": "bitcoin", "quantity": "2", "price": "100"})
+    with patch("web_app.utils.series.get_coin_market_chart", return_value={"prices": [[0, 150]]}) as mock_chart:
+        resp = api_client.get(reverse("portfolio-performance") + "?days=5")
+    assert resp.status_code == 200
+    assert resp.data["coins"] == ["bitcoin"]
+    assert len(resp.data["t"]) == 5
+    assert resp.data["unrealised"] == [100.0] * 5
+    mock_chart.assert_called_once_with("bitcoin", "usd", 5)
+
+
+@pytest.mark.django_db
+def test_portfolio_performance_rejects_bad_days(api_client, user):
+    api_client.force_authenticate(user=user)
+    assert api_client.get(reverse("portfolio-performance") + "?days=abc").status_code == 400
+    assert api_client.get(reverse("portfolio-performance") + "?days=0").status_code == 400
+
+
+@pytest.mark.django_db
+def test_portfolio_batch_applies_trades_in_order(api_client, user):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    api_client.force_authenticate(user=user)
+    trades = [
+        {"coin_id": "bitcoin", "type": "BUY", "quantity": "2", "price": "100"},
+        {"coin_id": "ethereum", "type": "BUY", "quantity": "1", "price": "50"},
+        {"coin_id": "bitcoin", "type": "SELL", "quantity": "1", "price": "130"},
+    ]
+    with CaptureQueriesContext(connection) as ctx:
+        resp = api_client.post(reverse("portfolio-batch"), {"trades": trades}, format="json")
+    assert resp.status_code == 201
+    assert len(resp.data["transactions"]) == 3
+    inserts = [q for q in ctx.captured_queries if q["sql"].startswith('INSERT INTO "web_app_transaction"')]
+    assert len(inserts) == 1
+
+    sides = list(Transaction.objects.filter(user=user).order_by("time", "id").values_list("coin_id", "type"))
+    assert sides == [("bitcoin", "BUY"), ("ethereum", "BUY"), ("bitcoin", "SELL")]
+    assert Holding.objects.get(user=user, coin_id="bitcoin").quantity == Decimal("1")
+    assert resp.data["realised_total"] == 30.0
+    assert resp.data["trade_count"] == 3
+    assert resp.data["total_cost_basis"] == 150.0
+
+
+@pytest.mark.django_db
+def test_portfolio_batch_is_all_or_nothing(api_client, user):
+    api_client.force_authenticate(user=user)
+    trades = [
+        {"coin_id": "bitcoin", "type": "BUY", "quantity": "1", "price": "100"},
+        {"coin_id": "bitcoin", "type": "SELL", "quantity": "3", "price": "100"},
+    ]
+    resp = api_client.post(reverse("portfolio-batch"), {"trades": trades}, format="json")
+    assert resp.status_code == 400
+    assert resp.data["code"] == 1001
+    assert resp.data["errors"][0]["index"] == 1
+    assert not Transaction.objects.filter(user=user).exists()
+    assert not Holding.objects.filter(user=user).exists()
+    assert not Coin.objects.filter(id="bitcoin").exists()  # created inside the rolled back transaction
+
+
+@pytest.mark.django_db
+def test_portfolio_batch_validates_every_trade(api_client, user):
+    api_client.force_authenticate(user=user)
+    trades = [
+        {"coin_id": "bitcoin", "type": "BUY", "quantity": "1", "price": "100"},
+        {"coin_id": "bitcoin", "type": "HOLD", "quantity": "1", "price": "100"},
+        {"coin_id": "bitcoin", "type": "BUY", "quantity": "-1", "price": "100"},
+    ]
+    resp = api_client.post(reverse("portfolio-batch"), {"trades": trades}, format="json")
+    assert resp.status_code == 400
+    assert resp.data["code"] == 1000
+    assert [e["index"] for e in resp.data["errors"]] == [1, 2]
+    assert api_client.post(reverse("portfolio-batch"), {"trades": []}, format="json").status_code == 400
+
+
+def _simulation_list_queries(api_client, user, count):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    coins = [Coin.objects.get_or_create(id=cid, defaults={"symbol": cid[:3].upper(), "name": cid})[0]
+             for cid in ("bitcoin", "ethereum", "solana")]
+    for i in range(Simulation.objects.filter(user=user).count(), count):
+        sim = Simulation.objects.create(user=user, name=f"Sim {i}", start_date=timezone.now().date())
+        for coin in coins:
+            Transaction.objects.create(user=user, simulation=sim, coin=coin, type="BUY", quantity=2, price=10)
+        Transaction.objects.create(user=user, simulation=sim, coin=coins[0], type="SELL", quantity=1, price=20)
+    with patch("web_app.utils.prices.get_markets",
+               return_value=[{"id": "bitcoin", "current_price": 30}, {"id": "ethereum", "current_price": 15}]) as mock:
+        with CaptureQueriesContext(connection) as ctx:
+            resp = api_client.get(reverse("simulations"))
+    assert mock.call_count == 1
+    return resp, len(ctx.captured_queries)
+
+
+@pytest.mark.django_db
+def test_simulation_list_summaries_use_constant_queries(api_client, user):
+    from django.core.cache import cache
+
+    api_client.force_authenticate(user=user)
+    cache.clear()
+    resp, few = _simulation_list_queries(api_client, user, 2)
+    cache.clear()
+    resp, many = _simulation_list_queries(api_client, user, 12)
+    assert few == many
+    rows = resp.data if isinstance(resp.data, list) else resp.data["results"]
+    assert len(rows) == 12
+    # 60 bought - 20 sold; 5 units left; btc 1 @ 30 + eth 2 @ 15 + sol 2 @ its Coin row price (0)
+    assert {(r["invested"], r["units"], r["current_value"]) for r in rows} == {(40.0, 5.0, 60.0)}
+
+
+@pytest.mark.django_db
+def test_simulation_series_endpoint(api_client, user):
+    api_client.force_authenticate(user=user)
+    sim = Simulation.objects.create(user=user, name="Series", start_date=timezone.now().date())
+    resp = api_client.get(reverse("simulation-series", kwargs={"sim_id": sim.id}))
+    assert resp.status_code == 200
+    assert resp.data["value"] == []
+
+    other = User.objects.create_user(email="other-series@example.com", username="other-series", password="pass")
+    theirs = Simulation.objects.create(user=other, name="Theirs", start_date=timezone.now().date())
+    assert api_client.get(reverse("simulation-series", kwargs={"sim_id": theirs.id})).status_code == 404
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import User, Coin, Simulation, CurrentPrice, PriceCache, Holding, Transaction, WatchListItem
+from .models import User, Coin, Simulation, CurrentPrice, PriceCache, Holding, Transaction, WatchListItem, PortfolioSnapshot, BacktestSweep, LeaderboardEntry, SimulationArchive
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
@@ -42,3 +42,25 @@ class TransactionAdmin(admin.ModelAdmin):
 @admin.register(WatchListItem)
 class WatchListItemAdmin(admin.ModelAdmin):
     list_display = ("user", "coin", "simulation", "created_at")
+
+@admin.register(PortfolioSnapshot)
+class PortfolioSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("user", "simulation", "currency", "date", "value", "cost_basis", "realised_profit")
+    list_filter = ("currency",)
+    search_fields = ("user__email",)
+
+@admin.register(BacktestSweep)
+class BacktestSweepAdmin(admin.ModelAdmin):
+    list_display = ("name", "user", "status", "completed", "total", "rank_by", "created_at")
+    list_filter = ("status",)
+    search_fields = ("user__email", "name")
+
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ("window", "rank", "simulation", "user", "return_pct", "computed_at")
+    list_filter = ("window",)
+
+@admin.register(SimulationArchive)
+class SimulationArchiveAdmin(admin.ModelAdmin):
+    list_display = ("simulation", "size", "counts", "created_at")
+    exclude = ("payload",)
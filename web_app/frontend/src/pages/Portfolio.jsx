@@ -9,10 +9,16 @@ import {
   Tooltip,
   Filler,
 } from "chart.js";
-import { fetchMarketsByIds, searchCoins, fetchMarketChart } from "../services/coingecko";
+import { fetchMarketsByIds, searchCoins } from "../services/coingecko";
 import { useAuth } from "../state/AuthContext";
 import { useUserCurrency } from "../hooks/useUserCurrency";
-import { fetchPortfolio, buyHolding, sellHolding as sellHoldingApi } from "../services/portfolio";
+import {
+  applyPortfolioDelta,
+  fetchPortfolio,
+  fetchPortfolioPerformance,
+  buyHolding,
+  sellHolding as sellHoldingApi,
+} from "../services/portfolio";
 
 ChartJS.register(LineElement, CategoryScale, LinearScale, PointElement, Tooltip, Filler);
 
@@ -143,6 +149,9 @@ const normalizeHoldingsFromApi = (holdings) => {
       quantity: toFiniteNumber(h.quantity) ?? 0,
       avgBuyPrice: toFiniteNumber(h.avg_price) ?? 0,
       avgPriceBaseCurrency: (h.avg_price_currency || "USD").toUpperCase(),
+      // live valuation resolved server-side in the user's currency
+      livePrice: toFiniteNumber(h.current_price),
+      liveCh24h: toFiniteNumber(h.change_24h_pct),
       // meta
       name: coin.name || h.name,
       symbol: (coin.symbol || h.symbol || "").toUpperCase(),
@@ -162,7 +171,7 @@ const mergeHoldingsWithMarket = (holdings, marketData = [], usdRate = 1, display
     const market = marketData.find((m) => m.id === holding.id) || {};
     const quantity = toFiniteNumber(holding.quantity) ?? 0;
     const avgBuyPriceUsd = toFiniteNumber(holding.avgBuyPrice) ?? 0;
-    const rawCurrentPrice = toFiniteNumber(market.current_price);
+    const rawCurrentPrice = holding.livePrice ?? toFiniteNumber(market.current_price);
     const fallbackPrice =
       rawCurrentPrice != null && rawCurrentPrice > 0
         ? rawCurrentPrice
@@ -195,12 +204,11 @@ const mergeHoldingsWithMarket = (holdings, marketData = [], usdRate = 1, display
       symbol: (market?.symbol || holding.symbol || holding.id || "").toUpperCase(),
       image: market?.image ?? holding.image ?? null,
       currentPrice: resolvedPrice ?? 0,
-      ch24h: toFiniteNumber(market?.ch24h),
-      ch7d: toFiniteNumber(market?.ch7d),
-      sparkline: buildSparklineSeries(
-        market?.sparkline_in_7d?.price,
-        fallbackPrice
-      ),
+      ch24h: holding.liveCh24h ?? toFiniteNumber(market?.ch24h),
+      ch7d: toFiniteNumber(market?.ch7d) ?? holding.ch7d ?? null,
+      sparkline: market?.sparkline_in_7d?.price
+        ? buildSparklineSeries(market.sparkline_in_7d.price, fallbackPrice)
+        : holding.sparkline ?? buildSparklineSeries(null, fallbackPrice),
       transactions: Array.isArray(holding.transactions)
         ? holding.transactions.map((tx) => ({
             ...tx,
@@ -215,12 +223,12 @@ const mergeHoldingsWithMarket = (holdings, marketData = [], usdRate = 1, display
   });
 };
 
-const bucketTimestamp = (timestamp) => {
-  const rawTs = toFiniteNumber(timestamp);
-  if (rawTs == null) return null;
-  const bucketSizeMs = 24 * ONE_HOUR_MS;
-  return Math.floor(rawTs / bucketSizeMs) * bucketSizeMs;
-};
+// Keep already-loaded sparklines and 7d change when refreshing from a trade response.
+const withKnownSparklines = (holdings, previous = []) =>
+  holdings.map((holding) => {
+    const known = previous.find((p) => p.id === holding.id);
+    return known ? { ...holding, sparkline: known.sparkline, ch7d: known.ch7d } : holding;
+  });
 
 const isSameDay = (leftTs, rightTs) => {
   const left = new Date(leftTs);
@@ -433,6 +441,11 @@ export default function Portfolio() {
 
   useEffect(() => {
     let cancel = false;
+    // Polls after the first load ask only for holdings changed since the last sync version.
+    let syncVersion = null;
+    let apiHoldings = [];
+    // Sparklines and 7d change for coins already decorated; refetched only when a new coin appears.
+    let marketData = [];
     async function loadPortfolio() {
       // Only show loading spinner on initial load, not on refreshes
       const isInitialLoad = holdings.length === 0;
@@ -440,9 +453,22 @@ export default function Portfolio() {
       setError(null);
       
       try {
-        const payload = await fetchPortfolio(authFetch);
-        const apiHoldings = payload.holdings || [];
-        const savedHoldings = normalizeHoldingsFromApi(apiHoldings);
+        const payload = await fetchPortfolio(authFetch, syncVersion);
+        const isDelta = payload.full === false;
+        apiHoldings = applyPortfolioDelta(apiHoldings, payload);
+        if (payload.version != null) syncVersion = payload.version;
+        const changedIds = new Set((payload.holdings || []).map((h) => h.holding_id));
+        // Unchanged rows in a delta are repriced from the live quotes that come with it.
+        const quotes = payload.quotes || {};
+        const savedHoldings = normalizeHoldingsFromApi(apiHoldings).map((h, i) =>
+          isDelta && !changedIds.has(apiHoldings[i].holding_id)
+            ? {
+                ...h,
+                livePrice: toFiniteNumber(quotes[h.id]?.price),
+                liveCh24h: toFiniteNumber(quotes[h.id]?.change_24h_pct),
+              }
+            : h
+        );
 
         if (!savedHoldings.length) {
           if (!cancel) {
@@ -452,23 +478,23 @@ export default function Portfolio() {
           return;
         }
 
+        // Prices, P&L and 24h change come with the portfolio payload
+        if (!cancel) setHoldings(mergeHoldingsWithMarket(savedHoldings, marketData, usdConversion, userCurrency));
+        if (isInitialLoad) setLoading(false);
+
+        // Sparklines and 7d change are decoration; load them without blocking the table
         const ids = savedHoldings.map((h) => h.id).filter(Boolean);
-        // Backend will cache this for 5 minutes, so frequent calls are OK
-        const marketData = await fetchMarketsByIds({
+        const decorated = new Set(marketData.map((m) => m.id));
+        if (ids.every((id) => decorated.has(id))) return;
+        marketData = await fetchMarketsByIds({
           ids,
           vsCurrency: normalizedCurrency,
-          priceChangePct: "24h,7d",
+          priceChangePct: "7d",
           sparkline: true,
         });
-
-        const enrichedHoldings = mergeHoldingsWithMarket(
-          savedHoldings,
-          marketData,
-          usdConversion,
-          userCurrency
-        );
-
-        if (!cancel) setHoldings(enrichedHoldings);
+        if (!cancel) {
+          setHoldings(mergeHoldingsWithMarket(savedHoldings, marketData, usdConversion, userCurrency));
+        }
       } catch (err) {
         console.error("Portfolio load error:", err);
         if (!cancel) setError(err.message || "Failed to load portfolio");
@@ -666,20 +692,17 @@ export default function Portfolio() {
         showFlash("Crypto not found. Check the ID.", "error");
         return;
       }
-      await buyHolding(authFetch, { coin_id: cryptoId, quantity, price: buyPrice, currency: userCurrency });
-      const updatedPayload = await fetchPortfolio(authFetch);
-      const updatedHoldings = normalizeHoldingsFromApi(updatedPayload.holdings || []);
-      const ids = Array.from(new Set(updatedHoldings.map((h) => h.id).filter(Boolean)));
-      const marketData = ids.length
-        ? await fetchMarketsByIds({ ids, vsCurrency: normalizedCurrency, priceChangePct: "24h,7d", sparkline: true })
-        : [];
-      const enrichedHoldings = mergeHoldingsWithMarket(
-        updatedHoldings,
-        marketData,
-        usdConversion,
-        userCurrency
-      );
-      setHoldings(enrichedHoldings);
+      const updatedPayload = await buyHolding(authFetch, {
+        coin_id: cryptoId,
+        quantity,
+        price: buyPrice,
+        currency: userCurrency,
+      });
+      const updatedHoldings = withKnownSparklines(normalizeHoldingsFromApi(updatedPayload.holdings || []), [
+        ...holdings,
+        { id: selectedCoin.id, sparkline: buildSparklineSeries(selectedCoin.sparkline_in_7d?.price, null) },
+      ]);
+      setHoldings(mergeHoldingsWithMarket(updatedHoldings, [], usdConversion, userCurrency));
       setRealisedProfitBase(Number(updatedPayload?.realised_total) || 0);
       setShowAddModal(false);
       setNewCryptoId("");
@@ -726,9 +749,13 @@ export default function Portfolio() {
 
     setSellingCrypto(true);
     try {
-      await sellHoldingApi(authFetch, { coin_id: sellCryptoId, quantity, price: sellQuotePrice, currency: userCurrency });
-      const payload = await fetchPortfolio(authFetch);
-      const savedHoldings = normalizeHoldingsFromApi(payload.holdings || []);
+      const payload = await sellHoldingApi(authFetch, {
+        coin_id: sellCryptoId,
+        quantity,
+        price: sellQuotePrice,
+        currency: userCurrency,
+      });
+      const savedHoldings = withKnownSparklines(normalizeHoldingsFromApi(payload.holdings || []), holdings);
       if (savedHoldings.length === 0) {
         setHoldings([]);
         setRealisedProfitBase(Number(payload?.realised_total) || 0);
@@ -737,22 +764,7 @@ export default function Portfolio() {
         return;
       }
 
-      const ids = savedHoldings.map((h) => h.id).filter(Boolean);
-      const allMarketData = await fetchMarketsByIds({
-        ids,
-        vsCurrency: normalizedCurrency,
-        priceChangePct: "24h,7d",
-        sparkline: true,
-      });
-
-      const enrichedHoldings = mergeHoldingsWithMarket(
-        savedHoldings,
-        allMarketData,
-        usdConversion,
-        userCurrency
-      );
-
-      setHoldings(enrichedHoldings);
+      setHoldings(mergeHoldingsWithMarket(savedHoldings, [], usdConversion, userCurrency));
       setRealisedProfitBase(Number(payload?.realised_total) || 0);
       setShowSellModal(false);
       setSellCryptoId("");
@@ -831,121 +843,20 @@ export default function Portfolio() {
       setChartError(null);
       setChartLoading(true);
       try {
-        const totalCostBasis = holdings.reduce(
-          (acc, holding) =>
-            acc +
-            (toFiniteNumber(holding.quantity) ?? 0) *
-              (toFiniteNumber(holding.avgBuyPrice) ?? 0),
-          0
-        );
-
+        // Value / unrealised P&L series are aligned and summed server-side.
         let hadChartErrors = false;
-        const chartPromises = holdings.map((holding) =>
-          fetchMarketChart({
-            id: holding.id,
-            vsCurrency: normalizedCurrency,
-            days: chartDays.toString(),
-            interval: "daily",
-          }).catch((err) => {
-            console.error(`Failed to fetch market chart for ${holding.id}:`, err);
-            hadChartErrors = true;
-            return [];
-          })
-        );
-        let allChartData = await Promise.all(chartPromises);
-
-        // Fall back to sparkline data if market chart is unavailable
-        allChartData = allChartData.map((data, idx) => {
-          if (Array.isArray(data) && data.length > 0) return data;
-          const holding = holdings[idx];
-          if (!holding?.sparkline || holding.sparkline.length === 0) return [];
-          const nowTs = Date.now();
-          const spanSteps = Math.max(holding.sparkline.length - 1, 1);
-          const stepMs =
-            (chartDays * 24 * 60 * 60 * 1000) / spanSteps;
-          return holding.sparkline.map((price, i) => [
-            nowTs - (holding.sparkline.length - 1 - i) * stepMs,
-            price,
-          ]);
-        });
-
-        const nowTs = Date.now();
-        const nowBucket = bucketTimestamp(nowTs);
-        const windowStart = nowTs - (chartDays - 1) * 24 * 60 * 60 * 1000;
-
-        // Build portfolio unrealised profit map: sum(quantity * (price_t - avgBuyPrice))
-        const portfolioProfitMap = new Map();
-        const allTimestamps = new Set();
-
-        holdings.forEach((holding, index) => {
-          if (!holding) return;
-          const qty = toFiniteNumber(holding.quantity) ?? 0;
-          const avg = toFiniteNumber(holding.avgBuyPrice) ?? 0;
-          if (!Number.isFinite(qty) || qty <= 0) return;
-
-          const coinData = Array.isArray(allChartData?.[index])
-            ? allChartData[index]
-            : [];
-
-          const priceByTimestamp = new Map();
-          coinData.forEach((point) => {
-            if (!Array.isArray(point) || point.length < 2) return;
-            const timestamp = bucketTimestamp(point[0]);
-            if (timestamp == null || timestamp < windowStart) return;
-            const price = toFiniteNumber(point[1]);
-            if (!Number.isFinite(price)) return;
-            priceByTimestamp.set(timestamp, price);
-          });
-
-          if (!priceByTimestamp.size) return;
-
-          const sortedPriceEntries = Array.from(priceByTimestamp.entries()).sort(
-            (a, b) => a[0] - b[0]
-          );
-
-          sortedPriceEntries.forEach(([timestamp, price]) => {
-            allTimestamps.add(timestamp);
-            const profitContribution = qty * (price - avg);
-            portfolioProfitMap.set(
-              timestamp,
-              (portfolioProfitMap.get(timestamp) ?? 0) + profitContribution
-            );
-          });
-
-          const currentPrice = toFiniteNumber(holding.currentPrice);
-          if (Number.isFinite(currentPrice)) {
-            allTimestamps.add(nowBucket);
-            const currentProfit = qty * (currentPrice - avg);
-            portfolioProfitMap.set(
-              nowBucket,
-              (portfolioProfitMap.get(nowBucket) ?? 0) + currentProfit
-            );
-          }
+        const performance = await fetchPortfolioPerformance(authFetch, chartDays).catch((err) => {
+          console.error("Failed to fetch portfolio performance:", err);
+          hadChartErrors = true;
+          return null;
         });
 
-        if (!portfolioProfitMap.has(nowBucket)) {
-          const currentProfit = holdings.reduce((total, holding) => {
-            const qty = toFiniteNumber(holding.quantity) ?? 0;
-            const avg = toFiniteNumber(holding.avgBuyPrice) ?? 0;
-            const currentPrice = toFiniteNumber(holding.currentPrice);
-            if (!Number.isFinite(qty) || qty <= 0) return total;
-            const price = Number.isFinite(currentPrice) ? currentPrice : avg;
-            return total + qty * (price - avg);
-          }, 0);
-          if (Number.isFinite(currentProfit)) {
-            allTimestamps.add(nowBucket);
-            portfolioProfitMap.set(nowBucket, currentProfit);
-          }
-        }
-
-        const sortedTimestamps = Array.from(allTimestamps)
-          .filter((timestamp) => timestamp >= windowStart)
-          .sort((a, b) => a - b);
-
-        let chartArray = sortedTimestamps
-          .map((timestamp) => ({
+        const timestamps = Array.isArray(performance?.t) ? performance.t : [];
+        const unrealised = Array.isArray(performance?.unrealised) ? performance.unrealised : [];
+        let chartArray = timestamps
+          .map((timestamp, idx) => ({
             timestamp,
-            value: portfolioProfitMap.get(timestamp) ?? 0,
+            value: toFiniteNumber(unrealised[idx]),
             invested: 0,
             date: formatChartLabel(timestamp),
           }))
@@ -1003,7 +914,7 @@ export default function Portfolio() {
     return () => {
       cancel = true;
     };
-  }, [holdingsKey, hasHoldings, chartTimeframe, holdings, chartDays, normalizedCurrency]);
+  }, [authFetch, holdingsKey, hasHoldings, chartTimeframe, holdings, chartDays, normalizedCurrency]);
 
   const chartPerformanceChange = useMemo(() => {
     if (!chartData.length) return 0;
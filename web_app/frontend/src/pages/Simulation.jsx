@@ -2,11 +2,12 @@
 import { useEffect, useState } from "react";
 import { Link } from "react-router-dom";
 import AddPositionForm from "../components/AddPositionForm";
-import { getCoinMarketChart } from "../services/coins";
 import {
     createSimulation,
     deleteSimulation,
     getSimulation,
+    getSimulationSeries,
+    getSimulationPositions,
     listSimulations,
 } from "../services/simulations";
 import { useAuth } from "../state/AuthContext";
@@ -31,6 +32,8 @@ export default function Simulation() {
     const [posSimId, setPosSimId] = useState("");
     const [selectedSimDetail, setSelectedSimDetail] = useState(null);
     const [series, setSeries] = useState([]);
+    const [seriesCurrency, setSeriesCurrency] = useState("USD");
+    const [holdings, setHoldings] = useState([]);
 
     // initial load
     useEffect(() => {
@@ -122,38 +125,49 @@ export default function Simulation() {
     };
 
     useEffect(() => {
+        let cancel = false;
         (async () => {
             const detail = selectedSimDetail;
-            if (!detail || !Array.isArray(detail.positions)) {
+            if (!detail?.id) {
                 setSeries([]);
                 return;
             }
-            const totals = {};
-            for (const p of detail.positions) {
-                const coinId = p.coin?.id || p.coin_id || p.coin?.symbol;
-                if (!coinId) continue;
-                const qty = Number(p.quantity || 0) * (p.type === "SELL" ? -1 : 1);
-                totals[coinId] = (totals[coinId] || 0) + qty;
+            try {
+                // Aligned on one time grid server-side, with each trade applied at its own time
+                const data = await getSimulationSeries(detail.id);
+                if (cancel) return;
+                const t = data?.t || [];
+                const v = data?.value || [];
+                setSeriesCurrency(data?.currency || "USD");
+                setSeries(t.map((ts, i) => ({ t: ts, v: v[i] })));
+            } catch {
+                if (!cancel) setSeries([]);
             }
-            const ids = Object.keys(totals).filter((k) => totals[k] > 0);
-            if (ids.length === 0) {
-                setSeries([]);
+        })();
+        return () => {
+            cancel = true;
+        };
+    }, [selectedSimDetail]);
+
+    useEffect(() => {
+        let cancel = false;
+        (async () => {
+            const detail = selectedSimDetail;
+            if (!detail?.id) {
+                setHoldings([]);
                 return;
             }
-            const days = Math.max(7, Math.min(90, Math.ceil((Date.now() - new Date(detail.start_date).getTime()) / 864e5)));
-            const charts = await Promise.all(ids.map((id) => getCoinMarketChart(id, "usd", days)));
-            const combined = [];
-            for (let i = 0; i < charts[0]?.prices?.length; i++) {
-                const t = charts[0].prices[i][0];
-                let v = 0;
-                for (let j = 0; j < charts.length; j++) {
-                    const s = charts[j]?.prices || [];
-                    if (s[i]) v += s[i][1] * totals[ids[j]];
-                }
-                combined.push({ t, v });
+            try {
+                // One row per coin held, kept up to date by the trade endpoints and valued live
+                const data = await getSimulationPositions(detail.id);
+                if (!cancel) setHoldings(data?.holdings || []);
+            } catch {
+                if (!cancel) setHoldings([]);
             }
-            setSeries(combined);
         })();
+        return () => {
+            cancel = true;
+        };
     }, [selectedSimDetail]);
 
     function Sparkline({ data = [], width = 520, height = 140 }) {
@@ -170,7 +184,7 @@ export default function Simulation() {
         const last = data[data.length - 1]?.v ?? 0;
         return (
             <div className="flex flex-col gap-2">
-                <div className="text-sm opacity-70">Portfolio value trend (USD)</div>
+                <div className="text-sm opacity-70">Portfolio value trend ({seriesCurrency})</div>
                 <svg width={width} height={height} className="rounded bg-base-200">
                     <path d={path} fill="none" stroke="currentColor" strokeWidth="2" />
                 </svg>
@@ -422,6 +436,35 @@ export default function Simulation() {
                                         <div><b>End:</b> {selectedSimDetail.end_date || "-"}</div>
                                     </div>
 
+                                    {holdings.length > 0 && (
+                                        <div className="overflow-x-auto">
+                                            <table className="table table-sm">
+                                                <thead>
+                                                    <tr>
+                                                        <th>Coin</th>
+                                                        <th>Qty</th>
+                                                        <th>Price</th>
+                                                        <th>Value</th>
+                                                        <th>P/L</th>
+                                                    </tr>
+                                                </thead>
+                                                <tbody>
+                                                    {holdings.map((h) => (
+                                                        <tr key={h.holding_id}>
+                                                            <td>{h.coin_data?.symbol || h.coin_id || "-"}</td>
+                                                            <td>{h.quantity}</td>
+                                                            <td>{h.current_price != null ? Number(h.current_price).toLocaleString() : "-"}</td>
+                                                            <td>{h.market_value != null ? Number(h.market_value).toLocaleString() : "-"}</td>
+                                                            <td className={(h.unrealised_pnl ?? 0) >= 0 ? "text-success" : "text-error"}>
+                                                                {h.unrealised_pnl != null ? Number(h.unrealised_pnl).toLocaleString() : "-"}
+                                                            </td>
+                                                        </tr>
+                                                    ))}
+                                                </tbody>
+                                            </table>
+                                        </div>
+                                    )}
+
                                     <div className="overflow-x-auto">
                                         <table className="table table-sm">
                                             <thead>
@@ -1,10 +1,11 @@
-import React, { useCallback, useEffect, useMemo, useState } from "react";
+import React, { useCallback, useEffect, useMemo, useRef, useState } from "react";
 import { fetchMarketsByIds } from "../services/coingecko";
 import { useAuth } from "../state/AuthContext";
 import { useUserCurrency } from "../hooks/useUserCurrency";
 import {
   WATCHLIST_CHANGED_EVENT,
-  fetchWatchlist,
+  applyWatchlistDelta,
+  fetchWatchlistChanges,
   notifyWatchlistChanged,
   removeFromWatchlist,
 } from "../services/watchlist";
@@ -41,10 +42,15 @@ export default function Watchlist() {
   const [sortDir, setSortDir] = useState("desc");
   const [page, setPage] = useState(1);
 
+  // Last sync version seen (0 loads the full list); refreshes only fetch items added or removed since then.
+  const syncVersionRef = useRef(0);
+
   const refreshWatchlist = useCallback(async () => {
     try {
-      const list = await fetchWatchlist(authFetch);
-      setWatchlist(list);
+      const payload = await fetchWatchlistChanges(authFetch, syncVersionRef.current);
+      if (payload?.version != null) syncVersionRef.current = payload.version;
+      if (payload?.full === false && !payload.items?.length && !payload.deleted?.length) return;
+      setWatchlist((prev) => applyWatchlistDelta(prev, payload));
     } catch (e) {
       // ignore individual errors; transient
     }
@@ -1,7 +1,21 @@
 const unwrap = (res) => (res?.data ? res.data : res);
 
-export const fetchPortfolio = async (authFetch) => {
-  const res = await authFetch("/api/portfolio/");
+export const fetchPortfolio = async (authFetch, since = null) => {
+  const query = since != null ? `?since=${encodeURIComponent(since)}` : "";
+  const res = await authFetch(`/api/portfolio/${query}`);
+  return unwrap(res);
+};
+
+// Patch the last known holdings list with a ?since= delta (changed rows replace, deleted ids drop out).
+export const applyPortfolioDelta = (holdings, payload) => {
+  const incoming = payload?.holdings || [];
+  if (payload?.full !== false) return incoming;
+  const replaced = new Set([...(payload.deleted || []), ...incoming.map((h) => h.holding_id)]);
+  return [...incoming, ...holdings.filter((h) => !replaced.has(h.holding_id))];
+};
+
+export const fetchPortfolioPerformance = async (authFetch, days = 7) => {
+  const res = await authFetch(`/api/portfolio/performance/?days=${encodeURIComponent(days)}`);
   return unwrap(res);
 };
 
@@ -50,6 +50,16 @@ export async function getSimulation(simId) {
     return data;
 }
 
+export async function getSimulationSeries(simId) {
+    const { data } = await api.get(`/simulations/${simId}/series/`);
+    return data;
+}
+
+export async function getSimulationPositions(simId) {
+    const { data } = await api.get(`/simulations/${simId}/positions/`);
+    return data;
+}
+
 export async function deleteSimulation(simId) {
     const token = await ensureCsrfHeader();
     const { data } = await api.delete(`/simulations/${simId}/`, {
@@ -10,6 +10,19 @@ export const fetchWatchlist = async (authFetch) => {
   return normalizeList(res);
 };
 
+// ?since=<version> returns { version, full, items, deleted }; since=0 behaves like a full load.
+export const fetchWatchlistChanges = async (authFetch, since = 0) => {
+  const res = await authFetch(`/api/watchlist/?since=${encodeURIComponent(since)}`);
+  return res?.data && !Array.isArray(res.data) ? res.data : res;
+};
+
+export const applyWatchlistDelta = (list, payload) => {
+  const items = normalizeList(payload?.items);
+  if (payload?.full !== false) return items;
+  const replaced = new Set([...(payload.deleted || []), ...items.map((w) => w.id)]);
+  return [...list.filter((w) => !replaced.has(w.id)), ...items];
+};
+
 export const WATCHLIST_CHANGED_EVENT = "watchlist:changed";
 
 export const notifyWatchlistChanged = (detail = {}) => {
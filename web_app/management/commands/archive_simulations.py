@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_app.utils.archive import ARCHIVE_BATCH_SIZE, archive_pending
+
+
+class Command(BaseCommand):
+    help = "Move archived simulations' transactions, holdings and watchlist items into cold storage (periodic job)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Archive at most this many simulations")
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Rows deleted per statement")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        done = archive_pending(options["limit"], options["batch_size"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {done['archived']} simulations ({done['rows']} rows), skipped {done['skipped']} "
+            f"in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_app.utils.leaderboard import LEADERBOARD_SIZE, build_leaderboard
+
+
+class Command(BaseCommand):
+    help = "Rank every active simulation over 7d, 30d and since start, and store the top rows (periodic job)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=LEADERBOARD_SIZE, help="Rows kept per window")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = build_leaderboard(options["size"])
+        elapsed = time.perf_counter() - started
+        summary = ", ".join(f"{window}: {count}" for window, count in written.items())
+        self.stdout.write(self.style.SUCCESS(f"Leaderboard rebuilt ({summary}) in {elapsed:.2f}s"))
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_app.utils.snapshots import rebuild_all_snapshots
+
+
+class Command(BaseCommand):
+    help = "Recompute daily portfolio valuation snapshots for every user and simulation (nightly job)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=None,
+            help="Only recompute the last N days (default: rebuild from each portfolio's first trade).",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written = rebuild_all_snapshots(days=options["days"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} snapshots in {elapsed:.2f}s"))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_app.utils.pricefill import PRICE_FILL_BATCH, fill_pending_prices
+
+
+class Command(BaseCommand):
+    help = "Resolve prices for trades accepted with price_status=PENDING, in coin-grouped batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=PRICE_FILL_BATCH, help="Rows per batch")
+        parser.add_argument("--loop", type=float, default=None,
+                            help="Keep running, sleeping this many seconds when nothing was filled")
+
+    def handle(self, *args, **options):
+        while True:
+            report = fill_pending_prices(options["limit"])
+            self.stdout.write(self.style.SUCCESS(
+                f"Filled {report['filled']}/{report['pending']} pending prices ({report['unresolved']} unresolved)"
+            ))
+            if options["loop"] is None:
+                return
+            if report["filled"] < options["limit"]:
+                time.sleep(options["loop"])
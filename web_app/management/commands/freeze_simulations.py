@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_app.utils.simulations import FREEZE_BATCH_SIZE, freeze_pending
+
+
+class Command(BaseCommand):
+    help = "Freeze the final valuations of ENDED and ARCHIVED simulations (periodic job)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Check at most this many simulations")
+        parser.add_argument("--batch-size", type=int, default=FREEZE_BATCH_SIZE,
+                            help="Simulations per fingerprint query")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        done = freeze_pending(options["limit"], options["batch_size"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Checked {done['checked']} simulations: {done['frozen']} frozen, {done['deferred']} deferred "
+            f"in {elapsed:.2f}s"
+        ))
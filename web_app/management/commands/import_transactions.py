@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from web_app.models import Simulation, User
+from web_app.utils.imports import IMPORT_CHUNK_SIZE, ImportFormatError, import_transactions
+
+
+class Command(BaseCommand):
+    help = "Stream-import a CSV trade history (coin, side, qty, price, currency, time) for one user."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file to import")
+        parser.add_argument("--user", required=True, help="Email of the owning user")
+        parser.add_argument("--simulation", help="Import into this simulation id instead of the live portfolio")
+        parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(email=options["user"]).first()
+        if user is None:
+            raise CommandError(f"No user with email {options['user']}")
+        simulation = None
+        if options.get("simulation"):
+            simulation = Simulation.objects.filter(id=options["simulation"], user=user).first()
+            if simulation is None:
+                raise CommandError(f"No simulation {options['simulation']} for {user.email}")
+
+        with open(options["path"], newline="", encoding="utf-8-sig") as handle:
+            try:
+                report = import_transactions(user, handle, simulation=simulation, chunk_size=options["chunk_size"])
+            except ImportFormatError as e:
+                raise CommandError(str(e))
+
+        for error in report["errors"]:
+            self.stderr.write(f"line {error['line']}: {error['detail']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report['imported']} of {report['rows']} rows ({report['failed']} failed) "
+            f"in {report['seconds']}s, {report['rows_per_second']} rows/s"
+        ))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_app.utils.benchmarks import BASKETS, DEFAULT_BENCHMARKS, parse_benchmarks, precompute_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Build the shared benchmark series for every currency and date range used by simulations."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--benchmarks",
+            default=",".join(DEFAULT_BENCHMARKS + BASKETS),
+            help="Comma separated benchmarks: coin:<coin_id>, top10, mcap",
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        built = precompute_benchmarks(parse_benchmarks(options["benchmarks"]))
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Built {built} benchmark series in {elapsed:.2f}s"))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from web_app.utils.sync import TOMBSTONE_RETENTION_DAYS, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = "Delete old delta-sync tombstones; clients with older tokens get a full resync."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=TOMBSTONE_RETENTION_DAYS,
+                            help="Keep tombstones newer than this many days")
+
+    def handle(self, *args, **options):
+        pruned = prune_tombstones(options["days"])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {pruned} tombstones"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from web_app.utils.portfolio import rebuild_all_summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuild every per-user / per-simulation portfolio summary row from the transaction ledger."
+
+    def handle(self, *args, **options):
+        count = rebuild_all_summaries()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} portfolio summaries"))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from web_app.models import Transaction
+from web_app.utils.lots import rebuild_lots
+from web_app.utils.portfolio import rebuild_all_summaries
+
+
+class Command(BaseCommand):
+    help = "Replay every (user, simulation, coin) ledger through the lot engine, then rebuild portfolio summaries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild ledgers owned by this user id")
+
+    def handle(self, *args, **options):
+        ledgers = Transaction.objects.all()
+        if options.get("user"):
+            ledgers = ledgers.filter(user_id=options["user"])
+        keys = ledgers.values_list("user_id", "simulation_id", "coin_id").distinct().order_by()
+        count = 0
+        for user_id, simulation_id, coin_id in keys:
+            oversold = rebuild_lots(user_id, simulation_id, coin_id)["oversold"]
+            if oversold:
+                self.stdout.write(self.style.WARNING(
+                    f"{user_id}/{simulation_id or 'portfolio'}/{coin_id}: {len(oversold)} sells exceed the "
+                    f"quantity held, first {oversold[0]}"
+                ))
+            count += 1
+        rebuild_all_summaries()
+        self.stdout.write(self.style.SUCCESS(f"Replayed {count} ledgers"))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from web_app.utils.currency import SUPPORTED_CURRENCIES, refresh_fx_rates
+
+
+class Command(BaseCommand):
+    help = "Refresh the FxRate table for all supported currencies (run on a schedule, e.g. every few minutes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "currencies",
+            nargs="*",
+            help="Currency codes to refresh (defaults to all supported currencies).",
+        )
+
+    def handle(self, *args, **options):
+        currencies = options["currencies"] or SUPPORTED_CURRENCIES
+        rates = refresh_fx_rates(currencies)
+        if not rates:
+            raise CommandError("FX refresh failed; no rates were updated")
+        for code, rate in sorted(rates.items()):
+            self.stdout.write(f"{code}: {rate}")
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {len(rates)} FX rates"))
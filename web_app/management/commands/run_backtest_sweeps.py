@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from web_app.models import BacktestSweep
+from web_app.utils.sweeps import run_sweep
+
+
+class Command(BaseCommand):
+    help = "Run pending backtest sweeps and resume interrupted ones across a process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sweep", help="Only run this sweep id (any status)")
+        parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+        parser.add_argument("--chunk-size", type=int, default=None, help="Backtests per task")
+
+    def handle(self, *args, **options):
+        sweeps = BacktestSweep.objects.filter(status__in=["PENDING", "RUNNING"]).order_by("created_at")
+        if options.get("sweep"):
+            sweeps = BacktestSweep.objects.filter(id=options["sweep"])
+        extra = {"chunk_size": options["chunk_size"]} if options.get("chunk_size") else {}
+        for sweep in sweeps:
+            sweep = run_sweep(sweep, workers=options.get("workers"), **extra)
+            self.stdout.write(self.style.SUCCESS(f"Sweep {sweep.id}: {sweep.completed}/{sweep.total} {sweep.status}"))
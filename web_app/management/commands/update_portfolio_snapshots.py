@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from web_app.utils.snapshots import process_pending_updates
+
+
+class Command(BaseCommand):
+    help = "Recompute the snapshots of portfolios whose ledger changed since the last run (run every few minutes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Update at most this many portfolios")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        done = process_pending_updates(options["limit"])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated {done['updated']} portfolios ({done['snapshots']} snapshots), {done['failed']} failed "
+            f"in {elapsed:.2f}s"
+        ))
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:20
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('currency', models.CharField(default='USD', max_length=12)),
+                ('date', models.DateField()),
+                ('value', models.DecimalField(decimal_places=10, default=0.0, max_digits=30)),
+                ('cost_basis', models.DecimalField(decimal_places=10, default=0.0, max_digits=30)),
+                ('realised_profit', models.DecimalField(decimal_places=10, default=0.0, max_digits=30)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('simulation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='web_app.simulation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='portfolio_snapshots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'simulation', 'currency', 'date'), name='ux_portfolio_snapshot_day')],
+            },
+        ),
+    ]
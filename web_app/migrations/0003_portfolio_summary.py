@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:23
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0002_portfolio_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSummary',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('realised_total', models.DecimalField(decimal_places=10, default=0.0, max_digits=30)),
+                ('total_cost_basis', models.DecimalField(decimal_places=10, default=0.0, max_digits=30)),
+                ('trade_count', models.PositiveIntegerField(default=0)),
+                ('realised_local', models.DecimalField(decimal_places=10, default=0.0, max_digits=30)),
+                ('local_currency', models.CharField(blank=True, default='', max_length=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('simulation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='summaries', to='web_app.simulation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='portfolio_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'simulation'), name='ux_user_simulation_summary')],
+            },
+        ),
+    ]
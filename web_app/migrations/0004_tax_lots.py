@@ -0,0 +1,42 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:31
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0003_portfolio_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='cost_basis_method',
+            field=models.CharField(choices=[('FIFO', 'First in, first out'), ('LIFO', 'Last in, first out'), ('AVERAGE', 'Average cost')], default='AVERAGE', max_length=8),
+        ),
+        migrations.CreateModel(
+            name='LotState',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('method', models.CharField(choices=[('FIFO', 'First in, first out'), ('LIFO', 'Last in, first out'), ('AVERAGE', 'Average cost')], max_length=8)),
+                ('position', models.PositiveIntegerField()),
+                ('last_time', models.DateTimeField()),
+                ('last_tx_id', models.UUIDField()),
+                ('quantity', models.DecimalField(decimal_places=20, default=0.0, max_digits=40)),
+                ('cost', models.DecimalField(decimal_places=10, default=0.0, max_digits=30)),
+                ('realised', models.DecimalField(decimal_places=10, default=0.0, max_digits=30)),
+                ('lots', models.BinaryField(default=b'')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('coin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lot_states', to='web_app.coin')),
+                ('simulation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lot_states', to='web_app.simulation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lot_states', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'simulation', 'coin', 'method', 'position'), name='ux_lot_state_position')],
+            },
+        ),
+    ]
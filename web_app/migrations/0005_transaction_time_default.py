@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 02:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0004_tax_lots'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='time',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:00
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0006_sync_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BacktestSweep',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=200)),
+                ('base', models.JSONField(default=dict)),
+                ('grid', models.JSONField(default=dict)),
+                ('currency', models.CharField(default='USD', max_length=12)),
+                ('rank_by', models.CharField(default='return_pct', max_length=32)),
+                ('status', models.CharField(choices=[('PENDING', 'Pending'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('completed', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='backtest_sweeps', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BacktestSweepResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('params', models.JSONField(default=dict)),
+                ('score', models.FloatField(null=True)),
+                ('stats', models.JSONField(default=dict)),
+                ('sweep', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='results', to='web_app.backtestsweep')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sweep', '-score'], name='ix_sweep_result_score')],
+                'constraints': [models.UniqueConstraint(fields=('sweep', 'index'), name='ux_sweep_result_index')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0007_backtest_sweeps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='price_status',
+            field=models.CharField(choices=[('FILLED', 'Filled'), ('PENDING', 'Pending')], db_index=True, default='FILLED', max_length=10),
+        ),
+    ]
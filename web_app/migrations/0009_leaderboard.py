@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0008_transaction_price_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window', models.CharField(choices=[('7d', '7 days'), ('30d', '30 days'), ('all', 'Since start')], max_length=8)),
+                ('rank', models.PositiveIntegerField()),
+                ('return_pct', models.FloatField()),
+                ('value', models.DecimalField(decimal_places=10, default=0.0, max_digits=30)),
+                ('currency', models.CharField(default='USD', max_length=12)),
+                ('computed_at', models.DateTimeField()),
+                ('simulation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to='web_app.simulation')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['window', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('window', 'rank'), name='ux_leaderboard_window_rank')],
+            },
+        ),
+    ]
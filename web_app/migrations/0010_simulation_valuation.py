@@ -0,0 +1,34 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:30
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0009_leaderboard'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimulationValuation',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('currency', models.CharField(default='USD', max_length=12)),
+                ('valued_at', models.DateField()),
+                ('ledger', models.CharField(max_length=40)),
+                ('invested', models.DecimalField(decimal_places=10, default=0.0, max_digits=30)),
+                ('units', models.DecimalField(decimal_places=20, default=0.0, max_digits=40)),
+                ('value', models.DecimalField(decimal_places=10, default=0.0, max_digits=30)),
+                ('holdings', models.JSONField(default=list)),
+                ('metrics', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('simulation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valuations', to='web_app.simulation')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('simulation', 'currency'), name='ux_simulation_valuation_currency')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0010_simulation_valuation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimulationArchive',
+            fields=[
+                ('simulation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='web_app.simulation')),
+                ('payload', models.BinaryField()),
+                ('counts', models.JSONField(default=dict)),
+                ('ledger', models.CharField(max_length=40)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
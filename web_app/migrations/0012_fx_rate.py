@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0011_simulation_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FxRate',
+            fields=[
+                ('currency', models.CharField(max_length=12, primary_key=True, serialize=False)),
+                ('rate', models.DecimalField(decimal_places=10, max_digits=30)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-19 03:53
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0012_fx_rate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingSnapshotUpdate',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('user_id', models.UUIDField()),
+                ('simulation_id', models.UUIDField(blank=True, null=True)),
+                ('from_date', models.DateField()),
+                ('marked_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user_id', 'simulation_id'], name='ix_pending_snapshot_portfolio')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0013_pending_snapshot_update'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='price_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='price_retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
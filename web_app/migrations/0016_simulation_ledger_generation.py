@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('web_app', '0015_simulation_freeze_retry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulation',
+            name='ledger_generation',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -7,6 +7,13 @@ from django.utils.translation import gettext_lazy as _
 # -------------------------
 # User
 # -------------------------
+COST_BASIS_METHODS = [
+    ("FIFO", "First in, first out"),
+    ("LIFO", "Last in, first out"),
+    ("AVERAGE", "Average cost"),
+]
+
+
 class User(AbstractUser):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     email = models.EmailField(unique=True)
@@ -14,6 +21,7 @@ class User(AbstractUser):
     preferred_currency = models.CharField(max_length=3, default='USD')  
     timezone = models.CharField(max_length=50, default='Australia/Sydney') 
     date_format = models.CharField(max_length=20, default='YYYY-MM-DD')  
+    cost_basis_method = models.CharField(max_length=8, choices=COST_BASIS_METHODS, default='AVERAGE')
     created_at = models.DateTimeField(auto_now_add=True)  
     updated_at = models.DateTimeField(auto_now=True)  
 
@@ -73,6 +81,11 @@ class Simulation(models.Model):
     start_date = models.DateField()
     end_date = models.DateField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="ACTIVE")
+    # Backoff for finished simulations the freeze job could not value yet
+    freeze_attempts = models.PositiveSmallIntegerField(default=0)
+    freeze_retry_at = models.DateTimeField(null=True, blank=True)
+    # Ledger changes seen; cached time-travel indexes record the one they reflect (kept here so every worker agrees)
+    ledger_generation = models.PositiveBigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -101,6 +114,18 @@ class CurrentPrice(models.Model):
         return f"{self.coin.symbol} @ {self.price} {self.currency}"
 
 
+# -------------------------
+# FxRate (latest USDC price per currency; shared by every process)
+# -------------------------
+class FxRate(models.Model):
+    currency = models.CharField(max_length=12, primary_key=True)
+    rate = models.DecimalField(max_digits=30, decimal_places=10)  # price of 1 USDC in currency
+    fetched_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"USDC @ {self.rate} {self.currency}"
+
+
 # -------------------------
 # PriceCache (historical snapshots)
 # -------------------------
@@ -157,6 +182,7 @@ class Holding(models.Model):
         default="USD"
     )
     updated_at = models.DateTimeField(auto_now=True)
+    version = models.PositiveBigIntegerField(default=0, db_index=True)  # user's sync version at last write
 
     class Meta:
         constraints = [
@@ -175,6 +201,10 @@ class Transaction(models.Model):
         ("BUY", "Buy"),
         ("SELL", "Sell"),
     ]
+    PRICE_STATUS = [
+        ("FILLED", "Filled"),
+        ("PENDING", "Pending"),  # accepted without a price; fill_pending_prices resolves it
+    ]
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="transactions")
@@ -209,7 +239,11 @@ class Transaction(models.Model):
         max_length=12,
         default="USD"
     )
-    time = models.DateTimeField(auto_now_add=True)
+    time = models.DateTimeField(default=timezone.now)  # set explicitly for imported / backdated trades
+    price_status = models.CharField(max_length=10, choices=PRICE_STATUS, default="FILLED", db_index=True)
+    # Backoff for PENDING rows the price fill could not resolve
+    price_attempts = models.PositiveSmallIntegerField(default=0)
+    price_retry_at = models.DateTimeField(null=True, blank=True)
     fee = models.DecimalField(
         max_digits=30, 
         decimal_places=10, 
@@ -220,6 +254,253 @@ class Transaction(models.Model):
         return f"{self.type} {self.quantity} {self.coin.symbol} @ {self.price} by {self.user}"
 
 
+# -------------------------
+# PortfolioSummary (running per-user / per-simulation ledger totals)
+# -------------------------
+class PortfolioSummary(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="portfolio_summaries")
+    simulation = models.ForeignKey(Simulation, on_delete=models.CASCADE, related_name="summaries",
+                                   null=True, blank=True)
+    realised_total = models.DecimalField(max_digits=30, decimal_places=10, default=0.0)  # USD
+    total_cost_basis = models.DecimalField(max_digits=30, decimal_places=10, default=0.0)  # USD, open positions
+    trade_count = models.PositiveIntegerField(default=0)
+    # realised_total in local_currency, each sell converted at its own date; blank = needs recompute
+    realised_local = models.DecimalField(max_digits=30, decimal_places=10, default=0.0)
+    local_currency = models.CharField(max_length=12, blank=True, default="")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "simulation"], name="ux_user_simulation_summary")
+        ]
+
+    def __str__(self):
+        return f"Summary {self.user}: {self.trade_count} trades, realised {self.realised_total}"
+
+
+# -------------------------
+# LotState (open tax lots per user / simulation / coin, checkpointed along the ledger)
+# -------------------------
+class LotState(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="lot_states")
+    simulation = models.ForeignKey(Simulation, on_delete=models.CASCADE, related_name="lot_states",
+                                   null=True, blank=True)
+    coin = models.ForeignKey(Coin, on_delete=models.CASCADE, related_name="lot_states")
+    method = models.CharField(max_length=8, choices=COST_BASIS_METHODS)
+    position = models.PositiveIntegerField()  # ledger rows applied, in (time, id) order
+    last_time = models.DateTimeField()
+    last_tx_id = models.UUIDField()
+    quantity = models.DecimalField(max_digits=40, decimal_places=20, default=0.0)
+    cost = models.DecimalField(max_digits=30, decimal_places=10, default=0.0)  # USD, open lots
+    realised = models.DecimalField(max_digits=30, decimal_places=10, default=0.0)  # USD, cumulative
+    lots = models.BinaryField(default=b"")  # packed float64 quantities then unit costs, oldest lot first
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "simulation", "coin", "method", "position"], name="ux_lot_state_position"
+            )
+        ]
+
+    def __str__(self):
+        return f"Lots {self.user} {self.coin_id} {self.method} @ {self.position}"
+
+
+# -------------------------
+# SyncState / SyncTombstone (per-user change counter for ?since= deltas)
+# -------------------------
+class SyncState(models.Model):
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True,
+                                related_name="sync_state")
+    version = models.PositiveBigIntegerField(default=0)
+    pruned_version = models.PositiveBigIntegerField(default=0)  # tombstones up to here were pruned
+
+    def __str__(self):
+        return f"Sync {self.user_id} @ {self.version}"
+
+
+class SyncTombstone(models.Model):
+    KINDS = [
+        ("holding", "Holding"),
+        ("watchlist", "Watchlist item"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="sync_tombstones")
+    kind = models.CharField(max_length=16, choices=KINDS)
+    object_id = models.UUIDField()
+    simulation_id = models.UUIDField(null=True, blank=True)
+    version = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "kind", "version"], name="ix_tombstone_user_kind_version")]
+
+    def __str__(self):
+        return f"Deleted {self.kind} {self.object_id} @ {self.version}"
+
+
+# -------------------------
+# PortfolioSnapshot (materialized daily valuation per user / simulation / currency)
+# -------------------------
+class PortfolioSnapshot(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="portfolio_snapshots")
+    simulation = models.ForeignKey(Simulation, on_delete=models.CASCADE, related_name="snapshots",
+                                   null=True, blank=True)
+    currency = models.CharField(max_length=12, default="USD")
+    date = models.DateField()
+    value = models.DecimalField(max_digits=30, decimal_places=10, default=0.0)
+    cost_basis = models.DecimalField(max_digits=30, decimal_places=10, default=0.0)
+    realised_profit = models.DecimalField(max_digits=30, decimal_places=10, default=0.0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "simulation", "currency", "date"], name="ux_portfolio_snapshot_day")
+        ]
+
+    def __str__(self):
+        return f"Snapshot {self.user} {self.date}: {self.value} {self.currency}"
+
+
+# -------------------------
+# PendingSnapshotUpdate (portfolio whose snapshots are stale from from_date; cleared by the snapshot job)
+# -------------------------
+class PendingSnapshotUpdate(models.Model):
+    # Plain ids, not foreign keys: marks are written from Transaction delete signals while a
+    # cascade is deleting the user or simulation; the job treats a vanished ledger as empty.
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user_id = models.UUIDField()
+    simulation_id = models.UUIDField(null=True, blank=True)
+    from_date = models.DateField()
+    marked_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["user_id", "simulation_id"], name="ix_pending_snapshot_portfolio")]
+
+    def __str__(self):
+        return f"Snapshots of {self.user_id} stale from {self.from_date}"
+
+
+# -------------------------
+# SimulationValuation (final value of an ENDED/ARCHIVED simulation, frozen at its end date)
+# -------------------------
+class SimulationValuation(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    simulation = models.ForeignKey(Simulation, on_delete=models.CASCADE, related_name="valuations")
+    currency = models.CharField(max_length=12, default="USD")
+    valued_at = models.DateField()  # closing prices of this day
+    ledger = models.CharField(max_length=40)  # sha1 of the transaction fingerprint it was computed from
+    invested = models.DecimalField(max_digits=30, decimal_places=10, default=0.0)
+    units = models.DecimalField(max_digits=40, decimal_places=20, default=0.0)
+    value = models.DecimalField(max_digits=30, decimal_places=10, default=0.0)
+    holdings = models.JSONField(default=list)
+    metrics = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["simulation", "currency"], name="ux_simulation_valuation_currency")
+        ]
+
+    def __str__(self):
+        return f"Valuation {self.simulation_id} @ {self.valued_at}: {self.value} {self.currency}"
+
+
+# -------------------------
+# SimulationArchive (cold copy of an ARCHIVED simulation's rows; the hot rows are deleted)
+# -------------------------
+class SimulationArchive(models.Model):
+    simulation = models.OneToOneField(Simulation, on_delete=models.CASCADE, primary_key=True, related_name="archive")
+    payload = models.BinaryField()  # zlib-compressed JSON lines, one {"model", "row"} object per archived row
+    counts = models.JSONField(default=dict)  # model label -> rows archived
+    ledger = models.CharField(max_length=40)  # sha1 of the transaction fingerprint at archive time
+    size = models.PositiveIntegerField(default=0)  # compressed bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive {self.simulation_id}: {sum(self.counts.values())} rows, {self.size} bytes"
+
+
+# -------------------------
+# BacktestSweep / BacktestSweepResult (parameter grid over one strategy, ranked by a stat)
+# -------------------------
+class BacktestSweep(models.Model):
+    STATUS_CHOICES = [
+        ("PENDING", "Pending"),
+        ("RUNNING", "Running"),
+        ("DONE", "Done"),
+        ("FAILED", "Failed"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="backtest_sweeps")
+    name = models.CharField(max_length=200)
+    base = models.JSONField(default=dict)  # strategy spec shared by every run
+    grid = models.JSONField(default=dict)  # field -> list of values; runs are their cartesian product
+    currency = models.CharField(max_length=12, default="USD")
+    rank_by = models.CharField(max_length=32, default="return_pct")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="PENDING")
+    total = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Sweep {self.name} ({self.completed}/{self.total})"
+
+
+class BacktestSweepResult(models.Model):
+    sweep = models.ForeignKey(BacktestSweep, on_delete=models.CASCADE, related_name="results")
+    index = models.PositiveIntegerField()  # position in the expanded grid
+    params = models.JSONField(default=dict)
+    score = models.FloatField(null=True)  # stats[rank_by]; higher ranks first
+    stats = models.JSONField(default=dict)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["sweep", "index"], name="ux_sweep_result_index")]
+        indexes = [models.Index(fields=["sweep", "-score"], name="ix_sweep_result_score")]
+
+    def __str__(self):
+        return f"Sweep {self.sweep_id} #{self.index}: {self.score}"
+
+
+# -------------------------
+# LeaderboardEntry (precomputed top simulations per window; rewritten by build_leaderboard)
+# -------------------------
+class LeaderboardEntry(models.Model):
+    WINDOW_CHOICES = [
+        ("7d", "7 days"),
+        ("30d", "30 days"),
+        ("all", "Since start"),
+    ]
+
+    window = models.CharField(max_length=8, choices=WINDOW_CHOICES)
+    rank = models.PositiveIntegerField()
+    simulation = models.ForeignKey(Simulation, on_delete=models.CASCADE, related_name="leaderboard_entries")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="leaderboard_entries")
+    return_pct = models.FloatField()
+    value = models.DecimalField(max_digits=30, decimal_places=10, default=0.0)
+    currency = models.CharField(max_length=12, default="USD")
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["window", "rank"]
+        constraints = [models.UniqueConstraint(fields=["window", "rank"], name="ux_leaderboard_window_rank")]
+
+    def __str__(self):
+        return f"{self.window} #{self.rank}: {self.simulation_id} {self.return_pct:.2f}%"
+
+
 class PasswordResetToken(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="password_reset_tokens")
@@ -247,6 +528,7 @@ class WatchListItem(models.Model):
     coin = models.ForeignKey('Coin', on_delete=models.CASCADE)
     simulation = models.ForeignKey('Simulation', on_delete=models.CASCADE, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    version = models.PositiveBigIntegerField(default=0, db_index=True)  # user's sync version at last write
 
     class Meta:
         unique_together = ('user', 'coin', 'simulation')
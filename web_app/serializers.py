@@ -1,10 +1,11 @@
 import logging
-from django.db.models import Sum, F
 from rest_framework import serializers
 from .models import (
     User, CurrentPrice, PriceCache, Coin, WatchListItem,
     Simulation, Transaction, Holding,
 )
+from .utils.metrics import cached_simulation_metrics
+from .utils.simulations import simulation_summaries
 
 # ------------------------------------------------------------------------------
 # Logging setup
@@ -50,7 +51,7 @@ class UserProfileSerializer(SafeModelSerializer):
         model = User
         fields = [
             "id", "email", "display_name",
-            "preferred_currency", "timezone", "date_format",
+            "preferred_currency", "timezone", "date_format", "cost_basis_method",
         ]
         read_only_fields = ["id", "email"]
 
@@ -121,9 +122,9 @@ class TransactionSerializer(SafeModelSerializer):
             "id", "type", "coin", "coin_id",
             "quantity", "price", "price_currency",
             "time", "fee", "simulation_id",
-            "realised_profit", "realised_profit_currency",
+            "realised_profit", "realised_profit_currency", "price_status",
         ]
-        read_only_fields = ["id", "time", "realised_profit", "realised_profit_currency"]
+        read_only_fields = ["id", "time", "realised_profit", "realised_profit_currency", "price_status"]
 
     def validate(self, attrs):
         try:
@@ -247,95 +248,69 @@ class SimulationSummarySerializer(SafeModelSerializer):
     invested = serializers.SerializerMethodField()
     units = serializers.SerializerMethodField()
     current_value = serializers.SerializerMethodField()
+    valued_at = serializers.SerializerMethodField()
+    metrics = serializers.SerializerMethodField()
 
     class Meta:
         model = Simulation
         fields = [
             "id", "name", "status", "start_date", "end_date",
-            "created_at", "invested", "units", "current_value"
+            "created_at", "invested", "units", "current_value", "valued_at", "metrics"
         ]
 
-    def _current_price(self, coin, vs_currency="USD"):
+    def _batch(self, obj):
+        if isinstance(self.parent, serializers.ListSerializer) and self.parent.instance is not None:
+            return list(self.parent.instance)
+        return [obj]
+
+    def _summary(self, obj):
         """
-        Get current price with fallback to cached or static coin price.
+        Totals for obj, computed for every simulation in the enclosing list at
+        once so listing N simulations costs the same queries as listing one.
         """
-        try:
-            cp = getattr(coin, "live_price", None)
-            if cp and cp.currency.lower() == vs_currency.lower():
-                return float(cp.price)
-            return float(getattr(coin, "current_price", 0))
-        except Exception as e:
-            logger.warning(f"Failed to get current price for coin {coin}: {e}")
-            return 0.0
+        summaries = self.context.setdefault("simulation_summaries", {})
+        if obj.id not in summaries:
+            summaries.update(simulation_summaries(self._batch(obj)))
+        return summaries.get(obj.id, {})
 
     def get_invested(self, obj):
         try:
-            buys = obj.transactions.filter(type="BUY").aggregate(
-                v=Sum(F("price") * F("quantity"))
-            )["v"] or 0
-            sells = obj.transactions.filter(type="SELL").aggregate(
-                v=Sum(F("price") * F("quantity"))
-            )["v"] or 0
-            return round(float(buys) - float(sells), 2)
+            return self._summary(obj).get("invested", 0.0)
         except Exception as e:
             self.handle_exception(e, "SimulationSummarySerializer.get_invested")
 
     def get_units(self, obj):
         try:
-            # Sum net quantities from transactions (BUY - SELL)
-            total = 0.0
-            for t in obj.transactions.all():
-                q = float(getattr(t, "quantity", 0) or 0)
-                total += q if t.type == "BUY" else -q
-            return round(max(total, 0.0), 4)
+            return self._summary(obj).get("units", 0.0)
         except Exception as e:
             self.handle_exception(e, "SimulationSummarySerializer.get_units")
 
     def get_current_value(self, obj):
         try:
-            vs = getattr(obj.user, "preferred_currency", "USD")
-            # Compute net qty per coin id
-            totals = {}
-            for t in obj.transactions.select_related("coin"):
-                if not t.coin:
-                    continue
-                cid = getattr(t.coin, "id", None)
-                if not cid:
-                    continue
-                qty = float(getattr(t, "quantity", 0) or 0)
-                if t.type == "SELL":
-                    qty = -qty
-                totals[cid] = totals.get(cid, 0.0) + qty
-
-            # Fetch current prices in one call
-            ids = [cid for cid, q in totals.items() if q > 0]
-            prices = {}
-            if ids:
-                try:
-                    from .utils.coingecko import get_current_prices
-                    data = get_current_prices(ids, vs.lower()) or {}
-                    for cid in ids:
-                        p = (data.get(cid) or {}).get(vs.lower())
-                        if p is not None:
-                            prices[cid] = float(p)
-                except Exception:
-                    prices = {}
-
-            total_value = 0.0
-            for cid, qty in totals.items():
-                if qty <= 0:
-                    continue
-                p = prices.get(cid)
-                if p is None:
-                    # safe fallback to the coin model via any tx
-                    tx = obj.transactions.filter(coin__id=cid).select_related("coin").first()
-                    coin = getattr(tx, "coin", None)
-                    p = self._current_price(coin, vs) if coin else 0.0
-                total_value += qty * float(p or 0)
-            return round(total_value, 2)
+            return self._summary(obj).get("current_value", 0.0)
         except Exception as e:
             self.handle_exception(e, "SimulationSummarySerializer.get_current_value")
 
+    def get_valued_at(self, obj):
+        """The end date a finished simulation's frozen valuation is priced at; None while it is live."""
+        try:
+            return self._summary(obj).get("valued_at")
+        except Exception as e:
+            self.handle_exception(e, "SimulationSummarySerializer.get_valued_at")
+
+    def get_metrics(self, obj):
+        """Frozen or already cached risk/return metrics (see /metrics/); never computed while listing."""
+        try:
+            frozen = self._summary(obj).get("metrics")
+            if frozen is not None:
+                return frozen
+            metrics = self.context.setdefault("simulation_metrics", {})
+            if obj.id not in metrics:
+                metrics.update(cached_simulation_metrics(self._batch(obj)))
+            return metrics.get(obj.id)
+        except Exception as e:
+            self.handle_exception(e, "SimulationSummarySerializer.get_metrics")
+
 # ------------------------------------------------------------------------------
 # Simulation Detail
 # ------------------------------------------------------------------------------
@@ -422,17 +397,29 @@ class PortfolioHoldingSerializer(SafeModelSerializer):
         ]
         read_only_fields = fields
 
+    def _valuation(self, obj):
+        return (self.context.get("valuations") or {}).get(str(obj.id)) or {}
+
     def get_coin_data(self, obj):
         try:
             coin = obj.coin
+            live = self._valuation(obj)
+            price = live.get("current_price")
+            change = live.get("change_24h_pct")
             return {
                 "id": coin.id,
                 "symbol": coin.symbol,
                 "name": coin.name,
-                "current_price": float(getattr(coin, "current_price", 0) or 0),
-                "price_change_24h": float(getattr(coin, "price_change_24h", 0) or 0),
+                "current_price": float(price if price is not None else getattr(coin, "current_price", 0) or 0),
+                "price_change_24h": float(change if change is not None else getattr(coin, "price_change_24h", 0) or 0),
                 "market_cap": float(getattr(coin, "market_cap", 0) or 0),
                 "last_updated": getattr(coin, "last_updated", None),
             }
         except Exception as e:
             self.handle_exception(e, "PortfolioHoldingSerializer.get_coin_data")
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        if "valuations" in self.context:
+            data.update(self._valuation(instance))
+        return data
@@ -0,0 +1,61 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Holding, Simulation, SimulationValuation, Transaction, WatchListItem
+from .utils.archive import restore_simulation
+from .utils.series import invalidate_simulation_series
+from .utils.snapshots import schedule_snapshot_update
+from .utils.timeline import schedule_index_update
+from .utils.sync import bump_version, record_deletion
+from .utils.valuation import is_finished
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, **kwargs):
+    schedule_snapshot_update(instance)
+    invalidate_simulation_series(instance.simulation_id)
+    schedule_index_update(instance)
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, **kwargs):
+    schedule_snapshot_update(instance)
+    invalidate_simulation_series(instance.simulation_id)
+    schedule_index_update(instance, deleted=True)
+
+
+@receiver(pre_save, sender=Simulation)
+def remember_simulation_status(sender, instance, **kwargs):
+    instance._previous_status = None if instance._state.adding else \
+        Simulation.objects.filter(pk=instance.pk).values_list("status", flat=True).first()
+
+
+@receiver(post_save, sender=Simulation)
+def simulation_saved(sender, instance, created, **kwargs):
+    # Only a status change matters: unarchiving brings cold rows back first; reopening discards the
+    # frozen valuation and its backoff. Finished simulations are frozen by the freeze_simulations job.
+    previous = getattr(instance, "_previous_status", None)
+    if created or previous is None or previous == instance.status:
+        return
+    if previous == "ARCHIVED":
+        restore_simulation(instance)
+    if not is_finished(instance):
+        SimulationValuation.objects.filter(simulation=instance).delete()
+        if instance.freeze_attempts or instance.freeze_retry_at:
+            Simulation.objects.filter(pk=instance.pk).update(freeze_attempts=0, freeze_retry_at=None)
+
+
+@receiver(pre_save, sender=Holding)
+@receiver(pre_save, sender=WatchListItem)
+def stamp_sync_version(sender, instance, **kwargs):
+    instance.version = bump_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Holding)
+def holding_deleted(sender, instance, **kwargs):
+    record_deletion("holding", instance.user_id, instance.id, instance.simulation_id)
+
+
+@receiver(post_delete, sender=WatchListItem)
+def watchlist_item_deleted(sender, instance, **kwargs):
+    record_deletion("watchlist", instance.user_id, instance.id, instance.simulation_id)
@@ -32,17 +32,31 @@ urlpatterns = [
     # --- Portfolio ---
     path("portfolio/", views.portfolio_view, name="portfolio"),
     path("portfolio/sell/", views.portfolio_sell, name="portfolio-sell"),
+    path("portfolio/batch/", views.portfolio_batch, name="portfolio-batch"),
+    path("portfolio/performance/", views.portfolio_performance, name="portfolio-performance"),
+    path("portfolio/history/", views.portfolio_history, name="portfolio-history"),
+    path("portfolio/projection/", views.portfolio_projection, name="portfolio-projection"),
+    path("portfolio/rebalance/", views.portfolio_rebalance, name="portfolio-rebalance"),
+    path("portfolio/metrics/", views.portfolio_metrics, name="portfolio-metrics"),
 
     # --- Simulations ---
     path("simulations/", views.SimulationListCreateView.as_view(), name="simulations"),
+    path("simulations/backtest/", views.simulation_backtest, name="simulation-backtest"),
+    path("simulations/leaderboard/", views.simulation_leaderboard, name="simulation-leaderboard"),
+    path("simulations/sweeps/", views.backtest_sweeps, name="backtest-sweeps"),
+    path("simulations/sweeps/<uuid:sweep_id>/", views.backtest_sweep_detail, name="backtest-sweep-detail"),
     path("simulations/<uuid:sim_id>/", views.SimulationDetailView.as_view(), name="simulation-detail"),
     path("simulations/<uuid:sim_id>/positions/", views.SimulationPositionsView.as_view(), name="simulation-positions"),
     path("simulations/<uuid:sim_id>/transactions/", views.simulation_transaction, name="simulation-transaction"),
+    path("simulations/<uuid:sim_id>/series/", views.simulation_series_view, name="simulation-series"),
+    path("simulations/<uuid:sim_id>/metrics/", views.simulation_metrics_view, name="simulation-metrics"),
+    path("simulations/<uuid:sim_id>/benchmarks/", views.simulation_benchmarks_view, name="simulation-benchmarks"),
     path("transactions/<uuid:tx_id>/", views.delete_transaction, name="transaction-delete"),
 
     # --- Transactions ---
     path("transactions/", views.list_transactions, name="transactions-list"),
     path("transactions/create/", views.create_transaction, name="transaction-create"),
+    path("transactions/import/", views.import_transactions_view, name="transactions-import"),
 
     # --- Health Check ---
     path("health/", views.health_check, name="health-check"),
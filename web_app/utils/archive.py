@@ -0,0 +1,209 @@
+import json
+import logging
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from django.db import connections, router, transaction as dbtx
+
+from ..models import Holding, LotState, Simulation, SimulationArchive, SyncTombstone, Transaction, WatchListItem
+from .lots import rebuild_lots
+from .metrics import ledger_fingerprints
+from .portfolio import invalidate_summary
+from .series import invalidate_simulation_series
+from .simulations import freeze_finished
+from .sync import bump_version, record_deletions
+from .timeline import drop_simulation_index
+from .valuation import _ledger_hash
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_BATCH_SIZE = 500  # rows per DELETE / bulk_create; keeps IN (...) lists under SQLite's parameter limit
+ARCHIVED_MODELS = (Transaction, Holding, WatchListItem)  # restored in this order
+SYNCED_KINDS = {Holding: "holding", WatchListItem: "watchlist"}  # sync tombstone kind per synced model
+COMPRESSION_LEVEL = 6
+
+
+def _label(model) -> str:
+    return model._meta.model_name
+
+
+def _json_default(value):
+    # Full-precision strings: DjangoJSONEncoder drops microseconds, which would change the ledger fingerprint.
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    raise TypeError(f"Cannot archive {type(value).__name__}")
+
+
+def encode_rows(rows: Iterable[Tuple[str, dict]]) -> bytes:
+    """(model label, row) pairs as zlib-compressed JSON lines."""
+    compressor = zlib.compressobj(COMPRESSION_LEVEL)
+    chunks = []
+    for label, row in rows:
+        line = json.dumps({"model": label, "row": row}, default=_json_default, separators=(",", ":"))
+        chunks.append(compressor.compress(line.encode() + b"\n"))
+    chunks.append(compressor.flush())
+    return b"".join(chunks)
+
+
+def decode_rows(payload: bytes) -> Iterator[Tuple[str, dict]]:
+    for line in zlib.decompress(bytes(payload)).splitlines():
+        if line:
+            record = json.loads(line)
+            yield record["model"], record["row"]
+
+
+def _hot_rows(model, simulation_id, batch_size: int) -> Iterator[Tuple[str, dict]]:
+    columns = [f.attname for f in model._meta.concrete_fields]
+    rows = model.objects.filter(simulation_id=simulation_id).order_by("pk").values(*columns)
+    for row in rows.iterator(chunk_size=batch_size):
+        yield _label(model), row
+
+
+def _delete_batches(model, ids: Sequence, batch_size: int) -> None:
+    """
+    DELETE by primary key in batches of batch_size with a raw cursor. The
+    ORM's delete() collects every row and sends per-row signals, each bumping
+    the sync version for its own tombstone; archive_simulation records them
+    in bulk instead.
+    """
+    conn = connections[router.db_for_write(model)]
+    meta, qn = model._meta, conn.ops.quote_name
+    for start in range(0, len(ids), batch_size):
+        batch = [meta.pk.get_db_prep_value(pk, conn) for pk in ids[start:start + batch_size]]
+        sql = f"DELETE FROM {qn(meta.db_table)} WHERE {qn(meta.pk.column)} IN ({', '.join(['%s'] * len(batch))})"
+        with conn.cursor() as cursor:
+            cursor.execute(sql, batch)
+
+
+def _forget_caches(simulation) -> None:
+    invalidate_simulation_series(simulation.id)
+    drop_simulation_index(simulation.id)
+    invalidate_summary(simulation.user_id, simulation)
+
+
+def archive_simulation(simulation, batch_size: int = ARCHIVE_BATCH_SIZE) -> Optional[SimulationArchive]:
+    """
+    Move an ARCHIVED simulation's transactions, holdings and watchlist items
+    into one compressed SimulationArchive row and delete them from the hot
+    tables in batches. Its final valuation is frozen first and keeps being
+    served while the rows are cold; a simulation that cannot be frozen yet is
+    left alone (None). Holdings and watchlist items get sync tombstones so
+    delta clients drop them. Lot checkpoints are dropped and rebuilt on restore.
+    """
+    if freeze_finished([simulation]).get(simulation.id) is None:
+        logger.info(f"Not archiving simulation {simulation.id}: its valuation is not frozen")
+        return None
+
+    with dbtx.atomic():
+        # Lock the simulation so an unarchive cannot interleave with the move.
+        locked = Simulation.objects.select_for_update().filter(pk=simulation.pk, status="ARCHIVED").first()
+        if locked is None:
+            return None
+        existing = SimulationArchive.objects.filter(simulation=locked).first()
+        if existing is not None:
+            return existing
+
+        fingerprint = ledger_fingerprints([locked.id])[locked.id]
+        counts: Dict[str, int] = {}
+        ids: Dict[str, List] = {}
+
+        def rows():
+            for model in ARCHIVED_MODELS:
+                for label, row in _hot_rows(model, locked.id, batch_size):
+                    counts[label] = counts.get(label, 0) + 1
+                    ids.setdefault(label, []).append(row["id"])
+                    yield label, row
+
+        payload = encode_rows(rows())
+        archive = SimulationArchive.objects.create(
+            simulation=locked, payload=payload, counts=counts, ledger=_ledger_hash(fingerprint), size=len(payload),
+        )
+        LotState.objects.filter(simulation=locked).delete()
+        for model in ARCHIVED_MODELS:
+            _delete_batches(model, ids.get(_label(model), []), batch_size)
+        for model, kind in SYNCED_KINDS.items():
+            record_deletions(kind, locked.user_id, ids.get(_label(model), []), locked.id)
+
+    _forget_caches(locked)
+    logger.info(f"Archived simulation {locked.id}: {counts} in {len(payload)} bytes")
+    return archive
+
+
+def restore_simulation(simulation, batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Bulk-load an archived simulation's rows back into the hot tables with
+    their original ids and timestamps, rebuild its lot state and drop the
+    archive. Holdings and watchlist items get a new sync version (one bump)
+    and their archive tombstones are removed, so delta clients see them
+    return. Returns rows restored per model ({} if the simulation was not
+    archived).
+    """
+    models = {_label(m): m for m in ARCHIVED_MODELS}
+    with dbtx.atomic():
+        archive = SimulationArchive.objects.select_for_update().filter(simulation_id=simulation.pk).first()
+        if archive is None:
+            return {}
+
+        instances: Dict[str, list] = {label: [] for label in models}
+        for label, row in decode_rows(archive.payload):
+            model = models[label]
+            values = {f.attname: f.to_python(row[f.attname]) for f in model._meta.concrete_fields}
+            instances[label].append(model(**values))
+
+        synced = [obj for model in SYNCED_KINDS for obj in instances[_label(model)]]
+        if synced:
+            # bulk_create skips the pre_save signal that stamps sync versions.
+            version = bump_version(simulation.user_id)
+            for obj in synced:
+                obj.version = version
+            for start in range(0, len(synced), batch_size):
+                SyncTombstone.objects.filter(
+                    user_id=simulation.user_id, object_id__in=[obj.id for obj in synced[start:start + batch_size]],
+                ).delete()
+
+        for label, model in models.items():
+            objs = instances[label]
+            # bulk_create re-stamps auto_now(_add) fields on the instances; write the archived values back.
+            stamped = [f.attname for f in model._meta.concrete_fields
+                       if getattr(f, "auto_now", False) or getattr(f, "auto_now_add", False)]
+            original = [[getattr(obj, name) for name in stamped] for obj in objs]
+            model.objects.bulk_create(objs, batch_size=batch_size)
+            if stamped and objs:
+                for obj, values in zip(objs, original):
+                    for name, value in zip(stamped, values):
+                        setattr(obj, name, value)
+                model.objects.bulk_update(objs, stamped, batch_size=batch_size)
+
+        for coin_id in sorted({tx.coin_id for tx in instances[_label(Transaction)]}):
+            rebuild_lots(simulation.user_id, simulation.pk, coin_id)
+        archive.delete()
+
+    _forget_caches(simulation)
+    restored = {label: len(objs) for label, objs in instances.items()}
+    logger.info(f"Restored simulation {simulation.pk}: {restored}")
+    return restored
+
+
+def archive_pending(limit: Optional[int] = None, batch_size: int = ARCHIVE_BATCH_SIZE) -> Dict[str, int]:
+    """Batch job: archive ARCHIVED simulations that still have hot rows, oldest change first."""
+    pending = Simulation.objects.filter(status="ARCHIVED", archive__isnull=True).order_by("updated_at")
+    if limit:
+        pending = pending[:limit]
+    done = {"archived": 0, "skipped": 0, "rows": 0}
+    for simulation in pending:
+        try:
+            archive = archive_simulation(simulation, batch_size)
+        except Exception as e:
+            logger.warning(f"Archiving simulation {simulation.id} failed: {e}")
+            archive = None
+        if archive is None:
+            done["skipped"] += 1
+            continue
+        done["archived"] += 1
+        done["rows"] += sum(archive.counts.values())
+    return done
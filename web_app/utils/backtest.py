@@ -0,0 +1,380 @@
+import hashlib
+import logging
+import time
+from datetime import date, datetime, time as dt_time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction as dbtx
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from ..models import Coin, Simulation, Transaction
+from .coingecko import CACHE_TIMEOUT, get_coin_market_chart
+from .currency import day_numbers, normalise
+from .lots import rebuild_lots
+from .series import MS_PER_DAY, chart_arrays
+from .snapshots import schedule_snapshot_update_from
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("DCA", "REBALANCE", "THRESHOLD")
+MAX_BACKTEST_COINS = 20
+MAX_BACKTEST_DAYS = 3660
+BACKTEST_PRICES_CACHE_KEY = "backtest_prices_{currency}_{start}_{end}_{coins}"
+TRADE_BATCH_SIZE = 1000
+TRADE_HOUR = 12  # UTC hour trades are stamped at; same-day trades are a microsecond apart to keep engine order
+
+
+class BacktestSpecError(ValueError):
+    """The strategy spec is invalid; the message is safe to show to the user."""
+
+
+def _number(data: dict, field: str, default=None, minimum: float = 0.0, strict: bool = False) -> float:
+    raw = data.get(field, default)
+    if raw is None:
+        raise BacktestSpecError(f"{field} is required")
+    try:
+        value = float(raw)
+    except (TypeError, ValueError):
+        raise BacktestSpecError(f"{field} must be a number")
+    if not np.isfinite(value) or value < minimum or (strict and value == minimum):
+        raise BacktestSpecError(f"{field} must be {'greater than' if strict else 'at least'} {minimum:g}")
+    return value
+
+
+def parse_spec(data: dict, today: Optional[date] = None) -> Dict[str, object]:
+    """Validate and normalise a strategy spec from request data."""
+    today = today or timezone.now().date()
+    strategy = str(data.get("strategy") or "").strip().upper()
+    if strategy not in STRATEGIES:
+        raise BacktestSpecError(f"strategy must be one of {', '.join(STRATEGIES)}")
+
+    coins = data.get("coins")
+    if isinstance(coins, str):
+        coins = [c for c in coins.split(",")]
+    coins = list(dict.fromkeys(str(c).strip().lower() for c in (coins or []) if str(c).strip()))
+    if not coins:
+        raise BacktestSpecError("coins is required")
+    if len(coins) > MAX_BACKTEST_COINS:
+        raise BacktestSpecError(f"at most {MAX_BACKTEST_COINS} coins")
+
+    raw_weights = data.get("weights") or {}
+    if not isinstance(raw_weights, dict):
+        raise BacktestSpecError("weights must map coin ids to numbers")
+    weights = np.asarray([_number(raw_weights, c, default=0 if raw_weights else 1) for c in coins])
+    if weights.sum() <= 0:
+        raise BacktestSpecError("weights must not all be zero")
+
+    start = parse_date(str(data.get("start_date") or ""))
+    end = parse_date(str(data.get("end_date") or "")) if data.get("end_date") else today
+    if start is None or end is None:
+        raise BacktestSpecError("start_date and end_date must be YYYY-MM-DD")
+    if end > today:
+        raise BacktestSpecError("end_date cannot be in the future")
+    if start >= end:
+        raise BacktestSpecError("start_date must be before end_date")
+    if (end - start).days > MAX_BACKTEST_DAYS:
+        raise BacktestSpecError(f"date range is limited to {MAX_BACKTEST_DAYS} days")
+
+    spec = {
+        "strategy": strategy,
+        "coins": coins,
+        "weights": (weights / weights.sum()).tolist(),
+        "start_date": start,
+        "end_date": end,
+        "fee_bps": _number(data, "fee_bps", 10),
+        "slippage_bps": _number(data, "slippage_bps", 5),
+        "min_trade": _number(data, "min_trade", 1),
+    }
+    if strategy == "DCA":
+        spec["amount"] = _number(data, "amount", strict=True)
+        spec["every_days"] = int(_number(data, "every_days", 7, minimum=1))
+    elif strategy == "REBALANCE":
+        spec["initial_cash"] = _number(data, "initial_cash", strict=True)
+        spec["every_days"] = int(_number(data, "every_days", 30, minimum=1))
+    else:
+        spec["amount"] = _number(data, "amount", strict=True)
+        spec["buy_below"] = _number(data, "buy_below", 0.1, strict=True)
+        spec["sell_above"] = _number(data, "sell_above", 0.1, strict=True)
+        spec["sell_fraction"] = min(_number(data, "sell_fraction", 0.5, strict=True), 1.0)
+        spec["lookback_days"] = int(_number(data, "lookback_days", 30, minimum=2))
+    return spec
+
+
+def historical_prices(coin_ids: Sequence[str], currency: str, start: date, end: date) -> np.ndarray:
+    """
+    Daily closing prices, shape (len(coin_ids), days in [start, end]), from
+    each coin's market_chart aligned on end-of-day timestamps. Days before a
+    coin's first sample are NaN. Cached per coin set, currency and range.
+    """
+    currency = normalise(currency)
+    fingerprint = hashlib.sha1(",".join(coin_ids).encode()).hexdigest()
+    key = BACKTEST_PRICES_CACHE_KEY.format(currency=currency, start=start, end=end, coins=fingerprint)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    start_day, end_day = (int(d) for d in day_numbers([start, end]))
+    today = int(day_numbers([timezone.now()])[0])
+    grid = (np.arange(start_day, end_day + 1, dtype=np.int64) + 1) * MS_PER_DAY - 1
+    matrix = np.full((len(coin_ids), len(grid)), np.nan)
+    for row, coin_id in enumerate(coin_ids):
+        ts, prices = chart_arrays(get_coin_market_chart(coin_id, currency.lower(), today - start_day + 1))
+        if not len(ts):
+            continue
+        idx = np.searchsorted(ts, grid, side="right") - 1
+        matrix[row] = np.where(idx >= 0, prices[np.clip(idx, 0, None)], np.nan)
+    cache.set(key, matrix, CACHE_TIMEOUT)
+    return matrix
+
+
+def _dca(prices: np.ndarray, spec: dict):
+    n_coins, n_days = prices.shape
+    days = np.arange(0, n_days, spec["every_days"])
+    day_idx = np.repeat(days, n_coins)
+    coin_idx = np.tile(np.arange(n_coins), len(days))
+    spend = np.tile(np.asarray(spec["weights"]) * spec["amount"], len(days))
+    live = ~np.isnan(prices[coin_idx, day_idx]) & (spend >= spec["min_trade"])
+    return day_idx[live], coin_idx[live], spend[live]
+
+
+def _rebalance(prices: np.ndarray, spec: dict, fee: float, slip: float):
+    n_coins, n_days = prices.shape
+    weights = np.asarray(spec["weights"])
+    held = np.zeros(n_coins)
+    cash = spec["initial_cash"]
+    days, coins, buys, quantities = [], [], [], []
+    for day in range(0, n_days, spec["every_days"]):
+        price = prices[:, day]
+        valid = ~np.isnan(price)
+        if not valid.any():
+            continue
+        p = np.where(valid, price, 1.0)
+        w = np.where(valid, weights, 0.0)
+        if w.sum() <= 0:
+            continue
+        value = cash + float((held * p)[valid].sum())
+        delta = np.where(valid, value * w / w.sum() / p - held, 0.0)
+        delta[np.abs(delta * p) < spec["min_trade"]] = 0.0
+
+        sell = delta < 0
+        proceeds = float((-delta[sell] * p[sell] * (1 - slip) * (1 - fee)).sum())
+        buy = delta > 0
+        cost = float((delta[buy] * p[buy] * (1 + slip) * (1 + fee)).sum())
+        if cost > cash + proceeds and cost > 0:
+            delta[buy] *= (cash + proceeds) / cost
+            cost = cash + proceeds
+        cash += proceeds - cost
+        held += delta
+        for mask, is_buy in ((sell, False), (buy, True)):
+            idx = np.flatnonzero(mask & (delta != 0))
+            days.extend([day] * len(idx))
+            coins.extend(idx.tolist())
+            buys.extend([is_buy] * len(idx))
+            quantities.extend(np.abs(delta[idx]).tolist())
+    return (np.asarray(days, dtype=np.int64), np.asarray(coins, dtype=np.int64),
+            np.asarray(buys, dtype=bool), np.asarray(quantities, dtype=np.float64))
+
+
+def _threshold(prices: np.ndarray, spec: dict):
+    n_coins, n_days = prices.shape
+    lookback = spec["lookback_days"]
+    valid = ~np.isnan(prices)
+    # Trailing moving average from cumulative sums: window total = cumsum[t] - cumsum[t - lookback].
+    sums = np.cumsum(np.where(valid, prices, 0.0), axis=1)
+    counts = np.cumsum(valid, axis=1)
+    lagged = np.zeros((n_coins, min(lookback, n_days)))
+    window_sum = sums - np.concatenate([lagged, sums[:, :n_days - lagged.shape[1]]], axis=1)
+    window_count = counts - np.concatenate([lagged, counts[:, :n_days - lagged.shape[1]]], axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = prices / (window_sum / window_count) - 1.0
+    ready = valid & (counts >= lookback)
+    below = ready & (ratio <= -spec["buy_below"])
+    above = ready & (ratio >= spec["sell_above"])
+    # Act when a coin crosses into a band, not on every day it stays there.
+    enter_below = below & ~np.concatenate([np.zeros((n_coins, 1), dtype=bool), below[:, :-1]], axis=1)
+    enter_above = above & ~np.concatenate([np.zeros((n_coins, 1), dtype=bool), above[:, :-1]], axis=1)
+
+    spend = np.asarray(spec["weights"]) * spec["amount"] * n_coins
+    buy_coin, buy_day = np.nonzero(enter_below & (spend[:, None] >= spec["min_trade"]))
+    sell_coin, sell_day = np.nonzero(enter_above)
+    return buy_day, buy_coin, sell_day, sell_coin, spend
+
+
+def run_backtest(prices: np.ndarray, spec: dict) -> Dict[str, np.ndarray]:
+    """
+    Run a strategy over a (coins, days) price matrix. Returns trade arrays
+    (day, coin, is_buy, quantity, price, fee) in execution order and daily
+    value / contributed / cash series.
+
+    Buys fill at price * (1 + slippage) and sells at price * (1 - slippage);
+    fees are charged on the filled notional. DCA and THRESHOLD buys are
+    funded by fresh contributions; REBALANCE trades within initial_cash.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    n_coins, n_days = prices.shape
+    fee, slip = spec["fee_bps"] / 10_000, spec["slippage_bps"] / 10_000
+    strategy = spec["strategy"]
+
+    initial = spec.get("initial_cash", 0.0) if strategy == "REBALANCE" else 0.0
+    if strategy == "DCA":
+        day_idx, coin_idx, spend = _dca(prices, spec)
+        is_buy = np.ones(len(day_idx), dtype=bool)
+        fill = prices[coin_idx, day_idx] * (1 + slip)
+        quantity = spend / (1 + fee) / fill
+    elif strategy == "REBALANCE":
+        day_idx, coin_idx, is_buy, quantity = _rebalance(prices, spec, fee, slip)
+        fill = prices[coin_idx, day_idx] * np.where(is_buy, 1 + slip, 1 - slip)
+    else:
+        buy_day, buy_coin, sell_day, sell_coin, spend = _threshold(prices, spec)
+        # Buy sizes are fixed; a sell takes a fraction of whatever is held by then, so walk the events per coin.
+        buy_fill = prices[buy_coin, buy_day] * (1 + slip)
+        buy_qty = spend[buy_coin] / (1 + fee) / buy_fill
+        day_idx = np.concatenate([buy_day, sell_day])
+        coin_idx = np.concatenate([buy_coin, sell_coin])
+        is_buy = np.concatenate([np.ones(len(buy_day), dtype=bool), np.zeros(len(sell_day), dtype=bool)])
+        quantity = np.concatenate([buy_qty, np.zeros(len(sell_day))])
+        order = np.lexsort((~is_buy, day_idx))
+        day_idx, coin_idx, is_buy, quantity = day_idx[order], coin_idx[order], is_buy[order], quantity[order]
+        held = np.zeros(n_coins)
+        for i in range(len(day_idx)):
+            c = coin_idx[i]
+            if is_buy[i]:
+                held[c] += quantity[i]
+            else:
+                quantity[i] = held[c] * spec["sell_fraction"]
+                held[c] -= quantity[i]
+        fill = prices[coin_idx, day_idx] * np.where(is_buy, 1 + slip, 1 - slip)
+        keep = is_buy | (quantity * fill >= spec["min_trade"])
+        day_idx, coin_idx, is_buy, quantity, fill = (a[keep] for a in (day_idx, coin_idx, is_buy, quantity, fill))
+
+    if strategy != "THRESHOLD":
+        order = np.lexsort((is_buy, day_idx))  # sells first within a day
+        day_idx, coin_idx, is_buy, quantity, fill = (a[order] for a in (day_idx, coin_idx, is_buy, quantity, fill))
+
+    notional = quantity * fill
+    fees = notional * fee
+    signed_qty = np.where(is_buy, quantity, -quantity)
+    cash_flow = np.where(is_buy, -(notional + fees), notional - fees)
+
+    held = np.zeros((n_coins, n_days))
+    np.add.at(held, (coin_idx, day_idx), signed_qty)
+    held = np.cumsum(held, axis=1)
+    flows = np.zeros(n_days)
+    np.add.at(flows, day_idx, cash_flow)
+    contributed = np.full(n_days, float(initial))
+    if strategy != "REBALANCE":
+        # Externally funded buys: each buy's full cost is a contribution, so cash only accumulates sell proceeds.
+        contributed_flow = np.zeros(n_days)
+        np.add.at(contributed_flow, day_idx, np.where(is_buy, notional + fees, 0.0))
+        contributed = np.cumsum(contributed_flow)
+        flows += contributed_flow
+    cash = initial + np.cumsum(flows)
+    marked = np.where(np.isnan(prices), np.nan, held * prices)
+    # Coins without a price on a day keep their last known mark.
+    last = np.where(~np.isnan(marked), np.arange(n_days), 0)
+    np.maximum.accumulate(last, axis=1, out=last)
+    marked = np.nan_to_num(np.take_along_axis(marked, last, axis=1))
+    value = marked.sum(axis=0) + cash
+
+    return {
+        "day": day_idx, "coin": coin_idx, "is_buy": is_buy, "quantity": quantity, "price": fill, "fee": fees,
+        "value": value, "contributed": contributed, "cash": cash,
+    }
+
+
+def backtest_stats(result: Dict[str, np.ndarray]) -> Dict[str, object]:
+    value, contributed = result["value"], result["contributed"]
+    final, paid_in = float(value[-1]) if len(value) else 0.0, float(contributed[-1]) if len(contributed) else 0.0
+    gain = value - contributed
+    peak = np.maximum.accumulate(value) if len(value) else value
+    with np.errstate(invalid="ignore", divide="ignore"):
+        drawdown = np.where(peak > 0, (value - peak) / peak, 0.0)
+    return {
+        "final_value": round(final, 2),
+        "contributed": round(paid_in, 2),
+        "profit": round(float(gain[-1]) if len(gain) else 0.0, 2),
+        "return_pct": round((final - paid_in) / paid_in * 100, 4) if paid_in > 0 else None,
+        "max_drawdown_pct": round(float(drawdown.min()) * 100, 4) if len(drawdown) else 0.0,
+        "fees": round(float(result["fee"].sum()), 2),
+        "trades": int(len(result["day"])),
+        "buys": int(result["is_buy"].sum()),
+        "sells": int((~result["is_buy"]).sum()),
+    }
+
+
+def _decimal(value: float, places: int = 10) -> Decimal:
+    return Decimal(str(round(float(value), places)))
+
+
+def backtest(spec: dict, currency: str) -> Dict[str, object]:
+    """Load prices and run spec without touching the database; returns the raw result plus stats and timings."""
+    started = time.perf_counter()
+    prices = historical_prices(spec["coins"], currency, spec["start_date"], spec["end_date"])
+    loaded = time.perf_counter()
+    result = run_backtest(prices, spec)
+    finished = time.perf_counter()
+    missing = [cid for cid, row in zip(spec["coins"], prices) if np.isnan(row).all()]
+    return {
+        "result": result,
+        "stats": backtest_stats(result),
+        "missing": missing,
+        "timings": {"prices_ms": round((loaded - started) * 1000, 2), "engine_ms": round((finished - loaded) * 1000, 2)},
+    }
+
+
+def series_payload(spec: dict, result: Dict[str, np.ndarray]) -> Dict[str, List]:
+    days = np.arange(int(day_numbers([spec["start_date"]])[0]), int(day_numbers([spec["end_date"]])[0]) + 1)
+    return {
+        "t": (days * MS_PER_DAY).tolist(),
+        "value": np.round(result["value"], 2).tolist(),
+        "contributed": np.round(result["contributed"], 2).tolist(),
+    }
+
+
+def save_backtest(user, spec: dict, run: Dict[str, object], currency: str, name: str,
+                  description: str = "") -> Simulation:
+    """
+    Write a backtest as a Simulation: one bulk_create for all trades, then one
+    lot replay per coin to build holdings and realised P&L.
+    """
+    currency = normalise(currency)
+    result = run["result"]
+    coins = spec["coins"]
+    today = timezone.now().date()
+    base = datetime.combine(spec["start_date"], dt_time(TRADE_HOUR), tzinfo=dt_timezone.utc)
+
+    with dbtx.atomic():
+        known = set(Coin.objects.filter(id__in=coins).values_list("id", flat=True))
+        Coin.objects.bulk_create(
+            [Coin(id=cid, symbol=cid[:10].upper(), name=cid.replace("-", " ").title()) for cid in coins if cid not in known],
+            ignore_conflicts=True,
+        )
+        simulation = Simulation.objects.create(
+            user=user, name=name, description=description,
+            start_date=spec["start_date"], end_date=spec["end_date"],
+            status="ENDED" if spec["end_date"] < today else "ACTIVE",
+        )
+        txs = [
+            Transaction(
+                user_id=user.id, simulation_id=simulation.id, coin_id=coins[c],
+                type="BUY" if buy else "SELL",
+                quantity=_decimal(q, 18), price=_decimal(p), price_currency=currency, fee=_decimal(f),
+                cost_basis=_decimal(q * p) if buy else Decimal("0"),
+                realised_profit=Decimal("0"), realised_profit_currency=currency,
+                time=base + timedelta(days=int(d), microseconds=i),
+            )
+            for i, (d, c, buy, q, p, f) in enumerate(zip(
+                result["day"], result["coin"], result["is_buy"], result["quantity"], result["price"], result["fee"]
+            ))
+        ]
+        Transaction.objects.bulk_create(txs, batch_size=TRADE_BATCH_SIZE)
+        for coin_id in sorted({coins[c] for c in result["coin"]}):
+            rebuild_lots(user.id, simulation.id, coin_id)
+        if txs:
+            schedule_snapshot_update_from(user.id, simulation.id, txs[0].time)
+    logger.info(f"Backtest {spec['strategy']} saved as simulation {simulation.id} with {len(txs)} trades")
+    return simulation
@@ -0,0 +1,169 @@
+import logging
+import time
+from datetime import date, datetime, timezone as dt_timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from ..models import Simulation, User
+from .backtest import historical_prices
+from .coingecko import CACHE_TIMEOUT, get_markets
+from .currency import normalise
+from .series import ENDED_SERIES_TIMEOUT, MS_PER_DAY, simulation_series
+
+logger = logging.getLogger(__name__)
+
+BASKETS = ("top10", "mcap")
+BASKET_SIZE = 10
+DEFAULT_BENCHMARKS = ("coin:bitcoin",)
+MAX_BENCHMARKS = 3
+BENCHMARK_BUCKET_DAYS = 30
+BENCHMARK_SERIES_CACHE_KEY = "benchmark_series_{benchmark}_{currency}_{start}_{end}"
+
+
+class BenchmarkSpecError(ValueError):
+    """The benchmark list is invalid; the message is safe to show to the user."""
+
+
+def parse_benchmarks(raw: Optional[str]) -> List[str]:
+    """Comma separated benchmarks: coin:<coin_id>, top10 (equal weight) or mcap (market-cap weighted)."""
+    names = [b.strip().lower() for b in str(raw or "").split(",") if b.strip()] or list(DEFAULT_BENCHMARKS)
+    names = list(dict.fromkeys(names))
+    if len(names) > MAX_BENCHMARKS:
+        raise BenchmarkSpecError(f"at most {MAX_BENCHMARKS} benchmarks per request")
+    for name in names:
+        if name not in BASKETS and not (name.startswith("coin:") and len(name) > 5):
+            raise BenchmarkSpecError(f"unknown benchmark {name!r}; use coin:<coin_id>, {' or '.join(BASKETS)}")
+    return names
+
+
+def bucket_range(start: date, end: date) -> Tuple[date, date]:
+    """
+    The shared range a (start, end) comparison reads from: start floored to
+    a BENCHMARK_BUCKET_DAYS boundary, so simulations starting in the same
+    window reuse one series.
+    """
+    return date.fromordinal(start.toordinal() // BENCHMARK_BUCKET_DAYS * BENCHMARK_BUCKET_DAYS), end
+
+
+def constituents(benchmark: str, currency: str) -> Tuple[List[str], np.ndarray]:
+    """Coins and weights of a benchmark. Baskets use today's top coins from get_markets; empty if unavailable."""
+    if benchmark.startswith("coin:"):
+        return [benchmark[5:]], np.ones(1)
+    markets = get_markets({"vs_currency": currency.lower(), "per_page": BASKET_SIZE, "page": 1}) or []
+    top = [m for m in markets if m.get("id")][:BASKET_SIZE]
+    if benchmark == "mcap":
+        caps = np.asarray([float(m.get("market_cap") or 0) for m in top])
+        top = [m for m, cap in zip(top, caps) if cap > 0]
+        caps = caps[caps > 0]
+        return [m["id"] for m in top], caps / caps.sum() if len(caps) else caps
+    return [m["id"] for m in top], np.full(len(top), 1.0 / len(top)) if top else np.empty(0)
+
+
+def benchmark_series(benchmark: str, currency: str, start: date, end: date) -> Optional[Dict[str, object]]:
+    """
+    Daily growth index of a benchmark over [start, end], bought at start with
+    its weights and held: index[d] = sum(w * price[d] / first price). Coins
+    are held flat until their first price. Shared by every user's simulations
+    in the same (benchmark, currency, range) and cached for CACHE_TIMEOUT
+    (a day once the range is in the past). None if there is no price data.
+    """
+    currency = normalise(currency)
+    key = BENCHMARK_SERIES_CACHE_KEY.format(benchmark=benchmark, currency=currency, start=start, end=end)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    coin_ids, weights = constituents(benchmark, currency)
+    if not coin_ids:
+        return None
+    prices = historical_prices(coin_ids, currency, start, end)
+    priced = ~np.all(np.isnan(prices), axis=1)
+    if not priced.any():
+        return None
+    first = np.array([row[~np.isnan(row)][0] if p else np.nan for row, p in zip(prices, priced)])
+    relative = np.nan_to_num(prices[priced] / first[priced, None], nan=1.0)
+    weights = weights[priced] / weights[priced].sum()
+    series = {
+        "benchmark": benchmark,
+        "currency": currency,
+        "coins": [cid for cid, p in zip(coin_ids, priced) if p],
+        "weights": np.round(weights, 6).tolist(),
+        "missing": [cid for cid, p in zip(coin_ids, priced) if not p],
+        "first_day": start.toordinal(),
+        "index": weights @ relative,
+    }
+    cache.set(key, series, ENDED_SERIES_TIMEOUT if end < timezone.now().date() else CACHE_TIMEOUT)
+    return series
+
+
+def _utc_date(ms: int) -> date:
+    return datetime.fromtimestamp(ms / 1000, tz=dt_timezone.utc).date()
+
+
+def compare(simulation, currency: str, benchmarks: Sequence[str]) -> Dict[str, object]:
+    """
+    A simulation's value series against each benchmark bought with the same
+    cash flows: every change in invested cash buys (or sells) benchmark units
+    at that point's index level, so the benchmark value answers "what if I
+    had put the same money into it instead". The excess is then one array
+    subtraction against the shared benchmark series.
+    """
+    currency = normalise(currency)
+    series = simulation_series(simulation, currency)
+    result = {"simulation_id": str(simulation.id), "currency": currency, "t": series["t"],
+              "value": series["value"], "benchmarks": [], "unavailable": []}
+    if not series["t"]:
+        return result
+    t = np.asarray(series["t"], dtype=np.int64)
+    value, invested = np.asarray(series["value"]), np.asarray(series["invested"])
+    start, end = bucket_range(_utc_date(int(t[0])), _utc_date(int(t[-1])))
+    offsets = (t // MS_PER_DAY + date(1970, 1, 1).toordinal())
+
+    for name in benchmarks:
+        bench = benchmark_series(name, currency, start, end)
+        if bench is None:
+            result["unavailable"].append(name)
+            continue
+        level = bench["index"][np.clip(offsets - bench["first_day"], 0, len(bench["index"]) - 1)]
+        units = np.cumsum(np.diff(invested, prepend=0.0) / level)
+        bench_value = units * level
+        excess = value - bench_value
+        result["benchmarks"].append({
+            "benchmark": name,
+            "coins": bench["coins"],
+            "weights": bench["weights"],
+            "missing": bench["missing"],
+            "value": np.round(bench_value, 2).tolist(),
+            "excess": np.round(excess, 2).tolist(),
+            "final_value": round(float(bench_value[-1]), 2),
+            "final_excess": round(float(excess[-1]), 2),
+            "beat": bool(excess[-1] > 0),
+        })
+    return result
+
+
+def precompute_benchmarks(benchmarks: Sequence[str] = DEFAULT_BENCHMARKS + BASKETS) -> int:
+    """
+    Warm the shared benchmark series for every (currency, range bucket) in
+    use by simulations, so comparisons only read the cache. Returns the
+    number of series built.
+    """
+    started = time.perf_counter()
+    today = timezone.now().date()
+    currencies = dict(User.objects.values_list("id", "preferred_currency"))
+    ranges = set()
+    for user_id, start_date, end_date in Simulation.objects.values_list("user_id", "start_date", "end_date"):
+        if start_date is None:
+            continue
+        end = end_date if end_date and end_date < today else today
+        ranges.add((normalise(currencies.get(user_id)), *bucket_range(start_date, end)))
+    built = 0
+    for currency, start, end in sorted(ranges):
+        for name in benchmarks:
+            built += benchmark_series(name, currency, start, end) is not None
+    logger.info(f"Precomputed {built} benchmark series for {len(ranges)} ranges "
+                f"in {time.perf_counter() - started:.2f}s")
+    return built
@@ -1,13 +1,33 @@
+import logging
+import time
+from datetime import date, datetime, timezone as dt_timezone
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
-from functools import lru_cache
-from typing import Optional
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
-from .coingecko import get_current_prices
+import numpy as np
+from django.core.cache import cache
+
+from ..models import FxRate
+from .coingecko import get_coin_market_chart, get_current_prices
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_CURRENCY = "USD"
+SUPPORTED_CURRENCIES = ("USD", "EUR", "AUD")
 STABLE_COIN_ID = "usd-coin"
 DECIMAL_QUANTIZE = Decimal("0.0000000001")
 
+FX_TABLE_CACHE_KEY = "fx_rate_table"
+FX_RATE_TTL = 300  # a rate is fresh for 5 minutes
+FX_TABLE_TIMEOUT = 24 * 60 * 60  # stale rates are kept for a day as last resort
+FX_REFRESH_BACKOFF_KEY = "fx_refresh_backoff"
+FX_REFRESH_BACKOFF = 60  # after a failed refresh, serve stale rates without going upstream for a minute
+
+FX_HISTORY_CACHE_KEY = "fx_history_{currency}"
+FX_HISTORY_TIMEOUT = 6 * 60 * 60
+MS_PER_DAY = 24 * 60 * 60 * 1000
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
 
 def normalise(code: Optional[str]) -> str:
     if not code or not isinstance(code, str):
@@ -15,29 +35,107 @@ def normalise(code: Optional[str]) -> str:
     return code.strip().upper() or DEFAULT_CURRENCY
 
 
-@lru_cache(maxsize=64)
+def _parse_rate(value) -> Optional[Decimal]:
+    try:
+        rate = Decimal(str(value))
+    except (InvalidOperation, TypeError, ValueError):
+        return None
+    if not rate.is_finite() or rate <= 0:
+        return None
+    return rate
+
+
+def refresh_fx_rates(currencies: Optional[Iterable[str]] = None) -> Dict[str, Decimal]:
+    """
+    Fetch the USDC rate for every requested currency in a single upstream call
+    and store the results in the FxRate table (shared by every process) and
+    this process's cache. Only successful lookups are written; failures are
+    never memoized, they only set a short backoff marker.
+    """
+    codes = sorted({normalise(c) for c in (currencies or SUPPORTED_CURRENCIES)} - {DEFAULT_CURRENCY})
+    if not codes:
+        return {}
+
+    try:
+        data = get_current_prices(STABLE_COIN_ID, ",".join(code.lower() for code in codes))
+        quotes = data.get(STABLE_COIN_ID) or {}
+    except Exception as e:
+        logger.warning(f"FX refresh failed: {e}")
+        quotes = {}
+
+    fresh = {}
+    for code in codes:
+        rate = _parse_rate(quotes.get(code.lower()))
+        if rate is not None:
+            fresh[code] = rate
+
+    if fresh:
+        now = time.time()
+        fetched_at = datetime.fromtimestamp(now, tz=dt_timezone.utc)
+        for code, rate in fresh.items():
+            FxRate.objects.update_or_create(currency=code, defaults={"rate": rate, "fetched_at": fetched_at})
+        table = cache.get(FX_TABLE_CACHE_KEY) or {}
+        for code, rate in fresh.items():
+            table[code] = (rate, now)
+        cache.set(FX_TABLE_CACHE_KEY, table, FX_TABLE_TIMEOUT)
+    else:
+        # A marker, not a memoized failure: readers skip the upstream call until it expires.
+        cache.set(FX_REFRESH_BACKOFF_KEY, True, FX_REFRESH_BACKOFF)
+        logger.warning(f"FX refresh returned no rates for {codes}")
+    return fresh
+
+
+def _stored_rate(currency: str) -> Optional[Tuple[Decimal, float]]:
+    row = FxRate.objects.filter(currency=currency).values_list("rate", "fetched_at").first()
+    return (row[0], row[1].timestamp()) if row else None
+
+
 def _usd_coin_rate(currency: str) -> Optional[Decimal]:
     """
     Return the price of 1 USDC (≈ 1 USD) in the target currency.
-    Falls back to Decimal('1') when the lookup fails for USD.
+    Reads the cached FX table, then the FxRate rows written by
+    refresh_fx_rates in any process, and refreshes upstream when the rate is
+    older than FX_RATE_TTL. A stale rate is only served when the refresh fails
+    or a recent failure put refreshes on hold (FX_REFRESH_BACKOFF).
     """
     currency = normalise(currency)
     if currency == DEFAULT_CURRENCY:
         return Decimal("1")
 
-    data = get_current_prices(STABLE_COIN_ID, currency.lower())
-    try:
-        price = data.get(STABLE_COIN_ID, {}).get(currency.lower())
-    except AttributeError:
-        price = None
+    entry = (cache.get(FX_TABLE_CACHE_KEY) or {}).get(currency)
+    if entry and time.time() - entry[1] < FX_RATE_TTL:
+        return entry[0]
+
+    entry = _stored_rate(currency) or entry
+    if entry and time.time() - entry[1] < FX_RATE_TTL:
+        table = cache.get(FX_TABLE_CACHE_KEY) or {}
+        table[currency] = entry
+        cache.set(FX_TABLE_CACHE_KEY, table, FX_TABLE_TIMEOUT)
+        return entry[0]
+
+    fresh = {} if cache.get(FX_REFRESH_BACKOFF_KEY) else refresh_fx_rates(set(SUPPORTED_CURRENCIES) | {currency})
+    if currency in fresh:
+        return fresh[currency]
 
-    if price is None:
+    if entry:
+        logger.info(f"Serving stale FX rate for {currency}")
+        return entry[0]
+    return None
+
+
+def _conversion_rates(src_currency: str, dst_currency: str) -> Optional[Tuple[Decimal, Decimal]]:
+    src_rate = _usd_coin_rate(src_currency)
+    dst_rate = _usd_coin_rate(dst_currency)
+    if src_rate is None or dst_rate is None or src_rate <= 0 or dst_rate <= 0:
         return None
+    return src_rate, dst_rate
 
+
+def _to_decimal(amount) -> Decimal:
     try:
-        return Decimal(str(price))
+        return Decimal(str(amount))
     except (InvalidOperation, TypeError, ValueError):
-        return None
+        raise ValueError("Unable to convert amount to Decimal")
 
 
 def convert_amount(amount, src_currency: Optional[str], dst_currency: Optional[str]) -> Decimal:
@@ -48,20 +146,216 @@ def convert_amount(amount, src_currency: Optional[str], dst_currency: Optional[s
     dst_currency = normalise(dst_currency)
     src_currency = normalise(src_currency)
 
-    try:
-        numeric = Decimal(str(amount))
-    except (InvalidOperation, TypeError, ValueError):
-        raise ValueError("Unable to convert amount to Decimal")
+    numeric = _to_decimal(amount)
 
     if src_currency == dst_currency:
         return numeric
 
-    src_rate = _usd_coin_rate(src_currency)
-    dst_rate = _usd_coin_rate(dst_currency)
-
-    if src_rate is None or dst_rate is None or src_rate <= 0 or dst_rate <= 0:
+    rates = _conversion_rates(src_currency, dst_currency)
+    if rates is None:
         return numeric
 
+    src_rate, dst_rate = rates
     value_in_usd = numeric / src_rate
     converted = value_in_usd * dst_rate
     return converted.quantize(DECIMAL_QUANTIZE, rounding=ROUND_HALF_UP)
+
+
+def conversion_factor(src_currency: Optional[str], dst_currency: Optional[str]) -> Optional[Decimal]:
+    """
+    Return the multiplier converting src_currency amounts into dst_currency,
+    or None when rates are unavailable.
+    """
+    src_currency = normalise(src_currency)
+    dst_currency = normalise(dst_currency)
+    if src_currency == dst_currency:
+        return Decimal("1")
+    rates = _conversion_rates(src_currency, dst_currency)
+    if rates is None:
+        return None
+    src_rate, dst_rate = rates
+    return dst_rate / src_rate
+
+
+def convert_amounts(values, src_currency: Optional[str], dst_currency: Optional[str], exact: bool = False):
+    """
+    Convert a sequence (or NumPy array) of amounts, resolving the rates once.
+
+    By default returns a float64 ndarray. With exact=True returns a list of
+    Decimals identical to calling convert_amount on each value (use this for
+    ledger writes). Like convert_amount, values are returned unchanged when
+    rates are unavailable.
+    """
+    src_currency = normalise(src_currency)
+    dst_currency = normalise(dst_currency)
+    parsed = _parse_amounts(values, exact)
+    rates = None if src_currency == dst_currency else _conversion_rates(src_currency, dst_currency)
+    return _apply_rates(parsed, rates, exact)
+
+
+def _parse_amounts(values, exact: bool):
+    if exact:
+        return [_to_decimal(v) for v in values]
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValueError("Unable to convert amounts to float array")
+
+
+def _apply_rates(parsed, rates: Optional[Tuple[Decimal, Decimal]], exact: bool):
+    if rates is None:
+        return list(parsed) if exact else parsed.copy()
+    src_rate, dst_rate = rates
+    if exact:
+        return [(n / src_rate * dst_rate).quantize(DECIMAL_QUANTIZE, rounding=ROUND_HALF_UP) for n in parsed]
+    return parsed * float(dst_rate / src_rate)
+
+
+def convert_rows(
+    rows: Sequence[dict],
+    fields: Sequence[str],
+    dst_currency: Optional[str],
+    src_currency: Optional[str] = None,
+    currency_field: Optional[str] = None,
+    exact: bool = False,
+) -> List[dict]:
+    """
+    Convert the given numeric fields of every row into dst_currency.
+
+    The source currency is read per row from currency_field when given,
+    otherwise src_currency applies to all rows. Rates are resolved once per
+    distinct source currency. Returns shallow copies of the rows; None values
+    are left untouched and currency_field is rewritten to dst_currency. Rows
+    whose source currency has no rate keep their values and their source
+    label, so callers can tell them apart from converted rows.
+    """
+    dst_currency = normalise(dst_currency)
+    out = [dict(row) for row in rows]
+
+    groups: Dict[str, List[int]] = {}
+    for idx, row in enumerate(out):
+        code = normalise(row.get(currency_field) if currency_field else src_currency)
+        groups.setdefault(code, []).append(idx)
+
+    for code, indexes in groups.items():
+        rates = None if code == dst_currency else _conversion_rates(code, dst_currency)
+        if rates is None and code != dst_currency:
+            continue
+        if currency_field:
+            for i in indexes:
+                out[i][currency_field] = dst_currency
+        for field in fields:
+            present = [i for i in indexes if out[i].get(field) is not None]
+            if not present:
+                continue
+            converted = _apply_rates(_parse_amounts([out[i][field] for i in present], exact), rates, exact)
+            if not exact:
+                converted = converted.tolist()
+            for i, value in zip(present, converted):
+                out[i][field] = value
+    return out
+
+
+# ------------------------------------------------------------------------------
+# Historical FX (daily, built from the stablecoin price series)
+# ------------------------------------------------------------------------------
+def _to_day(value) -> int:
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(dt_timezone.utc)
+        value = value.date()
+    if isinstance(value, date):
+        return value.toordinal() - EPOCH_ORDINAL
+    raise ValueError(f"Unsupported date value: {value!r}")
+
+
+def day_numbers(dates) -> np.ndarray:
+    """
+    Convert dates, datetimes (naive = UTC) or a datetime64 array into
+    int64 day numbers since the Unix epoch.
+    """
+    if isinstance(dates, np.ndarray) and dates.dtype.kind == "M":
+        return dates.astype("datetime64[D]").astype(np.int64)
+    return np.fromiter((_to_day(d) for d in dates), dtype=np.int64)
+
+
+def historical_fx_table(currency: Optional[str]) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Return (day_numbers, rates) for the daily USDC price in currency, sorted by day.
+    Built from the full stablecoin series in one upstream call and shared through
+    the cache. Returns None (and caches nothing) when the series is unavailable.
+    """
+    currency = normalise(currency)
+    key = FX_HISTORY_CACHE_KEY.format(currency=currency)
+    table = cache.get(key)
+    if table is not None:
+        return table
+
+    data = get_coin_market_chart(STABLE_COIN_ID, currency.lower(), days="max")
+    points = (data.get("prices") or []) if isinstance(data, dict) else []
+    rows = [p for p in points if isinstance(p, (list, tuple)) and len(p) > 1 and _parse_rate(p[1]) is not None]
+    if not rows:
+        logger.warning(f"Historical FX series unavailable for {currency}")
+        return None
+
+    series = np.asarray([(float(p[0]), float(p[1])) for p in rows], dtype=np.float64)
+    series = series[np.argsort(series[:, 0], kind="stable")]
+    days = (series[:, 0] // MS_PER_DAY).astype(np.int64)
+    # Keep the last sample of each UTC day.
+    last = np.r_[days[1:] != days[:-1], True]
+    table = (days[last], series[last, 1])
+    cache.set(key, table, FX_HISTORY_TIMEOUT)
+    return table
+
+
+def historical_rates(currency: Optional[str], dates) -> np.ndarray:
+    """
+    Vectorized lookup of the USDC rate in currency for each date.
+    Each date uses the latest daily rate on or before it (the earliest rate for
+    dates before the series starts). Falls back to the live rate, then NaN.
+    """
+    currency = normalise(currency)
+    days = day_numbers(dates)
+    if currency == DEFAULT_CURRENCY:
+        return np.ones(days.shape, dtype=np.float64)
+
+    table = historical_fx_table(currency)
+    if table is None:
+        live = _usd_coin_rate(currency)
+        return np.full(days.shape, float(live) if live is not None else np.nan, dtype=np.float64)
+
+    table_days, table_rates = table
+    idx = np.searchsorted(table_days, days, side="right") - 1
+    return table_rates[np.clip(idx, 0, len(table_rates) - 1)]
+
+
+def historical_factors(src_currency: Optional[str], dst_currency: Optional[str], dates) -> np.ndarray:
+    """
+    Per-date multipliers converting src_currency into dst_currency.
+    Dates without a usable rate get a factor of 1, mirroring convert_amount.
+    """
+    src_currency = normalise(src_currency)
+    dst_currency = normalise(dst_currency)
+    if src_currency == dst_currency:
+        return np.ones(day_numbers(dates).shape, dtype=np.float64)
+    factors = historical_rates(dst_currency, dates) / historical_rates(src_currency, dates)
+    factors[~np.isfinite(factors) | (factors <= 0)] = 1.0
+    return factors
+
+
+def convert_at_dates(values, dates, src_currency, dst_currency: Optional[str]) -> np.ndarray:
+    """
+    Convert each value at the FX rate of its own date in one vectorized pass.
+    src_currency is either a single code or one code per value.
+    """
+    arr = _parse_amounts(values, exact=False)
+    if isinstance(src_currency, str) or src_currency is None:
+        return arr * historical_factors(src_currency, dst_currency, dates)
+
+    codes = np.asarray([normalise(c) for c in src_currency])
+    days = day_numbers(dates)
+    out = arr.copy()
+    for code in np.unique(codes):
+        mask = codes == code
+        out[mask] = arr[mask] * historical_factors(code, dst_currency, days[mask].astype("datetime64[D]"))
+    return out
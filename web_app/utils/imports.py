@@ -0,0 +1,290 @@
+import csv
+import logging
+import math
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from django.db import transaction as dbtx
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from ..models import Coin, Holding, Transaction
+from .coingecko import get_coin_market_chart
+from .currency import SUPPORTED_CURRENCIES, convert_at_dates, normalise
+from .lots import rebuild_lots
+from .portfolio import invalidate_summary
+from .series import MS_PER_DAY, chart_arrays, invalidate_simulation_series
+from .snapshots import schedule_snapshot_update_from
+from .timeline import drop_simulation_index
+
+logger = logging.getLogger(__name__)
+
+IMPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 500
+REQUIRED_COLUMNS = ("coin", "side", "qty", "time")
+SIDES = {"BUY": "BUY", "SELL": "SELL", "B": "BUY", "S": "SELL"}
+
+
+class ImportFormatError(ValueError):
+    """The file cannot be imported at all (e.g. missing header columns)."""
+
+
+def _parse_time(value: str) -> datetime:
+    value = (value or "").strip()
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"invalid time '{value}'")
+        parsed = datetime.combine(day, dt_time.min)
+    if timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    if parsed > timezone.now():
+        raise ValueError("time is in the future")
+    return parsed
+
+
+def _parse_decimal(value: str, field: str, required: bool = True) -> Optional[Decimal]:
+    value = (value or "").strip()
+    if not value:
+        if required:
+            raise ValueError(f"{field} is required")
+        return None
+    try:
+        number = Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"invalid {field} '{value}'")
+    if not number.is_finite() or number <= 0:
+        raise ValueError(f"{field} must be positive")
+    return number
+
+
+def parse_row(row: Dict[str, str], default_currency: str) -> Dict[str, object]:
+    """Validate one CSV row; raises ValueError with a user-facing message."""
+    coin_id = (row.get("coin") or "").strip().lower()
+    if not coin_id:
+        raise ValueError("coin is required")
+    side = SIDES.get((row.get("side") or "").strip().upper())
+    if side is None:
+        raise ValueError(f"invalid side '{row.get('side')}'")
+    currency = (row.get("currency") or "").strip().upper()
+    if currency and currency not in SUPPORTED_CURRENCIES:
+        raise ValueError(f"unsupported currency '{currency}'")
+    return {
+        "coin_id": coin_id,
+        "type": side,
+        "quantity": _parse_decimal(row.get("qty"), "qty"),
+        "price": _parse_decimal(row.get("price"), "price", required=False),
+        "currency": currency or default_currency,
+        "time": _parse_time(row.get("time")),
+    }
+
+
+def fill_missing_prices(rows: List[Dict[str, object]]) -> None:
+    """
+    Fill price for rows that lack one from historical charts, with one
+    market_chart request per (coin, currency) covering the oldest row. Each
+    row takes the latest sample at or before its time; rows before the first
+    sample are left without a price.
+    """
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(row["coin_id"], row["currency"])].append(row)
+    now = timezone.now()
+    for (coin_id, currency), group in groups.items():
+        oldest = min(r["time"] for r in group)
+        days = max(1, math.ceil((now - oldest).total_seconds() * 1000 / MS_PER_DAY) + 1)
+        ts, prices = chart_arrays(get_coin_market_chart(coin_id, currency.lower(), days))
+        if not len(ts):
+            continue
+        wanted = np.asarray([int(r["time"].timestamp() * 1000) for r in group], dtype=np.int64)
+        idx = np.searchsorted(ts, wanted, side="right") - 1
+        for row, i in zip(group, idx):
+            if i >= 0:
+                row["price"] = Decimal(str(round(float(prices[i]), 10)))
+
+
+def _record_error(report: Dict[str, object], line: int, detail: str) -> None:
+    report["failed"] += 1
+    if len(report["errors"]) < MAX_REPORTED_ERRORS:
+        report["errors"].append({"line": line, "detail": detail})
+
+
+def _resolve(batch, report, resolved) -> None:
+    """Price one chunk and convert it to USD at each row's date; runs outside any DB transaction."""
+    fill_missing_prices([row for _, row in batch if row["price"] is None])
+    ready = []
+    for line, row in batch:
+        if row["price"] is None:
+            _record_error(report, line, f"no historical price for {row['coin_id']} at {row['time'].isoformat()}")
+        else:
+            ready.append((line, row))
+    if not ready:
+        return
+    prices_usd = convert_at_dates(
+        [r["price"] for _, r in ready], [r["time"] for _, r in ready], [r["currency"] for _, r in ready], "USD"
+    )
+    for (line, row), price in zip(ready, prices_usd):
+        resolved.append((uuid.uuid4(), line, row["coin_id"], row["type"], row["quantity"],
+                         Decimal(str(round(float(price), 10))), row["time"]))
+
+
+def _reject_oversells(user_id, simulation_id, resolved, report) -> List[tuple]:
+    """
+    Drop imported sells the ledger cannot cover, walking each coin's existing
+    ledger and the imported rows in ledger order. Existing sells count at
+    their full quantity and are never dropped, so an imported sell is kept
+    only if the position stays non-negative from its time to the end of the
+    ledger: enough must be held at its time, and a backdated sell must not
+    leave a later sell short. Earlier sells are kept first. Like the trade
+    endpoints, a rejected sell leaves the position unchanged.
+    """
+    imported = defaultdict(list)
+    for row in resolved:
+        imported[row[2]].append(row)
+    existing = defaultdict(list)
+    ledger = Transaction.objects.filter(user_id=user_id, simulation_id=simulation_id, coin_id__in=list(imported))
+    for coin_id, tx_id, side, quantity, at in ledger.values_list("coin_id", "id", "type", "quantity", "time"):
+        existing[coin_id].append((at, tx_id, side, quantity, None))
+
+    rejected = set()
+    for coin_id, rows in imported.items():
+        merged = sorted(existing[coin_id] + [(at, tx_id, side, quantity, line)
+                                             for tx_id, line, _, side, quantity, _, at in rows],
+                        key=lambda r: (r[0], r[1]))
+        # Position after each row counting buys and existing sells; imported sells are decided below.
+        position, base = Decimal("0"), []
+        for _, _, side, quantity, line in merged:
+            if side == "BUY":
+                position += quantity
+            elif line is None:
+                position -= quantity
+            base.append(position)
+        # Accepted sells all precede the one being decided, so each lowers its whole suffix by the same amount.
+        floor = list(base)
+        for i in range(len(floor) - 2, -1, -1):
+            floor[i] = min(floor[i], floor[i + 1])
+        accepted = Decimal("0")
+        for i, (_, tx_id, side, quantity, line) in enumerate(merged):
+            if side == "BUY" or line is None:
+                continue
+            if quantity > base[i] - accepted:
+                _record_error(report, line, "sell exceeds the quantity held")
+                rejected.add(tx_id)
+            elif quantity > floor[i] - accepted:
+                _record_error(report, line, "sell would leave a later sell short")
+                rejected.add(tx_id)
+            else:
+                accepted += quantity
+    return [row for row in resolved if row[0] not in rejected]
+
+
+def _write(user, simulation, resolved, chunk_size: int) -> None:
+    """Bulk insert resolved rows in chunks."""
+    coin_ids = {r[2] for r in resolved}
+    known = Coin.objects.in_bulk(list(coin_ids))
+    Coin.objects.bulk_create(
+        [Coin(id=cid, symbol=cid[:10].upper(), name=cid.replace("-", " ").title())
+         for cid in coin_ids if cid not in known],
+        ignore_conflicts=True,
+    )
+    user_id, simulation_id = user.id, getattr(simulation, "id", None)
+    for start in range(0, len(resolved), chunk_size):
+        Transaction.objects.bulk_create([
+            Transaction(
+                id=tx_id, user_id=user_id, simulation_id=simulation_id, coin_id=coin_id, type=side,
+                quantity=quantity, price=price, price_currency="USD", fee=Decimal("0"),
+                cost_basis=quantity * price if side == "BUY" else Decimal("0"),
+                realised_profit=Decimal("0"), realised_profit_currency="USD", time=at,
+            )
+            for tx_id, _, coin_id, side, quantity, price, at in resolved[start:start + chunk_size]
+        ])
+
+
+def import_transactions(user, lines: Iterable[str], simulation=None,
+                        chunk_size: int = IMPORT_CHUNK_SIZE) -> Dict[str, object]:
+    """
+    Stream-import a CSV of trades (coin, side, qty, price, currency, time)
+    into the user's live portfolio or a simulation.
+
+    Rows are parsed one at a time; rows without a price are priced from one
+    batched historical lookup per chunk of chunk_size, before any DB
+    transaction is opened. The priced rows are then written in chunks inside
+    one transaction, with the affected holdings locked. Lots, holdings and
+    the portfolio summary are recomputed once per affected coin. Bad rows,
+    including sells that exceed the quantity held at their time, are skipped
+    and reported by line number.
+    """
+    started = time.perf_counter()
+    reader = csv.DictReader(lines)
+    header = {(name or "").strip().lower() for name in (reader.fieldnames or [])}
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
+    if missing:
+        raise ImportFormatError(f"missing columns: {', '.join(missing)}")
+    reader.fieldnames = [(name or "").strip().lower() for name in reader.fieldnames]
+
+    default_currency = normalise(getattr(user, "preferred_currency", None))
+    report = {"rows": 0, "imported": 0, "failed": 0, "errors": []}
+    resolved: List[tuple] = []  # (id, line, coin_id, type, quantity, USD price, time)
+
+    batch = []
+    for row in reader:
+        report["rows"] += 1
+        line = reader.line_num
+        try:
+            batch.append((line, parse_row(row, default_currency)))
+        except ValueError as e:
+            _record_error(report, line, str(e))
+        if len(batch) >= chunk_size:
+            _resolve(batch, report, resolved)
+            batch = []
+    if batch:
+        _resolve(batch, report, resolved)
+
+    simulation_id = getattr(simulation, "id", None)
+    earliest: Dict[str, datetime] = {}
+    if resolved:
+        with dbtx.atomic():
+            # Lock the positions as the trade endpoints do, then check sells against them.
+            coin_ids = list({row[2] for row in resolved})
+            list(Holding.objects.select_for_update().filter(
+                user_id=user.id, simulation_id=simulation_id, coin_id__in=coin_ids
+            ).values_list("id", flat=True))
+            resolved = _reject_oversells(user.id, simulation_id, resolved, report)
+            _write(user, simulation, resolved, chunk_size)
+            for _, _, coin_id, _, _, _, at in resolved:
+                if coin_id not in earliest or at < earliest[coin_id]:
+                    earliest[coin_id] = at
+            oversold = []
+            for coin_id, from_time in earliest.items():
+                oversold.extend(rebuild_lots(user.id, simulation_id, coin_id, from_time=from_time)["oversold"])
+            if oversold:
+                # The sweep above should make this unreachable; never commit an oversold ledger.
+                dbtx.set_rollback(True)
+                lines = {row[0]: row[1] for row in resolved}
+                for tx_id in oversold:
+                    _record_error(report, lines.get(uuid.UUID(str(tx_id)), 0), "sell exceeds the quantity held")
+                logger.warning(f"Import for {user.id} rolled back: {len(oversold)} sells oversold")
+                resolved, earliest = [], {}
+            if earliest:
+                invalidate_summary(user, simulation)
+                invalidate_simulation_series(simulation_id)
+                drop_simulation_index(simulation_id)
+                schedule_snapshot_update_from(user.id, simulation_id, min(earliest.values()))
+        report["imported"] = len(resolved)
+
+    report["errors"].sort(key=lambda e: e["line"])
+    elapsed = time.perf_counter() - started
+    report["coins"] = sorted(earliest)
+    report["seconds"] = round(elapsed, 3)
+    report["rows_per_second"] = round(report["rows"] / elapsed, 1) if elapsed > 0 else None
+    logger.info(
+        f"Imported {report['imported']}/{report['rows']} transactions for {user.id} "
+        f"in {report['seconds']}s ({report['failed']} failed)"
+    )
+    return report
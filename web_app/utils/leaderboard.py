@@ -0,0 +1,125 @@
+import heapq
+import logging
+import time
+from datetime import timedelta
+from decimal import Decimal
+from typing import Dict, List
+
+import numpy as np
+from django.db import transaction as dbtx
+from django.db.models import Sum
+from django.utils import timezone
+
+from ..models import LeaderboardEntry, Transaction
+from .backtest import historical_prices
+from .currency import convert_amounts
+from .simulations import _BUY_VALUE, _NET_QUANTITY, _SELL_VALUE
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_CURRENCY = "USD"
+LEADERBOARD_SIZE = 100
+WINDOW_DAYS = {"7d": 7, "30d": 30}
+WINDOWS = ("7d", "30d", "all")
+EPSILON = 1e-9
+
+
+def load_positions():
+    """
+    Net quantity per coin and cash bought/sold (in LEADERBOARD_CURRENCY) for
+    every ACTIVE simulation, from one GROUP BY over their transactions.
+    Returns (simulations, coins, quantity matrix, bought, sold) where
+    simulations is a list of (simulation_id, user_id).
+    """
+    rows = list(
+        Transaction.objects.filter(simulation__status="ACTIVE")
+        .values("simulation_id", "user_id", "coin_id", "price_currency")
+        .annotate(bought=Sum(_BUY_VALUE), sold=Sum(_SELL_VALUE), net=Sum(_NET_QUANTITY))
+        .order_by()
+    )
+    simulations = sorted({(r["simulation_id"], r["user_id"]) for r in rows}, key=lambda s: str(s[0]))
+    coins = sorted({r["coin_id"] for r in rows})
+    sim_row = {sid: i for i, (sid, _) in enumerate(simulations)}
+    coin_col = {cid: j for j, cid in enumerate(coins)}
+
+    quantity = np.zeros((len(simulations), len(coins)))
+    bought, sold = np.zeros(len(simulations)), np.zeros(len(simulations))
+    by_currency: Dict[str, List[dict]] = {}
+    for r in rows:
+        by_currency.setdefault(r["price_currency"], []).append(r)
+    for currency, group in by_currency.items():
+        idx = np.asarray([sim_row[r["simulation_id"]] for r in group], dtype=np.int64)
+        np.add.at(quantity, (idx, [coin_col[r["coin_id"]] for r in group]), [float(r["net"] or 0) for r in group])
+        for totals, field in ((bought, "bought"), (sold, "sold")):
+            amounts = [float(r[field] or 0) for r in group]
+            np.add.at(totals, idx, convert_amounts(amounts, currency, LEADERBOARD_CURRENCY))
+    return simulations, coins, np.maximum(quantity, 0.0), bought, sold
+
+
+def window_returns(quantity: np.ndarray, prices: np.ndarray, bought: np.ndarray,
+                   sold: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Returns per simulation for every window, as whole-matrix products.
+
+    prices is (coins, days) ending today. 7d and 30d compare the current
+    holdings' value now with the same holdings at the window start. "all"
+    is value plus sale proceeds over cash put in. Simulations holding a coin
+    without a price at either end, or with nothing at stake, are NaN.
+    """
+    held = quantity > EPSILON
+    now = prices[:, -1]
+    value = quantity @ np.nan_to_num(now)
+    unpriced_now = (held & np.isnan(now)).any(axis=1)
+    results = {}
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for window, days in WINDOW_DAYS.items():
+            then = prices[:, max(prices.shape[1] - 1 - days, 0)]
+            start = quantity @ np.nan_to_num(then)
+            ok = ~unpriced_now & ~(held & np.isnan(then)).any(axis=1) & (start > EPSILON)
+            results[window] = np.where(ok, (value / start - 1) * 100, np.nan)
+        ok = ~unpriced_now & (bought > EPSILON)
+        results["all"] = np.where(ok, (value + sold - bought) / bought * 100, np.nan)
+    return {"value": value, **results}
+
+
+def top_k(scores: np.ndarray, k: int = LEADERBOARD_SIZE) -> List[int]:
+    """Row indices of the k highest finite scores, best first (ties keep row order)."""
+    finite = np.flatnonzero(np.isfinite(scores))
+    best = heapq.nlargest(k, ((float(scores[i]), -int(i)) for i in finite))
+    return [-i for _, i in best]
+
+
+def build_leaderboard(size: int = LEADERBOARD_SIZE) -> Dict[str, int]:
+    """
+    Batch job: value every active simulation against one shared price matrix
+    and replace the stored top `size` rows of each window. Returns the number
+    of rows written per window.
+    """
+    started = time.perf_counter()
+    simulations, coins, quantity, bought, sold = load_positions()
+    today = timezone.now().date()
+    span = max(WINDOW_DAYS.values())
+    prices = historical_prices(coins, LEADERBOARD_CURRENCY, today - timedelta(days=span), today) if coins \
+        else np.empty((0, span + 1))
+    scores = window_returns(quantity, prices, bought, sold)
+
+    computed_at = timezone.now()
+    entries, written = [], {}
+    for window in WINDOWS:
+        best = top_k(scores[window], size)
+        written[window] = len(best)
+        entries += [
+            LeaderboardEntry(
+                window=window, rank=rank, simulation_id=simulations[i][0], user_id=simulations[i][1],
+                return_pct=round(float(scores[window][i]), 4),
+                value=Decimal(str(round(float(scores["value"][i]), 10))),
+                currency=LEADERBOARD_CURRENCY, computed_at=computed_at,
+            )
+            for rank, i in enumerate(best, start=1)
+        ]
+    with dbtx.atomic():
+        LeaderboardEntry.objects.all().delete()
+        LeaderboardEntry.objects.bulk_create(entries)
+    logger.info(f"Leaderboard: ranked {len(simulations)} simulations over {len(coins)} coins "
+                f"in {time.perf_counter() - started:.2f}s")
+    return written
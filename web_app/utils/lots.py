@@ -0,0 +1,327 @@
+import logging
+from array import array
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db import connections, router
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from ..models import Holding, LotState, Transaction, User
+from .currency import convert_at_dates, day_numbers
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("FIFO", "LIFO", "AVERAGE")
+DEFAULT_METHOD = "AVERAGE"
+CHECKPOINT_INTERVAL = 1000
+LOT_BATCH_SIZE = 1000
+EPSILON = 1e-12
+ROUNDING = 1e-10  # stored cost basis / realised profit precision
+FLOAT_SLACK = 1e-14  # a few ulps, relative
+OVERSELL_TOLERANCE = 1e-9  # relative; float drift across a long ledger is not an oversell
+LEDGER_ROW = ("id", "type", "quantity", "price", "price_currency", "time",
+              "cost_basis", "realised_profit", "realised_profit_currency")
+
+
+def _dec(value: float) -> Decimal:
+    return Decimal(str(round(value, 10)))
+
+
+class LotBook:
+    """
+    Open lots for one coin, held as parallel float arrays of quantity and unit
+    cost, oldest first. FIFO consumes from a head index (compacted lazily),
+    LIFO pops from the tail, AVERAGE keeps a single merged lot. Sells beyond
+    the open quantity close what is held and add the excess to shortfall.
+    """
+
+    __slots__ = ("method", "qty", "unit", "head", "quantity", "cost", "realised", "shortfall")
+
+    def __init__(self, method: str = DEFAULT_METHOD, lots: Sequence[Tuple[float, float]] = (),
+                 realised: float = 0.0):
+        if method not in METHODS:
+            raise ValueError(f"Unknown cost basis method: {method}")
+        self.method = method
+        self.qty, self.unit, self.head = array("d"), array("d"), 0
+        self.quantity = self.cost = 0.0
+        self.realised = realised
+        self.shortfall = 0.0
+        for q, u in lots:
+            self.qty.append(q)
+            self.unit.append(u)
+            self.quantity += q
+            self.cost += q * u
+
+    def lots(self) -> List[Tuple[float, float]]:
+        return list(zip(self.qty[self.head:], self.unit[self.head:]))
+
+    def buy(self, quantity: float, price: float) -> None:
+        if quantity <= 0:
+            return
+        if self.method == "AVERAGE" and len(self.qty) > self.head:
+            i = len(self.qty) - 1
+            total = self.qty[i] * self.unit[i] + quantity * price
+            self.qty[i] += quantity
+            self.unit[i] = total / self.qty[i]
+        else:
+            self.qty.append(quantity)
+            self.unit.append(price)
+        self.quantity += quantity
+        self.cost += quantity * price
+
+    def sell(self, quantity: float, price: float) -> Tuple[float, float]:
+        """Close up to quantity units at price. Returns (cost basis closed, realised profit)."""
+        if quantity > self.quantity:
+            if quantity - self.quantity > OVERSELL_TOLERANCE * quantity:
+                self.shortfall += quantity - self.quantity
+            quantity = self.quantity
+        remaining, closed = quantity, 0.0
+        qty, unit = self.qty, self.unit
+        if self.method == "LIFO":
+            while remaining > EPSILON and len(qty) > self.head:
+                take = min(remaining, qty[-1])
+                closed += take * unit[-1]
+                remaining -= take
+                if qty[-1] - take <= EPSILON:
+                    qty.pop()
+                    unit.pop()
+                else:
+                    qty[-1] -= take
+        else:
+            while remaining > EPSILON and self.head < len(qty):
+                take = min(remaining, qty[self.head])
+                closed += take * unit[self.head]
+                remaining -= take
+                if qty[self.head] - take <= EPSILON:
+                    self.head += 1
+                else:
+                    qty[self.head] -= take
+            if self.head > 1024 and self.head * 2 > len(qty):
+                del qty[:self.head]
+                del unit[:self.head]
+                self.head = 0
+
+        self.quantity -= quantity
+        self.cost -= closed
+        if self.quantity <= EPSILON or len(qty) == self.head:
+            self.quantity = self.cost = 0.0
+        realised = quantity * price - closed
+        self.realised += realised
+        return closed, realised
+
+    def pack(self) -> bytes:
+        return self.qty[self.head:].tobytes() + self.unit[self.head:].tobytes()
+
+    @classmethod
+    def unpack(cls, method: str, blob: bytes, realised: float = 0.0) -> "LotBook":
+        values = array("d")
+        values.frombytes(bytes(blob or b""))
+        half = len(values) // 2
+        return cls(method, zip(values[:half], values[half:]), realised)
+
+
+def replay(book: LotBook, types: Sequence[str], quantities: Sequence[float], prices: Sequence[float],
+           oversold: Optional[List[int]] = None):
+    """
+    Apply ledger rows to book in order. Returns per-row (cost_basis, realised)
+    lists; buys report their own cost and zero realised. Indexes of sells that
+    exceeded the open quantity are appended to oversold when given.
+    """
+    costs, realised = [0.0] * len(types), [0.0] * len(types)
+    buy, sell = book.buy, book.sell
+    for i, (kind, q, p) in enumerate(zip(types, quantities, prices)):
+        if kind == "BUY":
+            buy(q, p)
+            costs[i] = q * p
+        else:
+            short = book.shortfall
+            costs[i], realised[i] = sell(q, p)
+            if oversold is not None and book.shortfall != short:
+                oversold.append(i)
+    return costs, realised
+
+
+def user_method(user_id) -> str:
+    method = User.objects.filter(id=user_id).values_list("cost_basis_method", flat=True).first()
+    return method if method in METHODS else DEFAULT_METHOD
+
+
+def _ledger_rows(queryset) -> List[tuple]:
+    """
+    LEDGER_ROW tuples straight from the cursor. Django's per-value converters
+    (UUIDs, quantized Decimals, aware datetimes) were most of a 100k-row
+    rebuild; the replay works in floats, so only rows that become checkpoints
+    or rewritten sells are converted (_row_time, and the UUID field on write).
+    """
+    sql, params = queryset.values_list(*LEDGER_ROW).query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _row_time(value) -> datetime:
+    if isinstance(value, datetime):
+        return value if timezone.is_aware(value) else timezone.make_aware(value, dt_timezone.utc)
+    return timezone.make_aware(parse_datetime(value), dt_timezone.utc)
+
+
+def _ledger_days(times: Sequence) -> np.ndarray:
+    """
+    UTC dates as datetime64[D]. Raw rows carry naive UTC datetimes (SQLite),
+    aware ones, or 'YYYY-MM-DD HH:MM:SS' strings; naive values convert in one
+    NumPy call.
+    """
+    if not times:
+        return np.empty(0, dtype="datetime64[D]")
+    if isinstance(times[0], str):
+        return np.array([t[:10] for t in times], dtype="datetime64[D]")
+    if timezone.is_naive(times[0]):
+        return np.array(times, dtype="datetime64[us]").astype("datetime64[D]")
+    return day_numbers(times).astype("datetime64[D]")
+
+
+def _state(book: LotBook, user_id, simulation_id, coin_id, position: int, row) -> LotState:
+    return LotState(
+        user_id=user_id, simulation_id=simulation_id, coin_id=coin_id, method=book.method,
+        position=position, last_time=_row_time(row[5]), last_tx_id=row[0],
+        quantity=_dec(book.quantity), cost=_dec(book.cost), realised=_dec(book.realised), lots=book.pack(),
+    )
+
+
+def _sync_holding(user_id, simulation_id, coin_id, book: LotBook) -> None:
+    if book.quantity > EPSILON:
+        Holding.objects.update_or_create(
+            user_id=user_id, simulation_id=simulation_id, coin_id=coin_id,
+            defaults={
+                "quantity": Decimal(str(round(book.quantity, 12))),
+                "avg_price": _dec(book.cost / book.quantity),
+                "avg_price_currency": "USD",
+            },
+        )
+    else:
+        Holding.objects.filter(user_id=user_id, simulation_id=simulation_id, coin_id=coin_id).delete()
+
+
+def _write_sell_results(changed: Sequence[Tuple]) -> None:
+    """
+    Write (tx_id, cost_basis, realised_profit) back to sell rows with one
+    executemany UPDATE; bulk_update's per-row CASE expressions dominate the
+    replay time on large ledgers.
+    """
+    if not changed:
+        return
+    conn = connections[router.db_for_write(Transaction)]
+    meta = Transaction._meta
+    pk, cost_field, profit_field = meta.pk, meta.get_field("cost_basis"), meta.get_field("realised_profit")
+    qn = conn.ops.quote_name
+    sql = (
+        f"UPDATE {qn(meta.db_table)} SET {qn(cost_field.column)} = %s, {qn(profit_field.column)} = %s, "
+        f"{qn(meta.get_field('realised_profit_currency').column)} = %s WHERE {qn(pk.column)} = %s"
+    )
+    params = [
+        (
+            cost_field.get_db_prep_save(cost, conn),
+            profit_field.get_db_prep_save(gain, conn),
+            "USD",
+            pk.get_db_prep_value(tx_id, conn),
+        )
+        for tx_id, cost, gain in changed
+    ]
+    with conn.cursor() as cursor:
+        for start in range(0, len(params), LOT_BATCH_SIZE * 10):
+            cursor.executemany(sql, params[start:start + LOT_BATCH_SIZE * 10])
+
+
+def rebuild_lots(user_id, simulation_id, coin_id, from_time=None, method: Optional[str] = None) -> Dict[str, object]:
+    """
+    Bring one (user, simulation, coin) ledger's lot state up to date after a
+    change at from_time (None replays everything).
+
+    Replay starts from the latest checkpoint strictly before from_time, so an
+    append only applies the new row. Sell rows whose cost basis or realised
+    profit change are rewritten in USD, checkpoints past the start are
+    replaced, and the Holding row is synced to the open lots. Call inside the
+    transaction that changed the ledger. Replayed sells that exceeded the
+    open quantity are returned as "oversold" ids; callers that can refuse
+    the change should roll it back.
+    """
+    method = method or user_method(user_id)
+    states = LotState.objects.filter(user_id=user_id, simulation_id=simulation_id, coin_id=coin_id, method=method)
+    known = list(states.values_list("id", "position", "last_time"))
+    base_id, base_position = None, 0
+    if from_time is not None:
+        earlier = [s for s in known if s[2] < from_time]
+        if earlier:
+            base_id, base_position, _ = max(earlier, key=lambda s: s[1])
+
+    ledger = Transaction.objects.filter(user_id=user_id, simulation_id=simulation_id, coin_id=coin_id)
+    if base_id is not None:
+        base = states.get(id=base_id)
+        book = LotBook.unpack(method, base.lots, float(base.realised))
+        ledger = ledger.filter(Q(time__gt=base.last_time) | Q(time=base.last_time, id__gt=base.last_tx_id))
+    else:
+        book = LotBook(method)
+    rows = _ledger_rows(ledger.order_by("time", "id"))
+
+    days = _ledger_days([r[5] for r in rows])
+    currencies = [r[4] for r in rows]
+    if len(set(currencies)) == 1:
+        currencies = currencies[0]  # one code converts without the per-row grouping
+    prices = convert_at_dates([float(r[3]) for r in rows], days, currencies, "USD").tolist() if rows else []
+    types = [r[1] for r in rows]
+    quantities = [float(r[2]) for r in rows]
+
+    new_states, changed, oversold = [], [], []
+    i = 0
+    while i < len(rows):
+        # Replay up to the next checkpoint boundary (or the end of the ledger).
+        stop = min(len(rows), i + CHECKPOINT_INTERVAL - (base_position + i) % CHECKPOINT_INTERVAL)
+        short = []
+        costs, realised = replay(book, types[i:stop], quantities[i:stop], prices[i:stop], short)
+        oversold.extend(rows[i + j][0] for j in short)
+        for row, cost, gain in zip(rows[i:stop], costs, realised):
+            if row[1] == "BUY":
+                continue
+            # Stored values are the 10-dp roundings written by _dec, read back through SQLite's own text-to-real
+            # parse, which can be an ulp off; anything within that is unchanged.
+            if (abs(float(row[6]) - cost) > ROUNDING + FLOAT_SLACK * abs(cost)
+                    or abs(float(row[7]) - gain) > ROUNDING + FLOAT_SLACK * abs(gain) or row[8] != "USD"):
+                changed.append((row[0], _dec(cost), _dec(gain)))
+        new_states.append(_state(book, user_id, simulation_id, coin_id, base_position + stop, rows[stop - 1]))
+        i = stop
+
+    # Interval checkpoints up to the base survive; later ones and superseded heads are replaced.
+    stale = [sid for sid, pos, _ in known
+             if pos > base_position or (pos % CHECKPOINT_INTERVAL and (rows or sid != base_id))]
+    LotState.objects.filter(id__in=stale).delete()
+    LotState.objects.bulk_create(new_states, batch_size=LOT_BATCH_SIZE)
+    _write_sell_results(changed)
+    _sync_holding(user_id, simulation_id, coin_id, book)
+    if oversold:
+        logger.warning(f"Ledger {user_id}/{simulation_id}/{coin_id} sells {book.shortfall} more than it holds "
+                       f"({len(oversold)} sells)")
+    return {"book": book, "replayed": len(rows), "changed": [c[0] for c in changed], "oversold": oversold}
+
+
+def apply_transaction(tx) -> Dict[str, object]:
+    """Update lot state for a newly written transaction (an append replays one row)."""
+    return rebuild_lots(tx.user_id, tx.simulation_id, tx.coin_id, from_time=tx.time)
+
+
+def rebuild_user_lots(user_id, method: Optional[str] = None) -> int:
+    """Full replay of every ledger owned by a user, e.g. after a cost basis method change."""
+    keys = (
+        Transaction.objects.filter(user_id=user_id)
+        .values_list("simulation_id", "coin_id").distinct().order_by()
+    )
+    method = method or user_method(user_id)
+    LotState.objects.filter(user_id=user_id).exclude(method=method).delete()
+    count = 0
+    for simulation_id, coin_id in keys:
+        rebuild_lots(user_id, simulation_id, coin_id, method=method)
+        count += 1
+    return count
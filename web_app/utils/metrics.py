@@ -0,0 +1,197 @@
+import hashlib
+import logging
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Max, Sum
+from django.utils import timezone
+
+from ..models import PortfolioSnapshot, Transaction, User
+from .coingecko import CACHE_TIMEOUT
+from .currency import normalise
+from .series import ENDED_SERIES_TIMEOUT, MS_PER_DAY, simulation_series
+
+logger = logging.getLogger(__name__)
+
+METRICS_CACHE_KEY = "risk_metrics_{scope}_{currency}_{digest}"
+PORTFOLIO_METRICS_TIMEOUT = 24 * 60 * 60
+MS_PER_YEAR = 365 * MS_PER_DAY
+RISK_FREE_RATE = 0.0  # annual; crypto metrics are conventionally quoted against cash at 0%
+EPSILON = 1e-9
+
+
+def period_returns(t_ms: np.ndarray, value: np.ndarray, invested: np.ndarray):
+    """
+    Flow-adjusted returns between consecutive points: the change in value
+    less the cash put in (or taken out) over the period, relative to the
+    value at its start. Periods starting from nothing are skipped. Returns
+    (returns, timestamps) where timestamps has one more entry than returns:
+    the start of the first counted period followed by each period's end.
+    """
+    t_ms, value, invested = (np.asarray(a, dtype=np.float64) for a in (t_ms, value, invested))
+    if len(value) < 2:
+        return np.empty(0), t_ms[:1]
+    prev, flow = value[:-1], np.diff(invested)
+    live = prev > EPSILON
+    returns = (value[1:][live] - flow[live]) / prev[live] - 1.0
+    times = np.concatenate([t_ms[:-1][live][:1], t_ms[1:][live]])
+    return returns, times
+
+
+def risk_metrics(t_ms: Sequence, value: Sequence, invested: Sequence,
+                 risk_free: float = RISK_FREE_RATE) -> Dict[str, object]:
+    """
+    Time-weighted total return, annualised volatility, Sharpe and Sortino
+    ratios, and the depth and duration of the worst drawdown of a value
+    series with external cash flows. Annualisation uses the series' own
+    (median) spacing, so hourly and daily series are comparable.
+    """
+    returns, times = period_returns(np.asarray(t_ms), np.asarray(value), np.asarray(invested))
+    result = {
+        "periods": int(len(returns)), "periods_per_year": None, "total_return_pct": None, "volatility_pct": None,
+        "sharpe": None, "sortino": None, "max_drawdown_pct": None, "max_drawdown_days": None,
+    }
+    if not len(returns):
+        return result
+
+    growth = np.concatenate([[1.0], np.cumprod(1.0 + returns)])
+    peak = np.maximum.accumulate(growth)
+    drawdown = growth / peak - 1.0
+    # Index of the latest peak at or before each point; the longest gap to it is the longest time underwater.
+    last_peak = np.maximum.accumulate(np.where(drawdown >= 0, np.arange(len(growth)), 0))
+    underwater_ms = times - times[last_peak]
+    result.update(
+        total_return_pct=round(float(growth[-1] - 1.0) * 100, 4),
+        max_drawdown_pct=round(float(drawdown.min()) * 100, 4),
+        max_drawdown_days=round(float(underwater_ms.max()) / MS_PER_DAY, 2),
+    )
+    if len(returns) < 2:
+        return result
+
+    per_year = MS_PER_YEAR / max(float(np.median(np.diff(times))), 1.0)
+    excess = returns - risk_free / per_year
+    volatility = float(returns.std(ddof=1)) * np.sqrt(per_year)
+    downside = float(np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2))) * np.sqrt(per_year)
+    annual_excess = float(excess.mean()) * per_year
+    result.update(
+        periods_per_year=round(per_year, 2),
+        volatility_pct=round(volatility * 100, 4),
+        sharpe=round(annual_excess / volatility, 4) if volatility > EPSILON else None,
+        sortino=round(annual_excess / downside, 4) if downside > EPSILON else None,
+    )
+    return result
+
+
+def ledger_fingerprints(simulation_ids: Sequence) -> Dict[object, str]:
+    """
+    One GROUP BY over the simulations' transactions: count, latest time and
+    quantity/price sums identify the transaction set well enough to key a
+    cache, since any insert, delete, backfill or price fill moves one of them.
+    """
+    rows = (
+        Transaction.objects.filter(simulation_id__in=list(simulation_ids))
+        .values("simulation_id")
+        .annotate(n=Count("id"), last=Max("time"), qty=Sum("quantity"), px=Sum("price"))
+        .order_by()
+    )
+    prints = {sid: "0" for sid in simulation_ids}
+    for r in rows:
+        prints[r["simulation_id"]] = f"{r['n']}:{r['last'].isoformat()}:{r['qty']}:{r['px']}"
+    return prints
+
+
+def price_watermark(simulation, now=None) -> str:
+    """
+    How current the prices behind a simulation's series are: an ended
+    simulation's prices stop at its end date; a running one's are as fresh as
+    the CACHE_TIMEOUT bucket the chart cache is in.
+    """
+    now = now or timezone.now()
+    if simulation.end_date and simulation.end_date < now.date():
+        return f"ended:{simulation.end_date.isoformat()}"
+    return f"live:{int(now.timestamp()) // CACHE_TIMEOUT}"
+
+
+def _key(scope: str, currency: str, fingerprint: str, watermark: str) -> str:
+    digest = hashlib.sha1(f"{fingerprint}|{watermark}".encode()).hexdigest()
+    return METRICS_CACHE_KEY.format(scope=scope, currency=currency, digest=digest)
+
+
+def simulation_metrics_key(simulation, currency: str, fingerprint: str, now=None) -> str:
+    return _key(f"sim_{simulation.id}", normalise(currency), fingerprint, price_watermark(simulation, now))
+
+
+def simulation_metrics(simulation, currency: str) -> Dict[str, object]:
+    """Risk/return metrics of a simulation's value series, cached per (transaction set, price watermark)."""
+    currency = normalise(currency)
+    fingerprint = ledger_fingerprints([simulation.id])[simulation.id]
+    key = simulation_metrics_key(simulation, currency, fingerprint)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    series = simulation_series(simulation, currency)
+    result = {
+        "simulation_id": str(simulation.id),
+        "currency": currency,
+        "missing": series["missing"],
+        **risk_metrics(series["t"], series["value"], series["invested"]),
+    }
+    ended = price_watermark(simulation).startswith("ended")
+    cache.set(key, result, ENDED_SERIES_TIMEOUT if ended else CACHE_TIMEOUT)
+    return result
+
+
+def cached_simulation_metrics(simulations: Sequence) -> Dict[object, Optional[Dict[str, object]]]:
+    """
+    Already-computed metrics for a batch of simulations, in their owners'
+    currencies, without computing any: one fingerprint GROUP BY, one currency
+    lookup and one cache get_many. Simulations not cached yet map to None.
+    """
+    simulations = list(simulations)
+    if not simulations:
+        return {}
+    prints = ledger_fingerprints([s.id for s in simulations])
+    currencies = dict(
+        User.objects.filter(id__in={s.user_id for s in simulations}).values_list("id", "preferred_currency")
+    )
+    now = timezone.now()
+    keys = {
+        s.id: simulation_metrics_key(s, normalise(currencies.get(s.user_id)), prints[s.id], now)
+        for s in simulations
+    }
+    found = cache.get_many(list(keys.values()))
+    return {sid: found.get(key) for sid, key in keys.items()}
+
+
+def portfolio_metrics(user, currency: str) -> Dict[str, object]:
+    """
+    Risk/return metrics of the live portfolio from its daily snapshots, with
+    each day's cash flow taken from the change in cost basis net of realised
+    P&L. Cached per (transaction set, latest snapshot write).
+    """
+    currency = normalise(currency)
+    ledger = Transaction.objects.filter(user=user, simulation=None).aggregate(
+        n=Count("id"), last=Max("time"), qty=Sum("quantity"), px=Sum("price")
+    )
+    snapshots = PortfolioSnapshot.objects.filter(user=user, simulation=None, currency=currency)
+    mark = snapshots.aggregate(n=Count("id"), day=Max("date"), written=Max("updated_at"))
+    key = _key(f"user_{user.id}", currency,
+               "{n}:{last}:{qty}:{px}".format(**ledger), "{n}:{day}:{written}".format(**mark))
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    rows = list(snapshots.order_by("date").values_list("date", "value", "cost_basis", "realised_profit"))
+    days = np.asarray([r[0].toordinal() for r in rows], dtype=np.float64) * MS_PER_DAY
+    value = np.asarray([float(r[1]) for r in rows])
+    flows_in = np.asarray([float(r[2]) - float(r[3]) for r in rows])
+    result = {
+        "simulation_id": None,
+        "currency": currency,
+        "start": rows[0][0].isoformat() if rows else None,
+        "end": rows[-1][0].isoformat() if rows else None,
+        **risk_metrics(days, value, flows_in),
+    }
+    cache.set(key, result, PORTFOLIO_METRICS_TIMEOUT)
+    return result
@@ -0,0 +1,225 @@
+import logging
+from decimal import Decimal
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from django.db.models import Case, Count, DecimalField, F, Sum, Value, When
+from django.utils import timezone
+
+from ..models import PortfolioSummary, Transaction
+from .currency import convert_at_dates, convert_rows, normalise
+from .prices import live_quotes
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal("0")
+_MONEY = DecimalField(max_digits=40, decimal_places=20)
+
+# Open cost basis contributed by each ledger row: buys add their cost, sells remove the cost they closed.
+_COST_DELTA = Case(
+    When(type="BUY", cost_basis=0, then=F("quantity") * F("price")),
+    When(type="BUY", then=F("cost_basis")),
+    default=Value(-1) * F("cost_basis"),
+    output_field=_MONEY,
+)
+
+
+def realised_total_in(user, currency: str, simulation=None) -> float:
+    """Realised profit in currency, each sell converted at the FX rate of its own date (one pass)."""
+    rows = list(
+        Transaction.objects.filter(user=user, simulation=simulation)
+        .exclude(realised_profit=0)
+        .values_list("realised_profit", "realised_profit_currency", "time")
+    )
+    if not rows:
+        return 0.0
+    profits, currencies, times = zip(*rows)
+    return round(float(convert_at_dates(profits, times, currencies, currency).sum()), 10)
+
+
+def ledger_totals(queryset) -> Dict[Tuple, Dict[str, Decimal]]:
+    """Realised total, open cost basis and trade count per (user_id, simulation_id) in one GROUP BY."""
+    rows = (
+        queryset.values("user_id", "simulation_id")
+        .annotate(realised=Sum("realised_profit"), cost=Sum(_COST_DELTA), count=Count("id"))
+        .order_by()
+    )
+    return {
+        (r["user_id"], r["simulation_id"]): {
+            "realised_total": r["realised"] or ZERO,
+            "total_cost_basis": r["cost"] or ZERO,
+            "trade_count": r["count"],
+        }
+        for r in rows
+    }
+
+
+def rebuild_summary(user, simulation=None) -> PortfolioSummary:
+    """Recompute one summary row from the ledger (used on first access and for repair)."""
+    totals = ledger_totals(Transaction.objects.filter(user=user, simulation=simulation)).get(
+        (user.id, getattr(simulation, "id", None)),
+        {"realised_total": ZERO, "total_cost_basis": ZERO, "trade_count": 0},
+    )
+    summary, _ = PortfolioSummary.objects.update_or_create(
+        user=user, simulation=simulation,
+        defaults={**totals, "realised_local": ZERO, "local_currency": ""},
+    )
+    return summary
+
+
+def rebuild_all_summaries() -> int:
+    """Repair: rebuild every summary row from the ledger and drop rows whose ledger is empty."""
+    totals = ledger_totals(Transaction.objects.all())
+    existing = {(s.user_id, s.simulation_id): s for s in PortfolioSummary.objects.all()}
+    now = timezone.now()
+    to_create, to_update = [], []
+    for key, values in totals.items():
+        summary = existing.pop(key, None) or PortfolioSummary(user_id=key[0], simulation_id=key[1])
+        for field, value in values.items():
+            setattr(summary, field, value)
+        summary.realised_local, summary.local_currency, summary.updated_at = ZERO, "", now
+        (to_create if summary._state.adding else to_update).append(summary)
+    PortfolioSummary.objects.bulk_create(to_create, batch_size=1000)
+    PortfolioSummary.objects.bulk_update(
+        to_update,
+        ["realised_total", "total_cost_basis", "trade_count", "realised_local", "local_currency", "updated_at"],
+        batch_size=1000,
+    )
+    PortfolioSummary.objects.filter(id__in=[s.id for s in existing.values()]).delete()
+    return len(totals)
+
+
+def get_summary(user, simulation=None) -> PortfolioSummary:
+    summary = PortfolioSummary.objects.filter(user=user, simulation=simulation).first()
+    return summary or rebuild_summary(user, simulation)
+
+
+def record_trade(user, simulation, cost_delta: Decimal, realised_delta: Decimal = ZERO,
+                 realised_local_delta: Optional[Decimal] = None, local_currency: Optional[str] = None,
+                 trades: int = 1) -> None:
+    """
+    Apply one trade (or the summed deltas of `trades` trades) to the running
+    summary. Call inside the same atomic block that writes the Transactions.
+    A missing summary is rebuilt from the ledger, which already includes the
+    new rows.
+    """
+    summary = PortfolioSummary.objects.select_for_update().filter(user=user, simulation=simulation).first()
+    if summary is None:
+        rebuild_summary(user, simulation)
+        return
+
+    updates = {
+        "realised_total": F("realised_total") + realised_delta,
+        "total_cost_basis": F("total_cost_basis") + cost_delta,
+        "trade_count": F("trade_count") + trades,
+        "updated_at": timezone.now(),
+    }
+    if realised_delta:
+        if realised_local_delta is not None and summary.local_currency == normalise(local_currency):
+            updates["realised_local"] = F("realised_local") + realised_local_delta
+        else:
+            updates["local_currency"] = ""
+    PortfolioSummary.objects.filter(pk=summary.pk).update(**updates)
+
+
+def invalidate_summary(user, simulation=None) -> None:
+    """Drop the summary so the next read rebuilds it from the ledger."""
+    PortfolioSummary.objects.filter(user=user, simulation=simulation).delete()
+
+
+def realised_local(summary: PortfolioSummary, currency: str) -> float:
+    """Local-currency realised total, recomputed from the ledger only when the cached currency differs."""
+    currency = normalise(currency)
+    if summary.local_currency != currency:
+        value = realised_total_in(summary.user, currency, summary.simulation)
+        PortfolioSummary.objects.filter(pk=summary.pk).update(
+            realised_local=Decimal(str(value)), local_currency=currency
+        )
+        summary.realised_local, summary.local_currency = Decimal(str(value)), currency
+    return float(summary.realised_local)
+
+
+def _money(value) -> Optional[float]:
+    return round(float(value), 2) if np.isfinite(value) else None
+
+
+def value_holdings(holdings: Sequence, currency: str) -> Tuple[Dict[str, dict], Dict[str, object]]:
+    """
+    Live valuation of holdings in currency with one batched price lookup.
+
+    Returns (per-holding fields keyed by holding id, portfolio totals). Holdings
+    without a live quote get null valuation fields and are left out of the
+    market value totals; their cost still counts in cost_basis. Holdings whose
+    cost basis has no FX rate into currency get null cost fields, are listed
+    in "unconverted" and are left out of cost_basis and unrealised_pnl.
+    """
+    currency = normalise(currency)
+    holdings = list(holdings)
+    totals = {
+        "currency": currency, "market_value": 0.0, "cost_basis": 0.0, "unrealised_pnl": 0.0,
+        "unrealised_pnl_pct": None, "change_24h_value": 0.0, "change_24h_pct": None,
+        "unpriced": [], "unconverted": [],
+    }
+    if not holdings:
+        return {}, totals
+
+    rows = convert_rows(
+        [{"avg_price": h.avg_price, "avg_price_currency": h.avg_price_currency} for h in holdings],
+        ["avg_price"], currency, currency_field="avg_price_currency",
+    )
+    quotes = live_quotes([h.coin_id for h in holdings], currency)
+
+    qty = np.asarray([float(h.quantity) for h in holdings], dtype=np.float64)
+    # A cost basis without an FX rate into currency is unknown rather than mislabelled.
+    converted = np.asarray([r["avg_price_currency"] == currency for r in rows], dtype=bool)
+    avg = np.where(converted, [float(r["avg_price"]) for r in rows], np.nan)
+    price = np.asarray([quotes.get(h.coin_id, {}).get("price", np.nan) for h in holdings], dtype=np.float64)
+    pct = np.asarray(
+        [np.nan if quotes.get(h.coin_id, {}).get("change_24h_pct") is None else quotes[h.coin_id]["change_24h_pct"]
+         for h in holdings],
+        dtype=np.float64,
+    )
+
+    cost = qty * avg
+    value = qty * price
+    unrealised = value - cost
+    # Value 24h ago is value / (1 + pct); the change is the difference.
+    change = np.where(np.isnan(pct), np.nan, value - value / (1 + pct / 100))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        unrealised_pct = np.where(cost > 0, unrealised / cost * 100, np.nan)
+
+    per_holding = {
+        str(h.id): {
+            "current_price": None if np.isnan(price[i]) else float(price[i]),
+            "market_value": _money(value[i]),
+            "cost_basis": _money(cost[i]),
+            "unrealised_pnl": _money(unrealised[i]),
+            "unrealised_pnl_pct": _money(unrealised_pct[i]),
+            "change_24h_pct": None if np.isnan(pct[i]) else float(pct[i]),
+            "change_24h_value": _money(change[i]),
+            "valuation_currency": currency,
+        }
+        for i, h in enumerate(holdings)
+    }
+
+    priced = ~np.isnan(price)
+    market_value = float(value[priced].sum())
+    priced_cost = float(cost[priced & converted].sum())
+    market_value_costed = float(value[priced & converted].sum())
+    change_total = float(np.nansum(change[priced]))
+    totals.update({
+        "market_value": round(market_value, 2),
+        "cost_basis": round(float(np.nansum(cost)), 2),
+        "unrealised_pnl": round(market_value_costed - priced_cost, 2),
+        "unrealised_pnl_pct": (
+            _money((market_value_costed - priced_cost) / priced_cost * 100) if priced_cost > 0 else None
+        ),
+        "change_24h_value": round(change_total, 2),
+        "change_24h_pct": (
+            _money(change_total / (market_value - change_total) * 100) if market_value - change_total > 0 else None
+        ),
+        "unpriced": sorted({h.coin_id for h, ok in zip(holdings, priced) if not ok}),
+        "unconverted": sorted({h.coin_id for h, ok in zip(holdings, converted) if not ok}),
+    })
+    return per_holding, totals
@@ -0,0 +1,94 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from typing import Dict
+
+from django.db import transaction as dbtx
+from django.db.models import Q
+from django.utils import timezone
+
+from ..models import Transaction
+from .imports import fill_missing_prices
+from .lots import rebuild_lots
+from .portfolio import invalidate_summary
+from .series import invalidate_simulation_series
+from .snapshots import schedule_snapshot_update_from
+from .timeline import drop_simulation_index
+
+logger = logging.getLogger(__name__)
+
+PRICE_FILL_BATCH = 1000
+RETRY_BASE = timedelta(minutes=5)  # doubled per failed attempt
+RETRY_MAX = timedelta(days=1)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return min(RETRY_BASE * 2 ** max(attempts - 1, 0), RETRY_MAX)
+
+
+def _back_off(unresolved, now) -> None:
+    by_attempts = defaultdict(list)
+    for p in unresolved:
+        by_attempts[p["price_attempts"] + 1].append(p["id"])
+    for attempts, ids in by_attempts.items():
+        Transaction.objects.filter(id__in=ids, price_status="PENDING").update(
+            price_attempts=attempts, price_retry_at=now + retry_delay(attempts)
+        )
+
+
+def fill_pending_prices(limit: int = PRICE_FILL_BATCH) -> Dict[str, int]:
+    """
+    Resolve prices for up to `limit` PENDING transactions.
+
+    Rows are priced from historical charts with one market_chart request per
+    (coin, currency), outside any DB transaction. The resolved rows are then
+    written with one bulk update, and each affected ledger is replayed from
+    its earliest filled trade. Summaries, series and time-travel indexes are
+    refreshed once per portfolio. Rows without a price (no chart data yet, or
+    upstream errors) stay PENDING but are not selected again until their
+    retry time, which backs off exponentially up to a day, so a looping
+    worker moves on to rows it can resolve.
+    """
+    now = timezone.now()
+    pending = list(
+        Transaction.objects.filter(price_status="PENDING")
+        .filter(Q(price_retry_at__isnull=True) | Q(price_retry_at__lte=now))
+        .order_by("coin_id", "time")
+        .values("id", "coin_id", "price_currency", "time", "price_attempts")[:limit]
+    )
+    report = {"pending": len(pending), "filled": 0, "unresolved": 0}
+    if not pending:
+        return report
+    rows = [{"coin_id": p["coin_id"], "currency": p["price_currency"], "time": p["time"], "price": None}
+            for p in pending]
+    fill_missing_prices(rows)
+    resolved = {p["id"]: r["price"] for p, r in zip(pending, rows) if r["price"] is not None}
+    _back_off([p for p in pending if p["id"] not in resolved], now)
+
+    with dbtx.atomic():
+        # Re-read under lock; rows filled or deleted meanwhile are skipped.
+        txs = list(Transaction.objects.select_for_update().filter(id__in=list(resolved), price_status="PENDING"))
+        for tx in txs:
+            tx.price, tx.price_status = resolved[tx.id], "FILLED"
+        Transaction.objects.bulk_update(txs, ["price", "price_status"], batch_size=PRICE_FILL_BATCH)
+
+        ledgers, portfolios = {}, {}
+        for tx in txs:
+            ledger, portfolio = (tx.user_id, tx.simulation_id, tx.coin_id), (tx.user_id, tx.simulation_id)
+            ledgers[ledger] = min(ledgers.get(ledger, tx.time), tx.time)
+            portfolios[portfolio] = min(portfolios.get(portfolio, tx.time), tx.time)
+        for (user_id, simulation_id, coin_id), from_time in ledgers.items():
+            rebuild_lots(user_id, simulation_id, coin_id, from_time=from_time)
+        for (user_id, simulation_id), from_time in portfolios.items():
+            invalidate_summary(user_id, simulation_id)
+            invalidate_simulation_series(simulation_id)
+            drop_simulation_index(simulation_id)
+            schedule_snapshot_update_from(user_id, simulation_id, from_time)
+
+    report["filled"] = len(txs)
+    report["unresolved"] = len(pending) - len(resolved)
+    logger.info(
+        f"Filled {report['filled']} of {report['pending']} pending prices "
+        f"across {len({p['coin_id'] for p in pending})} coins"
+    )
+    return report
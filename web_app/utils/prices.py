@@ -0,0 +1,94 @@
+import logging
+from datetime import timedelta
+from typing import Dict, Optional, Sequence
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from ..models import Coin, CurrentPrice
+from .coingecko import CACHE_TIMEOUT, get_markets
+from .currency import normalise
+
+logger = logging.getLogger(__name__)
+
+LIVE_QUOTE_CACHE_KEY = "live_quote_{currency}_{coin_id}"
+
+
+def _quote(price, change_24h=None, source: str = "market") -> Optional[Dict[str, object]]:
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None
+    if price != price or price < 0:
+        return None
+    try:
+        change_24h = float(change_24h) if change_24h is not None else None
+    except (TypeError, ValueError):
+        change_24h = None
+    return {"price": price, "change_24h_pct": change_24h, "source": source}
+
+
+def _db_quotes(coin_ids: Sequence[str], currency: str, max_age: Optional[int]) -> Dict[str, dict]:
+    """CurrentPrice rows in currency (fresher than max_age seconds when given), one query."""
+    qs = CurrentPrice.objects.filter(coin_id__in=coin_ids, currency__iexact=currency)
+    if max_age is not None:
+        qs = qs.filter(last_updated__gte=timezone.now() - timedelta(seconds=max_age))
+    changes = dict(Coin.objects.filter(id__in=coin_ids).values_list("id", "price_change_24h"))
+    quotes = {}
+    for coin_id, price in qs.values_list("coin_id", "price"):
+        quote = _quote(price, changes.get(coin_id), source="db")
+        if quote:
+            quotes[coin_id] = quote
+    return quotes
+
+
+def live_quotes(coin_ids: Sequence[str], currency: str) -> Dict[str, dict]:
+    """
+    Current price and 24h change for many coins in one pass.
+
+    Each coin is resolved from the per-coin quote cache, then a fresh
+    CurrentPrice row, and only the remainder is fetched from CoinGecko in a
+    single /coins/markets call. If that call fails, stale CurrentPrice rows are
+    used. Coins without any quote are left out of the result.
+    """
+    currency = normalise(currency)
+    coin_ids = sorted({cid for cid in coin_ids if cid})
+    if not coin_ids:
+        return {}
+
+    keys = {LIVE_QUOTE_CACHE_KEY.format(currency=currency, coin_id=cid): cid for cid in coin_ids}
+    quotes = {keys[k]: v for k, v in cache.get_many(list(keys)).items()}
+
+    missing = [cid for cid in coin_ids if cid not in quotes]
+    if missing:
+        quotes.update(_db_quotes(missing, currency, CACHE_TIMEOUT))
+        missing = [cid for cid in coin_ids if cid not in quotes]
+
+    if missing:
+        markets = get_markets({
+            "vs_currency": currency.lower(),
+            "ids": ",".join(missing),
+            "per_page": max(len(missing), 1),
+            "price_change_percentage": "24h",
+        }) or []
+        fetched = {}
+        for row in markets:
+            if not isinstance(row, dict) or row.get("id") not in missing:
+                continue
+            quote = _quote(row.get("current_price"), row.get("price_change_percentage_24h"))
+            if quote:
+                fetched[row["id"]] = quote
+        if fetched:
+            cache.set_many(
+                {LIVE_QUOTE_CACHE_KEY.format(currency=currency, coin_id=cid): q for cid, q in fetched.items()},
+                CACHE_TIMEOUT,
+            )
+            quotes.update(fetched)
+        missing = [cid for cid in coin_ids if cid not in quotes]
+
+    if missing:
+        stale = _db_quotes(missing, currency, None)
+        if stale:
+            logger.info(f"Using stale DB prices for {len(stale)} coins in {currency}")
+        quotes.update(stale)
+    return quotes
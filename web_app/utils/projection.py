@@ -0,0 +1,207 @@
+import hashlib
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from django.core.cache import cache
+from django.utils import timezone
+
+from ..models import Holding
+from .backtest import historical_prices
+from .coingecko import CACHE_TIMEOUT
+from .currency import normalise
+from .prices import live_quotes
+from .simulations import position_totals
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("bootstrap", "normal")
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+MAX_PROJECTION_PATHS = 10_000
+MAX_PROJECTION_DAYS = 1825
+MIN_WINDOW_DAYS = 30
+MAX_WINDOW_DAYS = 1825
+MIN_RETURN_DAYS = 20
+RETURNS_CACHE_KEY = "projection_returns_{currency}_{window}_{end}_{coins}"
+
+
+class ProjectionSpecError(ValueError):
+    """The projection parameters or the positions are unusable; the message is safe to show to the user."""
+
+
+def _int(params, field: str, default: int, low: int, high: int) -> int:
+    raw = params.get(field)
+    try:
+        value = int(raw) if raw not in (None, "") else default
+    except (TypeError, ValueError):
+        raise ProjectionSpecError(f"{field} must be an integer")
+    if value < low or value > high:
+        raise ProjectionSpecError(f"{field} must be between {low} and {high}")
+    return value
+
+
+def parse_projection(params) -> Dict[str, object]:
+    """Validate projection query parameters (horizon_days, paths, window_days, method, seed, percentiles)."""
+    method = str(params.get("method") or "bootstrap").strip().lower()
+    if method not in METHODS:
+        raise ProjectionSpecError(f"method must be one of {', '.join(METHODS)}")
+    raw_pct = params.get("percentiles")
+    if raw_pct:
+        try:
+            percentiles = sorted({float(p) for p in str(raw_pct).split(",") if p.strip()})
+        except ValueError:
+            raise ProjectionSpecError("percentiles must be a comma separated list of numbers")
+        if not percentiles or percentiles[0] < 0 or percentiles[-1] > 100:
+            raise ProjectionSpecError("percentiles must be between 0 and 100")
+    else:
+        percentiles = list(DEFAULT_PERCENTILES)
+    seed = params.get("seed")
+    return {
+        "horizon_days": _int(params, "horizon_days", 365, 1, MAX_PROJECTION_DAYS),
+        "paths": _int(params, "paths", 5000, 100, MAX_PROJECTION_PATHS),
+        "window_days": _int(params, "window_days", 365, MIN_WINDOW_DAYS, MAX_WINDOW_DAYS),
+        "method": method,
+        "seed": _int(params, "seed", 0, 0, 2 ** 32 - 1) if seed not in (None, "") else None,
+        "percentiles": percentiles,
+    }
+
+
+def current_positions(user, simulation=None) -> Dict[str, float]:
+    """Open quantity per coin: the simulation's net trades, or the live portfolio's holdings."""
+    if simulation is not None:
+        totals = position_totals([simulation.id]).get(simulation.id, {})
+        return {cid: float(t["net"]) for cid, t in totals.items() if t["net"] > 0}
+    rows = Holding.objects.filter(user=user, simulation=None, quantity__gt=0).values_list("coin_id", "quantity")
+    return {cid: float(q) for cid, q in rows}
+
+
+def return_model(coin_ids: Sequence[str], currency: str, window_days: int) -> Dict[str, object]:
+    """
+    Daily log returns for a coin set over the trailing window, with what each
+    method needs precomputed: the gross-return rows for bootstrapping (days
+    where every priced coin moved, so cross-coin correlation is kept) and the
+    mean and Cholesky factor for the normal fit. Cached per coin set, currency,
+    window and day, so repeated projections only pay for the random draws.
+    """
+    currency = normalise(currency)
+    end = timezone.now().date()
+    fingerprint = hashlib.sha1(",".join(coin_ids).encode()).hexdigest()
+    key = RETURNS_CACHE_KEY.format(currency=currency, window=window_days, end=end, coins=fingerprint)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    prices = historical_prices(list(coin_ids), currency, end - timedelta(days=window_days), end)
+    priced = ~np.all(np.isnan(prices), axis=1)
+    log_returns = np.diff(np.log(prices[priced]), axis=1).T  # (days, priced coins)
+    log_returns = log_returns[np.all(np.isfinite(log_returns), axis=1)]
+
+    returns = np.zeros((len(log_returns), len(coin_ids)))
+    returns[:, priced] = log_returns  # coins without history are held flat
+    if len(returns) >= 2:
+        mean = returns.mean(axis=0)
+        # Jitter keeps the factorisation stable for flat or perfectly correlated coins.
+        cov = np.cov(returns, rowvar=False).reshape(len(coin_ids), len(coin_ids)) + np.eye(len(coin_ids)) * 1e-12
+        chol = np.linalg.cholesky(cov)
+    else:
+        mean, chol = np.zeros(len(coin_ids)), np.zeros((len(coin_ids), len(coin_ids)))
+    model = {
+        "growth": np.exp(returns),
+        "mean": mean,
+        "chol": chol,
+        "last_price": np.array([row[~np.isnan(row)][-1] if p else np.nan for row, p in zip(prices, priced)]),
+        "missing": [cid for cid, p in zip(coin_ids, priced) if not p],
+        "days": len(returns),
+    }
+    cache.set(key, model, CACHE_TIMEOUT)
+    return model
+
+
+def simulate_paths(model: Dict[str, object], start_values: np.ndarray, horizon_days: int, paths: int,
+                   method: str = "bootstrap", seed: Optional[int] = None) -> np.ndarray:
+    """
+    Portfolio value paths, shape (horizon_days + 1, paths), starting from
+    start_values (value per coin).
+
+    Each day every path draws one whole day of gross returns for all coins
+    (bootstrap resamples a historical day, normal draws correlated log
+    returns), multiplies its per-coin values in place and records their sum.
+    Work is one contiguous (paths, coins) float32 slab per day, so memory
+    does not grow with the horizon.
+    """
+    rng = np.random.default_rng(seed)
+    n_coins = len(start_values)
+    state = np.empty((paths, n_coins), dtype=np.float32)
+    state[:] = np.asarray(start_values, dtype=np.float32)
+    ones = np.ones(n_coins, dtype=np.float32)
+    values = np.empty((horizon_days + 1, paths), dtype=np.float32)
+    np.matmul(state, ones, out=values[0])
+
+    if method == "bootstrap":
+        growth = model["growth"].astype(np.float32)
+        days = rng.integers(0, len(growth), size=(horizon_days, paths))
+        step = np.empty_like(state)
+        for t in range(horizon_days):
+            np.take(growth, days[t], axis=0, out=step)
+            state *= step
+            np.matmul(state, ones, out=values[t + 1])
+    else:
+        chol_t = model["chol"].T.astype(np.float32)
+        mean = model["mean"].astype(np.float32)
+        for t in range(horizon_days):
+            step = rng.standard_normal((paths, n_coins), dtype=np.float32) @ chol_t
+            step += mean
+            np.exp(step, out=step)
+            state *= step
+            np.matmul(state, ones, out=values[t + 1])
+    return values
+
+
+def project(user, simulation, spec: Dict[str, object], currency: str) -> Dict[str, object]:
+    """Monte Carlo projection of a simulation's (or the live portfolio's) current positions."""
+    started = time.perf_counter()
+    currency = normalise(currency)
+    positions = current_positions(user, simulation)
+    if not positions:
+        raise ProjectionSpecError("there are no open positions to project")
+    coin_ids = sorted(positions)
+    model = return_model(coin_ids, currency, spec["window_days"])
+    if model["days"] < MIN_RETURN_DAYS:
+        raise ProjectionSpecError(f"not enough overlapping price history (need {MIN_RETURN_DAYS} days)")
+    model_ms = (time.perf_counter() - started) * 1000
+
+    quotes = live_quotes(coin_ids, currency)
+    prices = np.array([quotes[c]["price"] if c in quotes else model["last_price"][i] for i, c in enumerate(coin_ids)])
+    start_values = np.nan_to_num(np.array([positions[c] for c in coin_ids]) * prices)
+
+    seed = spec["seed"] if spec["seed"] is not None else int(np.random.SeedSequence().entropy % 2 ** 32)
+    t0 = time.perf_counter()
+    values = simulate_paths(model, start_values, spec["horizon_days"], spec["paths"], spec["method"], seed)
+    simulate_ms = (time.perf_counter() - t0) * 1000
+    bands = np.percentile(values, spec["percentiles"], axis=1)
+    final = values[-1].astype(np.float64)
+    start = float(start_values.sum())
+    logger.info(f"Projection for {user.id}: {spec['paths']} paths x {spec['horizon_days']} days "
+                f"x {len(coin_ids)} coins in {simulate_ms:.0f} ms")
+    return {
+        "simulation_id": str(simulation.id) if simulation is not None else None,
+        "currency": currency,
+        "method": spec["method"],
+        "seed": seed,
+        "paths": spec["paths"],
+        "horizon_days": spec["horizon_days"],
+        "window_days": spec["window_days"],
+        "history_days": model["days"],
+        "coins": coin_ids,
+        "missing": model["missing"],
+        "start_value": round(start, 2),
+        "days": list(range(spec["horizon_days"] + 1)),
+        "bands": {f"p{p:g}": np.round(row, 2).tolist() for p, row in zip(spec["percentiles"], bands)},
+        "final": {
+            "mean": round(float(final.mean()), 2),
+            "probability_of_loss": round(float((final < start).mean()), 4),
+        },
+        "timings": {"model_ms": round(model_ms, 1), "simulate_ms": round(simulate_ms, 1)},
+    }
@@ -0,0 +1,250 @@
+import logging
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pulp
+
+from .currency import normalise
+from .prices import live_quotes
+from .projection import MAX_WINDOW_DAYS, MIN_RETURN_DAYS, MIN_WINDOW_DAYS, current_positions, return_model
+
+logger = logging.getLogger(__name__)
+
+OBJECTIVES = ("targets", "min_risk")
+MAX_REBALANCE_COINS = 50
+MAX_FEE_BPS = 1000
+SOLVE_TIME_LIMIT = 10
+QUANTITY_PLACES = 10
+EPSILON = 1e-6
+
+
+class RebalanceSpecError(ValueError):
+    """The rebalance request cannot be solved as given; the message is safe to show to the user."""
+
+
+def _number(data, field: str, default: float, low: float, high: float) -> float:
+    raw = data.get(field)
+    try:
+        value = float(raw) if raw not in (None, "") else default
+    except (TypeError, ValueError):
+        raise RebalanceSpecError(f"{field} must be a number")
+    if not np.isfinite(value) or value < low or value > high:
+        raise RebalanceSpecError(f"{field} must be between {low:g} and {high:g}")
+    return value
+
+
+def _coin_list(data, field: str) -> List[str]:
+    raw = data.get(field) or []
+    if isinstance(raw, str):
+        raw = raw.split(",")
+    if not isinstance(raw, list):
+        raise RebalanceSpecError(f"{field} must be a list of coin ids")
+    return sorted({str(c).strip() for c in raw if str(c).strip()})
+
+
+def parse_rebalance(data) -> Dict[str, object]:
+    """
+    Validate a rebalance request: target weights (normalised to sum to 1) or
+    objective=min_risk, plus min_trade (value), fee_bps, fee_fixed (per
+    trade), keep (coins that must not be sold), and for min_risk the extra
+    coins it may buy, max_weight and an optional annual target_return_pct.
+    """
+    targets = data.get("targets")
+    objective = "targets" if targets else str(data.get("objective") or "").strip().lower()
+    if objective not in OBJECTIVES:
+        raise RebalanceSpecError("give targets (coin_id -> weight) or objective=min_risk")
+    weights = {}
+    if objective == "targets":
+        if not isinstance(targets, dict):
+            raise RebalanceSpecError("targets must be an object of coin_id -> weight")
+        try:
+            weights = {str(cid).strip(): float(w) for cid, w in targets.items() if str(cid).strip()}
+        except (TypeError, ValueError):
+            raise RebalanceSpecError("target weights must be numbers")
+        if any(not np.isfinite(w) or w < 0 for w in weights.values()) or sum(weights.values()) <= 0:
+            raise RebalanceSpecError("target weights must be non-negative and not all zero")
+        total = sum(weights.values())
+        weights = {cid: w / total for cid, w in weights.items()}
+    target_return = data.get("target_return_pct")
+    return {
+        "objective": objective,
+        "targets": weights,
+        "coins": _coin_list(data, "coins"),
+        "keep": _coin_list(data, "keep"),
+        "min_trade": _number(data, "min_trade", 0.0, 0.0, 1e12),
+        "fee_bps": _number(data, "fee_bps", 10.0, 0.0, MAX_FEE_BPS),
+        "fee_fixed": _number(data, "fee_fixed", 0.0, 0.0, 1e9),
+        "max_weight": _number(data, "max_weight", 1.0, 0.01, 1.0),
+        "target_return_pct": _number(data, "target_return_pct", 0.0, -100.0, 10_000.0)
+        if target_return not in (None, "") else None,
+        "window_days": int(_number(data, "window_days", 365, MIN_WINDOW_DAYS, MAX_WINDOW_DAYS)),
+    }
+
+
+def solve_rebalance(values: np.ndarray, spec: Dict[str, object], coin_ids: List[str],
+                    returns: Optional[np.ndarray] = None) -> Dict[str, object]:
+    """
+    Minimum-cost trades as a mixed-integer program.
+
+    Per coin the solver picks buy and sell amounts (in value), never both.
+    The trades must pay for themselves: buys plus fees are funded by sells,
+    and any unspent proceeds are left over as cash. Fees are fee_bps of the
+    traded value plus fee_fixed per trade. Trades smaller than min_trade are
+    not allowed, and coins in keep are never sold.
+
+    The objective always includes fees and leftover cash. For targets it adds
+    the distance from the target weights: the sum of the absolute value
+    gaps. For min_risk it adds the mean absolute deviation of the daily
+    portfolio value over the historical return scenarios. That is an LP risk
+    measure that keeps cross-coin correlation. In that case max_weight caps
+    every coin's share, and the mean daily return can be held at or above
+    target_return_pct.
+    """
+    n = len(coin_ids)
+    total = float(values.sum())
+    fee_rate = spec["fee_bps"] / 10_000
+    keep = set(spec["keep"])
+    prob = pulp.LpProblem("rebalance", pulp.LpMinimize)
+    buy = [pulp.LpVariable(f"buy_{i}", lowBound=0, upBound=total) for i in range(n)]
+    sell = [pulp.LpVariable(f"sell_{i}", lowBound=0, upBound=0 if cid in keep else float(values[i]))
+            for i, cid in enumerate(coin_ids)]
+    trades_made = []
+    if spec["min_trade"] > 0 or spec["fee_fixed"] > 0:
+        for i in range(n):
+            is_buy = pulp.LpVariable(f"is_buy_{i}", cat="Binary")
+            is_sell = pulp.LpVariable(f"is_sell_{i}", cat="Binary")
+            prob += buy[i] <= total * is_buy
+            prob += sell[i] <= float(values[i]) * is_sell
+            prob += buy[i] >= spec["min_trade"] * is_buy
+            prob += sell[i] >= spec["min_trade"] * is_sell
+            prob += is_buy + is_sell <= 1
+            trades_made += [is_buy, is_sell]
+
+    after = [float(values[i]) + buy[i] - sell[i] for i in range(n)]
+    invested = pulp.lpSum(after)
+    fees = fee_rate * pulp.lpSum(buy + sell) + spec["fee_fixed"] * pulp.lpSum(trades_made)
+    cash_left = pulp.lpSum(sell) - pulp.lpSum(buy) - fees
+    prob += cash_left >= 0
+
+    if spec["objective"] == "targets":
+        gaps = [pulp.LpVariable(f"gap_{i}", lowBound=0) for i in range(n)]
+        for i, cid in enumerate(coin_ids):
+            goal = spec["targets"].get(cid, 0.0) * invested
+            prob += gaps[i] >= after[i] - goal
+            prob += gaps[i] >= goal - after[i]
+        risk = pulp.lpSum(gaps)
+    else:
+        centred = returns - returns.mean(axis=0)
+        deviations = [pulp.LpVariable(f"dev_{t}", lowBound=0) for t in range(len(returns))]
+        for t, row in enumerate(centred):
+            move = pulp.lpSum(float(row[i]) * after[i] for i in range(n) if row[i])
+            prob += deviations[t] >= move
+            prob += deviations[t] >= -move
+        for i in range(n):
+            prob += after[i] <= spec["max_weight"] * invested
+        if spec["target_return_pct"] is not None:
+            daily = (1 + spec["target_return_pct"] / 100) ** (1 / 365) - 1
+            mean = returns.mean(axis=0)
+            prob += pulp.lpSum(float(mean[i]) * after[i] for i in range(n)) >= daily * invested
+        risk = pulp.lpSum(deviations) * (1.0 / len(returns))
+    prob += risk + fees + cash_left
+
+    status = prob.solve(pulp.PULP_CBC_CMD(msg=False, timeLimit=SOLVE_TIME_LIMIT))
+    if pulp.LpStatus[status] != "Optimal":
+        raise RebalanceSpecError(f"no feasible rebalance under these constraints ({pulp.LpStatus[status].lower()})")
+    return {
+        "buy": np.array([v.value() or 0.0 for v in buy]),
+        "sell": np.array([v.value() or 0.0 for v in sell]),
+        "fees": float(pulp.value(fees) or 0.0),
+        "cash_left": float(pulp.value(cash_left) or 0.0),
+    }
+
+
+def _volatility_pct(weights: np.ndarray, model: Optional[Dict[str, object]]) -> Optional[float]:
+    """Annualised ex-ante volatility of weights from the cached covariance factor."""
+    if model is None or model["days"] < 2 or weights.sum() <= 0:
+        return None
+    spread = model["chol"].T @ weights
+    return round(float(np.sqrt(spread @ spread * 365)) * 100, 4)
+
+
+def rebalance(user, simulation, spec: Dict[str, object], currency: str) -> Dict[str, object]:
+    """
+    Solve a rebalance of a simulation's (or the live portfolio's) open
+    positions into trades. For the live portfolio they are also returned as a
+    portfolio/batch/ payload.
+    """
+    started = time.perf_counter()
+    currency = normalise(currency)
+    positions = current_positions(user, simulation)
+    coin_ids = sorted(set(positions) | set(spec["targets"]) | set(spec["coins"]))
+    if not positions:
+        raise RebalanceSpecError("there are no open positions to rebalance")
+    if len(coin_ids) > MAX_REBALANCE_COINS:
+        raise RebalanceSpecError(f"at most {MAX_REBALANCE_COINS} coins per rebalance")
+
+    model = return_model(coin_ids, currency, spec["window_days"])
+    if spec["objective"] == "min_risk" and model["days"] < MIN_RETURN_DAYS:
+        raise RebalanceSpecError(f"not enough overlapping price history (need {MIN_RETURN_DAYS} days)")
+    quotes = live_quotes(coin_ids, currency)
+    prices = np.array([quotes[c]["price"] if c in quotes else model["last_price"][i] for i, c in enumerate(coin_ids)],
+                      dtype=np.float64)
+    unpriced = [c for c, p in zip(coin_ids, prices) if not np.isfinite(p) or p <= 0]
+    if unpriced:
+        raise RebalanceSpecError(f"no price for {', '.join(unpriced)}")
+    quantities = np.array([positions.get(c, 0.0) for c in coin_ids])
+    values = quantities * prices
+    model_ms = (time.perf_counter() - started) * 1000
+
+    t0 = time.perf_counter()
+    solved = solve_rebalance(values, spec, coin_ids, model["growth"] - 1.0)
+    solve_ms = (time.perf_counter() - t0) * 1000
+    after = values + solved["buy"] - solved["sell"]
+
+    fee_rate = spec["fee_bps"] / 10_000
+    trades = []
+    for i, cid in enumerate(coin_ids):
+        for side, amount in (("BUY", solved["buy"][i]), ("SELL", solved["sell"][i])):
+            if amount <= EPSILON:
+                continue
+            quantity = amount / prices[i] if side == "BUY" else min(amount / prices[i], quantities[i])
+            trades.append({
+                "coin_id": cid,
+                "type": side,
+                "quantity": round(float(quantity), QUANTITY_PLACES),
+                "price": round(float(prices[i]), QUANTITY_PLACES),
+                "currency": currency,
+                "value": round(float(amount), 2),
+                "fee": round(float(amount) * fee_rate + spec["fee_fixed"], QUANTITY_PLACES),
+            })
+    # Sells first, so the batch path funds buys from the same batch.
+    trades.sort(key=lambda t: (t["type"] != "SELL", t["coin_id"]))
+
+    def _state(v):
+        weights = v / v.sum() if v.sum() > 0 else v
+        return {
+            "value": round(float(v.sum()), 2),
+            "weights": {cid: round(float(w), 6) for cid, w in zip(coin_ids, weights)},
+            "volatility_pct": _volatility_pct(weights, model),
+        }
+
+    logger.info(f"Rebalance for {user.id}: {len(coin_ids)} coins, {len(trades)} trades in {solve_ms:.0f} ms")
+    return {
+        "simulation_id": str(simulation.id) if simulation is not None else None,
+        "currency": currency,
+        "objective": spec["objective"],
+        "coins": coin_ids,
+        "missing": model["missing"],
+        "before": _state(values),
+        "after": _state(after),
+        "trades": trades,
+        "fees": round(solved["fees"], 2),
+        "cash_left": round(solved["cash_left"], 2),
+        # portfolio/batch/ trades the live portfolio only; simulation trades go through their own endpoint.
+        "batch": None if simulation is not None else {
+            "currency": currency,
+            "trades": [{k: t[k] for k in ("coin_id", "type", "quantity", "price", "fee")} for t in trades],
+        },
+        "timings": {"model_ms": round(model_ms, 1), "solve_ms": round(solve_ms, 1)},
+    }
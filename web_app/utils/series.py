@@ -0,0 +1,241 @@
+import hashlib
+import logging
+import math
+import time
+import uuid
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction as dbtx
+from django.utils import timezone
+
+from ..models import Transaction
+from .coingecko import CACHE_TIMEOUT, get_coin_market_chart
+from .currency import convert_at_dates, convert_rows, normalise
+
+logger = logging.getLogger(__name__)
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+MS_PER_HOUR = 60 * 60 * 1000
+PERFORMANCE_CACHE_KEY = "portfolio_performance_{fingerprint}"
+SIMULATION_SERIES_CACHE_KEY = "simulation_series_{simulation_id}_{currency}_{generation}"
+SIMULATION_SERIES_GENERATION_KEY = "simulation_series_generation_{simulation_id}"
+HOURLY_SERIES_MAX_DAYS = 90
+ENDED_SERIES_TIMEOUT = 24 * 60 * 60
+
+
+def chart_arrays(data) -> Tuple[np.ndarray, np.ndarray]:
+    """Turn a market_chart payload into sorted (timestamps_ms, prices) arrays, dropping bad points."""
+    points = (data.get("prices") or []) if isinstance(data, dict) else []
+    rows = []
+    for p in points:
+        if not isinstance(p, (list, tuple)) or len(p) < 2:
+            continue
+        try:
+            ts, price = float(p[0]), float(p[1])
+        except (TypeError, ValueError):
+            continue
+        if np.isfinite(ts) and np.isfinite(price):
+            rows.append((ts, price))
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    arr = np.asarray(rows, dtype=np.float64)
+    arr = arr[np.argsort(arr[:, 0], kind="stable")]
+    return arr[:, 0].astype(np.int64), arr[:, 1]
+
+
+def daily_grid(days: int, now_ms: Optional[int] = None) -> np.ndarray:
+    """`days` timestamps (ms) spaced one day apart, ending at now."""
+    if now_ms is None:
+        now_ms = int(time.time() * 1000)
+    return now_ms - np.arange(days - 1, -1, -1, dtype=np.int64) * MS_PER_DAY
+
+
+def align_to_grid(series: Sequence[Tuple[np.ndarray, np.ndarray]], grid: np.ndarray) -> np.ndarray:
+    """
+    Align price series onto a common time grid.
+    Each grid point takes the latest sample at or before it; points before a
+    series starts take its first sample. Series without samples are all NaN.
+    Returns a (len(series), len(grid)) float64 matrix.
+    """
+    matrix = np.full((len(series), len(grid)), np.nan, dtype=np.float64)
+    for row, (ts, prices) in enumerate(series):
+        if not len(ts):
+            continue
+        idx = np.searchsorted(ts, grid, side="right") - 1
+        matrix[row] = prices[np.clip(idx, 0, len(prices) - 1)]
+    return matrix
+
+
+def price_matrix(coin_ids: Sequence[str], currency: str, days: int, grid: Optional[np.ndarray] = None):
+    """
+    Fetch each coin's market_chart (cached upstream) and align them on one grid.
+    Returns (grid, matrix, missing_coin_ids).
+    """
+    if grid is None:
+        grid = daily_grid(days)
+    series, missing = [], []
+    for coin_id in coin_ids:
+        ts, prices = chart_arrays(get_coin_market_chart(coin_id, currency.lower(), days))
+        if not len(ts):
+            missing.append(coin_id)
+        series.append((ts, prices))
+    return grid, align_to_grid(series, grid), missing
+
+
+def holdings_fingerprint(holdings: Sequence[dict], currency: str, days: int) -> str:
+    parts = sorted(
+        f"{h['coin_id']}:{h['quantity']}:{h['avg_price']}:{h.get('avg_price_currency', 'USD')}" for h in holdings
+    )
+    raw = f"{normalise(currency)}|{days}|" + ",".join(parts)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def portfolio_performance(holdings: Sequence[dict], currency: str, days: int) -> Dict[str, object]:
+    """
+    Value and unrealised P&L series for a set of holdings, in columnar form.
+
+    holdings are dicts with coin_id, quantity, avg_price and avg_price_currency.
+    Coins without chart data are held flat at their cost basis and reported in
+    "missing"; cost bases that cannot be converted into currency count as zero
+    and are reported in "unconverted". Results are cached per holdings
+    fingerprint.
+    """
+    currency = normalise(currency)
+    key = PERFORMANCE_CACHE_KEY.format(fingerprint=holdings_fingerprint(holdings, currency, days))
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    rows = convert_rows(holdings, ["avg_price"], currency, currency_field="avg_price_currency")
+    coin_ids: List[str] = [r["coin_id"] for r in rows]
+    qty = np.asarray([float(r["quantity"]) for r in rows], dtype=np.float64)
+    # Cost bases without an FX rate into currency are left out rather than mixed in.
+    converted = np.asarray([r["avg_price_currency"] == currency for r in rows], dtype=bool)
+    avg = np.where(converted, [float(r["avg_price"]) for r in rows], 0.0) if len(rows) else np.zeros(0)
+
+    grid, prices, missing = price_matrix(coin_ids, currency, days)
+    prices = np.where(np.isnan(prices), avg[:, None], prices)
+
+    cost_basis = float(qty @ avg) if len(rows) else 0.0
+    value = qty @ prices if len(rows) else np.zeros(len(grid))
+    result = {
+        "currency": currency,
+        "days": days,
+        "coins": coin_ids,
+        "missing": missing,
+        "unconverted": sorted({cid for cid, ok in zip(coin_ids, converted) if not ok}),
+        "cost_basis": round(cost_basis, 2),
+        "t": grid.tolist(),
+        "value": np.round(value, 2).tolist(),
+        "unrealised": np.round(value - cost_basis, 2).tolist(),
+    }
+    cache.set(key, result, CACHE_TIMEOUT)
+    return result
+
+
+def invalidate_simulation_series(simulation_id) -> None:
+    """
+    Retire every cached series of a simulation; call whenever its
+    transactions change. The token is replaced again once the write commits,
+    so a series computed from the ledger before the commit is not served
+    afterwards.
+    """
+    if simulation_id:
+        key = SIMULATION_SERIES_GENERATION_KEY.format(simulation_id=simulation_id)
+        cache.set(key, uuid.uuid4().hex, None)
+        dbtx.on_commit(lambda: cache.set(key, uuid.uuid4().hex, None))
+
+
+def _series_generation(simulation_id) -> str:
+    key = SIMULATION_SERIES_GENERATION_KEY.format(simulation_id=simulation_id)
+    cache.add(key, uuid.uuid4().hex, None)
+    return cache.get(key)
+
+
+def series_grid(start_ms: int, end_ms: int) -> np.ndarray:
+    """Hourly points for spans up to HOURLY_SERIES_MAX_DAYS, daily beyond; always ends exactly at end_ms."""
+    step = MS_PER_HOUR if end_ms - start_ms <= HOURLY_SERIES_MAX_DAYS * MS_PER_DAY else MS_PER_DAY
+    grid = np.arange(start_ms, end_ms, step, dtype=np.int64)
+    return np.append(grid, np.int64(end_ms))
+
+
+def cumulative_matrix(coin_idx: np.ndarray, tx_ms: np.ndarray, deltas: np.ndarray, n_coins: int,
+                      grid: np.ndarray) -> np.ndarray:
+    """
+    (n_coins, len(grid)) running totals of per-transaction deltas. A
+    transaction counts from the first grid point at or after its timestamp;
+    ones after the last grid point are ignored.
+    """
+    matrix = np.zeros((n_coins, len(grid)), dtype=np.float64)
+    col = np.searchsorted(grid, tx_ms, side="left")
+    live = col < len(grid)
+    np.add.at(matrix, (coin_idx[live], col[live]), deltas[live])
+    return np.cumsum(matrix, axis=1)
+
+
+def simulation_series(simulation, currency: str) -> Dict[str, object]:
+    """
+    Value of a simulation over time from its own trades.
+
+    Every coin's market_chart is aligned onto one grid from the simulation's
+    start (or first trade) to now (or its end date). Holdings at each point come
+    from a cumulative-quantity matrix in which each transaction applies at its
+    own timestamp. Coins without chart data are valued at the cash put into
+    them. Cached per simulation until its transactions change
+    (invalidate_simulation_series), and for CACHE_TIMEOUT while it is still
+    running.
+    """
+    currency = normalise(currency)
+    key = SIMULATION_SERIES_CACHE_KEY.format(
+        simulation_id=simulation.id, currency=currency, generation=_series_generation(simulation.id)
+    )
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    rows = list(
+        Transaction.objects.filter(simulation=simulation)
+        .order_by("time", "id")
+        .values_list("coin_id", "type", "quantity", "price", "price_currency", "time")
+    )
+    result = {"simulation_id": str(simulation.id), "currency": currency, "coins": [], "missing": [],
+              "t": [], "value": [], "invested": [], "pnl": []}
+    now = timezone.now()
+    ended = bool(simulation.end_date and simulation.end_date < now.date())
+    if rows:
+        coin_ids = sorted({r[0] for r in rows})
+        coin_index = {cid: i for i, cid in enumerate(coin_ids)}
+        coin_idx = np.asarray([coin_index[r[0]] for r in rows], dtype=np.int64)
+        tx_ms = np.asarray([int(r[5].timestamp() * 1000) for r in rows], dtype=np.int64)
+        sign = np.asarray([1.0 if r[1] == "BUY" else -1.0 for r in rows])
+        qty = np.asarray([float(r[2]) for r in rows]) * sign
+        prices = convert_at_dates([r[3] for r in rows], [r[5] for r in rows], [r[4] for r in rows], currency)
+
+        start = datetime.combine(simulation.start_date, dt_time.min, tzinfo=dt_timezone.utc) \
+            if simulation.start_date else rows[0][5]
+        start_ms = min(int(start.timestamp() * 1000), int(tx_ms[0]))
+        end = datetime.combine(simulation.end_date, dt_time.max, tzinfo=dt_timezone.utc) if ended else now
+        end_ms = max(int(end.timestamp() * 1000), start_ms)
+        grid = series_grid(start_ms, end_ms)
+
+        days_back = max(1, math.ceil((now.timestamp() * 1000 - start_ms) / MS_PER_DAY) + 1)
+        charts = [chart_arrays(get_coin_market_chart(cid, currency.lower(), days_back)) for cid in coin_ids]
+        price_grid = align_to_grid(charts, grid)
+
+        held = np.maximum(cumulative_matrix(coin_idx, tx_ms, qty, len(coin_ids), grid), 0.0)
+        invested = cumulative_matrix(coin_idx, tx_ms, qty * np.asarray(prices, dtype=np.float64), len(coin_ids), grid)
+        value = np.where(np.isnan(price_grid), invested, held * np.nan_to_num(price_grid)).sum(axis=0)
+        invested = invested.sum(axis=0)
+        result.update(
+            coins=coin_ids,
+            missing=[cid for cid, (ts, _) in zip(coin_ids, charts) if not len(ts)],
+            t=grid.tolist(),
+            value=np.round(value, 2).tolist(),
+            invested=np.round(invested, 2).tolist(),
+            pnl=np.round(value - invested, 2).tolist(),
+        )
+    cache.set(key, result, ENDED_SERIES_TIMEOUT if ended else CACHE_TIMEOUT)
+    return result
@@ -0,0 +1,173 @@
+import logging
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Optional, Sequence
+
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+from django.utils import timezone
+
+from ..models import Coin, Simulation, SimulationArchive, SimulationValuation, Transaction, User
+from .currency import normalise
+from .metrics import ledger_fingerprints
+from .pricefill import retry_delay
+from .prices import live_quotes
+from .valuation import FINISHED_STATUSES, _ledger_hash, freeze_simulation, frozen_summaries
+
+logger = logging.getLogger(__name__)
+
+FREEZE_BATCH_SIZE = 200  # finished simulations checked per fingerprint GROUP BY
+ZERO = Decimal("0")
+_AMOUNT = DecimalField(max_digits=40, decimal_places=20)
+
+_BUY_VALUE = Case(When(type="BUY", then=F("price") * F("quantity")), default=Value(ZERO), output_field=_AMOUNT)
+_SELL_VALUE = Case(When(type="SELL", then=F("price") * F("quantity")), default=Value(ZERO), output_field=_AMOUNT)
+_NET_QUANTITY = Case(
+    When(type="BUY", then=F("quantity")),
+    default=Value(-1) * F("quantity"),
+    output_field=_AMOUNT,
+)
+
+
+def position_totals(simulation_ids: Sequence) -> Dict[object, Dict[str, Dict[str, Decimal]]]:
+    """Bought value, sold value and net quantity per coin for many simulations, in one GROUP BY."""
+    rows = (
+        Transaction.objects.filter(simulation_id__in=list(simulation_ids))
+        .values("simulation_id", "coin_id")
+        .annotate(bought=Sum(_BUY_VALUE), sold=Sum(_SELL_VALUE), net=Sum(_NET_QUANTITY))
+        .order_by()
+    )
+    totals = defaultdict(dict)
+    for r in rows:
+        totals[r["simulation_id"]][r["coin_id"]] = {
+            "bought": r["bought"] or ZERO, "sold": r["sold"] or ZERO, "net": r["net"] or ZERO,
+        }
+    return totals
+
+
+def simulation_summaries(simulations: Sequence) -> Dict[object, Dict[str, float]]:
+    """
+    invested, units and current_value for a batch of simulations with a fixed
+    number of queries: one GROUP BY over their transactions, one lookup of the
+    owners' currencies, one batched quote lookup per currency for the union of
+    open coins, and one Coin query for coins without a quote. ENDED and
+    ARCHIVED simulations come from their frozen valuations instead (see
+    valuation.frozen_summaries) and add nothing to the quote lookups.
+    """
+    simulations = list(simulations)
+    if not simulations:
+        return {}
+    totals = position_totals([s.id for s in simulations])
+    currencies = dict(
+        User.objects.filter(id__in={s.user_id for s in simulations}).values_list("id", "preferred_currency")
+    )
+
+    summaries = frozen_summaries(simulations, currencies)
+
+    open_coins = defaultdict(set)
+    for sim in simulations:
+        if sim.id in summaries:
+            continue
+        currency = normalise(currencies.get(sim.user_id))
+        open_coins[currency].update(cid for cid, t in totals.get(sim.id, {}).items() if t["net"] > 0)
+    prices = {
+        currency: {cid: q["price"] for cid, q in live_quotes(sorted(ids), currency).items()}
+        for currency, ids in open_coins.items() if ids
+    }
+    unpriced = {cid for currency, ids in open_coins.items() for cid in ids if cid not in prices.get(currency, {})}
+    # Last resort: the price cached on the Coin row, as the per-simulation path did.
+    fallback = {cid: float(p or 0) for cid, p in Coin.objects.filter(id__in=unpriced).values_list("id", "current_price")} \
+        if unpriced else {}
+
+    for sim in simulations:
+        if sim.id in summaries:
+            continue
+        currency = normalise(currencies.get(sim.user_id))
+        coins = totals.get(sim.id, {})
+        invested = sum((t["bought"] - t["sold"] for t in coins.values()), ZERO)
+        units = sum((t["net"] for t in coins.values()), ZERO)
+        value = 0.0
+        for cid, t in coins.items():
+            if t["net"] <= 0:
+                continue
+            price = prices.get(currency, {}).get(cid, fallback.get(cid, 0.0))
+            value += float(t["net"]) * float(price or 0)
+        summaries[sim.id] = {
+            "invested": round(float(invested), 2),
+            "units": round(max(float(units), 0.0), 4),
+            "current_value": round(value, 2),
+        }
+    return summaries
+
+
+def freeze_finished(simulations: Sequence) -> Dict[object, Optional[SimulationValuation]]:
+    """
+    Make sure each finished simulation has a current valuation in its owner's
+    currency: one fingerprint GROUP BY and one valuation query for the batch,
+    then a freeze (price lookups) only for those missing or stale. A stale row
+    is deleted before its replacement is frozen. Simulations that cannot be
+    frozen yet back off (retry_delay) and map to None.
+    """
+    simulations = list(simulations)
+    if not simulations:
+        return {}
+    ids = [s.id for s in simulations]
+    prints = ledger_fingerprints(ids)
+    ledgers = {sid: _ledger_hash(fingerprint) for sid, fingerprint in prints.items()}
+    # Cold simulations have no hot rows to value; they keep the valuation they were archived with.
+    cold = dict(SimulationArchive.objects.filter(simulation_id__in=ids).values_list("simulation_id", "ledger"))
+    ledgers.update(cold)
+    currencies = dict(
+        User.objects.filter(id__in={s.user_id for s in simulations}).values_list("id", "preferred_currency")
+    )
+    stored = {(v.simulation_id, v.currency): v for v in SimulationValuation.objects.filter(simulation_id__in=ids)}
+    current = {s.id: stored.get((s.id, normalise(currencies.get(s.user_id)))) for s in simulations}
+    stale = {sid for sid, v in current.items() if sid not in cold and getattr(v, "ledger", None) != ledgers[sid]}
+    totals = position_totals(stale) if stale else {}
+
+    now = timezone.now()
+    done = {}
+    for sim in simulations:
+        valuation = current[sim.id]
+        if sim.id in stale:
+            if valuation is not None:
+                valuation.delete()
+            try:
+                valuation = freeze_simulation(sim, normalise(currencies.get(sim.user_id)), totals.get(sim.id, {}),
+                                              prints[sim.id])
+            except Exception as e:
+                logger.warning(f"Could not freeze simulation {sim.id}: {e}")
+                valuation = None
+        elif valuation is not None and valuation.ledger != ledgers[sim.id]:
+            valuation = None  # cold, and archived from a different ledger
+        if valuation is None:
+            attempts = sim.freeze_attempts + 1
+            retry_at = now + retry_delay(attempts)
+        else:
+            attempts, retry_at = 0, None
+        if (attempts, retry_at) != (sim.freeze_attempts, sim.freeze_retry_at):
+            # update(), not save(): saving would run the simulation_saved signal again.
+            Simulation.objects.filter(pk=sim.pk).update(freeze_attempts=attempts, freeze_retry_at=retry_at)
+            sim.freeze_attempts, sim.freeze_retry_at = attempts, retry_at
+        done[sim.id] = valuation
+    return done
+
+
+def freeze_pending(limit: Optional[int] = None, batch_size: int = FREEZE_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Batch job: freeze finished simulations that have no current valuation,
+    skipping those still backing off. Cold (archived) simulations keep the
+    valuation they were archived with.
+    """
+    due = (
+        Simulation.objects.filter(status__in=FINISHED_STATUSES, archive__isnull=True)
+        .filter(Q(freeze_retry_at__isnull=True) | Q(freeze_retry_at__lte=timezone.now()))
+        .order_by("updated_at")
+    )
+    if limit:
+        due = due[:limit]
+    due = list(due)
+    report = {"checked": len(due), "frozen": 0, "deferred": 0}
+    for start in range(0, len(due), batch_size):
+        for valuation in freeze_finished(due[start:start + batch_size]).values():
+            report["frozen" if valuation is not None else "deferred"] += 1
+    return report
@@ -0,0 +1,277 @@
+import logging
+from collections import defaultdict
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db import transaction as dbtx
+from django.db.models import DateField, Q, Value
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from ..models import PendingSnapshotUpdate, PortfolioSnapshot, Transaction, User
+from .coingecko import get_coin_market_chart
+from .currency import EPOCH_ORDINAL, convert_at_dates, day_numbers, normalise
+from .series import MS_PER_DAY, align_to_grid, chart_arrays
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_BATCH_SIZE = 1000
+LEDGER_FIELDS = ("user_id", "simulation_id", "coin_id", "type", "quantity", "price", "price_currency", "time",
+                 "cost_basis", "realised_profit", "realised_profit_currency")
+
+
+def _day_to_date(day: int) -> date:
+    return date.fromordinal(int(day) + EPOCH_ORDINAL)
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.astimezone(dt_timezone.utc).date() if value.tzinfo else value.date()
+    return value
+
+
+def _day_grid_ms(start_day: int, end_day: int) -> np.ndarray:
+    """End-of-day timestamps (ms) for each day in [start_day, end_day], capped at now."""
+    now_ms = int(timezone.now().timestamp() * 1000)
+    ends = (np.arange(start_day, end_day + 1, dtype=np.int64) + 1) * MS_PER_DAY - 1
+    return np.minimum(ends, now_ms)
+
+
+def replay_ledger(rows: Sequence[tuple], currency: str, coin_index: Dict[str, int]):
+    """
+    Replay a time-ordered ledger with the lot engine's accounting.
+
+    rows are tuples in LEDGER_FIELDS order. Buys add quantity * price; sells
+    take the cost basis (USD) and realised profit that lots.rebuild_lots wrote
+    to them, so snapshots follow the user's FIFO / LIFO / average method.
+    Amounts are converted into currency at each transaction's own date.
+    Returns per-transaction arrays (coin_idx, day, qty_delta, cost_delta,
+    realised_delta).
+    """
+    n = len(rows)
+    coin_idx = np.empty(n, dtype=np.int64)
+    qty_delta = np.zeros(n, dtype=np.float64)
+    cost_delta = np.zeros(n, dtype=np.float64)
+    realised_delta = np.zeros(n, dtype=np.float64)
+    if not n:
+        return coin_idx, np.empty(0, dtype=np.int64), qty_delta, cost_delta, realised_delta
+
+    times = [r[7] for r in rows]
+    days = day_numbers(times)
+    prices = convert_at_dates([r[5] for r in rows], times, [r[6] for r in rows], currency)
+    sold_cost = convert_at_dates([r[8] for r in rows], times, "USD", currency)
+    gains = convert_at_dates([r[9] for r in rows], times, [r[10] for r in rows], currency)
+
+    qty_held: Dict[int, float] = defaultdict(float)
+    for i, row in enumerate(rows):
+        c = coin_index[row[2]]
+        coin_idx[i] = c
+        q = float(row[4])
+        if row[3] == "BUY":
+            qty_delta[i] = q
+            cost_delta[i] = q * prices[i]
+        else:
+            # The lot book closes at most what is open; the excess is its shortfall.
+            qty_delta[i] = -min(q, qty_held[c])
+            cost_delta[i] = -sold_cost[i]
+            realised_delta[i] = gains[i]
+        qty_held[c] += qty_delta[i]
+    return coin_idx, days, qty_delta, cost_delta, realised_delta
+
+
+def daily_valuation(
+    rows: Sequence[tuple],
+    currency: str,
+    start_day: int,
+    end_day: int,
+    coin_ids: Sequence[str],
+    prices: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """
+    Daily value, cost basis and cumulative realised P&L for one ledger.
+
+    prices is a (len(coin_ids), end_day - start_day + 1) matrix aligned to the
+    day grid; NaN prices value the position at cost. Transactions before
+    start_day form the opening state.
+    """
+    coin_index = {cid: i for i, cid in enumerate(coin_ids)}
+    n_days = end_day - start_day + 1
+    coin_idx, days, dq, dc, dr = replay_ledger(rows, currency, coin_index)
+    col = np.clip(days - start_day, 0, n_days - 1)
+    live = days <= end_day
+
+    qty = np.zeros((len(coin_ids), n_days))
+    cost = np.zeros((len(coin_ids), n_days))
+    realised = np.zeros(n_days)
+    np.add.at(qty, (coin_idx[live], col[live]), dq[live])
+    np.add.at(cost, (coin_idx[live], col[live]), dc[live])
+    np.add.at(realised, col[live], dr[live])
+    qty = np.cumsum(qty, axis=1)
+    cost = np.cumsum(cost, axis=1)
+
+    value = np.where(np.isnan(prices), cost, qty * np.nan_to_num(prices))
+    return {
+        "days": np.arange(start_day, end_day + 1, dtype=np.int64),
+        "value": value.sum(axis=0),
+        "cost_basis": cost.sum(axis=0),
+        "realised": np.cumsum(realised),
+    }
+
+
+def _price_matrix(coin_ids: Sequence[str], currency: str, start_day: int, end_day: int) -> np.ndarray:
+    grid = _day_grid_ms(start_day, end_day)
+    today = day_numbers([timezone.now()])[0]
+    days_back = int(today - start_day + 1)
+    series = [chart_arrays(get_coin_market_chart(cid, currency.lower(), days_back)) for cid in coin_ids]
+    return align_to_grid(series, grid)
+
+
+def _write_snapshots(user_id, simulation_id, currency: str, result: Dict[str, np.ndarray],
+                     clear_from: Optional[date] = None) -> int:
+    days = result["days"]
+    if not len(days):
+        return 0
+    objs = [
+        PortfolioSnapshot(
+            user_id=user_id,
+            simulation_id=simulation_id,
+            currency=currency,
+            date=_day_to_date(day),
+            value=Decimal(str(round(float(value), 10))),
+            cost_basis=Decimal(str(round(float(cost), 10))),
+            realised_profit=Decimal(str(round(float(realised), 10))),
+        )
+        for day, value, cost, realised in zip(days, result["value"], result["cost_basis"], result["realised"])
+    ]
+    with dbtx.atomic():
+        PortfolioSnapshot.objects.filter(
+            user_id=user_id, simulation_id=simulation_id, currency=currency,
+            date__gte=min(clear_from or objs[0].date, objs[0].date), date__lte=objs[-1].date,
+        ).delete()
+        PortfolioSnapshot.objects.bulk_create(objs, batch_size=SNAPSHOT_BATCH_SIZE)
+    return len(objs)
+
+
+def update_snapshots_from(user_id, simulation_id, from_date, currency: Optional[str] = None) -> int:
+    """
+    Recompute one portfolio's snapshots from from_date through today.
+    Earlier rows are left untouched; the ledger before from_date only
+    provides the opening state.
+    """
+    if currency is None:
+        currency = User.objects.filter(id=user_id).values_list("preferred_currency", flat=True).first()
+    currency = normalise(currency)
+    rows = list(
+        Transaction.objects.filter(user_id=user_id, simulation_id=simulation_id)
+        .order_by("time", "id")
+        .values_list(*LEDGER_FIELDS)
+    )
+    today = int(day_numbers([timezone.now()])[0])
+    start_day = min(int(day_numbers([_as_date(from_date)])[0]), today)
+
+    clear_from = _day_to_date(start_day)
+
+    if not rows:
+        PortfolioSnapshot.objects.filter(
+            user_id=user_id, simulation_id=simulation_id, currency=currency, date__gte=clear_from
+        ).delete()
+        return 0
+
+    start_day = max(start_day, int(day_numbers([rows[0][7]])[0]))
+    coin_ids = sorted({r[2] for r in rows})
+    prices = _price_matrix(coin_ids, currency, start_day, today)
+    result = daily_valuation(rows, currency, start_day, today, coin_ids, prices)
+    return _write_snapshots(user_id, simulation_id, currency, result, clear_from=clear_from)
+
+
+def rebuild_all_snapshots(days: Optional[int] = None) -> int:
+    """
+    Nightly batch: recompute snapshots for every (user, simulation) ledger.
+
+    Loads all ledgers with one query and values every portfolio that shares a
+    currency against one price matrix built for the union of their coins.
+    days limits the recomputed window; None rebuilds from each first trade.
+    """
+    today = int(day_numbers([timezone.now()])[0])
+    currencies = dict(User.objects.values_list("id", "preferred_currency"))
+
+    ledgers: Dict[Tuple, List[tuple]] = defaultdict(list)
+    for row in Transaction.objects.order_by("user_id", "simulation_id", "time", "id").values_list(*LEDGER_FIELDS):
+        ledgers[(row[0], row[1])].append(row)
+
+    by_currency: Dict[str, List[Tuple]] = defaultdict(list)
+    for key in ledgers:
+        by_currency[normalise(currencies.get(key[0]))].append(key)
+
+    written = 0
+    for currency, keys in by_currency.items():
+        starts = {}
+        for key in keys:
+            first_day = int(day_numbers([ledgers[key][0][7]])[0])
+            starts[key] = min(max(first_day, today - days + 1) if days else first_day, today)
+        window_start = min(starts.values())
+        coin_ids = sorted({r[2] for key in keys for r in ledgers[key]})
+        matrix = _price_matrix(coin_ids, currency, window_start, today)
+        row_of = {cid: i for i, cid in enumerate(coin_ids)}
+
+        for key in keys:
+            rows = ledgers[key]
+            held = sorted({r[2] for r in rows})
+            offset = starts[key] - window_start
+            prices = matrix[[row_of[cid] for cid in held], offset:]
+            result = daily_valuation(rows, currency, starts[key], today, held, prices)
+            written += _write_snapshots(key[0], key[1], currency, result)
+        logger.info(f"Rebuilt snapshots for {len(keys)} portfolios in {currency}")
+    return written
+
+
+def schedule_snapshot_update(tx) -> None:
+    """Mark tx's portfolio stale from tx's date for the snapshot job."""
+    schedule_snapshot_update_from(tx.user_id, tx.simulation_id, tx.time or timezone.now())
+
+
+def schedule_snapshot_update_from(user_id, simulation_id, from_time) -> None:
+    """
+    Mark one portfolio's snapshots stale from from_time. This only writes a
+    PendingSnapshotUpdate row inside the caller's transaction (one per
+    portfolio, keeping the earliest date); process_pending_updates does the
+    chart reads and recomputation outside the request.
+    """
+    from_date = _as_date(from_time)
+    pending = PendingSnapshotUpdate.objects.filter(user_id=user_id, simulation_id=simulation_id)
+    # update() skips auto_now; the job relies on marked_at to spot marks renewed while it ran.
+    if not pending.update(from_date=Least("from_date", Value(from_date, output_field=DateField())),
+                          marked_at=timezone.now()):
+        PendingSnapshotUpdate.objects.create(user_id=user_id, simulation_id=simulation_id, from_date=from_date)
+
+
+def process_pending_updates(limit: Optional[int] = None) -> Dict[str, int]:
+    """
+    Batch job: recompute every portfolio marked stale, from its earliest
+    marked date. Marks are deleted only once their update succeeded, and only
+    if they were last marked before the job started and still carry the
+    marked_at it read; a mark renewed by a trade committing while the job
+    runs is kept for the next run.
+    """
+    started = timezone.now()
+    marks = PendingSnapshotUpdate.objects.order_by("marked_at").values_list(
+        "id", "user_id", "simulation_id", "from_date", "marked_at"
+    )
+    pending: Dict[Tuple, Tuple[Q, date]] = {}
+    for mark_id, user_id, simulation_id, from_date, marked_at in marks:
+        seen, start = pending.get((user_id, simulation_id), (Q(), from_date))
+        pending[(user_id, simulation_id)] = (seen | Q(id=mark_id, marked_at=marked_at), min(start, from_date))
+
+    done = {"updated": 0, "failed": 0, "snapshots": 0}
+    for (user_id, simulation_id), (seen, start) in list(pending.items())[:limit]:
+        try:
+            done["snapshots"] += update_snapshots_from(user_id, simulation_id, start)
+        except Exception as e:
+            logger.warning(f"Snapshot update failed for user {user_id}: {e}")
+            done["failed"] += 1
+            continue
+        PendingSnapshotUpdate.objects.filter(seen, marked_at__lte=started).delete()
+        done["updated"] += 1
+    return done
@@ -0,0 +1,163 @@
+import itertools
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.db import connection, connections
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import BacktestSweep, BacktestSweepResult
+from .backtest import BacktestSpecError, backtest_stats, historical_prices, parse_spec, run_backtest
+from .currency import normalise
+
+logger = logging.getLogger(__name__)
+
+SWEEPABLE = (
+    "coins", "weights", "amount", "every_days", "initial_cash", "buy_below", "sell_above", "sell_fraction",
+    "lookback_days", "fee_bps", "slippage_bps", "min_trade",
+)
+RANKABLE = ("return_pct", "profit", "final_value", "max_drawdown_pct")
+MAX_SWEEP_RUNS = 10_000
+MAX_INLINE_SWEEP_RUNS = 200
+SWEEP_CHUNK_SIZE = 64
+SWEEP_RESULT_BATCH = 500
+
+# Worker-side view of the shared price matrix, mapped once per process by _attach.
+_PRICES: Optional[np.ndarray] = None
+
+
+class SweepSpecError(ValueError):
+    """The sweep grid or one of its runs is invalid; the message is safe to show to the user."""
+
+
+def expand_grid(grid: Dict[str, Sequence]) -> List[Dict[str, object]]:
+    """Cartesian product of the grid, in a stable order (keys sorted, values as given)."""
+    keys = sorted(grid)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+
+
+def sweep_runs(base: dict, grid: dict, today=None) -> List[Tuple[Dict[str, object], Dict[str, object]]]:
+    """Validate a sweep and return (params, spec) for every run."""
+    if not isinstance(base, dict) or not isinstance(grid, dict) or not grid:
+        raise SweepSpecError("base must be an object and grid a non-empty object of value lists")
+    unknown = sorted(set(grid) - set(SWEEPABLE))
+    if unknown:
+        raise SweepSpecError(f"cannot sweep {', '.join(unknown)}; sweepable fields: {', '.join(SWEEPABLE)}")
+    if any(not isinstance(v, list) or not v for v in grid.values()):
+        raise SweepSpecError("every grid field needs a non-empty list of values")
+    total = int(np.prod([len(v) for v in grid.values()]))
+    if total > MAX_SWEEP_RUNS:
+        raise SweepSpecError(f"grid has {total} runs; the limit is {MAX_SWEEP_RUNS}")
+
+    runs = []
+    for params in expand_grid(grid):
+        try:
+            runs.append((params, parse_spec({**base, **params}, today=today)))
+        except BacktestSpecError as e:
+            raise SweepSpecError(f"{params}: {e}")
+    return runs
+
+
+def create_sweep(user, name: str, base: dict, grid: dict, rank_by: str = "return_pct") -> BacktestSweep:
+    if rank_by not in RANKABLE:
+        raise SweepSpecError(f"rank_by must be one of {', '.join(RANKABLE)}")
+    runs = sweep_runs(base, grid)
+    return BacktestSweep.objects.create(
+        user=user, name=name, base=base, grid=grid, rank_by=rank_by, total=len(runs),
+        currency=normalise(getattr(user, "preferred_currency", None)),
+    )
+
+
+def _attach(path: str, shape: Tuple[int, int]) -> None:
+    global _PRICES
+    _PRICES = np.memmap(path, dtype=np.float64, mode="r", shape=shape)
+
+
+def _run_chunk(tasks: Sequence[Tuple[int, List[int], dict]]) -> List[Tuple[int, Dict[str, object]]]:
+    """Backtest a chunk of runs against the mapped price matrix; only small stats dicts go back."""
+    return [(index, backtest_stats(run_backtest(_PRICES[rows], spec))) for index, rows, spec in tasks]
+
+
+def _save_results(sweep: BacktestSweep, runs, results: Sequence[Tuple[int, Dict[str, object]]]) -> None:
+    BacktestSweepResult.objects.bulk_create(
+        [
+            BacktestSweepResult(sweep=sweep, index=index, params=runs[index][0], stats=stats,
+                                score=stats.get(sweep.rank_by))
+            for index, stats in results
+        ],
+        batch_size=SWEEP_RESULT_BATCH,
+        ignore_conflicts=True,
+    )
+    BacktestSweep.objects.filter(pk=sweep.pk).update(
+        completed=BacktestSweepResult.objects.filter(sweep=sweep).count(), updated_at=timezone.now()
+    )
+
+
+def run_sweep(sweep: BacktestSweep, workers: Optional[int] = None, chunk_size: int = SWEEP_CHUNK_SIZE) -> BacktestSweep:
+    """
+    Run (or resume) a sweep. Runs that already have a result row are skipped.
+
+    The union price matrix is loaded once and written to a memory-mapped file
+    (in /dev/shm when available) that each worker maps read-only, so tasks
+    carry only run indices, coin rows and specs. Chunks of runs are fanned out
+    over a fork-based ProcessPoolExecutor and their stats are stored as they
+    complete, so an interrupted sweep picks up where it stopped.
+    """
+    runs = sweep_runs(sweep.base, sweep.grid)
+    done = set(BacktestSweepResult.objects.filter(sweep=sweep).values_list("index", flat=True))
+    pending = [i for i in range(len(runs)) if i not in done]
+    BacktestSweep.objects.filter(pk=sweep.pk).update(status="RUNNING", total=len(runs), error="")
+    path = None
+    try:
+        if pending:
+            coins = sorted({cid for i in pending for cid in runs[i][1]["coins"]})
+            row_of = {cid: r for r, cid in enumerate(coins)}
+            first = runs[pending[0]][1]
+            prices = historical_prices(coins, sweep.currency, first["start_date"], first["end_date"])
+
+            fd, path = tempfile.mkstemp(prefix="sweep-", suffix=".f64",
+                                        dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+            os.close(fd)
+            mapped = np.memmap(path, dtype=np.float64, mode="w+", shape=prices.shape)
+            mapped[:] = prices
+            mapped.flush()
+            del mapped
+
+            tasks = [(i, [row_of[c] for c in runs[i][1]["coins"]], runs[i][1]) for i in pending]
+            chunks = [tasks[i:i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+            workers = max(1, min(workers or os.cpu_count() or 1, len(chunks)))
+            if workers == 1:
+                _attach(path, prices.shape)
+                for chunk in chunks:
+                    _save_results(sweep, runs, _run_chunk(chunk))
+            else:
+                if not connection.in_atomic_block:
+                    connections.close_all()  # children never touch the DB; don't hand them open sockets
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"),
+                                         initializer=_attach, initargs=(path, prices.shape)) as pool:
+                    for future in as_completed([pool.submit(_run_chunk, chunk) for chunk in chunks]):
+                        _save_results(sweep, runs, future.result())
+        BacktestSweep.objects.filter(pk=sweep.pk).update(status="DONE", finished_at=timezone.now())
+        logger.info(f"Sweep {sweep.id}: ran {len(pending)} of {len(runs)} backtests")
+    except Exception as e:
+        BacktestSweep.objects.filter(pk=sweep.pk).update(status="FAILED", error=str(e)[:1000])
+        raise
+    finally:
+        if path:
+            os.unlink(path)
+    sweep.refresh_from_db()
+    return sweep
+
+
+def ranked_results(sweep: BacktestSweep, limit: int = 50, offset: int = 0) -> List[Dict[str, object]]:
+    rows = (
+        BacktestSweepResult.objects.filter(sweep=sweep)
+        .order_by(F("score").desc(nulls_last=True), "index")
+        .values("index", "params", "score", "stats")[offset:offset + limit]
+    )
+    return [{"rank": offset + n + 1, **row} for n, row in enumerate(rows)]
@@ -0,0 +1,107 @@
+import logging
+from datetime import timedelta
+from typing import Dict, Optional, Sequence, Tuple
+
+from django.db import IntegrityError, transaction as dbtx
+from django.db.models import F, Max
+from django.utils import timezone
+
+from ..models import SyncState, SyncTombstone
+
+logger = logging.getLogger(__name__)
+
+TOMBSTONE_RETENTION_DAYS = 30
+
+
+class InvalidSinceToken(ValueError):
+    pass
+
+
+def bump_version(user_id) -> int:
+    """
+    Increment and return the user's sync version. Runs inside the caller's
+    transaction: the counter row stays locked until commit, so versions
+    become visible in commit order and a client never skips one.
+    """
+    if not SyncState.objects.filter(user_id=user_id).update(version=F("version") + 1):
+        try:
+            with dbtx.atomic():
+                SyncState.objects.create(user_id=user_id, version=1)
+            return 1
+        except IntegrityError:
+            SyncState.objects.filter(user_id=user_id).update(version=F("version") + 1)
+    return SyncState.objects.filter(user_id=user_id).values_list("version", flat=True).get()
+
+
+def record_deletion(kind: str, user_id, object_id, simulation_id=None) -> None:
+    SyncTombstone.objects.create(
+        user_id=user_id, kind=kind, object_id=object_id, simulation_id=simulation_id,
+        version=bump_version(user_id),
+    )
+
+
+def record_deletions(kind: str, user_id, object_ids: Sequence, simulation_id=None) -> None:
+    """record_deletion for many rows of one user: a single version bump shared by one bulk_create."""
+    if not object_ids:
+        return
+    version = bump_version(user_id)
+    SyncTombstone.objects.bulk_create([
+        SyncTombstone(user_id=user_id, kind=kind, object_id=object_id, simulation_id=simulation_id, version=version)
+        for object_id in object_ids
+    ])
+
+
+def current_state(user_id) -> Tuple[int, int]:
+    """(version, pruned_version) for a user; (0, 0) before their first write."""
+    row = SyncState.objects.filter(user_id=user_id).values_list("version", "pruned_version").first()
+    return row or (0, 0)
+
+
+def parse_since(raw) -> Optional[int]:
+    if raw in (None, ""):
+        return None
+    try:
+        since = int(raw)
+    except (TypeError, ValueError):
+        raise InvalidSinceToken("since must be a version number")
+    if since < 0:
+        raise InvalidSinceToken("since must be a version number")
+    return since
+
+
+def delta_window(user_id, since: Optional[int]) -> Dict[str, object]:
+    """
+    Decide how to answer a ?since= request. Read the version before reading
+    rows: anything written afterwards has a higher version and is picked up
+    by the next delta. since=0, a token older than the pruned tombstones, or
+    one newer than the counter (e.g. after a restore) gets a full response;
+    rows written before versioning carry version 0 and only a full response
+    includes them.
+    """
+    version, pruned = current_state(user_id)
+    full = not since or since < pruned or since > version
+    return {"version": version, "since": since, "full": full}
+
+
+def deleted_since(user_id, kind: str, since: int, **filters):
+    """Ids of kind rows deleted after since; filters narrow it (e.g. simulation_id=None)."""
+    return [
+        str(pk) for pk in SyncTombstone.objects.filter(
+            user_id=user_id, kind=kind, version__gt=since, **filters,
+        ).values_list("object_id", flat=True)
+    ]
+
+
+def prune_tombstones(days: int = TOMBSTONE_RETENTION_DAYS) -> int:
+    """Drop old tombstones and remember, per user, the newest version that can no longer be answered as a delta."""
+    cutoff = timezone.now() - timedelta(days=days)
+    old = SyncTombstone.objects.filter(deleted_at__lt=cutoff)
+    pruned = 0
+    with dbtx.atomic():
+        for row in old.values("user_id").annotate(top=Max("version")):
+            SyncState.objects.filter(user_id=row["user_id"], pruned_version__lt=row["top"]).update(
+                pruned_version=row["top"]
+            )
+        pruned, _ = old.delete()
+    logger.info(f"Pruned {pruned} sync tombstones older than {days} days")
+    return pruned
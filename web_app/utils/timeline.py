@@ -0,0 +1,248 @@
+import logging
+from datetime import datetime, time as dt_time, timezone as dt_timezone
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction as dbtx
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from ..models import Simulation, Transaction
+from .backtest import historical_prices
+from .currency import SUPPORTED_CURRENCIES, convert_at_dates, normalise
+
+logger = logging.getLogger(__name__)
+
+SIMULATION_INDEX_CACHE_KEY = "simulation_index_{simulation_id}_{currency}"
+SIMULATION_INDEX_TIMEOUT = 24 * 60 * 60
+INDEX_ROW = ("id", "coin_id", "type", "quantity", "price", "price_currency", "time")
+EPSILON = 1e-12
+
+
+def _key(simulation_id, currency: str) -> str:
+    return SIMULATION_INDEX_CACHE_KEY.format(simulation_id=simulation_id, currency=currency)
+
+
+def _generation(simulation_id) -> int:
+    """
+    Ledger changes seen for a simulation; every cached index records the
+    generation it reflects. The counter lives on the Simulation row, not in
+    the cache, so a bump is atomic and seen by every worker.
+    """
+    return Simulation.objects.filter(pk=simulation_id).values_list("ledger_generation", flat=True).first() or 0
+
+
+def _bump_generation(simulation_id) -> int:
+    Simulation.objects.filter(pk=simulation_id).update(ledger_generation=F("ledger_generation") + 1)
+    return _generation(simulation_id)
+
+
+def _deltas(rows: Sequence[tuple], currency: str):
+    """Signed quantity and signed cash (in currency, at each trade's date) per ledger row."""
+    sign = np.asarray([1.0 if r[2] == "BUY" else -1.0 for r in rows])
+    dq = np.asarray([float(r[3]) for r in rows]) * sign
+    prices = convert_at_dates([r[4] for r in rows], [r[6] for r in rows], [r[5] for r in rows], currency)
+    return dq, dq * np.asarray(prices, dtype=np.float64)
+
+
+def build_index(simulation_id, currency: str) -> Dict[str, object]:
+    """
+    Prefix-sum index of a simulation's ledger in one currency.
+
+    Rows are the transactions in (time, id) order; qty[i] and cost[i] hold,
+    per coin column, the running net quantity and net cash invested after row
+    i. The per-row deltas are kept so rows can be inserted or removed later by
+    patching the suffix instead of replaying the ledger.
+    """
+    currency = normalise(currency)
+    rows = list(
+        Transaction.objects.filter(simulation_id=simulation_id).order_by("time", "id").values_list(*INDEX_ROW)
+    )
+    coins = sorted({r[1] for r in rows})
+    column = {cid: c for c, cid in enumerate(coins)}
+    col = np.asarray([column[r[1]] for r in rows], dtype=np.int64)
+    dq, dc = _deltas(rows, currency) if rows else (np.empty(0), np.empty(0))
+    qty = np.zeros((len(rows), len(coins)))
+    cost = np.zeros((len(rows), len(coins)))
+    qty[np.arange(len(rows)), col] = dq
+    cost[np.arange(len(rows)), col] = dc
+    return {
+        "currency": currency,
+        "ids": [str(r[0]) for r in rows],
+        "t": np.asarray([int(r[6].timestamp() * 1000) for r in rows], dtype=np.int64),
+        "col": col,
+        "dq": dq,
+        "dc": dc,
+        "coins": coins,
+        "qty": np.cumsum(qty, axis=0),
+        "cost": np.cumsum(cost, axis=0),
+    }
+
+
+def _remove_row(index: Dict[str, object], tx_id: str) -> bool:
+    try:
+        i = index["ids"].index(tx_id)
+    except ValueError:
+        return False
+    c = index["col"][i]
+    index["qty"][i + 1:, c] -= index["dq"][i]
+    index["cost"][i + 1:, c] -= index["dc"][i]
+    del index["ids"][i]
+    for name in ("t", "col", "dq", "dc"):
+        index[name] = np.delete(index[name], i)
+    for name in ("qty", "cost"):
+        index[name] = np.delete(index[name], i, axis=0)
+    return True
+
+
+def _insert_row(index: Dict[str, object], row: tuple) -> None:
+    if row[1] not in index["coins"]:
+        index["coins"].append(row[1])
+        for name in ("qty", "cost"):
+            index[name] = np.hstack([index[name], np.zeros((len(index["ids"]), 1))])
+    c = index["coins"].index(row[1])
+    ms = int(row[6].timestamp() * 1000)
+    dq, dc = (float(v[0]) for v in _deltas([row], index["currency"]))
+    p = int(np.searchsorted(index["t"], ms, side="right"))
+    for name, delta in (("qty", dq), ("cost", dc)):
+        matrix = index[name]
+        new = matrix[p - 1].copy() if p else np.zeros(matrix.shape[1])
+        new[c] += delta
+        matrix = np.insert(matrix, p, new, axis=0)
+        matrix[p + 1:, c] += delta
+        index[name] = matrix
+    index["ids"].insert(p, str(row[0]))
+    index["t"] = np.insert(index["t"], p, ms)
+    index["col"] = np.insert(index["col"], p, c)
+    index["dq"] = np.insert(index["dq"], p, dq)
+    index["dc"] = np.insert(index["dc"], p, dc)
+
+
+def update_simulation_index(simulation_id, tx_id, row: Optional[tuple] = None) -> None:
+    """
+    Patch every cached index of a simulation for one changed transaction:
+    its old row (if any) is removed and, unless it was deleted (row is None),
+    its current row is inserted at its time. Applying the same change twice is
+    harmless, so this can run both from signals and after a rebuild.
+
+    The cache read-modify-write is not atomic, so each change first takes the
+    next generation number. Only an index at the generation just before it is
+    patched; any other was read or written by a concurrent change and is
+    dropped, and readers rebuild an index whose generation is not current.
+    """
+    if not simulation_id:
+        return
+    generation = _bump_generation(simulation_id)
+    keys = [_key(simulation_id, c) for c in SUPPORTED_CURRENCIES]
+    updated, stale = {}, []
+    for key, index in cache.get_many(keys).items():
+        if index.get("generation") != generation - 1:
+            stale.append(key)
+            continue
+        _remove_row(index, str(tx_id))
+        if row is not None:
+            _insert_row(index, row)
+        index["generation"] = generation
+        updated[key] = index
+    if stale:
+        cache.delete_many(stale)
+    if updated:
+        cache.set_many(updated, SIMULATION_INDEX_TIMEOUT)
+
+
+def schedule_index_update(tx, deleted: bool = False) -> None:
+    """Apply a transaction change to the cached indexes once the surrounding DB transaction commits."""
+    if not tx.simulation_id:
+        return
+    simulation_id, tx_id = tx.simulation_id, tx.id  # delete() clears the pk before commit
+    row = None if deleted else tuple(getattr(tx, f) for f in INDEX_ROW)
+    dbtx.on_commit(lambda: update_simulation_index(simulation_id, tx_id, row))
+
+
+def drop_simulation_index(simulation_id) -> None:
+    """
+    Forget the cached indexes; use after bulk writes that bypass model
+    signals. The generation is bumped once the write commits, so an index
+    rebuilt from the ledger before the commit is not served afterwards.
+    """
+    if simulation_id:
+        cache.delete_many([_key(simulation_id, c) for c in SUPPORTED_CURRENCIES])
+        dbtx.on_commit(lambda: _bump_generation(simulation_id))
+
+
+def simulation_index(simulation_id, currency: str) -> Dict[str, object]:
+    """
+    The cached index, rebuilt when missing, when a concurrent change left it
+    at an older generation, or when its row count no longer matches the
+    ledger (one COUNT query guards against missed updates).
+    """
+    currency = normalise(currency)
+    key = _key(simulation_id, currency)
+    # Read the generation before the ledger: a change committed meanwhile bumps it and forces another rebuild.
+    generation = _generation(simulation_id)
+    index = cache.get(key)
+    if (index is None or index.get("generation") != generation
+            or len(index["ids"]) != Transaction.objects.filter(simulation_id=simulation_id).count()):
+        index = build_index(simulation_id, currency)
+        index["generation"] = generation
+        cache.set(key, index, SIMULATION_INDEX_TIMEOUT)
+    return index
+
+
+def parse_as_of(raw: str) -> datetime:
+    """A datetime, or a date meaning the end of that day (UTC). Raises ValueError."""
+    raw = (raw or "").strip()
+    try:
+        day = parse_date(raw)
+        parsed = datetime.combine(day, dt_time.max) if day else parse_datetime(raw)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError("as_of must be a YYYY-MM-DD date or an ISO datetime")
+    if timezone.is_naive(parsed):
+        parsed = parsed.replace(tzinfo=dt_timezone.utc)
+    if parsed.date() > timezone.now().date():
+        raise ValueError("as_of cannot be in the future")
+    return parsed
+
+
+def state_as_of(simulation, as_of: datetime, currency: str) -> Dict[str, object]:
+    """
+    Holdings, invested cash and value of a simulation at as_of: one binary
+    search for the last trade at or before it, one row read per matrix, and
+    the coins held priced at that day's close.
+    """
+    index = simulation_index(simulation.id, currency)
+    n = int(np.searchsorted(index["t"], int(as_of.timestamp() * 1000), side="right"))
+    qty = index["qty"][n - 1] if n else np.zeros(len(index["coins"]))
+    cost = index["cost"][n - 1] if n else np.zeros(len(index["coins"]))
+    held = [c for c in range(len(index["coins"])) if qty[c] > EPSILON]
+    coin_ids = [index["coins"][c] for c in held]
+    day = as_of.astimezone(dt_timezone.utc).date()
+    prices = historical_prices(coin_ids, index["currency"], day, day)[:, 0] if coin_ids else np.empty(0)
+
+    holdings, total_value = [], 0.0
+    for c, coin_id, price in zip(held, coin_ids, prices):
+        priced = bool(np.isfinite(price))
+        value = float(qty[c] * price) if priced else float(cost[c])
+        total_value += value
+        holdings.append({
+            "coin_id": coin_id,
+            "quantity": round(float(qty[c]), 12),
+            "invested": round(float(cost[c]), 2),
+            "price": round(float(price), 10) if priced else None,
+            "value": round(value, 2),
+        })
+    invested = float(cost.sum())
+    return {
+        "time": as_of.isoformat(),
+        "currency": index["currency"],
+        "transactions": n,
+        "holdings": holdings,
+        "missing": [h["coin_id"] for h in holdings if h["price"] is None],
+        "invested": round(invested, 2),
+        "value": round(total_value, 2),
+        "pnl": round(total_value - invested, 2),
+    }
@@ -0,0 +1,115 @@
+import hashlib
+import logging
+from decimal import Decimal
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+from django.db import IntegrityError, transaction as dbtx
+from django.utils import timezone
+
+from ..models import SimulationArchive, SimulationValuation
+from .backtest import historical_prices
+from .currency import conversion_factor, normalise
+from .metrics import ledger_fingerprints, simulation_metrics
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("ENDED", "ARCHIVED")
+
+
+def is_finished(simulation) -> bool:
+    return simulation.status in FINISHED_STATUSES
+
+
+def valuation_date(simulation):
+    """The day a finished simulation is valued at: its end date, or today if it was ended without one."""
+    today = timezone.now().date()
+    return min(simulation.end_date, today) if simulation.end_date else today
+
+
+def _ledger_hash(fingerprint: str) -> str:
+    return hashlib.sha1(fingerprint.encode()).hexdigest()
+
+
+def freeze_simulation(simulation, currency: str, totals: Dict[str, Dict[str, Decimal]],
+                      fingerprint: str) -> Optional[SimulationValuation]:
+    """
+    Value a finished simulation once, at the close of its end date, and store
+    the result with the metrics of its value series. Nothing is stored if an
+    open coin has no price that day (the next read tries again), so a frozen
+    valuation never contains a guess.
+    """
+    currency = normalise(currency)
+    day = valuation_date(simulation)
+    open_coins = sorted(cid for cid, t in totals.items() if t["net"] > 0)
+    closes = historical_prices(open_coins, currency, day, day)[:, 0] if open_coins else np.empty(0)
+    if np.isnan(closes).any():
+        logger.info(f"Not freezing simulation {simulation.id}: no {day} close for some coins")
+        return None
+
+    holdings = []
+    for cid, price in zip(open_coins, closes):
+        quantity = float(totals[cid]["net"])
+        holdings.append({"coin_id": cid, "quantity": round(quantity, 12), "price": round(float(price), 10),
+                         "value": round(quantity * float(price), 2)})
+    metrics = simulation_metrics(simulation, currency)
+    if metrics.get("missing"):
+        return None
+    invested = sum((t["bought"] - t["sold"] for t in totals.values()), Decimal("0"))
+    units = sum((t["net"] for t in totals.values()), Decimal("0"))
+    try:
+        with dbtx.atomic():
+            return SimulationValuation.objects.create(
+                simulation=simulation, currency=currency, valued_at=day, ledger=_ledger_hash(fingerprint),
+                invested=invested, units=max(units, Decimal("0")),
+                value=Decimal(str(round(sum(h["value"] for h in holdings), 2))),
+                holdings=holdings, metrics=metrics,
+            )
+    except IntegrityError:
+        # Frozen concurrently; the stored row wins.
+        return SimulationValuation.objects.filter(simulation=simulation, currency=currency).first()
+
+
+def frozen_summaries(simulations: Sequence, currencies: Dict[object, str]) -> Dict[object, Dict[str, object]]:
+    """
+    Summaries of finished simulations from their frozen valuations, with no
+    coin price lookups and no writes: one fingerprint GROUP BY and one valuation
+    query. Simulations without a valuation in their owner's currency, or whose
+    trades changed since freezing, are left out (and valued live) until the
+    freeze job (simulations.freeze_pending) catches up. Archived ones cannot
+    be valued live, so their stored valuation is converted instead.
+    """
+    finished = [s for s in simulations if is_finished(s)]
+    if not finished:
+        return {}
+    ledgers = {sid: _ledger_hash(fingerprint)
+               for sid, fingerprint in ledger_fingerprints([s.id for s in finished]).items()}
+    # Cold simulations have no hot rows; their ledger is the one recorded when they were archived.
+    cold = dict(SimulationArchive.objects.filter(simulation_id__in=[s.id for s in finished])
+                .values_list("simulation_id", "ledger"))
+    ledgers.update(cold)
+    stored = {
+        (v.simulation_id, v.currency): v
+        for v in SimulationValuation.objects.filter(simulation_id__in=[s.id for s in finished])
+    }
+    summaries = {}
+    for sim in finished:
+        currency = normalise(currencies.get(sim.user_id))
+        valuation, factor = stored.get((sim.id, currency)), None
+        if valuation is None and sim.id in cold:
+            # Archived rows cannot be re-valued; convert the valuation the simulation was archived with
+            # (unconverted without FX rates, as convert_amount does).
+            valuation = next((v for (sid, _), v in stored.items() if sid == sim.id and v.ledger == cold[sim.id]), None)
+            if valuation is not None:
+                factor = conversion_factor(valuation.currency, currency) or Decimal("1")
+        if valuation is None or valuation.ledger != ledgers[sim.id]:
+            continue
+        summaries[sim.id] = {
+            "invested": round(float(valuation.invested * (factor or 1)), 2),
+            "units": round(float(valuation.units), 4),
+            "current_value": round(float(valuation.value * (factor or 1)), 2),
+            "valued_at": valuation.valued_at.isoformat(),
+            # Metrics are returns and ratios; only their currency label changes.
+            "metrics": valuation.metrics if factor is None else {**valuation.metrics, "currency": currency},
+        }
+    return summaries
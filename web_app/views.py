@@ -1,7 +1,9 @@
+import io
 import logging
 import secrets
+import uuid
 from datetime import timedelta
-from decimal import Decimal
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
 
 import requests
 from django.conf import settings
@@ -39,14 +41,40 @@ from .models import (
     Transaction,
     Holding,
     PasswordResetToken,
+    PortfolioSnapshot,
+    PortfolioSummary,
+    LotState,
+    BacktestSweep,
+    LeaderboardEntry,
 )
 from .serializers import (
     UserRegistrationSerializer, UserProfileSerializer, CoinSerializer, CoinDetailSerializer,
     WatchlistSerializer, SimulationCreateSerializer, SimulationSummarySerializer,
     SimulationDetailSerializer, TransactionSerializer, PortfolioHoldingSerializer,
 )
+from .utils.backtest import (
+    BacktestSpecError, backtest as run_strategy_backtest, parse_spec as parse_backtest_spec,
+    save_backtest, series_payload as backtest_series,
+)
+from .utils.benchmarks import BenchmarkSpecError, compare as compare_benchmarks, parse_benchmarks
 from .utils.coingecko import get_markets, get_current_prices, get_coin_market_chart, get_global_market_caps, get_coin_details
-from .utils.currency import convert_amount, normalise as normalise_currency
+from .utils.currency import DECIMAL_QUANTIZE, conversion_factor, convert_amount, normalise as normalise_currency
+from .utils.imports import ImportFormatError, import_transactions
+from .utils.leaderboard import LEADERBOARD_SIZE, WINDOWS as LEADERBOARD_WINDOWS
+from .utils.lots import apply_transaction as apply_lots, rebuild_lots, rebuild_user_lots
+from .utils.metrics import portfolio_metrics as build_portfolio_metrics, simulation_metrics
+from .utils.portfolio import get_summary, invalidate_summary, realised_local, record_trade, value_holdings
+from .utils.prices import live_quotes
+from .utils.projection import ProjectionSpecError, parse_projection, project
+from .utils.rebalance import RebalanceSpecError, parse_rebalance, rebalance
+from .utils.series import portfolio_performance as build_portfolio_performance, simulation_series
+from .utils.snapshots import schedule_snapshot_update
+from .utils.sweeps import (
+    MAX_INLINE_SWEEP_RUNS, SweepSpecError, create_sweep, ranked_results as ranked_sweep_results, run_sweep,
+)
+from .utils.sync import InvalidSinceToken, current_state as current_sync_state, deleted_since, delta_window, parse_since
+from .utils.timeline import parse_as_of, state_as_of
+from .utils.valuation import frozen_summaries
 
 
 logger = logging.getLogger(__name__)
@@ -305,6 +333,17 @@ def logout_view(request):
         return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+def _save_profile(serializer):
+    """Save a profile update; a cost basis method change replays the user's ledgers under the new method."""
+    previous_method = serializer.instance.cost_basis_method
+    with dbtx.atomic():
+        user = serializer.save()
+        if user.cost_basis_method != previous_method:
+            rebuild_user_lots(user.id)
+            PortfolioSummary.objects.filter(user=user).delete()
+    return user
+
+
 class ProfileView(generics.RetrieveUpdateAPIView):
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
@@ -323,7 +362,7 @@ class ProfileView(generics.RetrieveUpdateAPIView):
         try:
             serializer = self.get_serializer(request.user, data=request.data, partial=True)
             if serializer.is_valid():
-                serializer.save()
+                _save_profile(serializer)
                 logger.info(f"Profile updated for {request.user.email}")
                 return safe_response(serializer.data)
             logger.warning(f"Profile update failed: {serializer.errors}")
@@ -482,7 +521,7 @@ def profile_view(request):
             
             serializer = UserProfileSerializer(request.user, data=update_data, partial=True)
             if serializer.is_valid():
-                user = serializer.save()
+                user = _save_profile(serializer)
                 logger.info(f"Profile updated successfully for user: {user.email}")
                 return safe_response({"data": serializer.data})
             
@@ -918,7 +957,17 @@ def admin_transaction_detail(request, tx_id):
         if not _staff_required(request.user):
             return safe_response({"detail": "forbidden"}, code=1001, status_code=403)
         tx = get_object_or_404(Transaction, id=tx_id)
-        tx.delete()
+        with dbtx.atomic():
+            # Lock the position while the ledger is replayed, as the trade endpoints do.
+            Holding.objects.select_for_update().filter(
+                user_id=tx.user_id, simulation_id=tx.simulation_id, coin_id=tx.coin_id
+            ).first()
+            tx.delete()
+            if rebuild_lots(tx.user_id, tx.simulation_id, tx.coin_id, from_time=tx.time)["oversold"]:
+                dbtx.set_rollback(True)
+                return safe_response({"detail": "Later sells would exceed the remaining quantity"}, code=1001,
+                                     status_code=400)
+            invalidate_summary(tx.user, tx.simulation)
         return safe_response({"detail": "deleted"}, status_code=204)
     except Exception as e:
         return handle_exception(e, "admin_transaction_detail")
@@ -1177,6 +1226,32 @@ class WatchlistView(generics.ListCreateAPIView):
     def get_queryset(self):
         return WatchListItem.objects.filter(user=self.request.user)
 
+    def list(self, request, *args, **kwargs):
+        """
+        Full list (with the current sync version in X-Sync-Version), or with
+        ?since=<version> only the items added and the ids removed since then.
+        """
+        try:
+            since = parse_since(request.query_params.get("since"))
+        except InvalidSinceToken as e:
+            return safe_response({"detail": str(e)}, code=1000, status_code=status.HTTP_400_BAD_REQUEST)
+        window = delta_window(request.user.id, since)
+        if since is None:
+            response = super().list(request, *args, **kwargs)
+            response["X-Sync-Version"] = str(window["version"])
+            return response
+
+        payload = {**window, "items": [], "deleted": []}
+        if window["full"]:
+            payload["items"] = self.get_serializer(self.get_queryset(), many=True).data
+        elif window["version"] != since:
+            changed = self.get_queryset().filter(version__gt=since).select_related("coin")
+            payload["items"] = self.get_serializer(changed, many=True).data
+            payload["deleted"] = deleted_since(request.user.id, "watchlist", since)
+        response = Response(payload)
+        response["X-Sync-Version"] = str(window["version"])
+        return response
+
     def create(self, request, *args, **kwargs):
         try:
             coin_id = request.data.get("coin_id")
@@ -1229,10 +1304,19 @@ class WatchlistRemoveView(generics.DestroyAPIView):
 def portfolio_view(request):
     try:
         user = request.user
+        if request.method == "GET" and request.query_params.get("since") not in (None, ""):
+            try:
+                since = parse_since(request.query_params.get("since"))
+            except InvalidSinceToken as e:
+                return safe_response({"detail": str(e)}, code=1000, status_code=400)
+            return safe_response(_portfolio_delta(user, since))
         if request.method == "GET" or request.method == "DELETE":
             if request.method == "DELETE":
-                Holding.objects.filter(user=user, simulation=None).delete()
-                Transaction.objects.filter(user=user, simulation=None).delete()
+                with dbtx.atomic():
+                    Holding.objects.filter(user=user, simulation=None).delete()
+                    Transaction.objects.filter(user=user, simulation=None).delete()
+                    LotState.objects.filter(user=user, simulation=None).delete()
+                    invalidate_summary(user)
             return safe_response(_serialize_portfolio(user))
 
         # POST = BUY
@@ -1248,22 +1332,18 @@ def portfolio_view(request):
         currency = normalise_currency(request.data.get("currency") or getattr(user, "preferred_currency", "USD"))
         price_in_usd = convert_amount(price, currency, "USD")
         with dbtx.atomic():
-            holding, created = Holding.objects.select_for_update().get_or_create(
+            # Lock the position; the lot engine then sets its quantity and average price.
+            Holding.objects.select_for_update().get_or_create(
                 user=user, coin=coin, simulation=None,
                 defaults={"quantity": quantity, "avg_price": price_in_usd, "avg_price_currency": "USD"},
             )
-            if not created:
-                total_cost = holding.quantity * holding.avg_price + quantity * price_in_usd
-                new_qty = holding.quantity + quantity
-                holding.quantity = new_qty
-                holding.avg_price = (total_cost / new_qty) if new_qty > 0 else Decimal("0")
-                holding.avg_price_currency = "USD"
-                holding.save(update_fields=["quantity", "avg_price", "avg_price_currency", "updated_at"])
-            Transaction.objects.create(
+            tx = Transaction.objects.create(
                 user=user, coin=coin, simulation=None, type="BUY",
                 quantity=quantity, price=price_in_usd, price_currency="USD", fee=Decimal("0"),
                 cost_basis=quantity * price_in_usd, realised_profit=Decimal("0"), realised_profit_currency="USD"
             )
+            apply_lots(tx)
+            record_trade(user, None, cost_delta=quantity * price_in_usd)
         return safe_response(_serialize_portfolio(user), status_code=201)
     except Exception as e:
         return handle_exception(e, "portfolio_view")
@@ -1282,6 +1362,12 @@ def portfolio_sell(request):
         if quantity <= 0 or price <= 0:
             return safe_response({"detail": "quantity and price must be positive"}, code=1000, status_code=400)
 
+        price_currency = normalise_currency(request.data.get("currency") or getattr(user, "preferred_currency", "USD"))
+        local_currency = normalise_currency(getattr(user, "preferred_currency", "USD"))
+        # Resolve FX before taking the row lock: a rate miss goes upstream and must not hold the lock
+        price_in_usd = convert_amount(price, price_currency, "USD")
+        to_local = conversion_factor("USD", local_currency)
+
         with dbtx.atomic():
             try:
                 holding = Holding.objects.select_for_update().get(user=user, simulation=None, coin__id=coin_id)
@@ -1290,52 +1376,423 @@ def portfolio_sell(request):
             if quantity > holding.quantity:
                 return safe_response({"detail": "Insufficient quantity"}, code=1001, status_code=400)
 
-            # Update holding
-            price_currency = normalise_currency(request.data.get("currency") or getattr(user, "preferred_currency", "USD"))
-            price_in_usd = convert_amount(price, price_currency, "USD")
-            if quantity == holding.quantity:
-                holding.delete()
-            else:
-                holding.quantity = holding.quantity - quantity
-                holding.save(update_fields=["quantity", "updated_at"])
-
-            Transaction.objects.create(
+            tx = Transaction.objects.create(
                 user=user, coin=holding.coin, simulation=None, type="SELL",
                 quantity=quantity, price=price_in_usd, price_currency="USD", fee=Decimal("0"),
-                cost_basis=quantity * holding.avg_price,
-                realised_profit=quantity * (price_in_usd - holding.avg_price),
-                realised_profit_currency="USD"
+                cost_basis=Decimal("0"), realised_profit=Decimal("0"), realised_profit_currency="USD"
+            )
+            # Closes lots per the user's cost basis method and updates the holding
+            apply_lots(tx)
+            tx.refresh_from_db(fields=["cost_basis", "realised_profit"])
+            cost_basis, realised = tx.cost_basis, tx.realised_profit
+            realised_local = realised if to_local is None else (realised * to_local).quantize(
+                DECIMAL_QUANTIZE, rounding=ROUND_HALF_UP)
+            record_trade(
+                user, None, cost_delta=-cost_basis, realised_delta=realised,
+                realised_local_delta=realised_local, local_currency=local_currency,
             )
         return safe_response(_serialize_portfolio(user))
     except Exception as e:
         return handle_exception(e, "portfolio_sell")
 
 
+MAX_BATCH_TRADES = 200
+
+
+def _parse_batch_trades(raw, default_currency):
+    """Validate a batch payload up front; returns (trades, errors) with errors keyed by index."""
+    if not isinstance(raw, list) or not raw:
+        return None, [{"index": None, "detail": "trades must be a non-empty list"}]
+    if len(raw) > MAX_BATCH_TRADES:
+        return None, [{"index": None, "detail": f"at most {MAX_BATCH_TRADES} trades per batch"}]
+    trades, errors = [], []
+    for i, item in enumerate(raw):
+        if not isinstance(item, dict):
+            errors.append({"index": i, "detail": "trade must be an object"})
+            continue
+        side = str(item.get("type") or item.get("side") or "").upper()
+        coin_id = str(item.get("coin_id") or "").strip()
+        try:
+            quantity = Decimal(str(item.get("quantity")))
+            price = Decimal(str(item.get("price")))
+            fee = Decimal(str(item.get("fee") or 0))
+        except (InvalidOperation, TypeError, ValueError):
+            errors.append({"index": i, "detail": "quantity, price and fee must be numbers"})
+            continue
+        if side not in ("BUY", "SELL") or not coin_id:
+            errors.append({"index": i, "detail": "coin_id and type (BUY or SELL) required"})
+        elif not quantity.is_finite() or not price.is_finite() or quantity <= 0 or price <= 0:
+            errors.append({"index": i, "detail": "quantity and price must be positive"})
+        elif not fee.is_finite() or fee < 0:
+            errors.append({"index": i, "detail": "fee cannot be negative"})
+        else:
+            currency = normalise_currency(item.get("currency") or default_currency)
+            trades.append({"coin_id": coin_id, "type": side, "quantity": quantity, "price": price, "fee": fee,
+                           "currency": currency})
+    return trades, errors
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def portfolio_batch(request):
+    """
+    Apply many buys and sells in one DB transaction. Trades are validated up
+    front, each affected holding is locked once, all transactions are inserted
+    with a single bulk_create, and the portfolio is serialized once.
+    """
+    try:
+        user = request.user
+        local_currency = normalise_currency(getattr(user, "preferred_currency", "USD"))
+        trades, errors = _parse_batch_trades(request.data.get("trades"), request.data.get("currency") or local_currency)
+        if errors:
+            return safe_response({"detail": "Invalid trades", "errors": errors}, code=1000, status_code=400)
+
+        coin_ids = list(dict.fromkeys(t["coin_id"] for t in trades))
+        # Resolve FX before taking locks: a rate miss goes upstream and must not hold the write transaction open
+        for trade in trades:
+            trade["price_usd"] = convert_amount(trade["price"], trade["currency"], "USD")
+            trade["fee_usd"] = convert_amount(trade["fee"], trade["currency"], "USD") if trade["fee"] else Decimal("0")
+        to_local = conversion_factor("USD", local_currency)
+
+        with dbtx.atomic():
+            known = Coin.objects.in_bulk(coin_ids)
+            Coin.objects.bulk_create(
+                [Coin(id=cid, symbol=cid[:10].upper(), name=cid.replace("-", " ").title())
+                 for cid in coin_ids if cid not in known],
+                ignore_conflicts=True,
+            )
+            held = {
+                h.coin_id: h.quantity
+                for h in Holding.objects.select_for_update().filter(user=user, simulation=None, coin_id__in=coin_ids)
+            }
+            # Apply in order against the locked quantities so a sell may use an earlier buy in the batch
+            for i, trade in enumerate(trades):
+                position = held.get(trade["coin_id"], Decimal("0"))
+                if trade["type"] == "SELL" and trade["quantity"] > position:
+                    dbtx.set_rollback(True)
+                    return safe_response(
+                        {"detail": "Insufficient quantity", "errors": [{"index": i, "detail": "Insufficient quantity"}]},
+                        code=1001, status_code=400,
+                    )
+                held[trade["coin_id"]] = position + (trade["quantity"] if trade["type"] == "BUY" else -trade["quantity"])
+
+            # Ascending ids keep batch order when rows share a timestamp (the ledger sorts by time, id)
+            ids = sorted(uuid.uuid4() for _ in trades)
+            txs = []
+            for tx_id, trade in zip(ids, trades):
+                price_in_usd = trade["price_usd"]
+                is_buy = trade["type"] == "BUY"
+                txs.append(Transaction(
+                    id=tx_id, user=user, coin_id=trade["coin_id"], simulation=None, type=trade["type"],
+                    quantity=trade["quantity"], price=price_in_usd, price_currency="USD", fee=trade["fee_usd"],
+                    cost_basis=trade["quantity"] * price_in_usd if is_buy else Decimal("0"),
+                    realised_profit=Decimal("0"), realised_profit_currency="USD",
+                ))
+            Transaction.objects.bulk_create(txs)
+            first_time = min(tx.time for tx in txs)
+            for coin_id in coin_ids:
+                rebuild_lots(user.id, None, coin_id, from_time=first_time)
+
+            written = Transaction.objects.filter(id__in=ids).values_list("type", "cost_basis", "realised_profit")
+            cost_delta = realised = Decimal("0")
+            for kind, cost, gain in written:
+                cost_delta += cost if kind == "BUY" else -cost
+                realised += gain
+            realised_local = realised if to_local is None else (realised * to_local).quantize(
+                DECIMAL_QUANTIZE, rounding=ROUND_HALF_UP)
+            record_trade(
+                user, None, cost_delta=cost_delta, realised_delta=realised,
+                realised_local_delta=realised_local, local_currency=local_currency, trades=len(txs),
+            )
+            schedule_snapshot_update(txs[0])
+
+        payload = _serialize_portfolio(user)
+        payload["transactions"] = [str(tx_id) for tx_id in ids]
+        return safe_response(payload, status_code=201)
+    except Exception as e:
+        return handle_exception(e, "portfolio_batch")
+
+
+PERFORMANCE_MAX_DAYS = 365
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def portfolio_performance(request):
+    """Value and unrealised P&L series for the live portfolio, aligned on a daily grid."""
+    try:
+        try:
+            days = int(request.GET.get("days", 7))
+        except (TypeError, ValueError):
+            return safe_response({"detail": "days must be an integer"}, code=1000, status_code=400)
+        if days < 1 or days > PERFORMANCE_MAX_DAYS:
+            return safe_response({"detail": f"days must be between 1 and {PERFORMANCE_MAX_DAYS}"}, code=1000, status_code=400)
+
+        user = request.user
+        holdings = list(
+            Holding.objects.filter(user=user, simulation=None, quantity__gt=0)
+            .values("coin_id", "quantity", "avg_price", "avg_price_currency")
+        )
+        currency = normalise_currency(getattr(user, "preferred_currency", "USD"))
+        return safe_response(build_portfolio_performance(holdings, currency, days))
+    except Exception as e:
+        return handle_exception(e, "portfolio_performance")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def portfolio_projection(request):
+    """
+    Monte Carlo percentile bands of future value for the live portfolio, or a
+    simulation's open positions with ?simulation_id=.
+    """
+    try:
+        user = request.user
+        simulation = None
+        sim_id = request.GET.get("simulation_id")
+        if sim_id:
+            try:
+                simulation = Simulation.objects.filter(id=sim_id, user=user).first()
+            except ValidationError:
+                simulation = None
+            if simulation is None:
+                return safe_response({"detail": "Simulation not found"}, code=1002, status_code=404)
+        currency = normalise_currency(getattr(user, "preferred_currency", "USD"))
+        try:
+            return safe_response(project(user, simulation, parse_projection(request.GET), currency))
+        except ProjectionSpecError as e:
+            return safe_response({"detail": str(e)}, code=1000, status_code=400)
+    except Exception as e:
+        return handle_exception(e, "portfolio_projection")
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def portfolio_rebalance(request):
+    """
+    Minimum-cost trades that move the live portfolio (or a simulation, with
+    simulation_id) to target weights or a minimum-risk mix. Nothing is
+    executed; for the live portfolio the `batch` payload can be posted to
+    portfolio/batch/ (null for a simulation, which that endpoint does not trade).
+    """
+    try:
+        user = request.user
+        simulation = None
+        sim_id = request.data.get("simulation_id") or request.GET.get("simulation_id")
+        if sim_id:
+            try:
+                simulation = Simulation.objects.filter(id=sim_id, user=user).first()
+            except ValidationError:
+                simulation = None
+            if simulation is None:
+                return safe_response({"detail": "Simulation not found"}, code=1002, status_code=404)
+        currency = normalise_currency(getattr(user, "preferred_currency", "USD"))
+        try:
+            return safe_response(rebalance(user, simulation, parse_rebalance(request.data), currency))
+        except RebalanceSpecError as e:
+            return safe_response({"detail": str(e)}, code=1000, status_code=400)
+    except Exception as e:
+        return handle_exception(e, "portfolio_rebalance")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def portfolio_metrics(request):
+    """Risk/return metrics of the live portfolio from its daily snapshots."""
+    try:
+        user = request.user
+        currency = normalise_currency(request.GET.get("currency") or getattr(user, "preferred_currency", "USD"))
+        return safe_response(build_portfolio_metrics(user, currency))
+    except Exception as e:
+        return handle_exception(e, "portfolio_metrics")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def portfolio_history(request):
+    """Materialized daily valuation snapshots for the portfolio or a simulation (single range read)."""
+    try:
+        user = request.user
+        start_raw, end_raw = request.GET.get("from"), request.GET.get("to")
+        try:
+            start = parse_date(start_raw) if start_raw else None
+            end = parse_date(end_raw) if end_raw else None
+        except ValueError:
+            start = end = None
+        if (start_raw and start is None) or (end_raw and end is None):
+            return safe_response({"detail": "from/to must be YYYY-MM-DD"}, code=1000, status_code=400)
+
+        simulation = None
+        sim_id = request.GET.get("simulation_id")
+        if sim_id:
+            simulation = get_object_or_404(Simulation, id=sim_id, user=user)
+
+        currency = normalise_currency(request.GET.get("currency") or getattr(user, "preferred_currency", "USD"))
+        qs = PortfolioSnapshot.objects.filter(user=user, simulation=simulation, currency=currency)
+        if start:
+            qs = qs.filter(date__gte=start)
+        if end:
+            qs = qs.filter(date__lte=end)
+        rows = list(qs.order_by("date").values_list("date", "value", "cost_basis", "realised_profit"))
+        return safe_response({
+            "currency": currency,
+            "simulation_id": str(simulation.id) if simulation else None,
+            "dates": [r[0].isoformat() for r in rows],
+            "value": [float(r[1]) for r in rows],
+            "cost_basis": [float(r[2]) for r in rows],
+            "realised": [float(r[3]) for r in rows],
+        })
+    except Exception as e:
+        return handle_exception(e, "portfolio_history")
+
+
 def _serialize_portfolio(user):
-    holdings = Holding.objects.filter(user=user, simulation=None).select_related("coin").order_by("-updated_at")
-    data = PortfolioHoldingSerializer(holdings, many=True).data
-    realised = (
-        Transaction.objects.filter(user=user, simulation=None)
-        .aggregate(v=Sum("realised_profit"))
-        .get("v") or 0
+    # Read the sync version before the rows so a concurrent write is re-sent by the next delta.
+    version, _ = current_sync_state(user.id)
+    holdings = list(Holding.objects.filter(user=user, simulation=None).select_related("coin").order_by("-updated_at"))
+    currency = normalise_currency(getattr(user, "preferred_currency", "USD"))
+    valuations, totals = value_holdings(holdings, currency)
+    data = PortfolioHoldingSerializer(holdings, many=True, context={"valuations": valuations}).data
+    summary = get_summary(user)
+    return {
+        "holdings": data,
+        "totals": totals,
+        "realised_total": float(summary.realised_total),
+        "realised_total_local": realised_local(summary, currency),
+        "currency": currency,
+        "total_cost_basis": float(summary.total_cost_basis),
+        "trade_count": summary.trade_count,
+        "version": version,
+    }
+
+
+def _portfolio_delta(user, since):
+    """
+    Holdings changed or deleted since a sync version, plus live quotes for
+    every held coin so unchanged rows can be repriced without a market call.
+    An idle poll is the counter lookup and the (cached) quotes; tokens that
+    are too old (pruned tombstones) or unknown fall back to the full payload.
+    """
+    window = delta_window(user.id, since)
+    if window["full"]:
+        payload = _serialize_portfolio(user)
+        payload.update(since=since, full=True)
+        return payload
+    currency = normalise_currency(getattr(user, "preferred_currency", "USD"))
+    held = Holding.objects.filter(user=user, simulation=None).values_list("coin_id", flat=True)
+    quotes = {
+        coin_id: {"price": quote.get("price"), "change_24h_pct": quote.get("change_24h_pct")}
+        for coin_id, quote in live_quotes(list(held), currency).items()
+    }
+    payload = {"version": window["version"], "since": since, "full": False, "holdings": [], "deleted": [],
+               "quotes": quotes, "currency": currency}
+    if window["version"] == since:
+        return payload
+
+    changed = list(
+        Holding.objects.filter(user=user, simulation=None, version__gt=since)
+        .select_related("coin").order_by("-updated_at")
     )
-    return {"holdings": data, "realised_total": float(realised)}
+    deleted = deleted_since(user.id, "holding", since, simulation_id=None)
+    if not changed and not deleted:
+        return payload
+    valuations, _ = value_holdings(changed, currency)
+    summary = get_summary(user)
+    payload.update(
+        holdings=PortfolioHoldingSerializer(changed, many=True, context={"valuations": valuations}).data,
+        deleted=deleted,
+        realised_total=float(summary.realised_total),
+        realised_total_local=realised_local(summary, currency),
+        total_cost_basis=float(summary.total_cost_basis),
+        trade_count=summary.trade_count,
+    )
+    return payload
+# -------------------------------------------------------------------------------
 # Transactions
 # -------------------------------------------------------------------------------
+def _record_ledger_trade(user, simulation, tx):
+    """
+    Apply a trade written through the lot engine to the running summary, with
+    amounts in USD. Only an append can be applied as a delta: a backdated
+    trade makes the replay rewrite later sells, so the summary is dropped and
+    rebuilt from the ledger on the next read.
+    """
+    later = Transaction.objects.filter(user=user, simulation=simulation, coin_id=tx.coin_id).filter(
+        Q(time__gt=tx.time) | Q(time=tx.time, id__gt=tx.id)
+    )
+    if later.exists():
+        invalidate_summary(user, simulation)
+        return
+    if tx.type == "BUY":
+        record_trade(user, simulation, cost_delta=tx.quantity * convert_amount(tx.price, tx.price_currency, "USD"))
+        return
+    tx.refresh_from_db(fields=["cost_basis", "realised_profit", "realised_profit_currency"])
+    local_currency = normalise_currency(getattr(user, "preferred_currency", "USD"))
+    record_trade(
+        user, simulation, cost_delta=-tx.cost_basis, realised_delta=tx.realised_profit,
+        realised_local_delta=convert_amount(tx.realised_profit, "USD", local_currency), local_currency=local_currency,
+    )
+
+
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
 def create_transaction(request):
     try:
         serializer = TransactionSerializer(data=request.data, context={"request": request})
-        if serializer.is_valid():
+        if not serializer.is_valid():
+            return safe_response({"detail": serializer.errors}, code=1000, status_code=status.HTTP_400_BAD_REQUEST)
+        side, quantity = serializer.validated_data["type"], serializer.validated_data["quantity"]
+        coin_id = serializer.validated_data["coin_id"]
+        with dbtx.atomic():
+            # Same path as the portfolio endpoints: lock the position, run the lot engine, update the summary.
+            if side == "SELL":
+                holding = Holding.objects.select_for_update().filter(
+                    user=request.user, simulation=None, coin_id=coin_id
+                ).first()
+                if holding is None or quantity > holding.quantity:
+                    return safe_response({"detail": "Insufficient quantity"}, code=1001,
+                                         status_code=status.HTTP_400_BAD_REQUEST)
             tx = serializer.save(user=request.user)
-            logger.info(f"Transaction created: {tx.id} by user {request.user.email}")
-            return safe_response(TransactionSerializer(tx).data, code=0, status_code=status.HTTP_201_CREATED)
-        return safe_response({"detail": serializer.errors}, code=1000, status_code=status.HTTP_400_BAD_REQUEST)
+            if side == "BUY":
+                Holding.objects.select_for_update().get_or_create(
+                    user=request.user, simulation=None, coin=tx.coin,
+                    defaults={"quantity": tx.quantity, "avg_price": tx.price, "avg_price_currency": tx.price_currency},
+                )
+            if apply_lots(tx)["oversold"]:
+                # A backdated sell can be covered now yet exceed what was held at its time or leave later sells short.
+                dbtx.set_rollback(True)
+                return safe_response({"detail": "Insufficient quantity at the trade's time"}, code=1001,
+                                     status_code=status.HTTP_400_BAD_REQUEST)
+            _record_ledger_trade(request.user, None, tx)
+        logger.info(f"Transaction created: {tx.id} by user {request.user.email}")
+        return safe_response(TransactionSerializer(tx).data, code=0, status_code=status.HTTP_201_CREATED)
     except Exception as e:
         return handle_exception(e, "create_transaction")
 
 
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def import_transactions_view(request):
+    """Stream-import a CSV trade history (multipart field "file") into the portfolio or a simulation."""
+    try:
+        upload = request.FILES.get("file")
+        if upload is None:
+            return safe_response({"detail": "file is required"}, code=1000, status_code=400)
+        simulation = None
+        if request.data.get("simulation_id"):
+            simulation = get_object_or_404(Simulation, id=request.data.get("simulation_id"), user=request.user)
+        stream = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+        try:
+            report = import_transactions(request.user, stream, simulation=simulation)
+        except ImportFormatError as e:
+            return safe_response({"detail": str(e)}, code=1000, status_code=400)
+        finally:
+            stream.detach()
+        return safe_response(report, status_code=status.HTTP_201_CREATED)
+    except Exception as e:
+        return handle_exception(e, "import_transactions_view")
+
+
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def list_transactions(request):
@@ -1400,15 +1857,253 @@ class SimulationDetailView(generics.RetrieveUpdateDestroyAPIView):
     def get_queryset(self):
         return Simulation.objects.filter(user=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        """With ?as_of=, also report holdings, invested cash and value at that time."""
+        raw = request.query_params.get("as_of")
+        if not raw:
+            return super().retrieve(request, *args, **kwargs)
+        try:
+            try:
+                as_of = parse_as_of(raw)
+            except ValueError as e:
+                return safe_response({"detail": str(e)}, code=1000, status_code=status.HTTP_400_BAD_REQUEST)
+            simulation = self.get_queryset().filter(id=kwargs.get("sim_id")).first()
+            if simulation is None:
+                return safe_response({"detail": "Simulation not found"}, code=1002, status_code=404)
+            data = self.get_serializer(simulation).data
+            currency = normalise_currency(getattr(request.user, "preferred_currency", "USD"))
+            data["as_of"] = state_as_of(simulation, as_of, currency)
+            return Response(data)
+        except Exception as e:
+            return handle_exception(e, "SimulationDetailView.retrieve")
+
 
 class SimulationPositionsView(generics.ListAPIView):
+    """Open positions of a simulation with live valuation; reads only its Holding rows (one per coin held)."""
     queryset = Holding.objects.all()
-    serializer_class = TransactionSerializer
+    serializer_class = PortfolioHoldingSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        sim_id = self.kwargs.get("sim_id")
-        return Holding.objects.filter(simulation__id=sim_id)
+        return (
+            Holding.objects.filter(simulation_id=self.kwargs.get("sim_id"), user=self.request.user, quantity__gt=0)
+            .select_related("coin").order_by("coin_id")
+        )
+
+    def list(self, request, *args, **kwargs):
+        try:
+            sim_id = self.kwargs.get("sim_id")
+            if not Simulation.objects.filter(id=sim_id, user=request.user).exists():
+                return safe_response({"detail": "Simulation not found"}, code=1002, status_code=404)
+            holdings = list(self.get_queryset())
+            currency = normalise_currency(getattr(request.user, "preferred_currency", "USD"))
+            valuations, totals = value_holdings(holdings, currency)
+            return safe_response({
+                "simulation_id": str(sim_id),
+                "currency": currency,
+                "holdings": self.get_serializer(holdings, many=True, context={"valuations": valuations}).data,
+                "totals": totals,
+            })
+        except Exception as e:
+            return handle_exception(e, "SimulationPositionsView.list")
+
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def simulation_backtest(request):
+    """
+    Run a DCA / rebalance / threshold strategy over historical prices and
+    save its trades as a new simulation (or only report results with dry_run).
+    """
+    try:
+        user = request.user
+        try:
+            spec = parse_backtest_spec(request.data)
+        except BacktestSpecError as e:
+            return safe_response({"detail": str(e)}, code=1000, status_code=400)
+        dry_run = str(request.data.get("dry_run", "")).lower() in ("1", "true", "yes")
+        name = str(request.data.get("name") or "").strip()
+        if not dry_run:
+            if not name:
+                return safe_response({"detail": "name is required"}, code=1000, status_code=400)
+            if Simulation.objects.filter(user=user, name__iexact=name).exists():
+                return safe_response({"detail": {"name": ["Simulation with this name already exists."]}},
+                                     code=1000, status_code=400)
+
+        currency = normalise_currency(getattr(user, "preferred_currency", "USD"))
+        run = run_strategy_backtest(spec, currency)
+        payload = {
+            "strategy": spec["strategy"],
+            "currency": currency,
+            "stats": run["stats"],
+            "missing": run["missing"],
+            "timings": run["timings"],
+            "series": backtest_series(spec, run["result"]),
+        }
+        if dry_run:
+            return safe_response(payload)
+        sim = save_backtest(user, spec, run, currency, name, str(request.data.get("description") or ""))
+        payload["simulation"] = SimulationSummarySerializer(sim, context={"request": request}).data
+        return safe_response(payload, status_code=201)
+    except Exception as e:
+        return handle_exception(e, "simulation_backtest")
+
+
+def _sweep_payload(sweep, limit=50, offset=0, detail=True):
+    payload = {
+        "id": str(sweep.id),
+        "name": sweep.name,
+        "status": sweep.status,
+        "rank_by": sweep.rank_by,
+        "currency": sweep.currency,
+        "total": sweep.total,
+        "completed": sweep.completed,
+        "error": sweep.error or None,
+        "base": sweep.base,
+        "grid": sweep.grid,
+        "created_at": sweep.created_at.isoformat(),
+        "finished_at": sweep.finished_at.isoformat() if sweep.finished_at else None,
+    }
+    if detail:
+        payload["results"] = ranked_sweep_results(sweep, limit, offset)
+    else:
+        for key in ("base", "grid"):
+            payload.pop(key)
+    return payload
+
+
+@api_view(["GET", "POST"])
+@permission_classes([IsAuthenticated])
+def backtest_sweeps(request):
+    """
+    GET lists the user's parameter sweeps. POST creates one from a base spec
+    and a grid; small sweeps run immediately, larger ones are left PENDING for
+    the run_backtest_sweeps batch command.
+    """
+    try:
+        user = request.user
+        if request.method == "GET":
+            sweeps = BacktestSweep.objects.filter(user=user)
+            return safe_response({"sweeps": [_sweep_payload(s, detail=False) for s in sweeps]})
+
+        name = str(request.data.get("name") or "").strip()
+        if not name:
+            return safe_response({"detail": "name is required"}, code=1000, status_code=400)
+        try:
+            sweep = create_sweep(user, name, request.data.get("base"), request.data.get("grid"),
+                                 request.data.get("rank_by") or "return_pct")
+        except SweepSpecError as e:
+            return safe_response({"detail": str(e)}, code=1000, status_code=400)
+        if sweep.total <= MAX_INLINE_SWEEP_RUNS:
+            sweep = run_sweep(sweep, workers=1)
+            return safe_response(_sweep_payload(sweep), status_code=201)
+        return safe_response(_sweep_payload(sweep), status_code=202)
+    except Exception as e:
+        return handle_exception(e, "backtest_sweeps")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def backtest_sweep_detail(request, sweep_id):
+    """Sweep progress and its ranked result table (?limit=50&offset=0)."""
+    try:
+        sweep = BacktestSweep.objects.filter(id=sweep_id, user=request.user).first()
+        if sweep is None:
+            return safe_response({"detail": "Sweep not found"}, code=1002, status_code=404)
+        try:
+            limit = min(max(int(request.GET.get("limit", 50)), 0), 500)
+            offset = max(int(request.GET.get("offset", 0)), 0)
+        except (TypeError, ValueError):
+            return safe_response({"detail": "limit and offset must be integers"}, code=1000, status_code=400)
+        return safe_response(_sweep_payload(sweep, limit, offset))
+    except Exception as e:
+        return handle_exception(e, "backtest_sweep_detail")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def simulation_leaderboard(request):
+    """Top active simulations across all users (?window=7d|30d|all&limit=50), precomputed by build_leaderboard."""
+    try:
+        window = request.GET.get("window", "30d")
+        if window not in LEADERBOARD_WINDOWS:
+            return safe_response(
+                {"detail": f"window must be one of {', '.join(LEADERBOARD_WINDOWS)}"}, code=1000, status_code=400
+            )
+        try:
+            limit = min(max(int(request.GET.get("limit", 50)), 0), LEADERBOARD_SIZE)
+        except (TypeError, ValueError):
+            return safe_response({"detail": "limit must be an integer"}, code=1000, status_code=400)
+        entries = list(
+            LeaderboardEntry.objects.filter(window=window).select_related("simulation", "user").order_by("rank")[:limit]
+        )
+        return safe_response({
+            "window": window,
+            "computed_at": entries[0].computed_at.isoformat() if entries else None,
+            "rows": [
+                {
+                    "rank": e.rank,
+                    "simulation_id": str(e.simulation_id),
+                    "name": e.simulation.name,
+                    # The board is public to every user, so never fall back to the username (often the email)
+                    "user": e.user.display_name or f"Trader #{e.user_id.hex[:8]}",
+                    "return_pct": e.return_pct,
+                    "value": float(e.value),
+                    "currency": e.currency,
+                    "mine": e.user_id == request.user.id,
+                }
+                for e in entries
+            ],
+        })
+    except Exception as e:
+        return handle_exception(e, "simulation_leaderboard")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def simulation_series_view(request, sim_id):
+    """Value, invested and P&L series for a simulation, with holdings applied at each trade's time."""
+    try:
+        sim = Simulation.objects.filter(id=sim_id, user=request.user).first()
+        if sim is None:
+            return safe_response({"detail": "Simulation not found"}, code=1002, status_code=404)
+        currency = normalise_currency(getattr(request.user, "preferred_currency", "USD"))
+        return safe_response(simulation_series(sim, currency))
+    except Exception as e:
+        return handle_exception(e, "simulation_series_view")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def simulation_metrics_view(request, sim_id):
+    """Total return, volatility, Sharpe/Sortino and drawdown of a simulation's value series."""
+    try:
+        sim = Simulation.objects.filter(id=sim_id, user=request.user).first()
+        if sim is None:
+            return safe_response({"detail": "Simulation not found"}, code=1002, status_code=404)
+        currency = normalise_currency(getattr(request.user, "preferred_currency", "USD"))
+        frozen = frozen_summaries([sim], {sim.user_id: currency}).get(sim.id, {}).get("metrics")
+        return safe_response(frozen or simulation_metrics(sim, currency))
+    except Exception as e:
+        return handle_exception(e, "simulation_metrics_view")
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def simulation_benchmarks_view(request, sim_id):
+    """A simulation's value against benchmarks bought with the same cash flows (?benchmark=coin:bitcoin,top10,mcap)."""
+    try:
+        sim = Simulation.objects.filter(id=sim_id, user=request.user).first()
+        if sim is None:
+            return safe_response({"detail": "Simulation not found"}, code=1002, status_code=404)
+        try:
+            benchmarks = parse_benchmarks(request.GET.get("benchmark"))
+        except BenchmarkSpecError as e:
+            return safe_response({"detail": str(e)}, code=1000, status_code=400)
+        currency = normalise_currency(getattr(request.user, "preferred_currency", "USD"))
+        return safe_response(compare_benchmarks(sim, currency, benchmarks))
+    except Exception as e:
+        return handle_exception(e, "simulation_benchmarks_view")
 
 
 @api_view(["POST"])
@@ -1427,36 +2122,65 @@ def simulation_transaction(request, sim_id):
                 break
         if tx_time is None:
             tx_time = timezone.now()
-        # fill price using historical price at tx_time; fallback to current
-        try:
-            coin_id = data.get("coin_id")
-            currency = request.user.preferred_currency.lower()
-            from .utils.coingecko import get_price_at_timestamp, get_current_prices
-            hist = get_price_at_timestamp(coin_id, currency, tx_time)
-            if hist is not None:
-                from decimal import Decimal, ROUND_HALF_UP
-                data["price"] = Decimal(str(hist)).quantize(Decimal("0.0000000001"), rounding=ROUND_HALF_UP)
-            else:
-                price_map = get_current_prices([coin_id], currency) or {}
-                p = price_map.get(coin_id, {}).get(currency)
-                if p is not None:
-                    from decimal import Decimal, ROUND_HALF_UP
-                    data["price"] = Decimal(str(p)).quantize(Decimal("0.0000000001"), rounding=ROUND_HALF_UP)
-        except Exception:
-            pass
-        serializer = TransactionSerializer(data=data, context={"request": request})
-        if serializer.is_valid():
-            tx = serializer.save(user=request.user, simulation=sim)
-            # Update timestamp to requested historical time
+        # async_price: accept now with price_status=PENDING; fill_pending_prices prices it later
+        deferred = str(request.data.get("async_price") or request.query_params.get("async_price") or "").lower() \
+            in ("1", "true", "yes")
+        price_status = "FILLED"
+        if deferred:
+            coin_id = str(data.get("coin_id") or "").strip()
+            if coin_id:
+                Coin.objects.get_or_create(
+                    id=coin_id, defaults={"symbol": coin_id[:10].upper(), "name": coin_id.replace("-", " ").title()}
+                )
+            if data.get("price") in (None, ""):
+                data["price"] = "0"
+                price_status = "PENDING"
+        else:
+            # fill price using historical price at tx_time; fallback to current
             try:
-                if tx_time:
-                    tx.time = tx_time
-                    tx.save(update_fields=["time"])
+                coin_id = data.get("coin_id")
+                currency = request.user.preferred_currency.lower()
+                from .utils.coingecko import get_price_at_timestamp, get_current_prices
+                hist = get_price_at_timestamp(coin_id, currency, tx_time)
+                if hist is not None:
+                    from decimal import Decimal, ROUND_HALF_UP
+                    data["price"] = Decimal(str(hist)).quantize(Decimal("0.0000000001"), rounding=ROUND_HALF_UP)
+                else:
+                    price_map = get_current_prices([coin_id], currency) or {}
+                    p = price_map.get(coin_id, {}).get(currency)
+                    if p is not None:
+                        from decimal import Decimal, ROUND_HALF_UP
+                        data["price"] = Decimal(str(p)).quantize(Decimal("0.0000000001"), rounding=ROUND_HALF_UP)
             except Exception:
                 pass
-            logger.info(f"Transaction in simulation {sim_id} created: {tx.id}")
-            return safe_response(TransactionSerializer(tx).data, code=0, status_code=status.HTTP_201_CREATED)
-        return safe_response({"detail": serializer.errors}, code=1000, status_code=status.HTTP_400_BAD_REQUEST)
+        serializer = TransactionSerializer(data=data, context={"request": request})
+        if not serializer.is_valid():
+            return safe_response({"detail": serializer.errors}, code=1000, status_code=status.HTTP_400_BAD_REQUEST)
+        side, quantity = serializer.validated_data["type"], serializer.validated_data["quantity"]
+        coin_id = serializer.validated_data["coin_id"]
+        with dbtx.atomic():
+            # Lock the position like the portfolio endpoints do; the lot engine then rewrites it.
+            if side == "SELL":
+                holding = (
+                    Holding.objects.select_for_update().filter(user=request.user, simulation=sim, coin_id=coin_id).first()
+                )
+                if holding is None or quantity > holding.quantity:
+                    return safe_response({"detail": "Insufficient quantity"}, code=1001,
+                                         status_code=status.HTTP_400_BAD_REQUEST)
+            tx = serializer.save(user=request.user, simulation=sim, time=tx_time, price_status=price_status)
+            if side == "BUY":
+                Holding.objects.select_for_update().get_or_create(
+                    user=request.user, simulation=sim, coin=tx.coin,
+                    defaults={"quantity": tx.quantity, "avg_price": tx.price, "avg_price_currency": tx.price_currency},
+                )
+            if apply_lots(tx)["oversold"]:
+                # A backdated sell can be covered now yet exceed what was held at its time or leave later sells short.
+                dbtx.set_rollback(True)
+                return safe_response({"detail": "Insufficient quantity at the trade's time"}, code=1001,
+                                     status_code=status.HTTP_400_BAD_REQUEST)
+            _record_ledger_trade(request.user, sim, tx)
+        logger.info(f"Transaction in simulation {sim_id} created: {tx.id}")
+        return safe_response(TransactionSerializer(tx).data, code=0, status_code=status.HTTP_201_CREATED)
     except Exception as e:
         return handle_exception(e, "simulation_transaction")
 
@@ -1466,7 +2190,18 @@ def simulation_transaction(request, sim_id):
 def delete_transaction(request, tx_id):
     try:
         tx = get_object_or_404(Transaction, id=tx_id, user=request.user)
-        tx.delete()
+        with dbtx.atomic():
+            # Lock the position while the ledger is replayed, as the trade endpoints do.
+            Holding.objects.select_for_update().filter(
+                user=request.user, simulation_id=tx.simulation_id, coin_id=tx.coin_id
+            ).first()
+            tx.delete()
+            # Replays the coin's ledger from the deleted row so later sells and the holding stay consistent
+            if rebuild_lots(tx.user_id, tx.simulation_id, tx.coin_id, from_time=tx.time)["oversold"]:
+                dbtx.set_rollback(True)
+                return safe_response({"detail": "Later sells would exceed the remaining quantity"}, code=1001,
+                                     status_code=status.HTTP_400_BAD_REQUEST)
+            invalidate_summary(request.user, tx.simulation)
         return safe_response({"detail": "deleted"}, code=0, status_code=status.HTTP_204_NO_CONTENT)
     except Exception as e:
         return handle_exception(e, "delete_transaction")